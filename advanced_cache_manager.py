@@ -22,6 +22,10 @@ from concurrent.futures import ThreadPoolExecutor
 import pickle
 import zlib
 
+from performance_monitor import performance_monitor
+from tracing import set_span_attribute
+from service_registry import register_worker
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -148,8 +152,9 @@ class AdvancedCacheManager:
                 except Exception as e:
                     logger.error(f"后台任务执行失败: {e}")
         
-        worker_thread = threading.Thread(target=background_worker, daemon=True)
-        worker_thread.start()
+        # 由服务注册表在服务就绪后启动，避免导入阶段启动线程
+        register_worker(f'{type(self).__name__}@{id(self):x}.maintenance',
+                        lambda: threading.Thread(target=background_worker, daemon=True).start())
     
     def _generate_key(self, data_type: str, **kwargs) -> str:
         """生成缓存键"""
@@ -487,6 +492,9 @@ class AdvancedCacheManager:
     
     def _record_access(self, key: str, level: CacheLevel, access_time: float):
         """记录访问信息"""
+        performance_monitor.record_cache_hit(access_time, level=level.value)
+        set_span_attribute('cache_level', level.value)
+
         # 更新统计
         if level == CacheLevel.L1_MEMORY:
             self.l1_stats.total_requests += 1
@@ -515,6 +523,9 @@ class AdvancedCacheManager:
     
     def _record_miss(self, key: str, access_time: float):
         """记录缓存未命中"""
+        performance_monitor.record_cache_miss(access_time, level='ALL')
+        set_span_attribute('cache_level', 'MISS')
+
         self.l1_stats.total_requests += 1
         self.l1_stats.update_hit_rate()
         
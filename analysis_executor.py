@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 共享分析线程池
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- 进程内固定数量的分析线程，指数/行业整体分析等批量任务提交为作业，不再每只股票一个线程
+- 多个作业之间轮转取任务（每次从队首作业取一只股票，作业未完成时放回队尾），并发请求公平分享线程
+- 作业内的上游调用共享一个自适应令牌桶（data_service.upstream_budget），上游报错时整体降速
+- 作业可取消（未开始的股票直接丢弃），可查询进度和已完成的结果；等待超时时取消剩余部分，返回已完成的结果
+- 结束的作业按保留时长保存供查询；结果按完成顺序编号，轮询时只返回游标之后的新结果
+- 提交时的上下文（追踪 span、上游预算等）随任务带入工作线程
+
+环境变量：
+- ANALYSIS_WORKERS: 分析线程数（默认8）
+- ANALYSIS_RATE: 所有分析作业合计每秒上游调用数上限（默认20）
+- ANALYSIS_BURST: 令牌桶容量（默认40）
+- ANALYSIS_JOB_TIMEOUT: 指数/行业整体分析的最长等待秒数（默认300）
+- ANALYSIS_JOB_RETENTION: 结束的作业保留多少秒供查询进度和结果（默认3600）
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from data_service import upstream_budget
+from token_bucket import AdaptiveTokenBucket
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', '8'))
+ANALYSIS_RATE = float(os.getenv('ANALYSIS_RATE', '20'))
+ANALYSIS_BURST = int(os.getenv('ANALYSIS_BURST', '40'))
+ANALYSIS_JOB_TIMEOUT = float(os.getenv('ANALYSIS_JOB_TIMEOUT', '300'))
+ANALYSIS_JOB_RETENTION = float(os.getenv('ANALYSIS_JOB_RETENTION', '3600'))
+
+# 状态统计中列出的最近结束作业数
+RECENT_JOBS_SHOWN = 20
+
+
+class AnalysisJob:
+    """一次批量分析：对每组参数调用 func，结果按提交顺序保存"""
+
+    def __init__(self, name: str, func: Callable, items: Sequence[tuple]):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.func = func
+        self.total = len(items)
+        self.results: List[Any] = [None] * self.total
+        self.errors: Dict[int, str] = {}
+        self.completed = 0
+        self.failed = 0
+        # 按完成顺序记录的序号，轮询游标即该列表的位置
+        self.finish_order: List[int] = []
+        self.cancelled = False
+        self.created_at = time.time()
+        self.finished_at = None
+        self._pending = deque(enumerate(items))
+        self._running = 0
+        self._context = contextvars.copy_context()
+        self._done = threading.Event()
+        if not self.total:
+            self._finish()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待作业结束，返回是否在超时前结束"""
+        return self._done.wait(timeout)
+
+    def _finish(self):
+        self.finished_at = time.time()
+        self._done.set()
+
+    def progress(self) -> Dict:
+        if self.cancelled:
+            status = 'cancelled'
+        elif self.done:
+            status = 'completed'
+        elif self.completed or self.failed or self._running:
+            status = 'running'
+        else:
+            status = 'queued'
+        elapsed = (self.finished_at or time.time()) - self.created_at
+        return {
+            'job_id': self.job_id,
+            'name': self.name,
+            'status': status,
+            'total': self.total,
+            'completed': self.completed,
+            'failed': self.failed,
+            'pending': len(self._pending),
+            'running': self._running,
+            'progress': round((self.completed + self.failed) / self.total * 100, 1) if self.total else 100.0,
+            'elapsed': round(elapsed, 3)
+        }
+
+
+class AnalysisExecutor:
+    """共享的有界分析线程池，作业间轮转调度"""
+
+    def __init__(self, max_workers: int = ANALYSIS_WORKERS, rate: float = ANALYSIS_RATE,
+                 burst: int = ANALYSIS_BURST, retention: float = ANALYSIS_JOB_RETENTION):
+        self.max_workers = max(1, max_workers)
+        self.retention = retention
+        self.bucket = AdaptiveTokenBucket(rate, burst)
+        self._cond = threading.Condition()
+        self._queue: deque = deque()
+        self._jobs: Dict[str, AnalysisJob] = {}
+        # 已结束的作业，按结束时间先后排列
+        self._finished: Dict[str, AnalysisJob] = OrderedDict()
+        self._threads: List[threading.Thread] = []
+        self.stats = {'jobs': 0, 'tasks': 0, 'cancelled_jobs': 0, 'max_queue_wait': 0.0}
+
+    def _ensure_workers(self):
+        # 首次提交时才启动线程，不拖慢服务启动
+        if len(self._threads) >= self.max_workers:
+            return
+        for i in range(len(self._threads), self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f'analysis-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, name: str, func: Callable, items: Sequence[tuple]) -> AnalysisJob:
+        """提交一个作业，items 为每次调用 func 的位置参数"""
+        job = AnalysisJob(name, func, list(items))
+        with self._cond:
+            self.stats['jobs'] += 1
+            if job.done:
+                self._keep_finished(job)
+                return job
+            self._ensure_workers()
+            self._jobs[job.job_id] = job
+            self._queue.append(job)
+            self._cond.notify_all()
+        logger.info(f"分析作业 {name}（{job.job_id}）已提交，共 {job.total} 项，排队作业 {len(self._queue)} 个")
+        return job
+
+    def run(self, name: str, func: Callable, items: Sequence[tuple],
+            timeout: Optional[float] = ANALYSIS_JOB_TIMEOUT) -> AnalysisJob:
+        """提交并等待作业；超时则取消剩余部分，返回作业（结果中未完成的项为 None）"""
+        job = self.submit(name, func, items)
+        if not job.wait(timeout):
+            logger.warning(f"分析作业 {name} 超过 {timeout} 秒，取消剩余 {len(job._pending)} 项")
+            self.cancel(job.job_id)
+            job.wait()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """取消作业：未开始的项直接丢弃，正在执行的项完成后结束"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.cancelled:
+                return False
+            job.cancelled = True
+            job._pending.clear()
+            self.stats['cancelled_jobs'] += 1
+            if job in self._queue:
+                self._queue.remove(job)
+            if not job._running:
+                self._close(job)
+        logger.info(f"分析作业 {job.name}（{job_id}）已取消，完成 {job.completed}/{job.total}")
+        return True
+
+    def _close(self, job: AnalysisJob):
+        self._jobs.pop(job.job_id, None)
+        job._finish()
+        self._keep_finished(job)
+
+    def _keep_finished(self, job: AnalysisJob):
+        self._finished[job.job_id] = job
+        self._prune_finished()
+
+    def _prune_finished(self):
+        """丢弃结束超过保留时长的作业"""
+        cutoff = time.time() - self.retention
+        while self._finished:
+            job = next(iter(self._finished.values()))
+            if job.finished_at >= cutoff:
+                break
+            self._finished.popitem(last=False)
+
+    def _find(self, job_id: str) -> Optional[AnalysisJob]:
+        self._prune_finished()
+        return self._jobs.get(job_id) or self._finished.get(job_id)
+
+    def _next_task(self):
+        """轮转取下一项：队首作业取一项后放回队尾"""
+        while not self._queue:
+            self._cond.wait()
+        job = self._queue.popleft()
+        index, args = job._pending.popleft()
+        if job._pending:
+            self._queue.append(job)
+        job._running += 1
+        if index == 0:
+            self.stats['max_queue_wait'] = max(self.stats['max_queue_wait'], time.time() - job.created_at)
+        return job, index, args
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job, index, args = self._next_task()
+            try:
+                # 每项使用提交时上下文的副本，同一上下文不能被多个线程同时进入
+                result = job._context.copy().run(self._call, job.func, args)
+                error = None
+            except Exception as e:
+                result, error = None, str(e)
+                logger.warning(f"分析作业 {job.name} 第 {index + 1} 项 {args} 失败: {error}")
+            with self._cond:
+                job._running -= 1
+                self.stats['tasks'] += 1
+                if error is None:
+                    job.results[index] = result
+                    job.completed += 1
+                else:
+                    job.errors[index] = error
+                    job.failed += 1
+                job.finish_order.append(index)
+                if not job._running and not job._pending and not job.done:
+                    self._close(job)
+
+    def _call(self, func: Callable, args: tuple):
+        with upstream_budget(self.bucket):
+            return func(*args)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._cond:
+            job = self._find(job_id)
+            return job.progress() if job else None
+
+    def get_job_results(self, job_id: str, cursor: int = 0) -> Optional[Dict]:
+        """作业进度及游标之后新完成的项
+
+        results 为 [{'index': 提交序号, 'result': 结果}]，errors 为 {提交序号: 失败原因}，
+        下次轮询传入返回的 next_cursor，每次只取新结果，响应大小与作业规模无关。
+        """
+        with self._cond:
+            job = self._find(job_id)
+            if job is None:
+                return None
+            cursor = min(max(0, cursor), len(job.finish_order))
+            indexes = job.finish_order[cursor:]
+            return {
+                **job.progress(),
+                'results': [{'index': i, 'result': job.results[i]} for i in indexes if i not in job.errors],
+                'errors': {i: job.errors[i] for i in indexes if i in job.errors},
+                'next_cursor': cursor + len(indexes)
+            }
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            self._prune_finished()
+            return {
+                'workers': self.max_workers,
+                'active_jobs': [job.progress() for job in self._jobs.values()],
+                'recent_jobs': [job.progress() for job in list(reversed(self._finished.values()))[:RECENT_JOBS_SHOWN]],
+                'queued_jobs': len(self._queue),
+                'upstream': self.bucket.get_stats(),
+                **self.stats,
+                'max_queue_wait': round(self.stats['max_queue_wait'], 3)
+            }
+
+
+# 全局分析线程池
+analysis_executor = AnalysisExecutor()
+
+
+def run_analysis(name: str, func: Callable, items: Sequence[tuple],
+                 timeout: Optional[float] = ANALYSIS_JOB_TIMEOUT) -> AnalysisJob:
+    """便捷函数：在共享线程池中执行批量分析"""
+    return analysis_executor.run(name, func, items, timeout)
@@ -331,6 +331,7 @@ def schedule_cache_cleanup():
     logger.info("缓存清理调度器已启动")
 
 
-# 启动缓存清理调度器
+# 登记缓存清理调度器，由服务注册表在服务就绪后启动
 if DATABASE_AVAILABLE and USE_DATABASE:
-    schedule_cache_cleanup()
+    from service_registry import register_worker
+    register_worker('api_cache.cleanup', schedule_cache_cleanup)
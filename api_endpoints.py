@@ -15,11 +15,6 @@ from auth_middleware import require_api_key, require_hmac_auth, api_access_logge
 from rate_limiter import require_rate_limit
 from api_response import APIResponse, ErrorCodes, validate_stock_code, normalize_stock_code, validate_request_data
 
-# 导入分析模块
-from stock_analyzer import StockAnalyzer
-from risk_monitor import RiskMonitor
-from fundamental_analyzer import FundamentalAnalyzer
-
 # 导入HF Spaces优化
 try:
     from hf_spaces_optimization import get_hf_timeout, is_hf_feature_enabled, get_hf_config
@@ -71,13 +66,16 @@ def api_error_handler(f):
 analyzer = None
 risk_monitor = None
 fundamental_analyzer = None
+batch_engine = None
 
 def init_analyzers(app_analyzer, app_risk_monitor, app_fundamental_analyzer):
     """初始化分析器实例"""
-    global analyzer, risk_monitor, fundamental_analyzer
+    global analyzer, risk_monitor, fundamental_analyzer, batch_engine
     analyzer = app_analyzer
     risk_monitor = app_risk_monitor
     fundamental_analyzer = app_fundamental_analyzer
+    from batch_scoring import BatchScoringEngine
+    batch_engine = BatchScoringEngine(app_analyzer)
     logger.info(f"分析器初始化完成: analyzer={analyzer is not None}, risk_monitor={risk_monitor is not None}, fundamental_analyzer={fundamental_analyzer is not None}")
 
 
@@ -696,9 +694,14 @@ def batch_score_stocks():
         "market_type": "A",
         "min_score": 60,
         "sort_by": "score",
-        "sort_order": "desc"
+        "sort_order": "desc",
+        "async": false
     }
+
+    股票数超过 BATCH_SCORE_SYNC_LIMIT 或 async 为 true 时作为后台任务执行，
+    返回任务ID，通过 /api/v1/tasks/<task_id> 查询进度和结果
     """
+    from batch_scoring import BATCH_SCORE_MAX_CODES, BATCH_SCORE_SYNC_LIMIT
     try:
         # 验证请求数据
         data = request.get_json()
@@ -716,6 +719,7 @@ def batch_score_stocks():
         min_score = data.get('min_score', 0)
         sort_by = data.get('sort_by', 'score')
         sort_order = data.get('sort_order', 'desc')
+        run_async = bool(data.get('async', False))
 
         # 验证股票代码列表
         if not stock_codes or len(stock_codes) == 0:
@@ -725,11 +729,11 @@ def batch_score_stocks():
                 status_code=400
             )
 
-        if len(stock_codes) > 100:  # 限制批量大小
+        if len(stock_codes) > BATCH_SCORE_MAX_CODES:  # 限制批量大小
             return APIResponse.error(
                 code=ErrorCodes.PORTFOLIO_TOO_LARGE,
-                message='批量分析股票数量不能超过100只',
-                details={'max_stocks': 100, 'provided': len(stock_codes)},
+                message=f'批量分析股票数量不能超过{BATCH_SCORE_MAX_CODES}只',
+                details={'max_stocks': BATCH_SCORE_MAX_CODES, 'provided': len(stock_codes)},
                 status_code=400
             )
 
@@ -751,67 +755,25 @@ def batch_score_stocks():
                 status_code=400
             )
 
-        # 执行批量分析
-        start_time = time.time()
-        results = []
-        successful_count = 0
-        failed_count = 0
-
-        for stock_code in valid_codes:
-            try:
-                # 快速分析获取评分
-                analysis_result = analyzer.quick_analyze_stock(stock_code, market_type)
-
-                score = analysis_result.get('score', 0)
-
-                # 应用最低评分过滤
-                if score >= min_score:
-                    results.append({
-                        'stock_code': stock_code,
-                        'stock_name': analysis_result.get('stock_name', '未知'),
-                        'score': round(score, 2),
-                        'risk_level': get_risk_level(analysis_result.get('risk_score', 50)),
-                        'recommendation': analysis_result.get('recommendation', '持有'),
-                        'price': analysis_result.get('price', 0),
-                        'price_change': analysis_result.get('price_change', 0),
-                        'volume_status': analysis_result.get('volume_status', '未知'),
-                        'ma_trend': analysis_result.get('ma_trend', '未知')
-                    })
-
-                successful_count += 1
-
-            except Exception as e:
-                logger.error(f"分析股票 {stock_code} 时出错: {str(e)}")
-                failed_count += 1
-
-                # 可选：包含失败的股票信息
-                results.append({
-                    'stock_code': stock_code,
-                    'error': f'分析失败: {str(e)}',
-                    'score': 0
-                })
-
-        # 排序结果
-        if results and sort_by in ['score', 'price_change']:
-            reverse = (sort_order.lower() == 'desc')
-            results.sort(
-                key=lambda x: x.get(sort_by, 0) if 'error' not in x else -999,
-                reverse=reverse
+        def finalize(scored):
+            return _batch_score_response(scored, len(valid_codes), min_score, sort_by, sort_order)
+
+        # 大批量转为后台任务
+        if run_async or len(valid_codes) > BATCH_SCORE_SYNC_LIMIT:
+            from 任务存储不一致问题完整解决方案 import task_manager as unified_task_manager
+            task_id = batch_engine.start_task(unified_task_manager, valid_codes, market_type, finalize)
+            return APIResponse.task_created(
+                task_id=task_id,
+                task_type='batch_score',
+                estimated_time=estimate_task_completion_time('batch_score', {'stock_codes': valid_codes})
             )
 
-        # 过滤掉失败的结果（如果不需要显示）
-        qualified_results = [r for r in results if 'error' not in r]
-
+        # 执行批量评分：缓存批量读取，缺失部分并发补齐，指标和评分整表计算
+        start_time = time.time()
+        scored = batch_engine.score_stocks(valid_codes, market_type)
+        response_data = finalize(scored)
         processing_time = int((time.time() - start_time) * 1000)
 
-        response_data = {
-            'total_analyzed': len(valid_codes),
-            'successful_count': successful_count,
-            'failed_count': failed_count,
-            'qualified_count': len(qualified_results),
-            'results': qualified_results
-        }
-
         meta = {
             'analysis_time': time.strftime('%Y-%m-%dT%H:%M:%SZ'),
             'processing_time_ms': processing_time,
@@ -820,7 +782,7 @@ def batch_score_stocks():
                 'sort_by': sort_by,
                 'sort_order': sort_order
             },
-            'cache_hit_rate': 0.0  # 批量分析通常缓存命中率较低
+            'cache_hit_rate': round(scored['stats']['cache_hits'] / len(valid_codes), 3)
         }
 
         return APIResponse.success(data=response_data, meta=meta)
@@ -835,6 +797,39 @@ def batch_score_stocks():
         )
 
 
+def _batch_score_response(scored: Dict, total: int, min_score: float, sort_by: str, sort_order: str) -> Dict:
+    """把批量评分结果按最低评分过滤、排序，转换为接口返回格式（同步和后台任务共用）"""
+    results = [
+        {
+            'stock_code': report['stock_code'],
+            'stock_name': report.get('stock_name', '未知'),
+            'score': round(report['score'], 2),
+            'risk_level': get_risk_level(report.get('risk_score', 50)),
+            'recommendation': report.get('recommendation') or '持有',
+            'price': report.get('price', 0),
+            'price_change': report.get('price_change', 0),
+            'volume_status': report.get('volume_status', '未知'),
+            'ma_trend': report.get('ma_trend', '未知')
+        }
+        for report in scored['results'] if report['score'] >= min_score
+    ]
+
+    # 排序结果
+    if results and sort_by in ['score', 'price_change']:
+        results.sort(key=lambda x: x.get(sort_by, 0), reverse=(sort_order.lower() == 'desc'))
+
+    failed_count = len(scored['errors'])
+    return {
+        'total_analyzed': total,
+        'successful_count': total - failed_count,
+        'failed_count': failed_count,
+        'qualified_count': len(results),
+        'results': results,
+        'failed_stocks': [{'stock_code': code, 'error': f'分析失败: {error}'}
+                          for code, error in scored['errors'].items()]
+    }
+
+
 # 异步任务处理API
 @api_v1.route('/tasks', methods=['POST'])
 @api_access_logger
@@ -879,7 +874,7 @@ def create_task():
             )
 
         # 导入任务管理器
-        from 任务存储不一致问题完整解决方案 import unified_task_manager
+        from 任务存储不一致问题完整解决方案 import task_manager as unified_task_manager
 
         # 创建任务
         task_id, task = unified_task_manager.create_task(task_type, **params)
@@ -913,7 +908,7 @@ def get_task_status(task_id):
     """
     try:
         # 导入任务管理器
-        from 任务存储不一致问题完整解决方案 import unified_task_manager
+        from 任务存储不一致问题完整解决方案 import task_manager as unified_task_manager
 
         # 获取任务信息
         task = unified_task_manager.get_task(task_id)
@@ -952,6 +947,51 @@ def get_task_status(task_id):
         )
 
 
+@api_v1.route('/tasks/<task_id>', methods=['DELETE'])
+@api_access_logger
+@require_rate_limit('/api/v1/tasks')
+@require_api_key('task_management')
+def cancel_task(task_id):
+    """
+    取消任务API（目前支持后台批量评分任务）
+    """
+    try:
+        # 导入任务管理器
+        from 任务存储不一致问题完整解决方案 import task_manager as unified_task_manager
+
+        task = unified_task_manager.get_task(task_id)
+        if not task:
+            return APIResponse.error(
+                code=ErrorCodes.TASK_NOT_FOUND,
+                message='任务不存在',
+                details={'task_id': task_id},
+                status_code=404
+            )
+
+        if task.get('type') != 'batch_score' or batch_engine is None \
+                or not batch_engine.cancel_task(unified_task_manager, task_id):
+            return APIResponse.error(
+                code=ErrorCodes.INVALID_PARAMETER_VALUE,
+                message='任务已结束或不支持取消',
+                details={'task_id': task_id, 'current_status': task['status']},
+                status_code=409
+            )
+
+        return APIResponse.success(
+            data={'task_id': task_id, 'status': unified_task_manager.get_task(task_id)['status']},
+            message='已请求取消任务'
+        )
+
+    except Exception as e:
+        logger.error(f"取消任务API出错: {traceback.format_exc()}")
+        return APIResponse.error(
+            code=ErrorCodes.INTERNAL_SERVER_ERROR,
+            message='取消任务失败',
+            details={'error_message': str(e)},
+            status_code=500
+        )
+
+
 @api_v1.route('/tasks/<task_id>/result', methods=['GET'])
 @api_access_logger
 @require_rate_limit('/api/v1/tasks')
@@ -962,7 +1002,7 @@ def get_task_result(task_id):
     """
     try:
         # 导入任务管理器
-        from 任务存储不一致问题完整解决方案 import unified_task_manager
+        from 任务存储不一致问题完整解决方案 import task_manager as unified_task_manager
 
         # 获取任务信息
         task = unified_task_manager.get_task(task_id)
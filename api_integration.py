@@ -26,10 +26,6 @@ def register_api_endpoints(app: Flask):
         logger.info("API v1端点已注册")
 
         # 初始化分析器 - 尝试从多个来源获取分析器实例
-        from stock_analyzer import StockAnalyzer
-        from risk_monitor import RiskMonitor
-        from fundamental_analyzer import FundamentalAnalyzer
-
         # 尝试从app对象获取分析器实例
         analyzer = getattr(app, 'analyzer', None)
         risk_monitor_instance = getattr(app, 'risk_monitor', None)
@@ -48,12 +44,15 @@ def register_api_endpoints(app: Flask):
 
         # 如果仍然没有，创建新的实例
         if analyzer is None:
+            from stock_analyzer import StockAnalyzer
             analyzer = StockAnalyzer()
             logger.info("创建新的StockAnalyzer实例")
         if risk_monitor_instance is None:
+            from risk_monitor import RiskMonitor
             risk_monitor_instance = RiskMonitor(analyzer)
             logger.info("创建新的RiskMonitor实例")
         if fundamental_analyzer_instance is None:
+            from fundamental_analyzer import FundamentalAnalyzer
             fundamental_analyzer_instance = FundamentalAnalyzer()
             logger.info("创建新的FundamentalAnalyzer实例")
 
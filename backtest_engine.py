@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 评分系统向量化回测引擎
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- 从 StockPriceHistory 缓存表一次性读取整个股票池的历史行情
+- 指标面板 → 评分面板 → 信号面板 → 持仓与收益，全部按列向量化计算
+- 评分规则与 StockAnalyzer.calculate_score / get_recommendation 保持一致
+  （不含依赖实时外部数据的美股财报季、港股联动调整）
+- 支持交易佣金、滑点和卖出印花税，信号按收盘生成、次日收盘执行
+
+实现说明：
+指标在"每只股票自己的交易日序号"上计算（停牌日不占位），与单只股票调用
+calculate_indicators 的结果逐位一致；评分完成后再按日历日期展开成 date × code 面板。
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from database import StockPriceHistory, Session
+
+logger = logging.getLogger(__name__)
+
+# 与 StockAnalyzer.params 一致
+DEFAULT_INDICATOR_PARAMS = {
+    'ma_periods': {'short': 5, 'medium': 20, 'long': 60},
+    'rsi_period': 14,
+    'bollinger_period': 20,
+    'bollinger_std': 2,
+    'volume_ma_period': 20,
+    'atr_period': 14
+}
+
+# 与 calculate_score 中按市场调整的权重一致
+MARKET_WEIGHTS = {
+    'A': {'trend': 0.30, 'volatility': 0.15, 'technical': 0.25, 'volume': 0.20, 'momentum': 0.10},
+    'US': {'trend': 0.35, 'volatility': 0.10, 'technical': 0.25, 'volume': 0.20, 'momentum': 0.15},
+    'HK': {'trend': 0.30, 'volatility': 0.20, 'technical': 0.25, 'volume': 0.25, 'momentum': 0.10},
+}
+
+# get_recommendation 的基础动作，按分数从低到高
+ACTIONS = ('sell', 'reduce', 'cautious_hold', 'hold', 'cautious_buy', 'buy', 'strong_buy')
+SCORE_THRESHOLDS = (15, 30, 45, 55, 70, 85)
+
+# 动作对应的目标仓位（None 表示维持原仓位）
+DEFAULT_ACTION_EXPOSURE = {
+    'strong_buy': 1.0,
+    'buy': 1.0,
+    'cautious_buy': 0.5,
+    'hold': None,
+    'cautious_hold': None,
+    'reduce': 0.25,
+    'sell': 0.0
+}
+
+TRADING_DAYS_PER_YEAR = 252
+# 指标预热需要的额外日历天数（MA60 + 缓冲）
+WARMUP_CALENDAR_DAYS = 120
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def load_price_history(stock_codes: List[str], start_date: str, end_date: str,
+                       market_type: str = 'A', session_factory=None) -> pd.DataFrame:
+    """一次查询读取股票池的历史行情，返回长表 (stock_code, date, open, high, low, close, volume)"""
+    session_factory = session_factory or Session
+    table = StockPriceHistory.__table__
+    stmt = select(
+        table.c.stock_code, table.c.trade_date, table.c.open_price, table.c.high_price,
+        table.c.low_price, table.c.close_price, table.c.volume
+    ).where(
+        table.c.stock_code.in_(list(stock_codes)),
+        table.c.market_type == market_type,
+        table.c.trade_date >= start_date.replace('-', ''),
+        table.c.trade_date <= end_date.replace('-', '')
+    )
+
+    session = session_factory()
+    try:
+        rows = session.execute(stmt).fetchall()
+    finally:
+        session.close()
+
+    df = pd.DataFrame(rows, columns=['stock_code', 'trade_date', 'open', 'high', 'low', 'close', 'volume'])
+    if df.empty:
+        return pd.DataFrame(columns=['stock_code', 'date', *PRICE_FIELDS])
+
+    df['date'] = pd.to_datetime(df['trade_date'].str.replace('-', ''), format='%Y%m%d')
+    for field in PRICE_FIELDS:
+        df[field] = pd.to_numeric(df[field], errors='coerce').astype(float)
+    df = df.drop(columns='trade_date')
+    return df.drop_duplicates(['stock_code', 'date'], keep='last')
+
+
+class _DensePanel:
+    """按股票内交易日序号排列的面板（行：第 i 个交易日，列：股票）"""
+
+    def __init__(self, prices: pd.DataFrame):
+        prices = prices.sort_values(['stock_code', 'date'], kind='mergesort').reset_index(drop=True)
+        self.long = prices
+        self.position = prices.groupby('stock_code', sort=False).cumcount().to_numpy()
+        self.codes = pd.Index(prices['stock_code'].unique())
+        self.code_index = self.codes.get_indexer(prices['stock_code'])
+        self.rows = int(self.position.max()) + 1 if len(prices) else 0
+
+    def pivot(self, values: np.ndarray) -> pd.DataFrame:
+        dense = np.full((self.rows, len(self.codes)), np.nan)
+        dense[self.position, self.code_index] = values
+        return pd.DataFrame(dense, columns=self.codes)
+
+    def gather(self, frame: pd.DataFrame) -> np.ndarray:
+        return frame.to_numpy()[self.position, self.code_index]
+
+
+def compute_indicator_panel(prices: pd.DataFrame, params: Dict = None):
+    """计算指标面板，与 StockAnalyzer.calculate_indicators + format_indicator_data 一致
+
+    Returns:
+        (dense_panel, indicators)，indicators 为 {指标名: DataFrame(交易日序号 × 股票)}
+    """
+    params = params or DEFAULT_INDICATOR_PARAMS
+    dense = _DensePanel(prices)
+    panel = {field: dense.pivot(dense.long[field].to_numpy(dtype=float)) for field in PRICE_FIELDS}
+    close, high, low, volume = panel['close'], panel['high'], panel['low'], panel['volume']
+
+    ind = {}
+    ind['MA5'] = close.ewm(span=params['ma_periods']['short'], adjust=False).mean()
+    ind['MA20'] = close.ewm(span=params['ma_periods']['medium'], adjust=False).mean()
+    ind['MA60'] = close.ewm(span=params['ma_periods']['long'], adjust=False).mean()
+
+    delta = close.diff()
+    period = params['rsi_period']
+    gain = delta.where(delta > 0, 0).rolling(window=period).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+    ind['RSI'] = 100 - (100 / (1 + gain / loss))
+
+    macd = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    signal = macd.ewm(span=9, adjust=False).mean()
+    ind['MACD'], ind['Signal'], ind['MACD_hist'] = macd, signal, macd - signal
+
+    middle = close.rolling(window=params['bollinger_period']).mean()
+    std = close.rolling(window=params['bollinger_period']).std()
+    ind['BB_upper'] = middle + std * params['bollinger_std']
+    ind['BB_middle'] = middle
+    ind['BB_lower'] = middle - std * params['bollinger_std']
+
+    volume_ma = volume.rolling(window=params['volume_ma_period']).mean()
+    ind['Volume_Ratio'] = volume / volume_ma
+
+    prev_close = close.shift(1)
+    true_range = np.fmax(np.fmax(high - low, (high - prev_close).abs()), (low - prev_close).abs())
+    atr = true_range.rolling(window=params['atr_period']).mean()
+    ind['Volatility'] = atr / close * 100
+    ind['ROC'] = close.pct_change(periods=10) * 100
+
+    # 与 format_indicator_data 相同的舍入
+    ind['close'] = close.round(2)
+    for name in ('MA5', 'MA20', 'MA60', 'BB_upper', 'BB_middle', 'BB_lower'):
+        ind[name] = ind[name].round(2)
+    for name in ('MACD', 'Signal', 'MACD_hist'):
+        ind[name] = ind[name].round(3)
+    for name in ('RSI', 'Volatility', 'ROC', 'Volume_Ratio'):
+        ind[name] = ind[name].round(2)
+
+    return dense, ind
+
+
+def compute_score_panel(ind: Dict[str, pd.DataFrame], market_type: str = 'A') -> pd.DataFrame:
+    """按 calculate_score 的规则向量化计算评分面板"""
+    weights = MARKET_WEIGHTS.get(market_type, MARKET_WEIGHTS['A'])
+    close, ma5, ma20, ma60 = (ind[k].to_numpy() for k in ('close', 'MA5', 'MA20', 'MA60'))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 1. 趋势（最高30分）
+        trend = np.select(
+            [(ma5 > ma20) & (ma20 > ma60), ma5 > ma20, ma20 > ma60], [15, 10, 5], 0
+        ) + 5 * (close > ma5) + 5 * (close > ma20) + 5 * (close > ma60)
+        trend = np.minimum(trend, 30)
+
+        # 2. 波动率（最高15分）
+        vol = ind['Volatility'].to_numpy()
+        volatility = np.select(
+            [(vol >= 1.0) & (vol <= 2.5), (vol > 2.5) & (vol <= 4.0), vol < 1.0], [15, 10, 5], 0
+        )
+
+        # 3. 技术指标（最高25分）
+        rsi = ind['RSI'].to_numpy()
+        rsi_score = np.select(
+            [(rsi >= 40) & (rsi <= 60), ((rsi >= 30) & (rsi < 40)) | ((rsi > 60) & (rsi <= 70)),
+             rsi < 30, rsi > 70],
+            [7, 10, 8, 2], 0
+        )
+        macd, signal = ind['MACD'].to_numpy(), ind['Signal'].to_numpy()
+        hist = ind['MACD_hist']
+        hist_prev = hist.shift(1).to_numpy()
+        hist = hist.to_numpy()
+        macd_score = np.select(
+            [(macd > signal) & (hist > 0), macd > signal, (macd < signal) & (hist < 0), hist > hist_prev],
+            [10, 8, 0, 5], 0
+        )
+        upper, lower = ind['BB_upper'].to_numpy(), ind['BB_lower'].to_numpy()
+        bb_position = (close - lower) / (upper - lower)
+        bb_score = np.select(
+            [(bb_position >= 0.3) & (bb_position <= 0.7), bb_position < 0.2, bb_position > 0.8], [3, 5, 1], 0
+        )
+        technical = np.minimum(rsi_score + macd_score + bb_score, 25)
+
+        # 4. 成交量（最高20分）：最近5日量比均值，窗口内有缺失则为 NaN（与逐项求和一致）
+        volume_ratio = ind['Volume_Ratio']
+        avg_ratio = volume_ratio.rolling(5, min_periods=1).mean()
+        has_nan = volume_ratio.isna().astype(float).rolling(5, min_periods=1).max() > 0
+        avg_ratio = avg_ratio.mask(has_nan).to_numpy()
+        close_prev = ind['close'].shift(1).to_numpy()
+        up, down = close > close_prev, close < close_prev
+        volume_score = np.select(
+            [(avg_ratio > 1.5) & up, (avg_ratio > 1.2) & up, (avg_ratio < 0.8) & down, (avg_ratio > 1.2) & down],
+            [20, 15, 10, 0], 8
+        )
+
+        # 5. 动量（最高10分）
+        roc = ind['ROC'].to_numpy()
+        momentum = np.select(
+            [roc > 5, (roc >= 2) & (roc <= 5), (roc >= 0) & (roc < 2), (roc >= -2) & (roc < 0)],
+            [10, 8, 5, 3], 0
+        )
+
+    final = (
+        trend * weights['trend'] / 0.30 +
+        volatility * weights['volatility'] / 0.15 +
+        technical * weights['technical'] / 0.25 +
+        volume_score * weights['volume'] / 0.20 +
+        momentum * weights['momentum'] / 0.10
+    )
+    final = np.clip(np.round(final), 0, 100)
+
+    # calculate_score 至少需要两行数据
+    final[0, :] = np.nan
+    final[np.isnan(close)] = np.nan
+    return pd.DataFrame(final, columns=ind['close'].columns)
+
+
+def score_to_action_codes(score: np.ndarray, volatility: np.ndarray = None, market_type: str = 'A',
+                          rsi: np.ndarray = None, macd_bullish: np.ndarray = None) -> np.ndarray:
+    """按 get_recommendation 的规则把评分映射为动作编号（ACTIONS 下标）
+
+    依次应用：分数阈值 → A股波动率 > 4 时买入降级为谨慎买入 → RSI 超买/超卖修正 → MACD 信号修正。
+    新闻情绪和港股大陆情绪依赖实时外部数据，回测中不应用。
+    """
+    buy, strong_buy = ACTIONS.index('buy'), ACTIONS.index('strong_buy')
+    hold, cautious_hold = ACTIONS.index('hold'), ACTIONS.index('cautious_hold')
+    cautious_buy = ACTIONS.index('cautious_buy')
+
+    codes = np.searchsorted(np.asarray(SCORE_THRESHOLDS), score, side='right').astype(float)
+    codes[np.isnan(score)] = np.nan
+    with np.errstate(invalid='ignore'):
+        if market_type == 'A' and volatility is not None:
+            codes[(volatility > 4.0) & (codes >= buy)] = cautious_buy
+
+        if rsi is not None:
+            overbought = (rsi > 80) & (codes >= buy)
+            oversold = ~overbought & (rsi < 20) & (codes <= ACTIONS.index('reduce'))
+            codes[overbought | oversold] = hold
+
+        if macd_bullish is not None:
+            bullish = macd_bullish.astype(bool)
+            to_buy = bullish & ((codes == hold) | (codes == cautious_hold))
+            to_hold = ~bullish & ((codes == cautious_buy) | (codes == buy))
+            codes[to_buy] = cautious_buy
+            codes[to_hold] = hold
+    return codes
+
+
+class VectorizedBacktester:
+    """评分系统向量化回测器"""
+
+    def __init__(self, market_type: str = 'A', params: Dict = None,
+                 commission: float = 0.0003, slippage: float = 0.0005, sell_tax: float = 0.0005,
+                 action_exposure: Dict[str, Optional[float]] = None, weighting: str = 'equal',
+                 execution_lag: int = 1, session_factory=None):
+        """
+        Args:
+            commission: 双边佣金费率
+            slippage: 双边滑点
+            sell_tax: 卖出印花税（A股现行 0.05%）
+            action_exposure: 动作到目标仓位的映射，None 表示维持原仓位
+            weighting: equal（每只股票固定 1/N 资金）或 normalized（按目标仓位在持仓股票间归一化）
+            execution_lag: 信号生成到执行的交易日数，默认收盘出信号、次日收盘成交
+        """
+        if weighting not in ('equal', 'normalized'):
+            raise ValueError(f"不支持的权重方式: {weighting}")
+        self.market_type = market_type
+        self.params = params or DEFAULT_INDICATOR_PARAMS
+        self.commission = commission
+        self.slippage = slippage
+        self.sell_tax = sell_tax
+        self.action_exposure = dict(DEFAULT_ACTION_EXPOSURE, **(action_exposure or {}))
+        self.weighting = weighting
+        self.execution_lag = max(0, int(execution_lag))
+        self.session_factory = session_factory
+
+    def build_panels(self, prices: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """行情长表 → 日历日期 × 股票 的收盘价、评分、动作、波动率面板"""
+        dense, ind = compute_indicator_panel(prices, self.params)
+        score_dense = compute_score_panel(ind, self.market_type)
+        with np.errstate(invalid='ignore'):
+            macd_bullish = ind['MACD'].to_numpy() > ind['Signal'].to_numpy()
+        action_dense = score_to_action_codes(score_dense.to_numpy(), ind['Volatility'].to_numpy(), self.market_type,
+                                             ind['RSI'].to_numpy(), macd_bullish)
+
+        long = dense.long[['date', 'stock_code', 'close']].copy()
+        long['score'] = dense.gather(score_dense)
+        long['action'] = action_dense[dense.position, dense.code_index]
+
+        def calendar(field):
+            return long.pivot(index='date', columns='stock_code', values=field).sort_index()
+
+        return {
+            'close': calendar('close'),
+            'score': calendar('score'),
+            'action': calendar('action')
+        }
+
+    def exposure_panel(self, action: pd.DataFrame) -> pd.DataFrame:
+        """动作面板 → 目标仓位面板（维持类动作沿用上一目标，停牌日沿用）"""
+        mapping = np.full(len(ACTIONS), np.nan)
+        for i, name in enumerate(ACTIONS):
+            exposure = self.action_exposure.get(name)
+            if exposure is not None:
+                mapping[i] = exposure
+        values = action.to_numpy()
+        target = np.full(values.shape, np.nan)
+        valid = ~np.isnan(values)
+        target[valid] = mapping[values[valid].astype(int)]
+        return pd.DataFrame(target, index=action.index, columns=action.columns).ffill().fillna(0.0)
+
+    def run(self, stock_codes: List[str] = None, start_date: str = None, end_date: str = None,
+            prices: pd.DataFrame = None, forward_horizon: int = 5) -> Dict:
+        """执行回测
+
+        可直接传入行情长表 prices；否则从 StockPriceHistory 读取（自动多读预热区间）。
+        """
+        timings = {}
+        t0 = time.perf_counter()
+        end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+        start_date = start_date or (datetime.now() - timedelta(days=365 * 3)).strftime('%Y-%m-%d')
+
+        if prices is None:
+            warmup_start = (pd.Timestamp(start_date) - timedelta(days=WARMUP_CALENDAR_DAYS)).strftime('%Y-%m-%d')
+            prices = load_price_history(stock_codes, warmup_start, end_date, self.market_type,
+                                        self.session_factory)
+        timings['load'] = time.perf_counter() - t0
+        if prices.empty:
+            return {'error': '股票池在指定区间内没有缓存的历史行情'}
+
+        t1 = time.perf_counter()
+        panels = self.build_panels(prices)
+        timings['indicators_and_scores'] = time.perf_counter() - t1
+
+        t2 = time.perf_counter()
+        close = panels['close']
+        exposure = self.exposure_panel(panels['action'])
+
+        # 停牌日收益为0；仓位在执行滞后后生效
+        returns = close.ffill().pct_change().fillna(0.0)
+        if self.weighting == 'equal':
+            weights = exposure / exposure.shape[1]
+        else:
+            total = exposure.sum(axis=1)
+            weights = exposure.div(total.where(total > 0), axis=0).fillna(0.0)
+        weights = weights.shift(self.execution_lag).fillna(0.0)
+
+        in_range = close.index >= pd.Timestamp(start_date)
+        weights = weights.loc[in_range]
+        returns = returns.loc[in_range]
+        if weights.empty:
+            return {'error': '回测区间内没有交易日'}
+
+        trades = weights.diff()
+        trades.iloc[0] = weights.iloc[0]
+        buys = trades.clip(lower=0).sum(axis=1)
+        sells = (-trades).clip(lower=0).sum(axis=1)
+        costs = (buys + sells) * (self.commission + self.slippage) + sells * self.sell_tax
+
+        gross = (weights.shift(1).fillna(0.0) * returns).sum(axis=1)
+        net = gross - costs
+        equity = (1 + net).cumprod()
+        timings['portfolio'] = time.perf_counter() - t2
+
+        t3 = time.perf_counter()
+        score_analysis = self.score_bucket_returns(panels['score'], close, forward_horizon, start_date)
+        timings['score_analysis'] = time.perf_counter() - t3
+        timings['total'] = time.perf_counter() - t0
+
+        contribution = (weights.shift(1).fillna(0.0) * returns).sum(axis=0).sort_values(ascending=False)
+        return {
+            'market_type': self.market_type,
+            'start_date': weights.index[0].strftime('%Y-%m-%d'),
+            'end_date': weights.index[-1].strftime('%Y-%m-%d'),
+            'stock_count': int(close.shape[1]),
+            'trading_days': int(len(weights)),
+            'stats': self._performance_stats(net, equity, buys + sells, weights),
+            'equity_curve': {d.strftime('%Y-%m-%d'): round(float(v), 6) for d, v in equity.items()},
+            'top_contributors': {k: round(float(v), 6) for k, v in contribution.head(10).items()},
+            'bottom_contributors': {k: round(float(v), 6) for k, v in contribution.tail(10).items()},
+            'score_analysis': score_analysis,
+            'timings': {k: round(v, 4) for k, v in timings.items()}
+        }
+
+    @staticmethod
+    def _performance_stats(net: pd.Series, equity: pd.Series, turnover: pd.Series, weights: pd.DataFrame) -> Dict:
+        days = len(net)
+        total_return = float(equity.iloc[-1] - 1)
+        annual_return = float(equity.iloc[-1] ** (TRADING_DAYS_PER_YEAR / days) - 1) if days else 0.0
+        annual_vol = float(net.std(ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR)) if days > 1 else 0.0
+        drawdown = equity / equity.cummax() - 1
+        return {
+            'total_return': round(total_return * 100, 2),
+            'annual_return': round(annual_return * 100, 2),
+            'annual_volatility': round(annual_vol * 100, 2),
+            'sharpe': round(annual_return / annual_vol, 3) if annual_vol > 0 else 0.0,
+            'max_drawdown': round(float(drawdown.min()) * 100, 2),
+            'win_rate': round(float((net > 0).sum() / max((net != 0).sum(), 1)) * 100, 2),
+            'avg_daily_turnover': round(float(turnover.mean()) * 100, 2),
+            'avg_exposure': round(float(weights.sum(axis=1).mean()) * 100, 2)
+        }
+
+    @staticmethod
+    def score_bucket_returns(score: pd.DataFrame, close: pd.DataFrame, horizon: int = 5,
+                             start_date: str = None) -> Dict:
+        """按评分区间统计未来 horizon 日平均收益，检验评分的区分度"""
+        forward = close.ffill().shift(-horizon) / close - 1
+        if start_date:
+            mask = score.index >= pd.Timestamp(start_date)
+            score, forward = score.loc[mask], forward.loc[mask]
+        s = score.to_numpy().ravel()
+        f = forward.to_numpy().ravel()
+        valid = ~np.isnan(s) & ~np.isnan(f)
+        s, f = s[valid], f[valid]
+        if len(s) == 0:
+            return {'horizon': horizon, 'buckets': []}
+
+        edges = np.array([0, *SCORE_THRESHOLDS, 101])
+        bucket = np.searchsorted(edges, s, side='right') - 1
+        counts = np.bincount(bucket, minlength=len(edges) - 1)
+        sums = np.bincount(bucket, weights=f, minlength=len(edges) - 1)
+        wins = np.bincount(bucket, weights=(f > 0).astype(float), minlength=len(edges) - 1)
+        buckets = []
+        for i, action in enumerate(ACTIONS):
+            if counts[i] == 0:
+                continue
+            buckets.append({
+                'action': action,
+                'score_range': [int(edges[i]), int(edges[i + 1]) - 1],
+                'samples': int(counts[i]),
+                'avg_forward_return': round(float(sums[i] / counts[i]) * 100, 3),
+                'win_rate': round(float(wins[i] / counts[i]) * 100, 2)
+            })
+        return {'horizon': horizon, 'buckets': buckets}
+
+
+# 便捷函数
+def run_backtest(stock_codes: List[str], start_date: str = None, end_date: str = None,
+                 market_type: str = 'A', **kwargs) -> Dict:
+    """对股票池运行评分系统回测"""
+    forward_horizon = kwargs.pop('forward_horizon', 5)
+    backtester = VectorizedBacktester(market_type=market_type, **kwargs)
+    return backtester.run(stock_codes, start_date, end_date, forward_horizon=forward_horizon)
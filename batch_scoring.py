@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 批量评分引擎
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- 一次读取所有股票的已缓存日线（data_service.get_price_histories：内存缓存 + 一次数据库查询）
+- 缓存中缺失的日线和基本信息在共享分析线程池（analysis_executor）中并发补齐，受上游令牌桶限速
+- 所有股票拼成一张长表，按股票分组一次算出全部技术指标（与 StockAnalyzer.calculate_indicators 相同）
+- 评分规则按各股票最新一行整列计算（与 StockAnalyzer.calculate_score 相同）；港股的A股联动调整中
+  大陆市场情绪每批只取一次
+- 大批量请求作为后台任务在有界线程池中排队执行，通过任务接口查询进度和结果，可取消
+
+环境变量：
+- BATCH_SCORE_SYNC_LIMIT: 同步返回的最大股票数，超过时自动转为后台任务（默认100）
+- BATCH_SCORE_MAX_CODES: 单次请求的股票数上限（默认5000）
+- BATCH_SCORE_TASK_WORKERS: 同时执行的后台批量评分任务数，其余排队（默认2）
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from analysis_executor import ANALYSIS_JOB_TIMEOUT, analysis_executor
+from data_service import data_service
+from stock_cache_manager import stock_cache_manager
+from tracing import traced, set_span_attribute
+
+logger = logging.getLogger(__name__)
+
+BATCH_SCORE_SYNC_LIMIT = int(os.getenv('BATCH_SCORE_SYNC_LIMIT', '100'))
+BATCH_SCORE_MAX_CODES = int(os.getenv('BATCH_SCORE_MAX_CODES', '5000'))
+BATCH_SCORE_TASK_WORKERS = int(os.getenv('BATCH_SCORE_TASK_WORKERS', '2'))
+
+# 与 StockAnalyzer.params 相同的默认指标参数
+DEFAULT_PARAMS = {
+    'ma_periods': {'short': 5, 'medium': 20, 'long': 60},
+    'rsi_period': 14,
+    'bollinger_period': 20,
+    'bollinger_std': 2,
+    'volume_ma_period': 20,
+    'atr_period': 14
+}
+
+# 与 StockAnalyzer.format_indicator_data 相同的小数位
+ROUND_DIGITS = {
+    'open': 2, 'close': 2, 'high': 2, 'low': 2, 'MA5': 2, 'MA20': 2, 'MA60': 2,
+    'BB_upper': 2, 'BB_middle': 2, 'BB_lower': 2,
+    'MACD': 3, 'Signal': 3, 'MACD_hist': 3,
+    'RSI': 2, 'Volatility': 2, 'ROC': 2, 'Volume_Ratio': 2
+}
+
+# 成交量评分取最近几根K线的平均量比
+VOLUME_RATIO_BARS = 5
+
+
+def _ewm(grouped, span: int) -> pd.Series:
+    return grouped.ewm(span=span, adjust=False).mean().reset_index(level=0, drop=True)
+
+
+def _rolling(grouped, window: int, how: str = 'mean') -> pd.Series:
+    return getattr(grouped.rolling(window=window), how)().reset_index(level=0, drop=True)
+
+
+def compute_indicators(frames: Dict[str, pd.DataFrame], params: Dict = None) -> pd.DataFrame:
+    """
+    多只股票的日线拼成长表后按股票分组一次计算技术指标
+
+    返回包含 stock_code 列的长表，每只股票的行按日期升序
+    """
+    params = params or DEFAULT_PARAMS
+    # 直接拼接各列的数组，避免逐只股票构造 DataFrame
+    frame_list = list(frames.values())
+    data = pd.DataFrame({
+        column: np.concatenate([df[column].to_numpy() for df in frame_list])
+        for column in ('date', 'open', 'close', 'high', 'low', 'volume')
+    })
+    data['stock_code'] = np.repeat(list(frames.keys()), [len(df) for df in frame_list])
+    codes = data['stock_code']
+    close = data['close']
+    by_code = close.groupby(codes, sort=False)
+
+    ma = params['ma_periods']
+    data['MA5'] = _ewm(by_code, ma['short'])
+    data['MA20'] = _ewm(by_code, ma['medium'])
+    data['MA60'] = _ewm(by_code, ma['long'])
+
+    # RSI
+    delta = by_code.diff()
+    gain = _rolling(delta.where(delta > 0, 0).groupby(codes, sort=False), params['rsi_period'])
+    loss = _rolling((-delta.where(delta < 0, 0)).groupby(codes, sort=False), params['rsi_period'])
+    data['RSI'] = 100 - (100 / (1 + gain / loss))
+
+    # MACD
+    data['MACD'] = _ewm(by_code, 12) - _ewm(by_code, 26)
+    data['Signal'] = _ewm(data['MACD'].groupby(codes, sort=False), 9)
+    data['MACD_hist'] = data['MACD'] - data['Signal']
+
+    # 布林带
+    middle = _rolling(by_code, params['bollinger_period'])
+    std = _rolling(by_code, params['bollinger_period'], 'std')
+    data['BB_upper'] = middle + std * params['bollinger_std']
+    data['BB_middle'] = middle
+    data['BB_lower'] = middle - std * params['bollinger_std']
+
+    # 成交量
+    data['Volume_MA'] = _rolling(data['volume'].groupby(codes, sort=False), params['volume_ma_period'])
+    data['Volume_Ratio'] = data['volume'] / data['Volume_MA']
+
+    # ATR和波动率
+    prev_close = by_code.shift(1)
+    true_range = pd.concat([data['high'] - data['low'], (data['high'] - prev_close).abs(),
+                            (data['low'] - prev_close).abs()], axis=1).max(axis=1)
+    data['ATR'] = _rolling(true_range.groupby(codes, sort=False), params['atr_period'])
+    data['Volatility'] = data['ATR'] / close * 100
+
+    # 动量
+    data['ROC'] = (close / by_code.shift(10) - 1) * 100
+
+    for column, digits in ROUND_DIGITS.items():
+        data[column] = data[column].round(digits)
+    return data
+
+
+def score_latest(data: pd.DataFrame, market_type: str = 'A', earnings_season: bool = False,
+                 adjustments: Optional[Dict[str, float]] = None) -> pd.DataFrame:
+    """
+    按每只股票最新一行整列计算评分，规则与 StockAnalyzer.calculate_score 相同
+
+    adjustments 为按股票代码在取整前加到总分上的市场调整（港股的A股联动）
+    返回以股票代码为索引的表：各分项得分、总分和报告需要的最新行情字段
+    """
+    grouped = data.groupby('stock_code', sort=False)
+    size = grouped['close'].transform('size').to_numpy()
+    position = grouped.cumcount().to_numpy()
+    is_last = position == size - 1
+
+    # 成交量评分：最近 min(5, 行数-1) 根K线的量比，按从新到旧的顺序累加（与逐只计算的浮点结果一致）
+    ratio_by_code = data['Volume_Ratio'].groupby(data['stock_code'], sort=False)
+    bars = np.minimum(VOLUME_RATIO_BARS, size - 1)[is_last]
+    ratio_sum = np.zeros(is_last.sum())
+    for i in range(VOLUME_RATIO_BARS):
+        values = ratio_by_code.shift(i).to_numpy()[is_last]
+        ratio_sum = ratio_sum + np.where(i < bars, values, 0.0)
+
+    prev = grouped[['close', 'MACD_hist']].shift(1)[is_last]
+    latest = data[is_last].set_index('stock_code')
+    prev.index = latest.index
+
+    close, ma5, ma20, ma60 = (latest[c].to_numpy() for c in ('close', 'MA5', 'MA20', 'MA60'))
+    prev_close = prev['close'].to_numpy()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_ratio = ratio_sum / bars
+        bb_position = (close - latest['BB_lower'].to_numpy()) / (latest['BB_upper'] - latest['BB_lower']).to_numpy()
+
+    trend = np.select([(ma5 > ma20) & (ma20 > ma60), ma5 > ma20, ma20 > ma60], [15, 10, 5], 0)
+    trend = np.minimum(30, trend + 5 * (close > ma5) + 5 * (close > ma20) + 5 * (close > ma60))
+
+    volatility = latest['Volatility'].to_numpy()
+    volatility_score = np.select([(volatility >= 1.0) & (volatility <= 2.5), (volatility > 2.5) & (volatility <= 4.0),
+                                  volatility < 1.0], [15, 10, 5], 0)
+
+    rsi = latest['RSI'].to_numpy()
+    macd, signal, hist = (latest[c].to_numpy() for c in ('MACD', 'Signal', 'MACD_hist'))
+    technical = (
+        np.select([(rsi >= 40) & (rsi <= 60), ((rsi >= 30) & (rsi < 40)) | ((rsi > 60) & (rsi <= 70)),
+                   rsi < 30, rsi > 70], [7, 10, 8, 2], 0)
+        + np.select([(macd > signal) & (hist > 0), macd > signal, (macd < signal) & (hist < 0),
+                     hist > prev['MACD_hist'].to_numpy()], [10, 8, 0, 5], 0)
+        + np.select([(bb_position >= 0.3) & (bb_position <= 0.7), bb_position < 0.2, bb_position > 0.8], [3, 5, 1], 0)
+    )
+    technical = np.minimum(25, technical)
+
+    up, down = close > prev_close, close < prev_close
+    volume_score = np.select([(avg_ratio > 1.5) & up, (avg_ratio > 1.2) & up, (avg_ratio < 0.8) & down,
+                              (avg_ratio > 1.2) & down], [20, 15, 10, 0], 8)
+
+    roc = latest['ROC'].to_numpy()
+    momentum = np.select([roc > 5, (roc >= 2) & (roc <= 5), (roc >= 0) & (roc < 2), (roc >= -2) & (roc < 0)],
+                         [10, 8, 5, 3], 0)
+
+    weights = {'trend': 0.30, 'volatility': 0.15, 'technical': 0.25, 'volume': 0.20, 'momentum': 0.10}
+    if market_type == 'US':
+        weights.update(trend=0.35, volatility=0.10, momentum=0.15)
+    elif market_type == 'HK':
+        weights.update(volatility=0.20, volume=0.25)
+
+    total = (trend * weights['trend'] / 0.30 + volatility_score * weights['volatility'] / 0.15
+             + technical * weights['technical'] / 0.25 + volume_score * weights['volume'] / 0.20
+             + momentum * weights['momentum'] / 0.10)
+    if market_type == 'US' and earnings_season:
+        total = 0.9 * total + 5
+    if adjustments:
+        total = total + latest.index.map(lambda code: adjustments.get(code, 0)).to_numpy(dtype=float)
+    total = np.maximum(0, np.minimum(100, np.round(total)))
+
+    return pd.DataFrame({
+        'score': total,
+        'trend': trend,
+        'volatility': volatility_score,
+        'technical': technical,
+        'volume': volume_score,
+        'momentum': momentum,
+        'close': close,
+        'prev_close': prev_close,
+        'ma_up': ma5 > ma20,
+        'rsi': rsi,
+        'macd_up': macd > signal,
+        'volume_ratio': latest['Volume_Ratio'].to_numpy()
+    }, index=latest.index)
+
+
+class BatchScoringEngine:
+    """批量评分：缓存批量读取、缺失部分并发补齐、指标和评分整表计算"""
+
+    def __init__(self, analyzer=None, task_workers: int = BATCH_SCORE_TASK_WORKERS):
+        # analyzer 用于投资建议文字和港股的A股联动调整
+        self.analyzer = analyzer
+        self.lock = threading.Lock()
+        self.stats = {'batches': 0, 'stocks': 0, 'history_hits': 0, 'history_fetched': 0, 'failed': 0}
+        # 后台任务线程池：并发数有上限，超出的任务排队
+        self._task_pool = ThreadPoolExecutor(max_workers=max(1, task_workers),
+                                             thread_name_prefix='batch-score')
+        # 未结束的后台任务：任务ID -> (Future, 取消标记)
+        self._tasks: Dict[str, Tuple[Future, threading.Event]] = {}
+
+    def _fetch_missing(self, stock_code: str, market_type: str, start_date: str, end_date: str,
+                       need_history: bool, need_info: bool) -> Tuple[Optional[pd.DataFrame], Optional[Dict]]:
+        """补齐单只股票缺失的日线和基本信息（在分析线程中执行）"""
+        history = info = None
+        if need_history:
+            history = data_service.get_stock_price_history(stock_code, market_type, start_date, end_date)
+            if history is None or len(history) == 0:
+                raise ValueError(f"获取股票 {stock_code} 数据为空")
+        if need_info:
+            try:
+                info = data_service.get_stock_basic_info(stock_code, market_type)
+            except Exception as e:
+                logger.warning(f"获取股票 {stock_code} 基本信息失败: {e}")
+        return history, info
+
+    def _fill_missing(self, items: List[tuple], progress: Optional[Callable[[int], None]],
+                      cancel: Optional[threading.Event] = None):
+        """缺失部分作为一个作业提交到共享分析线程池，等待期间上报进度；超时或任务取消时取消剩余部分"""
+        job = analysis_executor.submit('batch_score', self._fetch_missing, items)
+        deadline = time.time() + ANALYSIS_JOB_TIMEOUT
+        while not job.wait(0.5):
+            if progress:
+                progress(10 + int(job.progress()['progress'] * 0.8))
+            if cancel is not None and cancel.is_set():
+                logger.info("批量评分任务已取消，取消补齐剩余部分")
+                analysis_executor.cancel(job.job_id)
+                job.wait()
+            elif time.time() > deadline:
+                logger.warning(f"批量评分补齐数据超过 {ANALYSIS_JOB_TIMEOUT} 秒，取消剩余部分")
+                analysis_executor.cancel(job.job_id)
+                job.wait()
+        return job
+
+    def _hk_adjustments(self, data: pd.DataFrame) -> Dict[str, float]:
+        """港股A股联动调整（与 calculate_score 相同）：联动度高的股票按大陆市场情绪 ±5 分，情绪每批只取一次"""
+        linked = [code for code, df in data.groupby('stock_code', sort=False)
+                  if self.analyzer._check_a_share_linkage(df.reset_index(drop=True)) > 0.7]
+        if not linked:
+            return {}
+        adjustment = 5 if self.analyzer._get_mainland_market_sentiment() > 0 else -5
+        return {code: adjustment for code in linked}
+
+    @traced('batch_scoring.score_stocks')
+    def score_stocks(self, stock_codes: List[str], market_type: str = 'A',
+                     progress: Optional[Callable[[int], None]] = None,
+                     cancel: Optional[threading.Event] = None) -> Dict:
+        """
+        批量评分
+
+        返回 {'results': 按输入顺序的成功结果, 'errors': {代码: 失败原因}, 'stats': 本批缓存命中情况}
+        cancel 被设置时取消尚未补齐的股票（记为已取消）
+        """
+        start_time = time.time()
+        stock_codes = list(dict.fromkeys(stock_codes))
+        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        end_date = datetime.now().strftime('%Y-%m-%d')
+
+        # 1. 批量读取缓存
+        frames, history_misses = data_service.get_price_histories(stock_codes, market_type, start_date, end_date)
+        infos, info_misses = stock_cache_manager.batch_get_stock_basic_info(stock_codes, market_type)
+        hits = len(frames)
+        if progress:
+            progress(10)
+
+        # 2. 缺失部分并发补齐
+        errors = {}
+        history_missing, info_missing = set(history_misses), set(info_misses)
+        fetch_codes = [code for code in stock_codes if code in history_missing or code in info_missing]
+        if fetch_codes:
+            items = [(code, market_type, start_date, end_date, code in history_missing, code in info_missing)
+                     for code in fetch_codes]
+            job = self._fill_missing(items, progress, cancel)
+            for index, code in enumerate(fetch_codes):
+                if index in job.errors:
+                    errors[code] = job.errors[index]
+                    continue
+                if job.results[index] is None:
+                    if code in history_missing:
+                        errors[code] = '已取消'
+                    continue
+                history, info = job.results[index]
+                if history is not None:
+                    frames[code] = history
+                if info:
+                    infos[code] = info
+        if progress:
+            progress(90)
+
+        # 3. 整表计算指标和评分
+        usable = {}
+        for code in stock_codes:
+            df = frames.get(code)
+            if df is None:
+                continue
+            if len(df) < 2:
+                errors[code] = f"股票 {code} 数据不足，无法进行分析"
+            else:
+                usable[code] = df
+
+        results = []
+        if usable:
+            params = getattr(self.analyzer, 'params', None) or DEFAULT_PARAMS
+            data = compute_indicators(usable, params)
+            earnings_season = market_type == 'US' and self.analyzer is not None and self.analyzer._is_earnings_season()
+            adjustments = self._hk_adjustments(data) if market_type == 'HK' and self.analyzer is not None else None
+            scores = score_latest(data, market_type, earnings_season, adjustments)
+            results = self._build_reports(stock_codes, scores, infos)
+
+        elapsed = time.time() - start_time
+        with self.lock:
+            self.stats['batches'] += 1
+            self.stats['stocks'] += len(stock_codes)
+            self.stats['history_hits'] += hits
+            self.stats['history_fetched'] += len(frames) - hits
+            self.stats['failed'] += len(errors)
+        set_span_attribute('stocks', len(stock_codes))
+        set_span_attribute('history_hits', hits)
+        logger.info(f"批量评分 {len(stock_codes)} 只: 缓存命中 {hits}，补齐 {len(frames) - hits}，"
+                    f"失败 {len(errors)}，耗时 {elapsed:.3f} 秒")
+        if progress:
+            progress(100)
+        return {
+            'results': results,
+            'errors': errors,
+            'stats': {'cache_hits': hits, 'fetched': len(frames) - hits, 'elapsed': round(elapsed, 3)}
+        }
+
+    def _build_reports(self, stock_codes: List[str], scores: pd.DataFrame, infos: Dict[str, Dict]) -> List[Dict]:
+        """生成与 quick_analyze_stock 相同字段的报告，按输入顺序"""
+        recommendations = {}
+        analysis_date = datetime.now().strftime('%Y-%m-%d')
+        reports = []
+        rows = scores.to_dict('index')
+        for code in stock_codes:
+            row = rows.get(code)
+            if row is None:
+                continue
+            score = row['score']
+            if score not in recommendations:
+                recommendations[score] = self.analyzer.get_recommendation(score) if self.analyzer else None
+            info = infos.get(code) or {}
+            reports.append({
+                'stock_code': code,
+                'stock_name': info.get('stock_name', '未知'),
+                'industry': info.get('industry', '未知'),
+                'analysis_date': analysis_date,
+                'score': score,
+                'score_details': {'trend': row['trend'], 'volatility': row['volatility'],
+                                  'technical': row['technical'], 'volume': row['volume'],
+                                  'momentum': row['momentum'], 'total': score},
+                'price': float(row['close']),
+                'price_change': float((row['close'] - row['prev_close']) / row['prev_close'] * 100),
+                'ma_trend': 'UP' if row['ma_up'] else 'DOWN',
+                'rsi': float(row['rsi']),
+                'macd_signal': 'BUY' if row['macd_up'] else 'SELL',
+                'volume_status': 'HIGH' if row['volume_ratio'] > 1.5 else 'NORMAL',
+                'recommendation': recommendations[score]
+            })
+        return reports
+
+    def start_task(self, task_manager, stock_codes: List[str], market_type: str,
+                   finalize: Callable[[Dict], Dict]) -> str:
+        """
+        作为后台任务执行批量评分，立即返回任务ID
+
+        任务在有界线程池中排队执行，进度和结果写入 task_manager（与 /api/v1/tasks 共用），
+        finalize 把评分结果转换为接口返回的数据
+        """
+        task_id, _ = task_manager.create_task('batch_score', stock_codes=stock_codes, market_type=market_type)
+        cancel = threading.Event()
+
+        def run():
+            if cancel.is_set():
+                task_manager.update_task(task_id, status='cancelled')
+                return
+            start_time = time.time()
+            task_manager.update_task(task_id, status='running', progress=0)
+            try:
+                scored = self.score_stocks(stock_codes, market_type, cancel=cancel,
+                                           progress=lambda p: task_manager.update_task(task_id, progress=p))
+                if cancel.is_set():
+                    task_manager.update_task(task_id, status='cancelled',
+                                             processing_time=round(time.time() - start_time, 3))
+                    return
+                task_manager.update_task(task_id, status='completed', progress=100, result=finalize(scored),
+                                         processing_time=round(time.time() - start_time, 3))
+            except Exception as e:
+                logger.error(f"批量评分任务 {task_id} 失败: {e}")
+                task_manager.update_task(task_id, status='failed', error=str(e))
+
+        def forget(_):
+            with self.lock:
+                self._tasks.pop(task_id, None)
+
+        with self.lock:
+            # 在提交方的上下文中执行，保留追踪 span 和上游令牌预算
+            future = self._task_pool.submit(contextvars.copy_context().run, run)
+            self._tasks[task_id] = (future, cancel)
+        future.add_done_callback(forget)
+        return task_id
+
+    def cancel_task(self, task_manager, task_id: str) -> bool:
+        """取消后台任务：排队中的直接取消，执行中的停止补齐剩余股票；任务不存在或已结束时返回 False"""
+        with self.lock:
+            entry = self._tasks.get(task_id)
+        if entry is None:
+            return False
+        future, cancel = entry
+        cancel.set()
+        if future.cancel():
+            task_manager.update_task(task_id, status='cancelled')
+        logger.info(f"批量评分任务 {task_id} 已取消")
+        return True
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {**self.stats, 'active_tasks': len(self._tasks)}
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 离线端到端基准测试
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+使用 ReplayProvider 代替 AKShare，在进程内通过 Flask 测试客户端压测：
+- /analyze               单只股票快速分析
+- /api/start_market_scan 市场扫描（提交任务并轮询到完成）
+- /api/v1/stocks/batch-score 批量评分
+- /api/portfolio_risk    组合风险
+
+上游延迟和失败由种子决定，每次请求使用未分析过的股票代码（冷路径），
+结果与基线比较，p95 或吞吐量超出容差即判定为性能回退并以非零状态退出。
+
+--startup 模式在全新子进程中分别以延迟初始化和立即初始化导入 web_server，
+统计导入耗时、导入后的线程数和首个请求耗时。
+
+用法：
+    python benchmark_suite.py --iterations 10 --concurrency 4 --save-baseline benchmark_baseline.json
+    python benchmark_suite.py --baseline benchmark_baseline.json --tolerance 0.25
+    python benchmark_suite.py --startup --iterations 3
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from data_provider import ReplayProvider, set_data_provider
+from log_pipeline import get_log_stats
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ('analyze', 'market_scan', 'batch_score', 'portfolio_risk')
+SCAN_SIZE = 20
+BATCH_SIZE = 10
+PORTFOLIO_SIZE = 5
+SCAN_TIMEOUT = 120
+# p95 比较时允许的绝对波动（毫秒），避免极快场景因计时噪声误报
+ABSOLUTE_SLACK_MS = 25.0
+
+
+class BenchmarkSuite:
+    """离线回放基准测试"""
+
+    def __init__(self, iterations: int = 10, concurrency: int = 4, latency_ms: float = 20.0,
+                 jitter_ms: float = 10.0, failure_rate: float = 0.0, seed: int = 42, data_dir: str = None):
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.provider = ReplayProvider(data_dir, latency_ms, jitter_ms, failure_rate, seed)
+        self._code_lock = threading.Lock()
+        self._next_code = 0
+        self.app = None
+        self.api_key = None
+
+    def setup(self):
+        """切换到回放数据源并加载 Web 应用"""
+        set_data_provider(self.provider)
+
+        import web_server
+        from auth_middleware import api_key_manager
+        from data_service import data_service
+        from rate_limiter import rate_limiter
+
+        # 回放模式下失败是注入的，重试无需真正等待
+        data_service.retry_backoff = 0.01
+        self.api_key = api_key_manager.generate_api_key('enterprise', ['all'])
+        # 端点级限流不是基准测试对象
+        for config in rate_limiter.endpoint_limits.values():
+            config['requests'] = max(config['requests'], 100000)
+        self.app = web_server.app
+
+    def _fresh_codes(self, count: int) -> List[str]:
+        """分配从未请求过的股票代码，保证每次都走冷路径"""
+        with self._code_lock:
+            start = self._next_code
+            self._next_code += count
+        return [f'{600000 + i:06d}' for i in range(start, start + count)]
+
+    # ==================== 场景 ====================
+
+    def _analyze(self, client) -> bool:
+        response = client.post('/analyze', json={'stock_codes': self._fresh_codes(1), 'market_type': 'A'})
+        body = response.get_json() or {}
+        return response.status_code == 200 and all('error' not in r for r in body.get('results', []))
+
+    def _market_scan(self, client) -> bool:
+        response = client.post('/api/start_market_scan', json={
+            'stock_list': self._fresh_codes(SCAN_SIZE), 'min_score': 0, 'market_type': 'A'})
+        if response.status_code != 200:
+            return False
+        task_id = response.get_json()['task_id']
+        deadline = time.time() + SCAN_TIMEOUT
+        while time.time() < deadline:
+            status = client.get(f'/api/scan_status/{task_id}').get_json() or {}
+            if status.get('status') == 'completed':
+                return True
+            if status.get('status') == 'failed':
+                return False
+            time.sleep(0.02)
+        return False
+
+    def _batch_score(self, client) -> bool:
+        response = client.post('/api/v1/stocks/batch-score', headers={'X-API-Key': self.api_key},
+                               json={'stock_codes': self._fresh_codes(BATCH_SIZE), 'market_type': 'A'})
+        return response.status_code == 200
+
+    def _portfolio_risk(self, client) -> bool:
+        portfolio = [{'stock_code': code, 'weight': 20, 'market_type': 'A'}
+                     for code in self._fresh_codes(PORTFOLIO_SIZE)]
+        response = client.post('/api/portfolio_risk', json={'portfolio': portfolio})
+        body = response.get_json() or {}
+        return response.status_code == 200 and 'error' not in body
+
+    # ==================== 执行 ====================
+
+    def run_scenario(self, name: str, func: Callable) -> Dict:
+        """并发执行一个场景并统计延迟分布"""
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def one_call():
+            nonlocal errors
+            client = self.app.test_client()
+            start_time = time.perf_counter()
+            try:
+                ok = func(client)
+            except Exception as e:
+                logger.warning(f"场景 {name} 请求异常: {e}")
+                ok = False
+            elapsed = (time.perf_counter() - start_time) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors += 1
+
+        log_before = get_log_stats()
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for future in [executor.submit(one_call) for _ in range(self.iterations)]:
+                future.result()
+        wall = time.perf_counter() - wall_start
+        log_after = get_log_stats()
+
+        values = np.array(latencies)
+        return {
+            **_log_volume(log_before, log_after),
+            'requests': len(values),
+            'errors': errors,
+            'throughput_rps': round(len(values) / wall, 3) if wall > 0 else 0.0,
+            'p50_ms': round(float(np.percentile(values, 50)), 2),
+            'p95_ms': round(float(np.percentile(values, 95)), 2),
+            'max_ms': round(float(values.max()), 2),
+            'mean_ms': round(float(values.mean()), 2)
+        }
+
+    def run(self, scenarios=SCENARIOS) -> Dict:
+        if self.app is None:
+            self.setup()
+        funcs = {
+            'analyze': self._analyze,
+            'market_scan': self._market_scan,
+            'batch_score': self._batch_score,
+            'portfolio_risk': self._portfolio_risk
+        }
+        results = {}
+        for name in scenarios:
+            print(f"▶ 运行场景 {name} ({self.iterations} 次, 并发 {self.concurrency})")
+            results[name] = self.run_scenario(name, funcs[name])
+            print(f"  {results[name]}")
+
+        return {
+            'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'config': {
+                'iterations': self.iterations,
+                'concurrency': self.concurrency,
+                'latency_ms': self.provider.latency_ms,
+                'jitter_ms': self.provider.jitter_ms,
+                'failure_rate': self.provider.failure_rate,
+                'seed': self.provider.seed
+            },
+            'scenarios': results,
+            'provider': self.provider.get_stats()
+        }
+
+
+# 在子进程中执行：导入 web_server 并发出第一个请求，结果以 JSON 输出到最后一行
+_STARTUP_PROBE = '''
+import json, threading, time
+start = time.perf_counter()
+import web_server
+import_ms = (time.perf_counter() - start) * 1000
+threads = threading.active_count()
+client = web_server.app.test_client()
+start = time.perf_counter()
+response = client.post('/analyze', json={'stock_codes': ['600000'], 'market_type': 'A'})
+first_request_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({'import_ms': import_ms, 'threads_after_import': threads,
+                  'first_request_ms': first_request_ms, 'status': response.status_code}))
+'''
+
+
+def measure_startup(lazy: bool, runs: int = 3, timeout: int = 180) -> Dict:
+    """在全新子进程中测量冷启动，取多次运行的中位数"""
+    env = dict(os.environ, LAZY_SERVICES='true' if lazy else 'false', DATA_PROVIDER='replay')
+    samples = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-c', _STARTUP_PROBE], env=env, capture_output=True,
+                                   text=True, timeout=timeout, cwd=os.path.dirname(os.path.abspath(__file__)))
+        wall_ms = (time.perf_counter() - start_time) * 1000
+        if completed.returncode != 0:
+            raise RuntimeError(f"启动测量子进程失败: {completed.stderr[-2000:]}")
+        sample = json.loads(completed.stdout.strip().splitlines()[-1])
+        sample['process_ms'] = wall_ms
+        samples.append(sample)
+
+    def median(key):
+        return round(float(np.median([s[key] for s in samples])), 2)
+
+    return {
+        'runs': runs,
+        'import_ms': median('import_ms'),
+        'first_request_ms': median('first_request_ms'),
+        'process_ms': median('process_ms'),
+        'threads_after_import': max(s['threads_after_import'] for s in samples),
+        'first_request_ok': all(s['status'] == 200 for s in samples)
+    }
+
+
+def run_startup_benchmark(runs: int = 3) -> Dict:
+    """对比延迟初始化与立即初始化的冷启动"""
+    results = {}
+    for mode, lazy in (('lazy', True), ('eager', False)):
+        print(f"▶ 测量冷启动 {mode} ({runs} 次)")
+        results[mode] = measure_startup(lazy, runs)
+        print(f"  {results[mode]}")
+    if results['lazy']['import_ms'] > 0:
+        results['import_speedup'] = round(results['eager']['import_ms'] / results['lazy']['import_ms'], 2)
+    return {
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'startup': results
+    }
+
+
+def _log_volume(before: Dict, after: Dict) -> Dict:
+    """场景期间日志管道的放行和抑制条数"""
+    if not after.get('enabled'):
+        return {}
+    return {
+        'log_records': after['passed'] - before['passed'],
+        'log_suppressed': (after['sampled_out'] + after['rate_limited'] + after['queue_dropped']
+                           - before['sampled_out'] - before['rate_limited'] - before['queue_dropped']),
+        'log_avg_enqueue_us': after['avg_enqueue_us']
+    }
+
+
+def compare_with_baseline(results: Dict, baseline: Dict, tolerance: float = 0.25) -> List[str]:
+    """与基线比较，返回回退描述列表"""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        p95_limit = base['p95_ms'] * (1 + tolerance) + ABSOLUTE_SLACK_MS
+        if current['p95_ms'] > p95_limit:
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms 超过基线 {base['p95_ms']}ms 的容差上限 {p95_limit:.1f}ms")
+        if current['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐量 {current['throughput_rps']}/s 低于基线 {base['throughput_rps']}/s")
+        if current['errors'] > base['errors']:
+            regressions.append(f"{name}: 错误数 {current['errors']} 多于基线 {base['errors']}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='离线回放端到端基准测试')
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help='录制数据目录，缺省使用模拟数据')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--baseline', help='基线结果文件，超出容差时返回非零状态')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save-baseline', help='把本次结果保存为基线')
+    parser.add_argument('--output', help='把本次结果保存为JSON')
+    parser.add_argument('--startup', action='store_true', help='只测量 web_server 冷启动（延迟/立即初始化对比）')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.startup:
+        print("🚀 冷启动基准测试")
+        print("=" * 40)
+        results = run_startup_benchmark(args.iterations)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"结果已保存: {args.output}")
+        return 0
+
+    suite = BenchmarkSuite(args.iterations, args.concurrency, args.latency_ms, args.jitter_ms,
+                           args.failure_rate, args.seed, args.data_dir)
+
+    print("🚀 离线回放基准测试")
+    print("=" * 40)
+    results = suite.run([s.strip() for s in args.scenarios.split(',') if s.strip()])
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"结果已保存: {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("❌ 检测到性能回退:")
+            for item in regressions:
+                print(f"  - {item}")
+            return 1
+        print("✅ 未检测到性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
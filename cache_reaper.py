@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+过期缓存增量清理器
+开发者：熊猫大侠
+版本：v1.0.0
+功能：按 expires_at 索引分块删除过期缓存，每块独立事务并在块之间让出，
+      避免长时间锁表；支持按交易日历在收盘后调度执行
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from database import (
+    Session, USE_DATABASE,
+    StockBasicInfo, StockPriceHistory, StockRealtimeData,
+    FinancialData, CapitalFlowData
+)
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 默认清理的缓存表：(统计名称, 模型, 过期判断列)
+DEFAULT_REAP_TARGETS = [
+    ('realtime', StockRealtimeData, 'expires_at'),
+    ('basic_info', StockBasicInfo, 'expires_at'),
+    ('financial', FinancialData, 'expires_at'),
+    ('capital_flow', CapitalFlowData, 'expires_at'),
+]
+
+
+class ExpiredCacheReaper:
+    """过期缓存增量清理器
+
+    每次只按索引列取出一小块过期记录的主键并删除，提交后休眠片刻再处理下一块，
+    使前台查询在两块之间总能拿到锁。
+    """
+
+    def __init__(self, session_factory: Optional[Callable] = None,
+                 chunk_size: int = 500, pause_seconds: float = 0.05,
+                 max_seconds_per_run: float = 60.0):
+        self.logger = logging.getLogger(__name__)
+        self.session_factory = session_factory or Session
+        self.chunk_size = chunk_size
+        self.pause_seconds = pause_seconds
+        self.max_seconds_per_run = max_seconds_per_run
+        self.targets: List[Tuple[str, object, str]] = list(DEFAULT_REAP_TARGETS)
+
+        self.lock = threading.Lock()
+        self._worker = None
+        self._stop_event = threading.Event()
+        self._truncated = False
+        self.last_run_stats: Dict = {}
+        self.last_run_date = None
+
+    def reap_table(self, model, column_name: str = 'expires_at',
+                   cutoff: Optional[datetime] = None,
+                   deadline: Optional[float] = None) -> Tuple[int, int]:
+        """分块删除单个表中的过期记录
+
+        Returns:
+            (删除条数, 处理块数)
+        """
+        cutoff = cutoff or datetime.now()
+        column = getattr(model, column_name)
+        deleted_total = 0
+        chunks = 0
+        self._truncated = False
+
+        while not self._stop_event.is_set():
+            if deadline is not None and time.time() >= deadline:
+                self.logger.info(f"清理 {model.__tablename__} 达到单次时间上限，剩余部分下次继续")
+                self._truncated = True
+                break
+
+            session = self.session_factory()
+            try:
+                # 通过 expires_at 索引定位一小块过期主键
+                ids = [row[0] for row in session.query(model.id).filter(
+                    column < cutoff
+                ).order_by(column).limit(self.chunk_size).all()]
+
+                if not ids:
+                    break
+
+                deleted = session.query(model).filter(
+                    model.id.in_(ids)
+                ).delete(synchronize_session=False)
+                session.commit()
+
+                deleted_total += deleted
+                chunks += 1
+            except Exception as e:
+                session.rollback()
+                self.logger.error(f"分块清理 {model.__tablename__} 失败: {e}")
+                break
+            finally:
+                session.close()
+
+            if len(ids) < self.chunk_size:
+                break
+
+            # 块之间让出，避免前台查询长时间等待
+            if self.pause_seconds > 0:
+                time.sleep(self.pause_seconds)
+
+        return deleted_total, chunks
+
+    def run_once(self, cutoff: Optional[datetime] = None) -> Dict:
+        """对所有目标表执行一轮增量清理并返回统计"""
+        if not self.lock.acquire(blocking=False):
+            self.logger.info("已有清理任务在执行，跳过本次")
+            return {}
+
+        try:
+            start_time = time.time()
+            deadline = start_time + self.max_seconds_per_run if self.max_seconds_per_run else None
+            stats = {'tables': {}, 'total_deleted': 0, 'chunks': 0, 'truncated': False}
+
+            for name, model, column_name in self.targets:
+                table_start = time.time()
+                deleted, chunks = self.reap_table(model, column_name, cutoff, deadline)
+                table_elapsed = time.time() - table_start
+
+                stats['tables'][name] = {
+                    'deleted': deleted,
+                    'chunks': chunks,
+                    'elapsed': round(table_elapsed, 3),
+                    'rows_per_sec': round(deleted / table_elapsed, 1) if table_elapsed > 0 else 0.0
+                }
+                stats['total_deleted'] += deleted
+                stats['chunks'] += chunks
+                stats['truncated'] = stats['truncated'] or self._truncated
+
+            elapsed = time.time() - start_time
+            stats['elapsed'] = round(elapsed, 3)
+            stats['rows_per_sec'] = round(stats['total_deleted'] / elapsed, 1) if elapsed > 0 else 0.0
+            stats['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+            self.last_run_stats = stats
+            if stats['total_deleted'] > 0:
+                detail = ", ".join(f"{k}{v['deleted']}条" for k, v in stats['tables'].items())
+                self.logger.info(f"增量清理过期缓存: {detail}, "
+                                 f"共{stats['chunks']}块, {stats['rows_per_sec']}行/秒")
+            return stats
+        finally:
+            self.lock.release()
+
+    def is_after_close(self, now: Optional[datetime] = None) -> bool:
+        """是否处于收盘后（或非交易日）的清理窗口"""
+        from trading_calendar import trading_calendar
+
+        now = now or datetime.now()
+        if not trading_calendar.is_trading_day(now.date()):
+            return True
+        # 15:30 收盘结算之后，或次日开盘前
+        minutes = now.hour * 60 + now.minute
+        return minutes >= 15 * 60 + 30 or minutes < 9 * 60
+
+    def start_background(self, interval_seconds: int = 3600, after_close_only: bool = True):
+        """启动后台清理线程
+
+        Args:
+            interval_seconds: 检查间隔
+            after_close_only: 为 True 时交易日只在收盘后执行，且每天最多一次完整清理
+        """
+        if not USE_DATABASE:
+            return
+        if self._worker and self._worker.is_alive():
+            return
+
+        self._stop_event.clear()
+
+        def worker():
+            while not self._stop_event.wait(interval_seconds):
+                try:
+                    if after_close_only:
+                        if not self.is_after_close():
+                            continue
+                        today = datetime.now().date()
+                        if self.last_run_date == today and not self.last_run_stats.get('truncated'):
+                            continue
+                        self.last_run_date = today
+                    self.run_once()
+                except Exception as e:
+                    self.logger.error(f"后台缓存清理失败: {e}")
+
+        self._worker = threading.Thread(target=worker, daemon=True, name='cache-reaper')
+        self._worker.start()
+        self.logger.info("过期缓存增量清理线程已启动")
+
+    def stop(self):
+        """停止后台清理"""
+        self._stop_event.set()
+
+    def get_stats(self) -> Dict:
+        """获取最近一次清理统计"""
+        return dict(self.last_run_stats)
+
+
+# 全局清理器实例
+cache_reaper = ExpiredCacheReaper()
+
+
+def reap_expired_cache(cutoff: Optional[datetime] = None) -> Dict:
+    """执行一轮增量过期缓存清理（便捷函数）"""
+    if not USE_DATABASE:
+        return {}
+    return cache_reaper.run_once(cutoff)
+
+
+def reap_old_price_history(keep_days: int = 30) -> int:
+    """分块清理超过保留期的历史价格缓存（便捷函数）"""
+    if not USE_DATABASE:
+        return 0
+    cutoff = datetime.now() - timedelta(days=keep_days)
+    deleted, _ = cache_reaper.reap_table(StockPriceHistory, 'created_at', cutoff)
+    return deleted
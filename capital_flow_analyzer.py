@@ -1,13 +1,37 @@
 # capital_flow_analyzer.py
 import logging
 import traceback
-import akshare as ak
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
 # 导入新的数据访问层
 from data_service import data_service
+from data_provider import get_data_provider
+from frame_schema import convert_frame, get_schema, to_records
+from fund_flow_store import fund_flow_store
+
+# 快照列 -> 排名接口输出字段
+RANK_OUTPUT_FIELDS = {
+    'price': 'price',
+    'change_pct': 'change_percent',
+    'main_net_flow': 'main_net_inflow',
+    'main_net_pct': 'main_net_inflow_percent',
+    'super_large_net_flow': 'super_large_net_inflow',
+    'super_large_net_pct': 'super_large_net_inflow_percent',
+    'large_net_flow': 'large_net_inflow',
+    'large_net_pct': 'large_net_inflow_percent',
+    'medium_net_flow': 'medium_net_inflow',
+    'medium_net_pct': 'medium_net_inflow_percent',
+    'small_net_flow': 'small_net_inflow',
+    'small_net_pct': 'small_net_inflow_percent',
+}
+
+
+def _tiered(values, thresholds, points):
+    """按降序阈值分档计分，超过第一个阈值得第一档分数，NaN 得0分"""
+    values = np.asarray(values, dtype=float)
+    return np.select([values > t for t in thresholds], points, default=0)
 
 
 class CapitalFlowAnalyzer:
@@ -54,7 +78,7 @@ class CapitalFlowAnalyzer:
             self.logger.info("获取股票代码名称映射...")
 
             # 尝试获取A股股票基本信息
-            stock_info = self._retry_api_call(ak.stock_info_a_code_name)
+            stock_info = self._retry_api_call(get_data_provider().stock_info_a_code_name)
 
             # 创建代码到名称的映射
             name_mapping = {}
@@ -115,27 +139,10 @@ class CapitalFlowAnalyzer:
                     return cached_data
 
             # 从akshare获取数据（带重试机制）
-            concept_data = self._retry_api_call(ak.stock_fund_flow_concept, symbol=period)
+            concept_data = self._retry_api_call(get_data_provider().stock_fund_flow_concept, symbol=period)
 
             # 处理数据
-            result = []
-            for _, row in concept_data.iterrows():
-                try:
-                    # 列名可能有所不同，所以我们使用灵活的方法
-                    item = {
-                        "rank": int(row.get("序号", 0)),
-                        "sector": row.get("行业", ""),
-                        "company_count": int(row.get("公司家数", 0)),
-                        "sector_index": float(row.get("行业指数", 0)),
-                        "change_percent": self._parse_percent(row.get("阶段涨跌幅", "0%")),
-                        "inflow": float(row.get("流入资金", 0)),
-                        "outflow": float(row.get("流出资金", 0)),
-                        "net_flow": float(row.get("净额", 0))
-                    }
-                    result.append(item)
-                except Exception as e:
-                    # self.logger.warning(f"Error processing row in concept fund flow: {str(e)}")
-                    continue
+            result = to_records(concept_data, get_schema('stock_fund_flow_concept'))
 
             # 缓存结果
             self.data_cache[cache_key] = (datetime.now(), result)
@@ -152,50 +159,16 @@ class CapitalFlowAnalyzer:
         try:
             self.logger.info(f"Getting individual fund flow ranking for period: {period}")
 
-            # 检查缓存
-            cache_key = f"individual_fund_flow_rank_{period}"
-            if cache_key in self.data_cache:
-                cache_time, cached_data = self.data_cache[cache_key]
-                # 如果在最近一小时内有缓存数据，则返回缓存数据
-                if (datetime.now() - cache_time).total_seconds() < 3600:
-                    return cached_data
-
-            # 从akshare获取数据
-            stock_data = ak.stock_individual_fund_flow_rank(indicator=period)
-
-            # 处理数据
-            result = []
-            for _, row in stock_data.iterrows():
-                try:
-                    # 根据不同时间段设置列名前缀
-                    period_prefix = "" if period == "今日" else f"{period}"
-
-                    item = {
-                        "rank": int(row.get("序号", 0)),
-                        "code": row.get("代码", ""),
-                        "name": row.get("名称", ""),
-                        "price": float(row.get("最新价", 0)),
-                        "change_percent": float(row.get(f"{period_prefix}涨跌幅", 0)),
-                        "main_net_inflow": float(row.get(f"{period_prefix}主力净流入-净额", 0)),
-                        "main_net_inflow_percent": float(row.get(f"{period_prefix}主力净流入-净占比", 0)),
-                        "super_large_net_inflow": float(row.get(f"{period_prefix}超大单净流入-净额", 0)),
-                        "super_large_net_inflow_percent": float(row.get(f"{period_prefix}超大单净流入-净占比", 0)),
-                        "large_net_inflow": float(row.get(f"{period_prefix}大单净流入-净额", 0)),
-                        "large_net_inflow_percent": float(row.get(f"{period_prefix}大单净流入-净占比", 0)),
-                        "medium_net_inflow": float(row.get(f"{period_prefix}中单净流入-净额", 0)),
-                        "medium_net_inflow_percent": float(row.get(f"{period_prefix}中单净流入-净占比", 0)),
-                        "small_net_inflow": float(row.get(f"{period_prefix}小单净流入-净额", 0)),
-                        "small_net_inflow_percent": float(row.get(f"{period_prefix}小单净流入-净占比", 0))
-                    }
-                    result.append(item)
-                except Exception as e:
-                    self.logger.warning(f"Error processing row in individual fund flow rank: {str(e)}")
-                    continue
+            # 全市场快照由 fund_flow_store 统一获取和缓存，与批量评分共用
+            snapshot = fund_flow_store.get_snapshot(period)
+            ranked = snapshot.sort_values('main_net_flow', ascending=False, na_position='last').reset_index()
 
-            # 缓存结果
-            self.data_cache[cache_key] = (datetime.now(), result)
+            frame = pd.DataFrame({'rank': np.arange(1, len(ranked) + 1), 'code': ranked['stock_code'],
+                                  'name': ranked['stock_name'].fillna('')})
+            for column, field in RANK_OUTPUT_FIELDS.items():
+                frame[field] = ranked[column].fillna(0.0).astype(float)
 
-            return result
+            return frame.to_dict('records')
         except Exception as e:
             self.logger.error(f"Error getting individual fund flow ranking: {str(e)}")
             self.logger.error(traceback.format_exc())
@@ -224,49 +197,27 @@ class CapitalFlowAnalyzer:
                 else:
                     market_type = "sh"  # Default to Shanghai
 
-            # 从akshare获取数据
-            flow_data = ak.stock_individual_fund_flow(stock=stock_code, market=market_type)
+            # 从上游获取数据
+            flow_data = get_data_provider().stock_individual_fund_flow(stock=stock_code, market=market_type)
 
             # 处理数据
+            flows = convert_frame(flow_data, get_schema('stock_individual_fund_flow'))
             result = {
                 "stock_code": stock_code,
-                "data": []
+                "data": flows.to_dict('records')
             }
 
-            for _, row in flow_data.iterrows():
-                try:
-                    item = {
-                        "date": row.get("日期", ""),
-                        "price": float(row.get("收盘价", 0)),
-                        "change_percent": float(row.get("涨跌幅", 0)),
-                        "main_net_inflow": float(row.get("主力净流入-净额", 0)),
-                        "main_net_inflow_percent": float(row.get("主力净流入-净占比", 0)),
-                        "super_large_net_inflow": float(row.get("超大单净流入-净额", 0)),
-                        "super_large_net_inflow_percent": float(row.get("超大单净流入-净占比", 0)),
-                        "large_net_inflow": float(row.get("大单净流入-净额", 0)),
-                        "large_net_inflow_percent": float(row.get("大单净流入-净占比", 0)),
-                        "medium_net_inflow": float(row.get("中单净流入-净额", 0)),
-                        "medium_net_inflow_percent": float(row.get("中单净流入-净占比", 0)),
-                        "small_net_inflow": float(row.get("小单净流入-净额", 0)),
-                        "small_net_inflow_percent": float(row.get("小单净流入-净占比", 0))
-                    }
-                    result["data"].append(item)
-                except Exception as e:
-                    self.logger.warning(f"Error processing row in individual fund flow: {str(e)}")
-                    continue
-
             # 计算汇总统计数据
             if result["data"]:
                 # 最近数据 (最近10天)
-                recent_data = result["data"][:min(10, len(result["data"]))]
+                recent = flows.head(10)
 
                 result["summary"] = {
-                    "recent_days": len(recent_data),
-                    "total_main_net_inflow": sum(item["main_net_inflow"] for item in recent_data),
-                    "avg_main_net_inflow_percent": np.mean(
-                        [item["main_net_inflow_percent"] for item in recent_data]),
-                    "positive_days": sum(1 for item in recent_data if item["main_net_inflow"] > 0),
-                    "negative_days": sum(1 for item in recent_data if item["main_net_inflow"] <= 0)
+                    "recent_days": len(recent),
+                    "total_main_net_inflow": float(recent["main_net_inflow"].sum()),
+                    "avg_main_net_inflow_percent": float(recent["main_net_inflow_percent"].mean()),
+                    "positive_days": int((recent["main_net_inflow"] > 0).sum()),
+                    "negative_days": int((recent["main_net_inflow"] <= 0).sum())
                 }
 
             # Cache the result
@@ -296,9 +247,9 @@ class CapitalFlowAnalyzer:
             # 尝试多种API接口获取数据
             api_methods = [
                 # 方法1：使用行业板块成分股接口
-                lambda: self._retry_api_call(ak.stock_board_industry_cons_em, symbol=sector),
+                lambda: self._retry_api_call(get_data_provider().stock_board_industry_cons_em, symbol=sector),
                 # 方法2：尝试概念板块成分股接口
-                lambda: self._retry_api_call(ak.stock_board_concept_cons_em, symbol=sector)
+                lambda: self._retry_api_call(get_data_provider().stock_board_concept_cons_em, symbol=sector)
             ]
 
             for i, api_method in enumerate(api_methods):
@@ -317,32 +268,16 @@ class CapitalFlowAnalyzer:
                         self.logger.warning(f"API方法 {i+1} 返回数据缺少必要列: {stocks.columns.tolist()}")
                         continue
 
-                    # 处理数据
-                    result = []
-                    processed_count = 0
-                    for _, row in stocks.iterrows():
-                        try:
-                            # 获取股票代码和名称
-                            stock_code = str(row.get("代码", "")).strip()
-                            stock_name = str(row.get("名称", "")).strip()
-
-                            # 验证股票代码格式
-                            if not stock_code or len(stock_code) != 6 or not stock_code.isdigit():
-                                continue
-
-                            item = {
-                                "code": stock_code,
-                                "name": stock_name if stock_name else f"股票{stock_code}",
-                                "price": float(row.get("最新价", 0)) if pd.notna(row.get("最新价")) else 0.0,
-                                "change_percent": float(row.get("涨跌幅", 0)) if pd.notna(row.get("涨跌幅")) else 0.0,
-                                "main_net_inflow": 0,  # 资金流向数据需要单独获取
-                                "main_net_inflow_percent": 0
-                            }
-                            result.append(item)
-                            processed_count += 1
-                        except Exception as e:
-                            self.logger.warning(f"处理股票数据行时出错: {str(e)}")
-                            continue
+                    # 处理数据：只保留6位数字代码，名称缺失时用代码代替
+                    frame = convert_frame(stocks, get_schema('stock_board_cons_em'))
+                    frame["code"] = frame["code"].str.strip()
+                    frame["name"] = frame["name"].str.strip()
+                    frame = frame[frame["code"].str.fullmatch(r"\d{6}")]
+                    # 资金流向数据需要单独获取
+                    frame = frame.assign(name=frame["name"].where(frame["name"] != "", "股票" + frame["code"]),
+                                         main_net_inflow=0, main_net_inflow_percent=0)
+                    result = frame.to_dict('records')
+                    processed_count = len(result)
 
                     if result:
                         self.logger.info(f"成功从API方法 {i+1} 获取到 {processed_count} 只 '{sector}' 成分股")
@@ -491,14 +426,57 @@ class CapitalFlowAnalyzer:
                 "error": str(e)
             }
 
-    def _parse_percent(self, percent_str):
-        """将百分比字符串转换为浮点数"""
+    def batch_calculate_capital_flow_scores(self, stock_codes, period="10日"):
+        """基于全市场资金流向快照批量计算评分
+
+        整个列表只需要一次上游调用。快照只有周期汇总、没有逐日明细，
+        因此单只评分中的"净流入天数占比"在这里换成该指标在全市场中的分位数，
+        阈值和分值保持一致。
+
+        Returns:
+            dict: {股票代码: 与 calculate_capital_flow_score 结构相同的评分}
+        """
+        empty = {"total": 0, "main_force": 0, "large_order": 0, "small_order": 0, "details": {}}
         try:
-            if isinstance(percent_str, str) and '%' in percent_str:
-                return float(percent_str.replace('%', ''))
-            return float(percent_str)
-        except (ValueError, TypeError):
-            return 0.0
+            snapshot = fund_flow_store.get_snapshot(period)
+            trade_date = fund_flow_store.get_trade_date(period)
+
+            # 分位数在全市场范围内计算，与评分列表大小无关
+            percentile = snapshot[['main_net_pct', 'super_large_net_pct', 'large_net_pct',
+                                   'medium_net_pct', 'small_net_pct']].rank(pct=True)
+            codes = [str(code).split('.')[0].zfill(6) for code in stock_codes]
+            frame = snapshot.reindex(codes)
+            percentile = percentile.reindex(codes)
+
+            ratio = (0.7, 0.5, 0.3)
+            main_force = (_tiered(frame['main_net_pct'], (3, 1, 0), (20, 15, 10))
+                          + _tiered(percentile['main_net_pct'], ratio, (20, 15, 10)))
+            large_order = (_tiered(percentile['super_large_net_pct'], ratio, (15, 10, 5))
+                           + _tiered(percentile['large_net_pct'], ratio, (15, 10, 5)))
+            small_order = (_tiered(percentile['medium_net_pct'], ratio, (15, 10, 5))
+                           + _tiered(percentile['small_net_pct'], ratio, (15, 10, 5)))
+            total = main_force + large_order + small_order
+
+            available = frame['main_net_pct'].notna().to_numpy()
+            details = frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+            results = {}
+            for i, (original, code) in enumerate(zip(stock_codes, codes)):
+                if not available[i]:
+                    results[original] = dict(empty)
+                    continue
+                results[original] = {
+                    "total": int(total[i]),
+                    "main_force": int(main_force[i]),
+                    "large_order": int(large_order[i]),
+                    "small_order": int(small_order[i]),
+                    "details": dict(details[i], stock_code=code, period=period, trade_date=trade_date)
+                }
+            return results
+        except Exception as e:
+            self.logger.error(f"Error batch calculating capital flow scores: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            return {code: dict(empty, error=str(e)) for code in stock_codes}
 
     def _generate_mock_concept_fund_flow(self, period):
         """生成模拟概念资金流向数据"""
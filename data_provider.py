@@ -0,0 +1,591 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 可插拔上游数据提供者
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- DataService 等模块通过 get_data_provider() 调用上游接口，不再直接依赖 akshare 模块
+- AkshareProvider：默认实现，按函数名转发到 AKShare
+- RecordingProvider：包装任意提供者，把每次调用结果保存为 pickle，用于录制回放数据
+- ReplayProvider：离线回放录制数据；没有录制时按股票代码生成确定性的模拟行情、
+  实时行情、基本信息和资金流向；支持固定延迟、抖动和失败注入
+- 提供者的方法名和参数与 AKShare 函数一致，调用方只需把 ak.xxx 换成 provider.xxx
+
+环境变量：
+- DATA_PROVIDER: akshare（默认）/ replay
+- REPLAY_DATA_DIR: 回放数据目录（RecordingProvider 的输出目录）
+- REPLAY_LATENCY_MS / REPLAY_JITTER_MS / REPLAY_FAILURE_RATE / REPLAY_SEED: 回放延迟与失败注入
+- RECORD_DATA_DIR: 使用 akshare 时同时录制到该目录
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import date
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DATA_PROVIDER = os.getenv('DATA_PROVIDER', 'akshare').lower()
+REPLAY_DATA_DIR = os.getenv('REPLAY_DATA_DIR', '')
+REPLAY_LATENCY_MS = float(os.getenv('REPLAY_LATENCY_MS', '0'))
+REPLAY_JITTER_MS = float(os.getenv('REPLAY_JITTER_MS', '0'))
+REPLAY_FAILURE_RATE = float(os.getenv('REPLAY_FAILURE_RATE', '0'))
+REPLAY_SEED = int(os.getenv('REPLAY_SEED', '42'))
+RECORD_DATA_DIR = os.getenv('RECORD_DATA_DIR', '')
+
+# 模拟行情的起始日期，同一代码同一日期的价格与请求区间无关
+SYNTHETIC_ANCHOR_DATE = date(2015, 1, 5)
+SYNTHETIC_INDUSTRIES = ('银行', '医药生物', '电子', '食品饮料', '计算机', '汽车', '电力设备', '非银金融')
+
+
+class InjectedFailure(ConnectionError):
+    """回放模式下注入的上游失败"""
+
+
+class ReplayDataMissing(LookupError):
+    """回放模式下既没有录制数据也不支持模拟的接口"""
+
+
+def _call_key(args, kwargs) -> str:
+    """把调用参数转为稳定的文件名"""
+    parts = [str(a) for a in args] + [f"{k}={kwargs[k]}" for k in sorted(kwargs)]
+    key = re.sub(r'[^0-9A-Za-z_=.\-一-鿿]+', '_', '__'.join(parts)) or 'default'
+    if len(key) > 120:
+        key = key[:80] + '_' + hashlib.md5(key.encode('utf-8')).hexdigest()
+    return key
+
+
+class DataProvider:
+    """上游数据提供者基类，方法名与 AKShare 函数一致"""
+
+    name = 'base'
+
+    def call(self, endpoint: str, *args, **kwargs):
+        return getattr(self, endpoint)(*args, **kwargs)
+
+    def get_stats(self) -> Dict:
+        return {'provider': self.name}
+
+
+class AkshareProvider(DataProvider):
+    """按函数名转发到 AKShare"""
+
+    name = 'akshare'
+
+    def __init__(self):
+        import akshare
+        self._ak = akshare
+
+    def __getattr__(self, endpoint: str) -> Callable:
+        if endpoint.startswith('_'):
+            raise AttributeError(endpoint)
+        return getattr(self._ak, endpoint)
+
+
+class RecordingProvider(DataProvider):
+    """录制上游返回结果，供 ReplayProvider 离线回放"""
+
+    name = 'recording'
+
+    def __init__(self, inner: DataProvider, data_dir: str):
+        self.inner = inner
+        self.data_dir = data_dir
+        self.recorded = 0
+
+    def __getattr__(self, endpoint: str) -> Callable:
+        if endpoint.startswith('_'):
+            raise AttributeError(endpoint)
+        func = getattr(self.inner, endpoint)
+
+        def recorder(*args, **kwargs):
+            result = func(*args, **kwargs)
+            if isinstance(result, pd.DataFrame):
+                directory = os.path.join(self.data_dir, endpoint)
+                os.makedirs(directory, exist_ok=True)
+                result.to_pickle(os.path.join(directory, _call_key(args, kwargs) + '.pkl'))
+                self.recorded += 1
+            return result
+
+        recorder.__name__ = endpoint
+        return recorder
+
+    def get_stats(self) -> Dict:
+        return {'provider': self.name, 'inner': self.inner.name, 'data_dir': self.data_dir,
+                'recorded': self.recorded}
+
+
+class ReplayProvider(DataProvider):
+    """离线回放提供者：录制数据优先，缺失时生成确定性的模拟数据"""
+
+    name = 'replay'
+
+    def __init__(self, data_dir: str = None, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 failure_rate: float = 0.0, seed: int = 42, synthetic: bool = True, universe_size: int = 300):
+        """
+        Args:
+            data_dir: 录制数据目录（<data_dir>/<接口名>/<参数>.pkl）
+            latency_ms: 每次调用的固定延迟
+            jitter_ms: 额外延迟的上限，按调用确定性抽取
+            failure_rate: 失败注入概率，按 (接口, 参数, 第几次调用) 确定性决定
+            seed: 随机种子，相同种子下延迟、失败和模拟数据完全一致
+            synthetic: 没有录制数据时是否生成模拟数据
+            universe_size: 实时行情和资金流排名中包含的模拟股票数量
+        """
+        self.data_dir = data_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.synthetic = synthetic
+        self.universe = [f'{600000 + i:06d}' for i in range(universe_size // 2)] + \
+                        [f'{i + 1:06d}' for i in range(universe_size - universe_size // 2)]
+
+        self._lock = threading.Lock()
+        self._call_counts: Dict[str, int] = defaultdict(int)
+        self._known_codes = set()
+        self._series_cache: Dict[str, pd.DataFrame] = {}
+        self._recorded_cache: Dict[str, pd.DataFrame] = {}
+        self.stats = defaultdict(lambda: {'calls': 0, 'failures': 0, 'recorded': 0, 'synthetic': 0})
+
+    # ==================== 调度 ====================
+
+    def _draw(self, endpoint: str, key: str, count: int, salt: str) -> float:
+        """按调用身份确定性地抽取 [0, 1) 的数，与线程调度顺序无关"""
+        digest = zlib.crc32(f'{self.seed}:{salt}:{endpoint}:{key}:{count}'.encode('utf-8'))
+        return digest / 2 ** 32
+
+    def _serve(self, endpoint: str, args, kwargs, generator: Optional[Callable]):
+        key = _call_key(args, kwargs)
+        with self._lock:
+            count = self._call_counts[f'{endpoint}/{key}']
+            self._call_counts[f'{endpoint}/{key}'] = count + 1
+            self.stats[endpoint]['calls'] += 1
+
+        delay = self.latency_ms + self.jitter_ms * self._draw(endpoint, key, count, 'latency')
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        if self.failure_rate > 0 and self._draw(endpoint, key, count, 'failure') < self.failure_rate:
+            with self._lock:
+                self.stats[endpoint]['failures'] += 1
+            raise InjectedFailure(f"回放模式注入失败: {endpoint}({key})")
+
+        recorded = self._load_recorded(endpoint, key)
+        if recorded is not None:
+            with self._lock:
+                self.stats[endpoint]['recorded'] += 1
+            return recorded.copy()
+
+        if generator is None or not self.synthetic:
+            raise ReplayDataMissing(f"没有 {endpoint}({key}) 的回放数据")
+        with self._lock:
+            self.stats[endpoint]['synthetic'] += 1
+        return generator(*args, **kwargs)
+
+    def _load_recorded(self, endpoint: str, key: str) -> Optional[pd.DataFrame]:
+        if not self.data_dir:
+            return None
+        cache_key = f'{endpoint}/{key}'
+        if cache_key in self._recorded_cache:
+            return self._recorded_cache[cache_key]
+        path = os.path.join(self.data_dir, endpoint, key + '.pkl')
+        df = pd.read_pickle(path) if os.path.exists(path) else None
+        self._recorded_cache[cache_key] = df
+        return df
+
+    def __getattr__(self, endpoint: str) -> Callable:
+        if endpoint.startswith('_'):
+            raise AttributeError(endpoint)
+        generator = getattr(self, f'_synthetic_{endpoint}', None)
+
+        def replay(*args, **kwargs):
+            return self._serve(endpoint, args, kwargs, generator)
+
+        replay.__name__ = endpoint
+        return replay
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            endpoints = {name: dict(values) for name, values in self.stats.items()}
+        return {
+            'provider': self.name,
+            'data_dir': self.data_dir,
+            'latency_ms': self.latency_ms,
+            'jitter_ms': self.jitter_ms,
+            'failure_rate': self.failure_rate,
+            'seed': self.seed,
+            'endpoints': endpoints
+        }
+
+    # ==================== 模拟数据 ====================
+
+    def _code_rng(self, code: str, salt: str = '') -> np.random.Generator:
+        return np.random.default_rng(zlib.crc32(f'{self.seed}:{salt}:{code}'.encode('utf-8')))
+
+    def _daily_series(self, code: str, market: str) -> pd.DataFrame:
+        """某只股票从锚定日期到今天的完整日线，同一代码结果固定"""
+        cache_key = f'{market}:{code}'
+        series = self._series_cache.get(cache_key)
+        if series is not None:
+            return series
+
+        from trading_calendar import trading_calendar
+        days = pd.to_datetime(trading_calendar.get_trading_days_between(
+            SYNTHETIC_ANCHOR_DATE, date.today(), market if market in ('A', 'HK', 'US') else 'A'))
+        rng = self._code_rng(code, market)
+        n = len(days)
+        returns = rng.normal(0.0003, 0.02, n)
+        close = rng.uniform(5, 100) * np.cumprod(1 + returns)
+        open_ = close / (1 + returns) * (1 + rng.normal(0, 0.004, n))
+        spread = np.abs(rng.normal(0, 0.01, n)) * close
+        high = np.maximum(open_, close) + spread
+        low = np.maximum(np.minimum(open_, close) - spread, 0.01)
+        volume = np.round(rng.uniform(5e4, 5e5, n) * (1 + np.abs(returns) * 20))
+        series = pd.DataFrame({
+            'date': days,
+            'open': open_.round(2), 'high': high.round(2), 'low': low.round(2), 'close': close.round(2),
+            'volume': volume, 'amount': (volume * close * 100).round(2),
+            'change_pct': (returns * 100).round(2)
+        })
+        with self._lock:
+            self._series_cache[cache_key] = series
+            self._known_codes.add(code)
+        return series
+
+    def _hist_frame(self, code: str, market: str, start_date: str, end_date: str) -> pd.DataFrame:
+        series = self._daily_series(code, market)
+        start = pd.Timestamp(str(start_date)) if start_date else series['date'].iloc[0]
+        end = pd.Timestamp(str(end_date)) if end_date else series['date'].iloc[-1]
+        df = series[(series['date'] >= start) & (series['date'] <= end)]
+        prev_close = (df['close'] / (1 + df['change_pct'] / 100))
+        return pd.DataFrame({
+            '日期': df['date'].dt.strftime('%Y-%m-%d'),
+            '股票代码': code,
+            '开盘': df['open'], '收盘': df['close'], '最高': df['high'], '最低': df['low'],
+            '成交量': df['volume'], '成交额': df['amount'],
+            '振幅': ((df['high'] - df['low']) / prev_close * 100).round(2),
+            '涨跌幅': df['change_pct'],
+            '涨跌额': (df['close'] - prev_close).round(2),
+            '换手率': (df['volume'] / 1e6).round(2)
+        }).reset_index(drop=True)
+
+    def _synthetic_stock_zh_a_hist(self, symbol, period='daily', start_date='19700101', end_date='20500101',
+                                   adjust=''):
+        return self._hist_frame(str(symbol), 'A', start_date, end_date)
+
+    def _synthetic_stock_us_hist(self, symbol, period='daily', start_date='19700101', end_date='20500101',
+                                 adjust=''):
+        return self._hist_frame(str(symbol), 'US', start_date, end_date)
+
+    def _synthetic_stock_hk_daily(self, symbol, adjust=''):
+        series = self._daily_series(str(symbol), 'HK')
+        return series[['date', 'open', 'high', 'low', 'close', 'volume']].copy()
+
+    def _stock_name(self, code: str) -> str:
+        return f'模拟{code}'
+
+    def _industry(self, code: str) -> str:
+        return SYNTHETIC_INDUSTRIES[zlib.crc32(code.encode('utf-8')) % len(SYNTHETIC_INDUSTRIES)]
+
+    def _codes(self):
+        with self._lock:
+            known = sorted(self._known_codes)
+        return list(dict.fromkeys(self.universe + known))
+
+    def _spot_frame(self, market: str) -> pd.DataFrame:
+        rows = []
+        for i, code in enumerate(self._codes()):
+            series = self._daily_series(code, market)
+            last, prev = series.iloc[-1], series.iloc[-2]
+            rng = self._code_rng(code, 'valuation')
+            rows.append({
+                '序号': i + 1, '代码': code, '名称': self._stock_name(code),
+                '最新价': last['close'], '涨跌幅': last['change_pct'],
+                '涨跌额': round(last['close'] - prev['close'], 2),
+                '成交量': last['volume'], '成交额': last['amount'],
+                '振幅': round((last['high'] - last['low']) / prev['close'] * 100, 2),
+                '最高': last['high'], '最低': last['low'], '今开': last['open'], '昨收': prev['close'],
+                '量比': round(float(rng.uniform(0.5, 2.5)), 2),
+                '换手率': round(last['volume'] / 1e6, 2),
+                '市盈率-动态': round(float(rng.uniform(5, 60)), 2), '市盈率': round(float(rng.uniform(5, 60)), 2),
+                '市净率': round(float(rng.uniform(0.5, 8)), 2),
+                '总市值': round(last['close'] * float(rng.uniform(1e8, 5e9)), 2),
+                '流通市值': round(last['close'] * float(rng.uniform(5e7, 3e9)), 2)
+            })
+        return pd.DataFrame(rows)
+
+    def _synthetic_stock_zh_a_spot_em(self):
+        return self._spot_frame('A')
+
+    def _synthetic_stock_hk_spot_em(self):
+        return self._spot_frame('HK')
+
+    def _synthetic_stock_us_spot_em(self):
+        return self._spot_frame('US')
+
+    def _synthetic_stock_individual_info_em(self, symbol, timeout=None):
+        code = str(symbol)
+        last = self._daily_series(code, 'A').iloc[-1]
+        rng = self._code_rng(code, 'info')
+        total_share = float(rng.uniform(1e8, 5e9))
+        float_share = total_share * float(rng.uniform(0.3, 1.0))
+        items = [
+            ('股票代码', code), ('股票简称', self._stock_name(code)),
+            ('总股本', total_share), ('流通股', float_share),
+            ('总市值', total_share * last['close']), ('流通市值', float_share * last['close']),
+            ('行业', self._industry(code)),
+            ('上市时间', int(rng.integers(1995, 2015)) * 10000 + 101)
+        ]
+        return pd.DataFrame(items, columns=['item', 'value'])
+
+    def _synthetic_stock_info_a_code_name(self):
+        codes = self._codes()
+        return pd.DataFrame({'code': codes, 'name': [self._stock_name(c) for c in codes]})
+
+    def _flow_columns(self, rng, amount, prefix=''):
+        main = float(rng.normal(0, 0.05)) * amount
+        super_large = main * float(rng.uniform(0.3, 0.7))
+        large = main - super_large
+        medium = -main * float(rng.uniform(0.2, 0.6))
+        small = -main - medium
+        values = {}
+        for name, value in (('主力', main), ('超大单', super_large), ('大单', large), ('中单', medium),
+                            ('小单', small)):
+            values[f'{prefix}{name}净流入-净额'] = round(value, 2)
+            values[f'{prefix}{name}净流入-净占比'] = round(value / amount * 100, 2) if amount else 0.0
+        return values
+
+    def _synthetic_stock_individual_fund_flow(self, stock, market='sh'):
+        code = str(stock)
+        series = self._daily_series(code, 'A').tail(120)
+        rows = []
+        for row in series.itertuples():
+            rng = self._code_rng(f'{code}:{row.date:%Y%m%d}', 'flow')
+            item = {'日期': row.date.strftime('%Y-%m-%d'), '收盘价': row.close, '涨跌幅': row.change_pct}
+            item.update(self._flow_columns(rng, row.amount))
+            rows.append(item)
+        return pd.DataFrame(rows)
+
+    def _synthetic_stock_individual_fund_flow_rank(self, indicator='今日'):
+        prefix = '' if indicator == '今日' else indicator
+        rows = []
+        for code in self._codes():
+            last = self._daily_series(code, 'A').iloc[-1]
+            rng = self._code_rng(f'{code}:{indicator}', 'flow_rank')
+            item = {'代码': code, '名称': self._stock_name(code), '最新价': last['close'],
+                    f'{prefix}涨跌幅': last['change_pct']}
+            item.update(self._flow_columns(rng, last['amount'], prefix))
+            rows.append(item)
+        df = pd.DataFrame(rows).sort_values(f'{prefix}主力净流入-净额', ascending=False)
+        df.insert(0, '序号', range(1, len(df) + 1))
+        return df.reset_index(drop=True)
+
+    def _synthetic_stock_hsgt_hist_em(self, symbol, start_date=None, end_date=None):
+        # 单只股票的北向持股历史，默认近90个交易日
+        code = str(symbol)
+        series = self._daily_series(code, 'A')
+        if start_date is None and end_date is None:
+            series = series.tail(90)
+        else:
+            start = pd.Timestamp(str(start_date)) if start_date else series['date'].iloc[0]
+            end = pd.Timestamp(str(end_date)) if end_date else series['date'].iloc[-1]
+            series = series[(series['date'] >= start) & (series['date'] <= end)]
+        rng = self._code_rng(code, 'hsgt')
+        ratio = np.clip(rng.uniform(0.5, 8) + np.cumsum(rng.normal(0, 0.05, len(series))), 0.01, None)
+        holding = np.round(ratio / 100 * rng.uniform(5e8, 5e9))
+        return pd.DataFrame({
+            '日期': series['date'].dt.strftime('%Y-%m-%d').values,
+            '持股数': holding,
+            '持股比例': ratio.round(2),
+            '持股变动': np.diff(holding, prepend=holding[:1]),
+            '持股市值': (holding * series['close'].values).round(2)
+        })
+
+    def _synthetic_stock_fund_flow_industry(self, symbol='即时'):
+        rows = []
+        for name, _ in self._industry_boards():
+            last = self._daily_series(f'board:{name}', 'A').iloc[-1]
+            rng = self._code_rng(f'{name}:{symbol}', 'industry_flow')
+            inflow = round(float(rng.uniform(50, 500)), 2)
+            outflow = round(inflow * float(rng.uniform(0.8, 1.2)), 2)
+            item = {'行业': name, '行业指数': last['close'], '流入资金': inflow, '流出资金': outflow,
+                    '净额': round(inflow - outflow, 2), '公司家数': int(rng.integers(10, 200))}
+            if symbol == '即时':
+                leader = self.universe[int(rng.integers(0, len(self.universe)))]
+                item.update({'行业-涨跌幅': f"{last['change_pct']:.2f}%", '领涨股': self._stock_name(leader),
+                             '领涨股-涨跌幅': f"{rng.uniform(0, 10):.2f}%",
+                             '当前价': round(float(rng.uniform(5, 100)), 2)})
+            else:
+                item['阶段涨跌幅'] = f"{rng.normal(0, 5):.2f}%"
+            rows.append(item)
+        df = pd.DataFrame(rows).sort_values('净额', ascending=False).reset_index(drop=True)
+        df.insert(0, '序号', range(1, len(df) + 1))
+        return df
+
+    def _report_dates(self, count: int):
+        """最近 count 个已披露的报告期末日期，按时间降序"""
+        today = pd.Timestamp(date.today())
+        quarter_end = pd.Timestamp(today.year, ((today.month - 1) // 3) * 3 + 1, 1) - pd.Timedelta(days=1)
+        # 报告期结束后约一个月才披露
+        if (today - quarter_end).days < 30:
+            quarter_end = pd.Timestamp(quarter_end.year, ((quarter_end.month - 1) // 3) * 3 + 1, 1) \
+                - pd.Timedelta(days=1)
+        return list(pd.date_range(end=quarter_end, periods=count, freq='QE')[::-1])
+
+    def _synthetic_stock_financial_analysis_indicator(self, symbol, start_year='1900'):
+        code = str(symbol)
+        rows = []
+        for report_date in self._report_dates(24):
+            if report_date.year < int(start_year):
+                continue
+            rng = self._code_rng(f'{code}:{report_date:%Y%m%d}', 'indicator')
+            rows.append({
+                '日期': report_date.strftime('%Y-%m-%d'),
+                '摊薄每股收益(元)': round(float(rng.uniform(0.05, 3)), 4),
+                '每股净资产_调整后(元)': round(float(rng.uniform(1, 30)), 4),
+                '总资产净利润率(%)': round(float(rng.uniform(0.5, 15)), 4),
+                '销售净利率(%)': round(float(rng.uniform(1, 30)), 4),
+                '销售毛利率(%)': round(float(rng.uniform(10, 70)), 4),
+                '加权净资产收益率(%)': round(float(rng.uniform(1, 30)), 4),
+                '流动比率': round(float(rng.uniform(0.6, 4)), 4),
+                '资产负债率(%)': round(float(rng.uniform(10, 85)), 4),
+            })
+        return pd.DataFrame(rows[::-1])
+
+    def _synthetic_stock_value_em(self, symbol):
+        code = str(symbol)
+        series = self._daily_series(code, 'A').tail(250)
+        rng = self._code_rng(code, 'value')
+        eps, bps, sps = (float(rng.uniform(0.2, 3)), float(rng.uniform(2, 30)), float(rng.uniform(2, 50)))
+        shares = float(rng.uniform(1e8, 5e9))
+        return pd.DataFrame({
+            '数据日期': series['date'].dt.strftime('%Y-%m-%d'),
+            '当日收盘价': series['close'], '当日涨跌幅': series['change_pct'],
+            '总市值': (series['close'] * shares).round(2), '流通市值': (series['close'] * shares * 0.8).round(2),
+            '总股本': shares, '流通股本': shares * 0.8,
+            'PE(TTM)': (series['close'] / eps).round(2), 'PE(静)': (series['close'] / eps * 1.05).round(2),
+            '市净率': (series['close'] / bps).round(2), 'PEG值': round(float(rng.uniform(0.3, 3)), 2),
+            '市现率': (series['close'] / eps * 0.8).round(2), '市销率': (series['close'] / sps).round(2)
+        }).reset_index(drop=True)
+
+    def _synthetic_stock_financial_abstract(self, symbol):
+        """与新版接口一致的宽表：行为指标，列为报告期"""
+        code = str(symbol)
+        rng = self._code_rng(code, 'abstract')
+        report_dates = self._report_dates(24)
+        base_revenue = float(rng.uniform(1e9, 1e11))
+        growth = float(rng.uniform(-0.05, 0.25))
+        margin = float(rng.uniform(0.03, 0.25))
+        rows = {'营业总收入': {}, '归母净利润': {}}
+        for report_date in report_dates:
+            # 累计口径：年内各季度递增，逐年按增长率变化
+            years = report_date.year - report_dates[-1].year
+            annual = base_revenue * (1 + growth) ** years
+            quarter_rng = self._code_rng(f'{code}:{report_date:%Y%m%d}', 'abstract')
+            revenue = annual * report_date.quarter / 4 * float(quarter_rng.uniform(0.9, 1.1))
+            rows['营业总收入'][report_date.strftime('%Y%m%d')] = round(revenue, 2)
+            rows['归母净利润'][report_date.strftime('%Y%m%d')] = round(
+                revenue * margin * float(quarter_rng.uniform(0.8, 1.2)), 2)
+        df = pd.DataFrame.from_dict(rows, orient='index').reset_index().rename(columns={'index': '指标'})
+        df.insert(0, '选项', '常用指标')
+        return df
+
+    def _industry_boards(self):
+        names = list(SYNTHETIC_INDUSTRIES) + [f'模拟行业{i:02d}' for i in range(1, 91 - len(SYNTHETIC_INDUSTRIES))]
+        return [(name, f'BK{1000 + i:04d}') for i, name in enumerate(names)]
+
+    def _synthetic_stock_board_industry_name_em(self):
+        rows = []
+        for name, code in self._industry_boards():
+            last = self._daily_series(f'board:{name}', 'A').iloc[-1]
+            rng = self._code_rng(name, 'board')
+            rows.append({'板块名称': name, '板块代码': code, '最新价': last['close'],
+                         '涨跌幅': last['change_pct'], '总市值': round(float(rng.uniform(1e11, 5e12)), 2),
+                         '换手率': round(float(rng.uniform(0.3, 5)), 2),
+                         '上涨家数': int(rng.integers(0, 80)), '下跌家数': int(rng.integers(0, 80))})
+        df = pd.DataFrame(rows).sort_values('涨跌幅', ascending=False).reset_index(drop=True)
+        df.insert(0, '排名', range(1, len(df) + 1))
+        return df
+
+    def _synthetic_stock_board_industry_hist_em(self, symbol, start_date='19700101', end_date='20500101',
+                                                period='日k', adjust=''):
+        # 按名称或代码查询返回同一板块的行情
+        name = dict((code, name) for name, code in self._industry_boards()).get(str(symbol), str(symbol))
+        df = self._hist_frame(f'board:{name}', 'A', start_date, end_date)
+        return df.drop(columns=['股票代码'])
+
+    def _synthetic_index_stock_cons_weight_csindex(self, symbol):
+        # 成分股数量与真实指数一致，沪深两市交替取代码
+        count = {'000300': 300, '000905': 500, '000852': 1000, '000906': 800}.get(str(symbol), 50)
+        codes = [f'{600000 + i // 2:06d}' if i % 2 == 0 else f'{i // 2 + 1:06d}' for i in range(count)]
+        weights = self._code_rng(str(symbol), 'index_weight').dirichlet(np.ones(count)) * 100
+        return pd.DataFrame({'日期': date.today().isoformat(), '指数代码': str(symbol),
+                             '成分券代码': codes, '成分券名称': [self._stock_name(c) for c in codes],
+                             '交易所': ['上海证券交易所' if c.startswith('6') else '深圳证券交易所' for c in codes],
+                             '权重': np.round(weights, 3)})
+
+    def _synthetic_stock_board_industry_cons_em(self, symbol):
+        spot = self._spot_frame('A')
+        members = spot[[self._industry(code) == symbol for code in spot['代码']]]
+        return members.reset_index(drop=True).assign(序号=lambda df: range(1, len(df) + 1))
+
+    def _synthetic_stock_info_global_cls(self, symbol='全部'):
+        # 最近的财联社电报：每5分钟一条，同一时段内容固定，按时间升序
+        latest = pd.Timestamp.now().floor('5min')
+        rows = []
+        for i in range(20):
+            when = latest - pd.Timedelta(minutes=5 * (19 - i))
+            rng = self._code_rng(f'{when:%Y%m%d%H%M}', 'telegraph')
+            code = self.universe[int(rng.integers(0, len(self.universe)))]
+            name = self._stock_name(code)
+            change = round(float(rng.normal(0, 4)), 2)
+            rows.append({'标题': f'{name}盘中{"拉升" if change >= 0 else "走低"}',
+                         '内容': f'{name}（{code}）盘中涨跌幅{change}%，{self._industry(code)}板块成交活跃',
+                         '发布日期': when.date(), '发布时间': when.time()})
+        return pd.DataFrame(rows)
+
+
+_provider: Optional[DataProvider] = None
+_provider_lock = threading.Lock()
+
+
+def create_provider_from_env() -> DataProvider:
+    """按环境变量创建提供者"""
+    if DATA_PROVIDER == 'replay':
+        return ReplayProvider(REPLAY_DATA_DIR or None, REPLAY_LATENCY_MS, REPLAY_JITTER_MS,
+                              REPLAY_FAILURE_RATE, REPLAY_SEED)
+    provider = AkshareProvider()
+    if RECORD_DATA_DIR:
+        provider = RecordingProvider(provider, RECORD_DATA_DIR)
+    return provider
+
+
+def get_data_provider() -> DataProvider:
+    """获取当前全局数据提供者"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_provider_from_env()
+                logger.info(f"上游数据提供者: {_provider.name}")
+    return _provider
+
+
+def set_data_provider(provider: DataProvider) -> Optional[DataProvider]:
+    """替换全局数据提供者，返回原提供者（测试和基准测试使用）"""
+    global _provider
+    with _provider_lock:
+        previous, _provider = _provider, provider
+    logger.info(f"上游数据提供者切换为: {provider.name}")
+    return previous
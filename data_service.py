@@ -6,14 +6,16 @@
 许可证：MIT License
 """
 
-import akshare as ak
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
 import logging
+import os
 import traceback
 import threading
+import contextvars
+from contextlib import contextmanager
 from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import time
 import requests
@@ -28,12 +30,16 @@ from database import (
     StockBasicInfo, StockPriceHistory, StockRealtimeData,
     FinancialData, CapitalFlowData,
     CACHE_DEFAULT_TTL, REALTIME_DATA_TTL, BASIC_INFO_TTL, FINANCIAL_DATA_TTL,
-    cleanup_expired_cache, get_cache_stats
+    cleanup_expired_cache, get_cache_stats, bulk_upsert
 )
 from database_optimizer import db_optimizer, get_optimized_session, batch_get_stock_data
 from stock_cache_manager import stock_cache_manager
 from smart_cache_manager import smart_cache_manager
 from trading_calendar import is_trading_day, get_last_trading_day
+from performance_monitor import performance_monitor
+from tracing import traced, span, set_span_attribute
+from data_provider import get_data_provider
+from service_registry import register_worker
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -48,6 +54,89 @@ MEMORY_CACHE_SIZE = 10000  # 增加缓存大小到10000条目
 cache_access_count = {}  # 缓存访问计数，用于LRU策略
 
 
+# 上游调用预算：批量任务（如夜间预缓存）在上下文中设置令牌桶，
+# 每次真正访问上游前取令牌，缓存命中不消耗
+_upstream_budget: contextvars.ContextVar = contextvars.ContextVar('upstream_budget', default=None)
+
+
+@contextmanager
+def upstream_budget(budget):
+    """在当前上下文中限制上游调用速率，budget 需提供 acquire/on_success/on_failure"""
+    token = _upstream_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _upstream_budget.reset(token)
+
+
+# 财务数据按定期报告披露节奏过期：披露窗口内每天刷新一次，窗口外保留到下个窗口开始
+FINANCIAL_WINDOW_TTL = int(os.getenv('FINANCIAL_WINDOW_TTL', '86400'))
+# 指数/行业成分股列表缓存时长（秒），成分调整按季度进行
+INDEX_CONSTITUENTS_TTL = int(os.getenv('INDEX_CONSTITUENTS_TTL', '86400'))
+# (开始月, 开始日, 结束月, 结束日)：年报与一季报、半年报、三季报
+FINANCIAL_DISCLOSURE_WINDOWS = ((1, 1, 4, 30), (7, 1, 8, 31), (10, 1, 10, 31))
+
+# 财务分析指标列 -> FinancialData 字段
+FINANCIAL_INDICATOR_COLUMNS = {
+    '加权净资产收益率(%)': 'roe',
+    '总资产净利润率(%)': 'roa',
+    '销售毛利率(%)': 'gross_margin',
+    '销售净利率(%)': 'net_margin',
+    '资产负债率(%)': 'debt_ratio',
+    '流动比率': 'current_ratio',
+    '摊薄每股收益(元)': 'eps',
+    '每股净资产_调整后(元)': 'bps',
+}
+# 财务摘要指标名（按优先级） -> FinancialData 字段
+FINANCIAL_ABSTRACT_ROWS = {
+    'revenue': ('营业总收入', '营业收入'),
+    'net_profit': ('归母净利润', '净利润'),
+}
+
+
+def financial_data_expiry(now: datetime = None) -> datetime:
+    """计算财务数据的过期时间"""
+    now = now or datetime.now()
+    for year in (now.year, now.year + 1):
+        for start_month, start_day, end_month, end_day in FINANCIAL_DISCLOSURE_WINDOWS:
+            start = datetime(year, start_month, start_day)
+            end = datetime(year, end_month, end_day) + timedelta(days=1)
+            if start <= now < end:
+                return now + timedelta(seconds=FINANCIAL_WINDOW_TTL)
+            if now < start:
+                return min(start, now + timedelta(seconds=FINANCIAL_DATA_TTL))
+    return now + timedelta(seconds=FINANCIAL_DATA_TTL)
+
+
+def next_close_expiry(now: datetime = None) -> datetime:
+    """按日变化的数据（估值指标、板块日线等）到下一个 15:30 过期"""
+    now = now or datetime.now()
+    close = now.replace(hour=15, minute=30, second=0, microsecond=0)
+    return close if now < close else close + timedelta(days=1)
+
+
+def last_closed_bar_date(market_type: str = 'A', now: datetime = None):
+    """已收盘的最新日K线日期：交易日 15:30 之后为当天，否则为上一交易日"""
+    now = now or datetime.now()
+    today = now.date()
+    if is_trading_day(today, market_type) and now >= now.replace(hour=15, minute=30, second=0, microsecond=0):
+        return today
+    return get_last_trading_day(today, market_type)
+
+
+def _report_period(value) -> Optional[str]:
+    """报告日期转为 YYYY-Qn"""
+    date = pd.to_datetime(str(value), errors='coerce')
+    if pd.isna(date):
+        return None
+    return f"{date.year}-Q{(date.month - 1) // 3 + 1}"
+
+
+def _to_float(value) -> Optional[float]:
+    value = pd.to_numeric(value, errors='coerce')
+    return None if pd.isna(value) else float(value)
+
+
 class DataService:
     """统一数据访问服务"""
 
@@ -55,6 +144,7 @@ class DataService:
         self.logger = logging.getLogger(__name__)
         self.api_timeout = 30  # API调用超时时间
         self.max_retries = 3   # 最大重试次数
+        self.retry_backoff = float(os.getenv('API_RETRY_BACKOFF', '1'))  # 重试退避基数（秒）
 
         # 配置网络会话
         self._setup_session()
@@ -101,17 +191,23 @@ class DataService:
     
     def _schedule_cache_cleanup(self):
         """定期清理过期缓存"""
+        # 数据库过期缓存交由增量清理器在收盘后分块处理
+        if USE_DATABASE:
+            from cache_reaper import cache_reaper
+            register_worker('cache_reaper', lambda: cache_reaper.start_background(
+                interval_seconds=3600, after_close_only=True))
+
         def cleanup_task():
             while True:
                 try:
                     time.sleep(3600)  # 每小时清理一次
-                    cleanup_expired_cache()
                     self._cleanup_memory_cache()
                 except Exception as e:
                     self.logger.error(f"缓存清理任务失败: {e}")
-        
-        cleanup_thread = threading.Thread(target=cleanup_task, daemon=True)
-        cleanup_thread.start()
+
+        # 内存缓存是模块级共享的，多个实例只需一个清理线程，由服务注册表延后启动
+        register_worker('data_service.cache_cleanup',
+                        lambda: threading.Thread(target=cleanup_task, daemon=True).start())
     
     def _cleanup_memory_cache(self):
         """清理内存缓存 - 使用LRU策略"""
@@ -142,6 +238,8 @@ class DataService:
     
     def _check_memory_cache(self, cache_key: str, ttl: int) -> Optional[Any]:
         """检查内存缓存"""
+        # 计时包含等锁时间，命中和未命中都记入缓存查询耗时直方图
+        start_time = time.perf_counter()
         with data_lock:
             if cache_key in memory_cache:
                 cache_item = memory_cache[cache_key]
@@ -149,12 +247,15 @@ class DataService:
                 if time.time() - timestamp < ttl:
                     # 更新访问计数
                     cache_access_count[cache_key] = cache_access_count.get(cache_key, 0) + 1
+                    performance_monitor.record_cache_hit(time.perf_counter() - start_time, level='MEMORY')
+                    set_span_attribute('cache_level', 'MEMORY')
                     return cache_item.get('data')
                 else:
                     # 缓存过期，删除
                     del memory_cache[cache_key]
                     if cache_key in cache_access_count:
                         del cache_access_count[cache_key]
+        performance_monitor.record_cache_miss(time.perf_counter() - start_time, level='MEMORY')
         return None
     
     def _set_memory_cache(self, cache_key: str, data: Any):
@@ -184,18 +285,29 @@ class DataService:
     def _retry_api_call(self, api_func, *args, **kwargs):
         """带重试机制的API调用"""
         last_exception = None
+        endpoint = getattr(api_func, '__name__', 'unknown')
+
+        budget = _upstream_budget.get()
 
         for attempt in range(self.max_retries):
+            if budget is not None:
+                budget.acquire()
+            start_time = time.perf_counter()
             try:
-                # 配置akshare使用我们的session
-                if hasattr(ak, '_session'):
-                    ak._session = self.session
-
-                return self._fetch_with_timeout(api_func, *args, **kwargs)
+                with span('upstream.api', endpoint=endpoint, attempt=attempt + 1):
+                    result = self._fetch_with_timeout(api_func, *args, **kwargs)
+                performance_monitor.record_api_call(time.perf_counter() - start_time, endpoint=endpoint)
+                if budget is not None:
+                    budget.on_success()
+                return result
 
             except Exception as e:
                 last_exception = e
+                if budget is not None:
+                    budget.on_failure()
                 error_msg = str(e)
+                performance_monitor.record_api_call(time.perf_counter() - start_time, success=False,
+                                                    error=type(e).__name__, endpoint=endpoint)
                 self.logger.warning(f"API调用第 {attempt + 1} 次尝试失败: {error_msg}")
 
                 # 检查是否是SSL错误
@@ -205,7 +317,7 @@ class DataService:
 
                 if attempt < self.max_retries - 1:
                     # 指数退避，但最大等待时间不超过10秒
-                    wait_time = min(2 ** attempt, 10)
+                    wait_time = min(self.retry_backoff * 2 ** attempt, 10)
                     self.logger.info(f"等待 {wait_time} 秒后重试...")
                     time.sleep(wait_time)
 
@@ -223,6 +335,7 @@ class DataService:
 
         raise last_exception
     
+    @traced('data_service.get_stock_basic_info')
     def get_stock_basic_info(self, stock_code: str, market_type: str = 'A', use_advanced_cache: bool = True) -> Optional[Dict]:
         """获取股票基本信息"""
         # 优先使用高级缓存管理器
@@ -257,16 +370,17 @@ class DataService:
         
         # 3. 从API获取新数据
         try:
-            self.logger.info(f"从API获取股票 {stock_code} 基本信息")
+            self.logger.info("从API获取股票 %s 基本信息", stock_code)
 
             if market_type == 'A':
                 # 转换股票代码为AKShare API所需格式
                 original_code = stock_code
                 akshare_code = self._convert_stock_code_for_akshare(stock_code)
-                self.logger.info(f"基本信息获取 - 股票代码转换: {original_code} -> {akshare_code}")
+                self.logger.debug("基本信息获取 - 股票代码转换: %s -> %s", original_code, akshare_code)
 
                 # 获取A股基本信息
-                stock_info = self._retry_api_call(ak.stock_individual_info_em, symbol=akshare_code)
+                provider = get_data_provider()
+                stock_info = self._retry_api_call(provider.stock_individual_info_em, symbol=akshare_code)
 
                 # 检查API返回数据的有效性
                 if stock_info is None or len(stock_info) == 0:
@@ -293,7 +407,7 @@ class DataService:
                 # 获取股票名称
                 stock_name = ''
                 try:
-                    stock_name_df = self._retry_api_call(ak.stock_info_a_code_name)
+                    stock_name_df = self._retry_api_call(provider.stock_info_a_code_name)
                     if stock_name_df is not None and len(stock_name_df) > 0:
                         # 尝试使用转换后的代码匹配
                         matching_stocks = stock_name_df[stock_name_df['code'] == akshare_code]
@@ -324,7 +438,7 @@ class DataService:
                     'pb_ratio': self._safe_float(info_dict.get('市净率', 0))
                 }
 
-                self.logger.info(f"成功构建股票 {original_code} 基本信息，股票名称: {stock_name}")
+                self.logger.info("成功构建股票 %s 基本信息，股票名称: %s", original_code, stock_name)
             else:
                 # 其他市场的处理逻辑
                 data = {
@@ -497,6 +611,7 @@ class DataService:
         return results, cache_misses
 
 
+    @traced('data_service.get_stock_price_history')
     def get_stock_price_history(self, stock_code: str, market_type: str = 'A',
                                start_date: str = None, end_date: str = None,
                                use_smart_cache: bool = True) -> Optional[pd.DataFrame]:
@@ -522,33 +637,107 @@ class DataService:
         # 否则使用传统缓存策略
         return self._get_stock_price_history_traditional(stock_code, market_type, start_date, end_date)
 
+    @traced('data_service.get_price_histories')
+    def get_price_histories(self, stock_codes: List[str], market_type: str = 'A',
+                            start_date: str = None, end_date: str = None) -> Tuple[Dict[str, pd.DataFrame], List[str]]:
+        """
+        批量读取已缓存的历史价格：先查内存缓存，其余一次查询数据库
+
+        数据库中最新一根K线不早于已收盘的最新交易日才算命中；返回 ({代码: DataFrame}, 未命中的代码)，
+        未命中的由调用方按单只路径（含增量更新和上游获取）补齐
+        """
+        if start_date is None:
+            start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y-%m-%d')
+
+        results = {}
+        cache_misses = []
+
+        # 1. 内存缓存（与单只查询共用缓存键）
+        for stock_code in stock_codes:
+            cache_key = self._get_cache_key('price_history', stock_code=stock_code,
+                                           market_type=market_type, start_date=start_date, end_date=end_date)
+            cached_data = self._check_memory_cache(cache_key, 3600)
+            if cached_data is not None:
+                results[stock_code] = cached_data
+            else:
+                cache_misses.append(stock_code)
+
+        # 2. 一次查询数据库，只取需要的列
+        db_hits = 0
+        if cache_misses and USE_DATABASE:
+            try:
+                with get_optimized_session() as session:
+                    rows = session.query(
+                        StockPriceHistory.stock_code, StockPriceHistory.trade_date,
+                        StockPriceHistory.open_price, StockPriceHistory.close_price,
+                        StockPriceHistory.high_price, StockPriceHistory.low_price,
+                        StockPriceHistory.volume, StockPriceHistory.amount, StockPriceHistory.change_pct
+                    ).filter(
+                        StockPriceHistory.stock_code.in_(cache_misses),
+                        StockPriceHistory.market_type == market_type,
+                        StockPriceHistory.trade_date >= start_date.replace('-', ''),
+                        StockPriceHistory.trade_date <= end_date.replace('-', '')
+                    ).all()
+
+                if rows:
+                    frame = pd.DataFrame(rows, columns=['stock_code', 'trade_date', 'open', 'close', 'high', 'low',
+                                                        'volume', 'amount', 'change_pct'])
+                    for column in ('open', 'close', 'high', 'low', 'volume', 'amount', 'change_pct'):
+                        frame[column] = pd.to_numeric(frame[column], errors='coerce')
+                    frame['date'] = pd.to_datetime(frame['trade_date'])
+                    frame = frame.drop('trade_date', axis=1).sort_values(['stock_code', 'date'])
+
+                    expected = pd.Timestamp(min(last_closed_bar_date(market_type), pd.Timestamp(end_date).date()))
+                    for stock_code, df in frame.groupby('stock_code', sort=False):
+                        if df['date'].iloc[-1] < expected:
+                            continue
+                        df = df.reset_index(drop=True)
+                        cache_key = self._get_cache_key('price_history', stock_code=stock_code, market_type=market_type,
+                                                       start_date=start_date, end_date=end_date)
+                        self._set_memory_cache(cache_key, df)
+                        results[stock_code] = df
+                        db_hits += 1
+                    cache_misses = [code for code in cache_misses if code not in results]
+            except Exception as e:
+                self.logger.error(f"批量读取历史价格失败: {e}")
+
+        self.logger.info(f"批量读取历史价格: 内存命中 {len(stock_codes) - len(cache_misses) - db_hits}, "
+                         f"数据库命中 {db_hits}, 需要补齐 {len(cache_misses)}")
+        set_span_attribute('misses', len(cache_misses))
+        return results, cache_misses
+
     def _get_stock_price_history_smart(self, stock_code: str, market_type: str,
                                      start_date: str, end_date: str) -> Optional[pd.DataFrame]:
         """智能历史价格数据获取（支持增量更新）"""
         try:
             # 1. 检查数据完整性
-            completeness = smart_cache_manager.check_price_data_completeness(
-                stock_code, start_date, end_date, market_type
-            )
+            with span('smart_cache.check_completeness'):
+                completeness = smart_cache_manager.check_price_data_completeness(
+                    stock_code, start_date, end_date, market_type
+                )
 
-            self.logger.info(f"股票 {stock_code} 数据完整性检查: "
-                           f"有数据={completeness['has_data']}, "
-                           f"需要更新={completeness['needs_update']}, "
-                           f"缺失{len(completeness['missing_dates'])}个交易日")
+            self.logger.debug("股票 %s 数据完整性检查: 有数据=%s, 需要更新=%s, 缺失%d个交易日",
+                              stock_code, completeness['has_data'], completeness['needs_update'],
+                              len(completeness['missing_dates']))
 
             # 2. 如果有完整数据且不需要更新，直接返回缓存数据
             if completeness['has_data'] and not completeness['needs_update']:
-                self.logger.info(f"股票 {stock_code} 使用完整缓存数据")
+                self.logger.debug("股票 %s 使用完整缓存数据", stock_code)
+                set_span_attribute('cache_level', 'DATABASE')
                 return completeness['cached_data']
 
             # 3. 如果有部分数据，进行增量更新
             if completeness['has_data'] and completeness['needs_update']:
+                set_span_attribute('cache_level', 'DATABASE_INCREMENTAL')
                 return self._perform_incremental_update(
                     stock_code, market_type, start_date, end_date, completeness
                 )
 
             # 4. 如果没有数据，全量获取
-            self.logger.info(f"股票 {stock_code} 无缓存数据，进行全量获取")
+            self.logger.info("股票 %s 无缓存数据，进行全量获取", stock_code)
+            set_span_attribute('cache_level', 'MISS')
             return self._fetch_full_price_data(stock_code, market_type, start_date, end_date)
 
         except Exception as e:
@@ -597,6 +786,7 @@ class DataService:
                             df['date'] = pd.to_datetime(df['trade_date'])
                             df = df.drop('trade_date', axis=1)
                             self._set_memory_cache(cache_key, df)
+                            set_span_attribute('cache_level', 'DATABASE')
                             return df
                         except Exception as df_error:
                             self.logger.error(f"创建DataFrame失败: {df_error}")
@@ -618,10 +808,10 @@ class DataService:
             )
 
             if update_start is None or update_end is None:
-                self.logger.info(f"股票 {stock_code} 无需增量更新")
+                self.logger.debug("股票 %s 无需增量更新", stock_code)
                 return completeness['cached_data']
 
-            self.logger.info(f"股票 {stock_code} 增量更新: {update_start} 到 {update_end}")
+            self.logger.info("股票 %s 增量更新: %s 到 %s", stock_code, update_start, update_end)
 
             # 获取增量数据
             incremental_df = self._fetch_api_price_data(stock_code, market_type, update_start, update_end)
@@ -646,7 +836,7 @@ class DataService:
                 (combined_df['date'] >= start_dt) & (combined_df['date'] <= end_dt)
             ]
 
-            self.logger.info(f"股票 {stock_code} 增量更新完成，总计 {len(combined_df)} 条记录")
+            self.logger.info("股票 %s 增量更新完成，总计 %d 条记录", stock_code, len(combined_df))
             return combined_df
 
         except Exception as e:
@@ -657,7 +847,7 @@ class DataService:
                              start_date: str, end_date: str) -> Optional[pd.DataFrame]:
         """获取完整的历史价格数据"""
         try:
-            self.logger.info(f"从API获取股票 {stock_code} 完整历史价格数据: {start_date} 到 {end_date}")
+            self.logger.info("从API获取股票 %s 完整历史价格数据: %s 到 %s", stock_code, start_date, end_date)
 
             # 从API获取数据
             df = self._fetch_api_price_data(stock_code, market_type, start_date, end_date)
@@ -678,6 +868,7 @@ class DataService:
             self.logger.error(f"获取完整历史价格失败: {e}")
             return None
 
+    @traced('data_service.fetch_api_price_data')
     def _fetch_api_price_data(self, stock_code: str, market_type: str,
                             start_date: str, end_date: str) -> Optional[pd.DataFrame]:
         """从API获取价格数据的核心方法"""
@@ -686,23 +877,24 @@ class DataService:
             original_code = stock_code
             if market_type == 'A':
                 akshare_code = self._convert_stock_code_for_akshare(stock_code)
-                self.logger.info(f"股票代码转换: {original_code} -> {akshare_code}")
+                self.logger.debug("股票代码转换: %s -> %s", original_code, akshare_code)
             else:
                 akshare_code = stock_code
 
             def fetch_price_data():
+                provider = get_data_provider()
                 try:
                     if market_type == 'A':
-                        result = ak.stock_zh_a_hist(
+                        result = provider.stock_zh_a_hist(
                             symbol=akshare_code,
                             start_date=start_date.replace('-', ''),
                             end_date=end_date.replace('-', ''),
                             adjust="qfq"
                         )
                     elif market_type == 'HK':
-                        result = ak.stock_hk_daily(symbol=akshare_code, adjust="qfq")
+                        result = provider.stock_hk_daily(symbol=akshare_code, adjust="qfq")
                     elif market_type == 'US':
-                        result = ak.stock_us_hist(
+                        result = provider.stock_us_hist(
                             symbol=akshare_code,
                             start_date=start_date.replace('-', ''),
                             end_date=end_date.replace('-', ''),
@@ -721,7 +913,7 @@ class DataService:
                     if len(result) == 0:
                         raise Exception(f"AKShare API返回空DataFrame，原始代码: {original_code}, AKShare代码: {akshare_code}, 日期范围: {start_date} 到 {end_date}")
 
-                    self.logger.info(f"成功获取股票 {original_code} 的 {len(result)} 条价格数据")
+                    self.logger.info("成功获取股票 %s 的 %d 条价格数据", original_code, len(result))
                     return result
 
                 except Exception as api_error:
@@ -763,6 +955,7 @@ class DataService:
             self.logger.error(f"API获取价格数据失败: {e}")
             return None
 
+    @traced('data_service.save_price_data_to_db')
     def _save_price_data_to_db(self, stock_code: str, market_type: str, df: pd.DataFrame,
                              start_date: str = None, end_date: str = None) -> bool:
         """保存价格数据到数据库"""
@@ -811,7 +1004,7 @@ class DataService:
 
                 if records:
                     session.bulk_save_objects(records)
-                    self.logger.info(f"保存股票 {stock_code} 历史价格: {len(records)} 条记录")
+                    self.logger.info("保存股票 %s 历史价格: %d 条记录", stock_code, len(records))
 
                 return True
 
@@ -819,6 +1012,7 @@ class DataService:
             self.logger.error(f"保存历史价格到数据库失败: {e}")
             return False
 
+    @traced('data_service.get_stock_realtime_data')
     def get_stock_realtime_data(self, stock_code: str, market_type: str = 'A') -> Optional[Dict]:
         """获取股票实时数据"""
         cache_key = self._get_cache_key('realtime_data', stock_code=stock_code, market_type=market_type)
@@ -849,7 +1043,7 @@ class DataService:
 
         # 3. 从API获取新数据
         try:
-            self.logger.info(f"从API获取股票 {stock_code} 实时数据")
+            self.logger.info("从API获取股票 %s 实时数据", stock_code)
 
             def safe_float_convert(value, default=0.0):
                 """安全的浮点数转换"""
@@ -862,14 +1056,15 @@ class DataService:
 
             def fetch_realtime_data():
                 """获取实时股票数据"""
+                provider = get_data_provider()
                 if market_type == 'A':
                     # 转换股票代码为AKShare API所需格式
                     original_code = stock_code
                     akshare_code = self._convert_stock_code_for_akshare(stock_code)
-                    self.logger.info(f"实时数据获取 - 股票代码转换: {original_code} -> {akshare_code}")
+                    self.logger.debug("实时数据获取 - 股票代码转换: %s -> %s", original_code, akshare_code)
 
                     # A股实时数据
-                    df = ak.stock_zh_a_spot_em()
+                    df = provider.stock_zh_a_spot_em()
                     if df is not None and not df.empty:
                         # 查找指定股票（使用转换后的代码）
                         stock_data = df[df['代码'] == akshare_code]
@@ -894,7 +1089,7 @@ class DataService:
                         self.logger.warning("获取A股实时数据失败：API返回空数据")
                 elif market_type == 'HK':
                     # 港股实时数据
-                    df = ak.stock_hk_spot_em()
+                    df = provider.stock_hk_spot_em()
                     if df is not None and not df.empty:
                         # 查找指定股票
                         stock_data = df[df['代码'] == stock_code]
@@ -915,7 +1110,7 @@ class DataService:
                             }
                 elif market_type == 'US':
                     # 美股实时数据
-                    df = ak.stock_us_spot_em()
+                    df = provider.stock_us_spot_em()
                     if df is not None and not df.empty:
                         # 查找指定股票
                         stock_data = df[df['代码'] == stock_code]
@@ -944,7 +1139,7 @@ class DataService:
             if data is None:
                 raise Exception(f"未找到股票 {stock_code} 的实时数据")
 
-            self.logger.info(f"成功获取股票 {stock_code} 实时数据: 价格={data['current_price']}")
+            self.logger.info("成功获取股票 %s 实时数据: 价格=%s", stock_code, data['current_price'])
 
         except Exception as api_error:
             self.logger.error(f"API获取实时数据失败: {api_error}")
@@ -1025,6 +1220,332 @@ class DataService:
             self.logger.error(f"获取股票实时数据失败: {e}")
             return None
 
+    # ==================== 财务数据 ====================
+
+    def _check_expiring_cache(self, cache_key: str) -> Optional[Any]:
+        """检查带 expires_at 的内存缓存"""
+        cached = self._check_memory_cache(cache_key, FINANCIAL_DATA_TTL)
+        if cached and cached['expires_at'] > datetime.now():
+            return cached['data']
+        return None
+
+    def _set_expiring_cache(self, cache_key: str, data: Any, expires_at: datetime):
+        self._set_memory_cache(cache_key, {'data': data, 'expires_at': expires_at})
+
+    def _load_financial_data_from_db(self, stock_codes: List[str],
+                                     market_type: str) -> Dict[str, Tuple[List[Dict], datetime]]:
+        """一次查询多只股票的财务数据，返回 {代码: (按报告期升序的记录, 最早过期时间)}"""
+        results = {}
+        try:
+            with get_optimized_session() as session:
+                records = session.query(FinancialData).filter(
+                    FinancialData.stock_code.in_(stock_codes),
+                    FinancialData.market_type == market_type
+                ).order_by(FinancialData.report_period).all()
+                for record in records:
+                    periods, expires_at = results.get(record.stock_code, ([], None))
+                    record_expires = record.expires_at or datetime.min
+                    periods.append(record.to_dict())
+                    results[record.stock_code] = (
+                        periods, record_expires if expires_at is None else min(expires_at, record_expires))
+        except Exception as e:
+            self.logger.error(f"从数据库读取财务数据失败: {e}")
+        return results
+
+    def _save_financial_data_to_db(self, rows: List[Dict]) -> int:
+        if not USE_DATABASE or not rows:
+            return 0
+        try:
+            return bulk_upsert(FinancialData, rows)
+        except Exception as e:
+            self.logger.error(f"保存财务数据到数据库失败: {e}")
+            return 0
+
+    def _fetch_financial_data(self, stock_code: str) -> List[Dict]:
+        """从上游获取财务分析指标和财务摘要，按报告期合并"""
+        provider = get_data_provider()
+        akshare_code = self._convert_stock_code_for_akshare(stock_code)
+        periods = {}
+
+        indicator = self._retry_api_call(provider.stock_financial_analysis_indicator, symbol=akshare_code,
+                                         start_year=str(datetime.now().year - 6))
+        if indicator is not None and not indicator.empty and '日期' in indicator.columns:
+            indicator = indicator.assign(_date=pd.to_datetime(indicator['日期'], errors='coerce'))
+            for _, row in indicator.dropna(subset=['_date']).sort_values('_date').iterrows():
+                period = _report_period(row['_date'])
+                values = periods.setdefault(period, {})
+                for column, field in FINANCIAL_INDICATOR_COLUMNS.items():
+                    if column in row.index:
+                        values[field] = _to_float(row[column])
+
+        abstract = self._retry_api_call(provider.stock_financial_abstract, symbol=akshare_code)
+        for period, field, value in self._parse_financial_abstract(abstract):
+            periods.setdefault(period, {})[field] = value
+
+        return [dict(values, report_period=period) for period, values in sorted(periods.items())]
+
+    def _parse_financial_abstract(self, abstract: pd.DataFrame):
+        """解析财务摘要，产出 (报告期, 字段, 数值)
+
+        新版接口为宽表：'指标' 列为指标名，其余 YYYYMMDD 列为各报告期；
+        旧版为长表：每行一个报告期，指标为列。
+        """
+        if abstract is None or abstract.empty:
+            return
+        if '指标' in abstract.columns:
+            date_columns = [c for c in abstract.columns if str(c).isdigit() and len(str(c)) == 8]
+            names = abstract['指标'].astype(str).str.strip()
+            for field, candidates in FINANCIAL_ABSTRACT_ROWS.items():
+                for name in candidates:
+                    matched = abstract[names == name]
+                    if matched.empty:
+                        continue
+                    row = matched.iloc[0]
+                    for column in date_columns:
+                        value = _to_float(row[column])
+                        if value is not None:
+                            yield _report_period(column), field, value
+                    break
+            return
+
+        date_column = next((c for c in ('截止日期', '报告期', '日期') if c in abstract.columns), None)
+        if date_column is None:
+            return
+        for _, row in abstract.iterrows():
+            period = _report_period(row[date_column])
+            if period is None:
+                continue
+            for field, candidates in FINANCIAL_ABSTRACT_ROWS.items():
+                name = next((c for c in candidates if c in row.index), None)
+                value = _to_float(row[name]) if name else None
+                if value is not None:
+                    yield period, field, value
+
+    def _financial_rows(self, stock_code: str, market_type: str, periods: List[Dict],
+                        expires_at: datetime) -> List[Dict]:
+        return [dict(p, stock_code=stock_code, market_type=market_type, expires_at=expires_at) for p in periods]
+
+    @traced('data_service.get_financial_data')
+    def get_financial_data(self, stock_code: str, market_type: str = 'A') -> List[Dict]:
+        """获取按报告期升序排列的财务数据
+
+        依次查询内存缓存、数据库 FinancialData 表和上游接口；过期时间按定期报告
+        披露节奏计算，上游失败时退回数据库中的过期记录。
+        """
+        cache_key = self._get_cache_key('financial_data', stock_code=stock_code, market_type=market_type)
+        cached = self._check_expiring_cache(cache_key)
+        if cached is not None:
+            return cached
+
+        stale = None
+        if USE_DATABASE:
+            start_time = time.perf_counter()
+            db_result = self._load_financial_data_from_db([stock_code], market_type).get(stock_code)
+            lookup_time = time.perf_counter() - start_time
+            if db_result:
+                periods, expires_at = db_result
+                if expires_at > datetime.now():
+                    performance_monitor.record_cache_hit(lookup_time, level='DATABASE')
+                    self._set_expiring_cache(cache_key, periods, expires_at)
+                    return periods
+                stale = periods
+            performance_monitor.record_cache_miss(lookup_time, level='DATABASE')
+
+        if market_type != 'A':
+            # 财务接口只覆盖A股
+            return stale or []
+
+        try:
+            periods = self._fetch_financial_data(stock_code)
+        except Exception as e:
+            self.logger.error(f"获取股票 {stock_code} 财务数据失败: {e}")
+            return stale or []
+
+        expires_at = financial_data_expiry()
+        rows = self._financial_rows(stock_code, market_type, periods, expires_at)
+        self._save_financial_data_to_db(rows)
+        periods = [{k: v for k, v in row.items() if k != 'expires_at'} for row in rows]
+        self._set_expiring_cache(cache_key, periods, expires_at)
+        self.logger.debug("获取股票 %s 财务数据: %d 个报告期", stock_code, len(periods))
+        return periods
+
+    def prefetch_financial_data(self, stock_codes: List[str], market_type: str = 'A',
+                                max_workers: int = 4) -> Dict:
+        """批量预取财务数据
+
+        一次查询数据库，只对缺失或过期的股票并发访问上游，结果合并为一次批量写入。
+        """
+        stats = {'total': len(stock_codes), 'memory': 0, 'database': 0, 'fetched': 0, 'failed': 0}
+        missing = []
+        for stock_code in dict.fromkeys(stock_codes):
+            cache_key = self._get_cache_key('financial_data', stock_code=stock_code, market_type=market_type)
+            if self._check_expiring_cache(cache_key) is not None:
+                stats['memory'] += 1
+            else:
+                missing.append(stock_code)
+
+        if missing and USE_DATABASE:
+            now = datetime.now()
+            for stock_code, (periods, expires_at) in self._load_financial_data_from_db(missing, market_type).items():
+                if expires_at > now:
+                    cache_key = self._get_cache_key('financial_data', stock_code=stock_code, market_type=market_type)
+                    self._set_expiring_cache(cache_key, periods, expires_at)
+                    missing.remove(stock_code)
+                    stats['database'] += 1
+
+        if missing and market_type == 'A':
+            expires_at = financial_data_expiry()
+            rows = []
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                # 每个任务复制当前上下文，批量任务设置的上游预算在工作线程中同样生效
+                futures = {
+                    executor.submit(contextvars.copy_context().run, self._fetch_financial_data, stock_code): stock_code
+                    for stock_code in missing
+                }
+                for future, stock_code in futures.items():
+                    try:
+                        periods = future.result()
+                    except Exception as e:
+                        self.logger.warning(f"预取股票 {stock_code} 财务数据失败: {e}")
+                        stats['failed'] += 1
+                        continue
+                    stock_rows = self._financial_rows(stock_code, market_type, periods, expires_at)
+                    rows.extend(stock_rows)
+                    cache_key = self._get_cache_key('financial_data', stock_code=stock_code, market_type=market_type)
+                    self._set_expiring_cache(
+                        cache_key, [{k: v for k, v in r.items() if k != 'expires_at'} for r in stock_rows], expires_at)
+                    stats['fetched'] += 1
+            self._save_financial_data_to_db(rows)
+
+        self.logger.info(f"预取财务数据: 内存命中 {stats['memory']}, 数据库命中 {stats['database']}, "
+                         f"上游获取 {stats['fetched']}, 失败 {stats['failed']}")
+        return stats
+
+    @traced('data_service.get_stock_valuation')
+    def get_stock_valuation(self, stock_code: str) -> Optional[Dict]:
+        """获取最新估值指标（PE/PB/PS），缓存到下一个收盘后"""
+        cache_key = self._get_cache_key('valuation', stock_code=stock_code)
+        cached = self._check_expiring_cache(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            provider = get_data_provider()
+            df = self._retry_api_call(provider.stock_value_em,
+                                      symbol=self._convert_stock_code_for_akshare(stock_code))
+        except Exception as e:
+            self.logger.error(f"获取股票 {stock_code} 估值指标失败: {e}")
+            return None
+        if df is None or df.empty:
+            return None
+
+        if '数据日期' in df.columns:
+            df = df.sort_values('数据日期')
+        latest = df.iloc[-1]
+        valuation = {
+            'trade_date': str(latest.get('数据日期', ''))[:10],
+            'pe_ttm': _to_float(latest.get('PE(TTM)')),
+            'pb': _to_float(latest.get('市净率')),
+            'ps_ttm': _to_float(latest.get('市销率')),
+        }
+        self._set_expiring_cache(cache_key, valuation, next_close_expiry())
+        return valuation
+
+    # ==================== 行业板块 ====================
+
+    @traced('data_service.get_industry_board_history')
+    def get_industry_board_history(self, industry: str, industry_code: str = None,
+                                   days: int = 60) -> Optional[pd.DataFrame]:
+        """获取行业板块日线（按日期升序），缓存到下一个收盘后
+
+        新版接口以板块名称查询；失败时按旧版接口以板块代码重试一次。
+        """
+        cache_key = self._get_cache_key('industry_history', industry=industry, days=days)
+        cached = self._check_expiring_cache(cache_key)
+        if cached is not None:
+            return cached
+
+        provider = get_data_provider()
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+        try:
+            df = self._retry_api_call(provider.stock_board_industry_hist_em, symbol=industry,
+                                      start_date=start_date.strftime('%Y%m%d'),
+                                      end_date=end_date.strftime('%Y%m%d'), period='日k', adjust='')
+        except Exception as e:
+            if not industry_code:
+                self.logger.warning(f"获取行业 {industry} 日线失败: {e}")
+                return None
+            try:
+                df = provider.stock_board_industry_hist_em(symbol=industry_code)
+            except Exception as code_error:
+                self.logger.warning(f"获取行业 {industry} 日线失败: {e}, {code_error}")
+                return None
+
+        if df is None or df.empty:
+            return None
+        if '日期' in df.columns:
+            df = df.sort_values('日期').reset_index(drop=True)
+        self._set_expiring_cache(cache_key, df, next_close_expiry())
+        return df
+
+    def get_index_constituents(self, index_code: str) -> List[Tuple[str, float]]:
+        """获取指数成分股及权重 [(代码, 权重)]，按权重降序，缓存 INDEX_CONSTITUENTS_TTL
+
+        优先取中证指数官网的权重；失败时改用成分股列表，权重按列表顺序递减。
+        """
+        cache_key = self._get_cache_key('index_constituents', index_code=index_code)
+        cached = self._check_expiring_cache(cache_key)
+        if cached is not None:
+            return cached
+
+        provider = get_data_provider()
+        constituents = []
+        try:
+            df = self._retry_api_call(provider.index_stock_cons_weight_csindex, symbol=index_code)
+            codes = df['成分券代码'].astype(str).str.zfill(6)
+            weight_column = next((c for c in ('权重', '权重(%)') if c in df.columns), None)
+            weights = pd.to_numeric(df[weight_column], errors='coerce').fillna(0.0) \
+                if weight_column else pd.Series(1.0, index=df.index)
+            constituents = sorted(zip(codes.tolist(), weights.astype(float).tolist()),
+                                  key=lambda item: item[1], reverse=True)
+        except Exception as e:
+            self.logger.warning(f"获取指数 {index_code} 成分股权重失败，改用成分股列表: {e}")
+
+        if not constituents:
+            try:
+                df = self._retry_api_call(provider.index_stock_cons, symbol=index_code)
+                codes = df['品种代码'].astype(str).str.zfill(6).tolist()
+                constituents = [(code, float(len(codes) - i)) for i, code in enumerate(codes)]
+            except Exception as e:
+                self.logger.error(f"获取指数 {index_code} 成分股失败: {e}")
+                return []
+
+        if constituents:
+            self._set_expiring_cache(cache_key, constituents,
+                                     datetime.now() + timedelta(seconds=INDEX_CONSTITUENTS_TTL))
+        return constituents
+
+    def get_industry_constituents(self, industry: str) -> List[str]:
+        """获取行业板块成分股代码列表，缓存 INDEX_CONSTITUENTS_TTL"""
+        cache_key = self._get_cache_key('industry_constituents', industry=industry)
+        cached = self._check_expiring_cache(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            df = self._retry_api_call(get_data_provider().stock_board_industry_cons_em, symbol=industry)
+        except Exception as e:
+            self.logger.error(f"获取行业 {industry} 成分股失败: {e}")
+            return []
+        if df is None or '代码' not in df.columns:
+            return []
+
+        codes = df['代码'].astype(str).str.zfill(6).tolist()
+        if codes:
+            self._set_expiring_cache(cache_key, codes, datetime.now() + timedelta(seconds=INDEX_CONSTITUENTS_TTL))
+        return codes
+
 
 # 全局数据服务实例
 data_service = DataService()
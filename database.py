@@ -1,13 +1,16 @@
 import os
+import threading
+import weakref
 from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, JSON, Boolean
 try:
     from sqlalchemy.dialects.mysql import DECIMAL
 except ImportError:
     # 如果MySQL驱动不可用，使用通用的Numeric类型
     from sqlalchemy import Numeric as DECIMAL
-from sqlalchemy import Index
+from sqlalchemy import Index, UniqueConstraint, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.expression import Insert, Update, Delete
+from sqlalchemy.orm import sessionmaker, Session as OrmSession
 from datetime import datetime
 import logging
 
@@ -62,6 +65,80 @@ REALTIME_DATA_TTL = int(os.getenv('REALTIME_DATA_TTL', '300'))  # 5分钟
 BASIC_INFO_TTL = int(os.getenv('BASIC_INFO_TTL', '604800'))  # 7天
 FINANCIAL_DATA_TTL = int(os.getenv('FINANCIAL_DATA_TTL', '7776000'))  # 90天
 
+# SQLite性能配置
+SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'wal').lower()  # wal | legacy
+SQLITE_READ_POOL_SIZE = int(os.getenv('SQLITE_READ_POOL_SIZE', '8'))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))  # 64MB
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', '268435456'))  # 256MB
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '30000'))
+
+
+def _use_sqlite_wal_profile(url):
+    """是否对该URL启用SQLite WAL配置（内存库不支持WAL）"""
+    if not url.lower().startswith('sqlite') or SQLITE_PROFILE != 'wal':
+        return False
+    return ':memory:' not in url and url.rstrip('/') not in ('sqlite:', 'sqlite+pysqlite:')
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """新建SQLite连接时设置WAL及性能相关PRAGMA"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def create_sqlite_engines(url):
+    """创建SQLite读写引擎
+
+    WAL模式下读不阻塞写、写不阻塞读，但同一时刻只能有一个写事务；
+    因此写操作统一走只有一个连接的写引擎（连接池即写队列），
+    读操作使用独立的读连接池。
+
+    Returns:
+        (读引擎, 写引擎)
+    """
+    from sqlalchemy.pool import QueuePool
+
+    connect_args = {
+        'check_same_thread': False,
+        'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+    }
+    read_engine = create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=SQLITE_READ_POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+        echo=False,
+        connect_args=connect_args
+    )
+    writer = create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+        echo=False,
+        connect_args=connect_args
+    )
+    event.listen(read_engine, 'connect', _apply_sqlite_pragmas)
+    event.listen(writer, 'connect', _apply_sqlite_pragmas)
+
+    logger.info(f"SQLite启用WAL配置: 读连接池{SQLITE_READ_POOL_SIZE}, 单写连接")
+    return read_engine, writer
+
+
+# 写引擎：SQLite WAL配置下为单独的单连接引擎，其余情况与 engine 相同
+write_engine = None
+
 # 创建引擎，添加连接池配置
 if 'mysql' in DATABASE_URL.lower():
     engine = create_engine(
@@ -81,10 +158,16 @@ if 'mysql' in DATABASE_URL.lower():
             "write_timeout": 60
         }
     )
+elif _use_sqlite_wal_profile(DATABASE_URL):
+    # SQLite WAL配置：读连接池 + 单写连接
+    engine, write_engine = create_sqlite_engines(DATABASE_URL)
 else:
     # SQLite配置
     engine = create_engine(DATABASE_URL, echo=False)
 
+if write_engine is None:
+    write_engine = engine
+
 Base = declarative_base()
 
 
@@ -184,6 +267,7 @@ class StockBasicInfo(Base):
     __table_args__ = (
         Index('idx_stock_market', 'stock_code', 'market_type'),
         Index('idx_expires_at', 'expires_at'),
+        UniqueConstraint('stock_code', 'market_type', name='uq_basic_info_stock_market'),
     )
 
     def to_dict(self):
@@ -229,6 +313,7 @@ class StockPriceHistory(Base):
     __table_args__ = (
         Index('idx_stock_date', 'stock_code', 'market_type', 'trade_date'),
         Index('idx_trade_date', 'trade_date'),
+        Index('idx_price_created_at', 'created_at'),  # 供缓存清理按写入时间分块
     )
 
     def to_dict(self):
@@ -269,6 +354,7 @@ class StockRealtimeData(Base):
     __table_args__ = (
         Index('idx_stock_realtime', 'stock_code', 'market_type'),
         Index('idx_realtime_expires', 'expires_at'),
+        UniqueConstraint('stock_code', 'market_type', name='uq_realtime_stock_market'),
     )
 
     def to_dict(self):
@@ -319,6 +405,7 @@ class FinancialData(Base):
     __table_args__ = (
         Index('idx_stock_financial', 'stock_code', 'market_type', 'report_period'),
         Index('idx_financial_expires', 'expires_at'),
+        UniqueConstraint('stock_code', 'market_type', 'report_period', name='uq_financial_stock_period'),
     )
 
     def to_dict(self):
@@ -354,9 +441,22 @@ class CapitalFlowData(Base):
     stock_code = Column(String(10), nullable=False, index=True)
     market_type = Column(String(5), nullable=False)
     trade_date = Column(String(10), nullable=False)  # YYYY-MM-DD格式
+    period = Column(String(10), nullable=False, default='今日')  # 统计周期 今日/3日/5日/10日
+    stock_name = Column(String(50))  # 股票名称
+    price = Column(Float)  # 最新价
+    change_pct = Column(Float)  # 周期涨跌幅
     main_inflow = Column(Float)  # 主力流入
     main_outflow = Column(Float)  # 主力流出
     main_net_flow = Column(Float)  # 主力净流入
+    main_net_pct = Column(Float)  # 主力净占比
+    super_large_net_flow = Column(Float)  # 超大单净流入
+    super_large_net_pct = Column(Float)  # 超大单净占比
+    large_net_flow = Column(Float)  # 大单净流入
+    large_net_pct = Column(Float)  # 大单净占比
+    medium_net_flow = Column(Float)  # 中单净流入
+    medium_net_pct = Column(Float)  # 中单净占比
+    small_net_flow = Column(Float)  # 小单净流入
+    small_net_pct = Column(Float)  # 小单净占比
     retail_inflow = Column(Float)  # 散户流入
     retail_outflow = Column(Float)  # 散户流出
     retail_net_flow = Column(Float)  # 散户净流入
@@ -369,6 +469,8 @@ class CapitalFlowData(Base):
     __table_args__ = (
         Index('idx_stock_flow_date', 'stock_code', 'market_type', 'trade_date'),
         Index('idx_flow_expires', 'expires_at'),
+        Index('idx_flow_period_date', 'period', 'trade_date'),
+        UniqueConstraint('stock_code', 'market_type', 'trade_date', 'period', name='uq_flow_stock_date_period'),
     )
 
     def to_dict(self):
@@ -376,9 +478,22 @@ class CapitalFlowData(Base):
             'stock_code': self.stock_code,
             'market_type': self.market_type,
             'trade_date': self.trade_date,
+            'period': self.period,
+            'stock_name': self.stock_name,
+            'price': self.price,
+            'change_pct': self.change_pct,
             'main_inflow': self.main_inflow,
             'main_outflow': self.main_outflow,
             'main_net_flow': self.main_net_flow,
+            'main_net_pct': self.main_net_pct,
+            'super_large_net_flow': self.super_large_net_flow,
+            'super_large_net_pct': self.super_large_net_pct,
+            'large_net_flow': self.large_net_flow,
+            'large_net_pct': self.large_net_pct,
+            'medium_net_flow': self.medium_net_flow,
+            'medium_net_pct': self.medium_net_pct,
+            'small_net_flow': self.small_net_flow,
+            'small_net_pct': self.small_net_pct,
             'retail_inflow': self.retail_inflow,
             'retail_outflow': self.retail_outflow,
             'retail_net_flow': self.retail_net_flow,
@@ -391,8 +506,129 @@ class CapitalFlowData(Base):
         return self.expires_at and datetime.now() > self.expires_at
 
 
+class RoutingSession(OrmSession):
+    """读写分离会话：flush 及 INSERT/UPDATE/DELETE 走写引擎，其余查询走读引擎
+
+    一旦本事务写过（flush 或执行写语句），之后的所有语句都固定走写连接，
+    直到提交或回滚：读连接看不到本事务未提交的写入。
+    写连接只有一个，固定期间本线程经 submit_write 提交的写操作会直接报错，见 submit_write。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pinned_to_writer = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            if not self._pinned_to_writer:
+                self._pinned_to_writer = True
+                _pinned_sessions().add(self)
+        if self._pinned_to_writer:
+            return write_engine
+        return engine
+
+
+# 各线程中正固定在写连接上的会话（弱引用：被回收的会话不再占用写连接）
+_writer_pins = threading.local()
+
+
+def _pinned_sessions():
+    if not hasattr(_writer_pins, 'sessions'):
+        _writer_pins.sessions = weakref.WeakSet()
+    return _writer_pins.sessions
+
+
+def _unpin_writer(session, transaction):
+    """最外层事务结束（提交或回滚）后，读操作重新走读引擎"""
+    if transaction.parent is None and session._pinned_to_writer:
+        session._pinned_to_writer = False
+        _pinned_sessions().discard(session)
+
+
+event.listen(RoutingSession, 'after_transaction_end', _unpin_writer)
+
+
 # 创建会话工厂
-Session = sessionmaker(bind=engine)
+if write_engine is engine:
+    Session = sessionmaker(bind=engine)
+else:
+    Session = sessionmaker(class_=RoutingSession)
+
+
+class SQLiteWriteQueue:
+    """SQLite写队列
+
+    由一个后台线程按提交顺序在写引擎上执行写操作，调用方拿到 Future，
+    可以等待结果，也可以直接返回（如缓存回写）。
+    """
+
+    def __init__(self, bind):
+        import queue
+        import threading
+
+        self.bind = bind
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, daemon=True, name='sqlite-writer')
+        self._thread.start()
+
+    def _worker(self):
+        while True:
+            func, args, kwargs, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with self.bind.begin() as conn:
+                    result = func(conn, *args, **kwargs)
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+
+    def submit(self, func, *args, **kwargs):
+        """提交写操作 func(conn, ...)，返回 Future"""
+        from concurrent.futures import Future
+
+        future = Future()
+        self._queue.put((func, args, kwargs, future))
+        return future
+
+    def pending(self):
+        """排队中的写操作数量"""
+        return self._queue.qsize()
+
+
+_write_queue = None
+
+
+def submit_write(func, *args, **kwargs):
+    """提交写操作 func(conn, ...)
+
+    SQLite WAL配置下进入写队列串行执行；其他数据库直接在事务中执行。
+
+    Returns:
+        Future
+
+    Raises:
+        RuntimeError: 当前线程有会话正占用唯一的写连接。写队列线程拿不到连接，
+            等待结果只会卡满连接池超时，因此直接报错，需先提交或回滚该会话
+    """
+    global _write_queue
+    from concurrent.futures import Future
+
+    if write_engine is engine:
+        future = Future()
+        try:
+            with engine.begin() as conn:
+                future.set_result(func(conn, *args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    if _pinned_sessions():
+        raise RuntimeError("当前线程的数据库会话已写入且未提交，占用着SQLite写连接；"
+                           "请先提交或回滚该会话再提交写操作")
+    if _write_queue is None:
+        _write_queue = SQLiteWriteQueue(write_engine)
+    return _write_queue.submit(func, *args, **kwargs)
 
 
 # ==================== 数据库管理功能 ====================
@@ -400,7 +636,9 @@ Session = sessionmaker(bind=engine)
 def init_db():
     """初始化数据库"""
     try:
-        Base.metadata.create_all(engine)
+        add_missing_columns()
+        Base.metadata.create_all(write_engine)
+        ensure_upsert_constraints()
         logger.info("数据库初始化成功")
     except Exception as e:
         logger.error(f"数据库初始化失败: {e}")
@@ -427,54 +665,17 @@ def test_connection():
 
 
 def cleanup_expired_cache():
-    """清理过期的缓存数据"""
+    """清理过期的缓存数据
+
+    按 expires_at 索引分块删除，每块单独提交，避免长事务锁表。
+    """
     if not USE_DATABASE:
         return
 
     try:
-        session = get_session()
-        current_time = datetime.now()
-
-        # 清理过期的实时数据
-        expired_realtime = session.query(StockRealtimeData).filter(
-            StockRealtimeData.expires_at < current_time
-        ).count()
-        session.query(StockRealtimeData).filter(
-            StockRealtimeData.expires_at < current_time
-        ).delete()
-
-        # 清理过期的基本信息
-        expired_basic = session.query(StockBasicInfo).filter(
-            StockBasicInfo.expires_at < current_time
-        ).count()
-        session.query(StockBasicInfo).filter(
-            StockBasicInfo.expires_at < current_time
-        ).delete()
-
-        # 清理过期的财务数据
-        expired_financial = session.query(FinancialData).filter(
-            FinancialData.expires_at < current_time
-        ).count()
-        session.query(FinancialData).filter(
-            FinancialData.expires_at < current_time
-        ).delete()
-
-        # 清理过期的资金流向数据
-        expired_flow = session.query(CapitalFlowData).filter(
-            CapitalFlowData.expires_at < current_time
-        ).count()
-        session.query(CapitalFlowData).filter(
-            CapitalFlowData.expires_at < current_time
-        ).delete()
-
-        session.commit()
-        session.close()
-
-        total_cleaned = expired_realtime + expired_basic + expired_financial + expired_flow
-        if total_cleaned > 0:
-            logger.info(f"清理过期缓存数据: 实时数据{expired_realtime}条, "
-                       f"基本信息{expired_basic}条, 财务数据{expired_financial}条, "
-                       f"资金流向{expired_flow}条")
+        # 延迟导入，避免循环依赖
+        from cache_reaper import reap_expired_cache
+        return reap_expired_cache()
 
     except Exception as e:
         logger.error(f"清理过期缓存失败: {e}")
@@ -534,60 +735,250 @@ def batch_get_realtime_data(stock_codes):
         return {}
 
 
+# ==================== 批量UPSERT ====================
+
+# 支持 upsert 的快照表及其唯一键
+UPSERT_KEYS = {
+    'stock_basic_info_cache': ('stock_code', 'market_type'),
+    'stock_realtime_data_cache': ('stock_code', 'market_type'),
+    'financial_data_cache': ('stock_code', 'market_type', 'report_period'),
+    'capital_flow_data_cache': ('stock_code', 'market_type', 'trade_date', 'period'),
+}
+UPSERT_CHUNK_SIZE = int(os.getenv('UPSERT_CHUNK_SIZE', '500'))
+
+
+def add_missing_columns(bind=None):
+    """为旧库补齐模型中新增的列
+
+    create_all 不会修改已存在的表，旧库表结构落后于模型时用
+    ALTER TABLE ... ADD COLUMN 逐列补齐（不删表、不丢数据），并补建模型中新增的索引。
+    NOT NULL 且没有标量默认值的列无法为已有行补值，只记录警告。
+    """
+    from sqlalchemy import inspect, text
+
+    bind = bind or write_engine
+    try:
+        inspector = inspect(bind)
+        existing_tables = set(inspector.get_table_names())
+    except Exception as e:
+        logger.warning(f"检查表结构失败: {e}")
+        return
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        try:
+            existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+            missing = [c for c in table.columns if c.name not in existing_columns]
+            existing_indexes = {idx['name'] for idx in inspector.get_indexes(table.name)}
+            if not missing and all(index.name in existing_indexes for index in table.indexes):
+                continue
+
+            added = []
+            with bind.begin() as conn:
+                for column in missing:
+                    column_sql = f"{column.name} {column.type.compile(dialect=bind.dialect)}"
+                    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                    if default is not None:
+                        literal = f"'{default}'" if isinstance(default, str) else default
+                        column_sql += f" DEFAULT {literal}"
+                    if not column.nullable:
+                        if default is None:
+                            logger.warning(f"{table.name}.{column.name} 为 NOT NULL 且无默认值，无法自动补齐")
+                            continue
+                        column_sql += " NOT NULL"
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_sql}"))
+                    added.append(column.name)
+
+                created = []
+                for index in table.indexes:
+                    if index.name not in existing_indexes \
+                            and {c.name for c in index.columns} <= existing_columns | set(added):
+                        index.create(conn)
+                        created.append(index.name)
+            if added or created:
+                logger.info(f"表 {table.name} 已补齐列 {added}，索引 {created}")
+        except Exception as e:
+            logger.warning(f"补齐表 {table.name} 的列失败: {e}")
+
+
+def ensure_upsert_constraints(bind=None):
+    """为旧库补齐 upsert 依赖的唯一约束
+
+    早期版本的快照表只有普通索引，可能存在同一唯一键的重复记录；
+    先按 UPSERT_KEYS 中的唯一键保留最新一条，再创建唯一索引。
+    """
+    from sqlalchemy import inspect, text
+
+    bind = bind or write_engine
+    try:
+        inspector = inspect(bind)
+        existing_tables = set(inspector.get_table_names())
+    except Exception as e:
+        logger.warning(f"检查唯一约束失败: {e}")
+        return
+
+    for table_name, key_columns in UPSERT_KEYS.items():
+        if table_name not in existing_tables:
+            continue
+        try:
+            keys = list(key_columns)
+            has_unique = any(
+                list(c.get('column_names') or []) == keys
+                for c in inspector.get_unique_constraints(table_name)
+            ) or any(
+                idx.get('unique') and list(idx.get('column_names') or []) == keys
+                for idx in inspector.get_indexes(table_name)
+            )
+            if has_unique:
+                continue
+
+            key_sql = ', '.join(keys)
+            with bind.begin() as conn:
+                conn.execute(text(
+                    f"DELETE FROM {table_name} WHERE id NOT IN ("
+                    f"SELECT id FROM (SELECT MAX(id) AS id FROM {table_name} "
+                    f"GROUP BY {key_sql}) AS keep_rows)"
+                ))
+                conn.execute(text(
+                    f"CREATE UNIQUE INDEX uq_{table_name}_key ON {table_name} ({key_sql})"
+                ))
+            logger.info(f"已为 {table_name} 创建唯一索引 ({key_sql})")
+        except Exception as e:
+            logger.warning(f"为 {table_name} 创建唯一索引失败: {e}")
+
+
+def _dialect_insert(bind):
+    """按数据库方言返回支持冲突更新的 insert 构造函数"""
+    dialect = bind.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None, dialect
+    return insert, dialect
+
+
+def bulk_upsert(model, rows, key_columns=None, bind=None, chunk_size=None):
+    """按唯一键批量插入或更新
+
+    SQLite/PostgreSQL 使用 INSERT ... ON CONFLICT DO UPDATE，
+    MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE，每块一条语句，
+    语句数量只与块数有关，与股票数量无关。
+
+    Args:
+        model: ORM 模型类
+        rows: 字典列表，键为模型列名，多余的键会被忽略
+        key_columns: 唯一键列，默认从 UPSERT_KEYS 读取
+        bind: Engine，默认经由 submit_write 写入口执行
+        chunk_size: 每条语句的最大行数
+
+    Returns:
+        int: 写入的行数
+    """
+    if not rows:
+        return 0
+
+    table = model.__table__
+    key_columns = tuple(key_columns or UPSERT_KEYS[table.name])
+    chunk_size = chunk_size or UPSERT_CHUNK_SIZE
+    column_names = set(table.columns.keys()) - {'id'}
+    now = datetime.now()
+
+    # 过滤无效列、补充时间戳，并按唯一键去重（保留最后一条）
+    deduped = {}
+    for row in rows:
+        record = {k: v for k, v in row.items() if k in column_names}
+        record.setdefault('updated_at', now)
+        deduped[tuple(record.get(k) for k in key_columns)] = record
+
+    # 多行语句要求每行列集合一致，按列集合分组
+    groups = {}
+    for record in deduped.values():
+        groups.setdefault(tuple(sorted(record)), []).append(record)
+
+    if bind is None:
+        # 未指定连接时经由写入口执行（SQLite WAL配置下进入写队列）
+        return submit_write(_execute_upsert, table, groups, key_columns, chunk_size).result()
+
+    with bind.begin() as conn:
+        return _execute_upsert(conn, table, groups, key_columns, chunk_size)
+
+
+def _execute_upsert(conn, table, groups, key_columns, chunk_size):
+    """在给定连接上分块执行 upsert 语句"""
+    insert, dialect = _dialect_insert(conn)
+    written = 0
+
+    for columns, group in groups.items():
+        update_columns = [c for c in columns if c not in key_columns and c != 'created_at']
+        for i in range(0, len(group), chunk_size):
+            chunk = group[i:i + chunk_size]
+
+            if insert is None:
+                # 未知方言：退回逐行查询更新
+                _upsert_rows_fallback(conn, table, chunk, key_columns, update_columns)
+                written += len(chunk)
+                continue
+
+            # executemany 形式复用已编译语句，驱动层会合并为多行 VALUES
+            stmt = insert(table)
+            if dialect == 'mysql':
+                stmt = stmt.on_duplicate_key_update(
+                    {c: stmt.inserted[c] for c in update_columns}
+                )
+            elif update_columns:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=list(key_columns),
+                    set_={c: stmt.excluded[c] for c in update_columns}
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=list(key_columns))
+            conn.execute(stmt, chunk)
+            written += len(chunk)
+
+    return written
+
+
+def _upsert_rows_fallback(conn, table, rows, key_columns, update_columns):
+    """逐行 upsert（仅用于不支持冲突更新语法的方言）"""
+    from sqlalchemy import and_
+
+    for row in rows:
+        condition = and_(*[table.c[k] == row.get(k) for k in key_columns])
+        result = conn.execute(
+            table.update().where(condition).values({c: row[c] for c in update_columns})
+        ) if update_columns else None
+        if result is None or result.rowcount == 0:
+            conn.execute(table.insert().values(row))
+
+
 def batch_save_stock_data(data_list, data_type):
-    """批量保存股票数据，优化保存性能"""
+    """批量保存股票数据，使用方言感知的批量UPSERT"""
     if not USE_DATABASE or not data_list:
         return False
 
-    try:
-        session = get_session()
-
-        if data_type == 'basic_info':
-            # 批量保存基本信息
-            for data in data_list:
-                existing = session.query(StockBasicInfo).filter_by(
-                    stock_code=data['stock_code']
-                ).first()
-
-                if existing:
-                    # 更新现有记录
-                    for key, value in data.items():
-                        if hasattr(existing, key):
-                            setattr(existing, key, value)
-                else:
-                    # 创建新记录
-                    new_record = StockBasicInfo(**data)
-                    session.add(new_record)
-
-        elif data_type == 'realtime':
-            # 批量保存实时数据
-            for data in data_list:
-                existing = session.query(StockRealtimeData).filter_by(
-                    stock_code=data['stock_code']
-                ).first()
-
-                if existing:
-                    # 更新现有记录
-                    for key, value in data.items():
-                        if hasattr(existing, key):
-                            setattr(existing, key, value)
-                else:
-                    # 创建新记录
-                    new_record = StockRealtimeData(**data)
-                    session.add(new_record)
-
-        # 批量提交
-        session.commit()
-        session.close()
+    model = {'basic_info': StockBasicInfo, 'realtime': StockRealtimeData}.get(data_type)
+    if model is None:
+        logger.warning(f"不支持的批量保存类型: {data_type}")
+        return False
 
-        logger.info(f"批量保存{data_type}数据成功: {len(data_list)}条记录")
+    try:
+        rows = []
+        for data in data_list:
+            row = dict(data)
+            row.setdefault('market_type', 'A')
+            rows.append(row)
+
+        written = bulk_upsert(model, rows)
+        logger.info(f"批量保存{data_type}数据成功: {written}条记录")
         return True
 
     except Exception as e:
         logger.error(f"批量保存{data_type}数据失败: {e}")
-        if 'session' in locals():
-            session.rollback()
-            session.close()
         return False
 
 
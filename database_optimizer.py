@@ -7,32 +7,212 @@
 功能：优化数据库连接池、查询性能、批量操作等
 """
 
+import re
 import time
+import bisect
 import logging
 from contextlib import contextmanager
 from typing import Dict, List, Optional, Any, Tuple
-from sqlalchemy import text, and_, or_
+from sqlalchemy import text, and_, or_, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import QueuePool
 from datetime import datetime, timedelta
 import threading
 
 from database import (
-    engine, get_session, USE_DATABASE,
+    engine, write_engine, Session, get_session, USE_DATABASE,
     StockBasicInfo, StockPriceHistory, StockRealtimeData,
-    FinancialData, CapitalFlowData
+    FinancialData, CapitalFlowData, bulk_upsert
 )
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 查询延迟直方图桶上界（毫秒）
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+_LITERAL_PATTERNS = [
+    (re.compile(r"%\(\w+\)s|%s"), '?'),                 # pymysql 占位符
+    (re.compile(r"'(?:[^']|'')*'"), '?'),                # 字符串字面量
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), '?'),            # 数字字面量
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), '(?+)'),  # IN (?, ?, ...) 折叠
+    (re.compile(r"\s+"), ' '),
+]
+
+
+def fingerprint_statement(statement: str) -> str:
+    """将SQL语句归一化为指纹：去掉字面量、折叠IN列表和空白"""
+    fingerprint = statement.strip()
+    for pattern, replacement in _LITERAL_PATTERNS:
+        fingerprint = pattern.sub(replacement, fingerprint)
+    return fingerprint
+
+
+class LatencyHistogram:
+    """固定桶延迟直方图"""
+
+    __slots__ = ('count', 'total_ms', 'max_ms', 'buckets', 'rows')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.rows = 0
+
+    def observe(self, elapsed_ms: float, rows: int = 0):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        if rows > 0:
+            self.rows += rows
+
+    def percentile(self, q: float) -> float:
+        """按桶上界估算分位数（毫秒）"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': round(self.percentile(0.50), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'rows': self.rows,
+            'buckets': {
+                ('+Inf' if bound == float('inf') else str(bound)): bucket_count
+                for bound, bucket_count in zip(LATENCY_BUCKETS_MS, self.buckets)
+            }
+        }
+
+
+class QueryInstrumentation:
+    """语句级查询统计
+
+    通过 SQLAlchemy 引擎事件 before/after_cursor_execute 记录每个语句指纹的
+    延迟直方图和影响行数，并统计 engine.connect() 取连接的等待时间。
+    """
+
+    def __init__(self, max_fingerprints: int = 500):
+        self.max_fingerprints = max_fingerprints
+        self.lock = threading.Lock()
+        self.statements: Dict[str, LatencyHistogram] = {}
+        self.pool_wait = LatencyHistogram()
+        self._fingerprint_cache: Dict[str, str] = {}
+        self._installed = set()
+
+    def install(self, target_engine):
+        """在引擎上注册事件钩子（重复调用无副作用）"""
+        if id(target_engine) in self._installed:
+            return
+        self._installed.add(id(target_engine))
+
+        event.listen(target_engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(target_engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(target_engine, 'handle_error', self._handle_error)
+        self._instrument_connect(target_engine)
+
+    def _instrument_connect(self, target_engine):
+        """包装引擎的 connect() 以测量取连接的等待时间
+
+        会话、engine.begin() 都经由 engine.connect() 取连接，耗时即连接池等待（含新建连接）。
+        """
+        original_connect = target_engine.connect
+
+        def timed_connect():
+            start_time = time.perf_counter()
+            try:
+                return original_connect()
+            finally:
+                elapsed_ms = (time.perf_counter() - start_time) * 1000
+                with self.lock:
+                    self.pool_wait.observe(elapsed_ms)
+
+        target_engine.connect = timed_connect
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def _handle_error(self, exception_context):
+        """语句执行失败时弹出开始时间，避免后续语句取到错位的开始时间"""
+        conn = exception_context.connection
+        if conn is None or exception_context.execution_context is None:
+            return
+        start_stack = conn.info.get('query_start_time')
+        if start_stack:
+            start_stack.pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start_stack = conn.info.get('query_start_time')
+        if not start_stack:
+            return
+        elapsed_ms = (time.perf_counter() - start_stack.pop()) * 1000
+
+        try:
+            rows = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+        except Exception:
+            rows = 0
+
+        fingerprint = self._fingerprint_cache.get(statement)
+        if fingerprint is None:
+            fingerprint = fingerprint_statement(statement)
+            if len(self._fingerprint_cache) < self.max_fingerprints * 4:
+                self._fingerprint_cache[statement] = fingerprint
+
+        with self.lock:
+            histogram = self.statements.get(fingerprint)
+            if histogram is None:
+                if len(self.statements) >= self.max_fingerprints:
+                    fingerprint = '<other>'
+                    histogram = self.statements.setdefault(fingerprint, LatencyHistogram())
+                else:
+                    histogram = self.statements[fingerprint] = LatencyHistogram()
+            histogram.observe(elapsed_ms, rows)
+
+    def get_stats(self, top_n: int = 20, order_by: str = 'total_ms') -> Dict:
+        """按总耗时（或其他字段）排序返回最重的语句指纹"""
+        with self.lock:
+            items = [(fp, hist.to_dict()) for fp, hist in self.statements.items()]
+            pool_wait = self.pool_wait.to_dict()
+
+        items.sort(key=lambda item: item[1].get(order_by, 0), reverse=True)
+        return {
+            'statement_count': len(items),
+            'total_executions': sum(stats['count'] for _, stats in items),
+            'top_statements': [dict(stats, fingerprint=fp) for fp, stats in items[:top_n]],
+            'pool_checkout_wait': pool_wait
+        }
+
+    def reset(self):
+        """清空统计"""
+        with self.lock:
+            self.statements.clear()
+            self.pool_wait = LatencyHistogram()
+
+
+# 全局查询统计实例
+query_instrumentation = QueryInstrumentation()
+
+
 class DatabaseOptimizer:
     """数据库优化器"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.session_factory = sessionmaker(bind=engine)
+        self.session_factory = Session
         self.connection_stats = {
             'total_queries': 0,
             'slow_queries': 0,
@@ -43,6 +223,11 @@ class DatabaseOptimizer:
         }
         self.slow_query_threshold = 1.0  # 慢查询阈值（秒）
         self.lock = threading.Lock()
+
+        # 语句级统计：读写引擎都挂上事件钩子
+        self.query_instrumentation = query_instrumentation
+        self.query_instrumentation.install(engine)
+        self.query_instrumentation.install(write_engine)
     
     @contextmanager
     def get_optimized_session(self):
@@ -150,116 +335,94 @@ class DatabaseOptimizer:
         return results
     
     def batch_save_stock_basic_info(self, stock_data_list: List[Dict]) -> bool:
-        """批量保存股票基本信息"""
+        """批量保存股票基本信息（批量UPSERT）"""
         if not USE_DATABASE or not stock_data_list:
             return False
         
+        start_time = time.time()
         try:
-            with self.get_optimized_session() as session:
-                # 批量删除旧记录
-                stock_codes = [data['stock_code'] for data in stock_data_list]
-                session.query(StockBasicInfo).filter(
-                    StockBasicInfo.stock_code.in_(stock_codes)
-                ).delete(synchronize_session=False)
-                
-                # 批量插入新记录
-                records = []
-                for data in stock_data_list:
-                    expires_at = datetime.now() + timedelta(seconds=data.get('ttl', 604800))
-                    record = StockBasicInfo(
-                        stock_code=data['stock_code'],
-                        stock_name=data.get('stock_name', ''),
-                        market_type=data.get('market_type', 'A'),
-                        industry=data.get('industry', ''),
-                        sector=data.get('sector', ''),
-                        list_date=data.get('list_date', ''),
-                        total_share=data.get('total_share', 0.0),
-                        float_share=data.get('float_share', 0.0),
-                        market_cap=data.get('market_cap', 0.0),
-                        pe_ratio=data.get('pe_ratio', 0.0),
-                        pb_ratio=data.get('pb_ratio', 0.0),
-                        expires_at=expires_at
-                    )
-                    records.append(record)
-                
-                session.bulk_save_objects(records)
-                self.logger.info(f"批量保存股票基本信息: {len(records)} 条记录")
-                return True
+            now = datetime.now()
+            rows = []
+            for data in stock_data_list:
+                rows.append({
+                    'stock_code': data['stock_code'],
+                    'stock_name': data.get('stock_name', ''),
+                    'market_type': data.get('market_type', 'A'),
+                    'industry': data.get('industry', ''),
+                    'sector': data.get('sector', ''),
+                    'list_date': data.get('list_date', ''),
+                    'total_share': data.get('total_share', 0.0),
+                    'float_share': data.get('float_share', 0.0),
+                    'market_cap': data.get('market_cap', 0.0),
+                    'pe_ratio': data.get('pe_ratio', 0.0),
+                    'pb_ratio': data.get('pb_ratio', 0.0),
+                    'expires_at': now + timedelta(seconds=data.get('ttl', 604800))
+                })
+            
+            written = bulk_upsert(StockBasicInfo, rows)
+            self.logger.info(f"批量保存股票基本信息: {written} 条记录")
+            return True
                 
         except Exception as e:
+            self._record_failed_query()
             self.logger.error(f"批量保存股票基本信息失败: {e}")
             return False
+        finally:
+            self._record_query_stats(time.time() - start_time)
     
     def batch_save_stock_realtime_data(self, stock_data_list: List[Dict]) -> bool:
-        """批量保存股票实时数据"""
+        """批量保存股票实时数据（批量UPSERT）"""
         if not USE_DATABASE or not stock_data_list:
             return False
         
+        start_time = time.time()
         try:
-            with self.get_optimized_session() as session:
-                # 批量删除旧记录
-                stock_codes = [data['stock_code'] for data in stock_data_list]
-                session.query(StockRealtimeData).filter(
-                    StockRealtimeData.stock_code.in_(stock_codes)
-                ).delete(synchronize_session=False)
-                
-                # 批量插入新记录
-                records = []
-                for data in stock_data_list:
-                    expires_at = datetime.now() + timedelta(seconds=data.get('ttl', 300))
-                    record = StockRealtimeData(
-                        stock_code=data['stock_code'],
-                        market_type=data.get('market_type', 'A'),
-                        current_price=data.get('current_price', 0.0),
-                        change_amount=data.get('change_amount', 0.0),
-                        change_pct=data.get('change_pct', 0.0),
-                        volume=data.get('volume', 0.0),
-                        amount=data.get('amount', 0.0),
-                        turnover_rate=data.get('turnover_rate', 0.0),
-                        pe_ratio=data.get('pe_ratio', 0.0),
-                        pb_ratio=data.get('pb_ratio', 0.0),
-                        expires_at=expires_at
-                    )
-                    records.append(record)
-                
-                session.bulk_save_objects(records)
-                self.logger.info(f"批量保存股票实时数据: {len(records)} 条记录")
-                return True
+            now = datetime.now()
+            rows = []
+            for data in stock_data_list:
+                rows.append({
+                    'stock_code': data['stock_code'],
+                    'market_type': data.get('market_type', 'A'),
+                    'current_price': data.get('current_price', 0.0),
+                    'change_amount': data.get('change_amount', 0.0),
+                    'change_pct': data.get('change_pct', 0.0),
+                    'volume': data.get('volume', 0.0),
+                    'amount': data.get('amount', 0.0),
+                    'turnover_rate': data.get('turnover_rate', 0.0),
+                    'pe_ratio': data.get('pe_ratio', 0.0),
+                    'pb_ratio': data.get('pb_ratio', 0.0),
+                    'expires_at': now + timedelta(seconds=data.get('ttl', 300))
+                })
+            
+            written = bulk_upsert(StockRealtimeData, rows)
+            self.logger.info(f"批量保存股票实时数据: {written} 条记录")
+            return True
                 
         except Exception as e:
+            self._record_failed_query()
             self.logger.error(f"批量保存股票实时数据失败: {e}")
             return False
+        finally:
+            self._record_query_stats(time.time() - start_time)
     
     def optimize_expired_cache_cleanup(self) -> int:
-        """优化过期缓存清理"""
+        """优化过期缓存清理（分块增量删除，不占用长事务）"""
         if not USE_DATABASE:
             return 0
         
         cleaned_count = 0
-        current_time = datetime.now()
         
         try:
-            with self.get_optimized_session() as session:
-                # 批量删除过期的基本信息缓存
-                basic_deleted = session.query(StockBasicInfo).filter(
-                    StockBasicInfo.expires_at < current_time
-                ).delete(synchronize_session=False)
-                
-                # 批量删除过期的实时数据缓存
-                realtime_deleted = session.query(StockRealtimeData).filter(
-                    StockRealtimeData.expires_at < current_time
-                ).delete(synchronize_session=False)
-                
-                # 批量删除过期的历史价格缓存（保留最近30天）
-                cutoff_date = current_time - timedelta(days=30)
-                price_deleted = session.query(StockPriceHistory).filter(
-                    StockPriceHistory.created_at < cutoff_date
-                ).delete(synchronize_session=False)
-                
-                cleaned_count = basic_deleted + realtime_deleted + price_deleted
-                
-                if cleaned_count > 0:
-                    self.logger.info(f"清理过期缓存: {cleaned_count} 条记录")
+            from cache_reaper import reap_expired_cache, reap_old_price_history
+
+            stats = reap_expired_cache()
+            cleaned_count += stats.get('total_deleted', 0)
+
+            # 清理过期的历史价格缓存（保留最近30天）
+            cleaned_count += reap_old_price_history(keep_days=30)
+            
+            if cleaned_count > 0:
+                self.logger.info(f"清理过期缓存: {cleaned_count} 条记录")
                 
         except Exception as e:
             self.logger.error(f"清理过期缓存失败: {e}")
@@ -272,7 +435,8 @@ class DatabaseOptimizer:
             'connection_stats': self.connection_stats.copy(),
             'table_stats': {},
             'index_stats': {},
-            'performance_metrics': {}
+            'performance_metrics': {},
+            'query_stats': self.query_instrumentation.get_stats()
         }
         
         if not USE_DATABASE:
@@ -366,6 +530,7 @@ class DatabaseOptimizer:
                 'connection_pool_hits': 0,
                 'connection_pool_misses': 0
             }
+        self.query_instrumentation.reset()
         self.logger.info("数据库统计信息已重置")
 
 
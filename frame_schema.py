@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 上游数据表列映射与向量化转换
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- 为每个 AKShare 接口声明输出字段 -> 源列、类型、默认值的映射
+- convert_frame 按列整体重命名和类型转换（pd.to_numeric、百分号字符串解析），
+  不逐行构造 Series，也不对每个单元格 try/except
+- to_records 直接输出字典列表，数值为 Python 原生类型，可直接 JSON 序列化
+- 源列名支持 {prefix} 占位符，如资金流排名的 "10日主力净流入-净额"
+"""
+
+import logging
+from datetime import date, datetime
+from typing import Dict, List, NamedTuple, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class Field(NamedTuple):
+    """输出字段定义
+
+    kind:
+        float / int: 数值，无法解析时取 default
+        percent: 允许带 % 的字符串，输出 float
+        percent_text: 去掉 % 后的数字字符串（行业资金流接口的历史输出格式）
+        str: 字符串，缺失为 default
+        text: 日期/时间转 ISO 字符串，其余转字符串
+    optional: 源列不存在时不输出该字段，否则整列取 default
+    """
+    source: str
+    kind: str = 'float'
+    default: object = 0.0
+    optional: bool = False
+
+
+def _numeric(series: pd.Series) -> pd.Series:
+    if series.dtype == object:
+        series = series.astype(str).str.strip().str.rstrip('%').str.replace(',', '', regex=False)
+    return pd.to_numeric(series, errors='coerce')
+
+
+def _to_text(value) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _convert_column(series: pd.Series, field: Field) -> pd.Series:
+    kind = field.kind
+    if kind in ('float', 'percent'):
+        return _numeric(series).astype(float).fillna(field.default)
+    if kind == 'int':
+        return _numeric(series).fillna(field.default).astype(int)
+    if kind == 'percent_text':
+        values = _numeric(series)
+        return values.astype(str).where(values.notna(), field.default)
+    if kind == 'str':
+        return series.astype(str).where(series.notna(), field.default)
+    if kind == 'text':
+        return series.fillna(field.default).map(_to_text)
+    raise ValueError(f"未知字段类型: {kind}")
+
+
+def _default_column(field: Field, length: int, index) -> pd.Series:
+    return pd.Series([field.default] * length, index=index,
+                     dtype=float if field.kind in ('float', 'percent') else object)
+
+
+def convert_frame(df: pd.DataFrame, schema: Dict[str, Field], prefix: str = '') -> pd.DataFrame:
+    """按 schema 整列转换，返回以输出字段为列的 DataFrame"""
+    columns = {}
+    if df is None:
+        df = pd.DataFrame()
+    for name, field in schema.items():
+        source = field.source.format(prefix=prefix)
+        if source in df.columns:
+            columns[name] = _convert_column(df[source], field)
+        elif not field.optional:
+            columns[name] = _default_column(field, len(df), df.index)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def to_records(df: pd.DataFrame, schema: Dict[str, Field], prefix: str = '') -> List[Dict]:
+    """按 schema 转换后输出字典列表"""
+    return convert_frame(df, schema, prefix).to_dict('records')
+
+
+def fund_flow_prefix(period: str) -> str:
+    """资金流排名接口的列名前缀：今日无前缀，其余为周期名"""
+    return '' if period == '今日' else period
+
+
+def get_schema(endpoint: str, variant: Optional[str] = None) -> Dict[str, Field]:
+    return SCHEMAS[endpoint if variant is None else f'{endpoint}:{variant}']
+
+
+# ==================== 各接口字段映射 ====================
+
+_FLOW_BREAKDOWN = {
+    'main_net_inflow': Field('{prefix}主力净流入-净额'),
+    'main_net_inflow_percent': Field('{prefix}主力净流入-净占比', 'percent'),
+    'super_large_net_inflow': Field('{prefix}超大单净流入-净额'),
+    'super_large_net_inflow_percent': Field('{prefix}超大单净流入-净占比', 'percent'),
+    'large_net_inflow': Field('{prefix}大单净流入-净额'),
+    'large_net_inflow_percent': Field('{prefix}大单净流入-净占比', 'percent'),
+    'medium_net_inflow': Field('{prefix}中单净流入-净额'),
+    'medium_net_inflow_percent': Field('{prefix}中单净流入-净占比', 'percent'),
+    'small_net_inflow': Field('{prefix}小单净流入-净额'),
+    'small_net_inflow_percent': Field('{prefix}小单净流入-净占比', 'percent'),
+}
+
+SCHEMAS: Dict[str, Dict[str, Field]] = {
+    # 概念/行业资金流（阶段排行）
+    'stock_fund_flow_concept': {
+        'rank': Field('序号', 'int', 0),
+        'sector': Field('行业', 'str', ''),
+        'company_count': Field('公司家数', 'int', 0),
+        'sector_index': Field('行业指数'),
+        'change_percent': Field('阶段涨跌幅', 'percent'),
+        'inflow': Field('流入资金'),
+        'outflow': Field('流出资金'),
+        'net_flow': Field('净额'),
+    },
+    # 个股资金流排名（全市场）
+    'stock_individual_fund_flow_rank': {
+        'rank': Field('序号', 'int', 0),
+        'code': Field('代码', 'str', ''),
+        'name': Field('名称', 'str', ''),
+        'price': Field('最新价'),
+        'change_percent': Field('{prefix}涨跌幅', 'percent'),
+        **_FLOW_BREAKDOWN,
+    },
+    # 单只股票逐日资金流
+    'stock_individual_fund_flow': {
+        'date': Field('日期', 'text', ''),
+        'price': Field('收盘价'),
+        'change_percent': Field('涨跌幅', 'percent'),
+        **_FLOW_BREAKDOWN,
+    },
+    # 板块成分股（资金流向页面）
+    'stock_board_cons_em': {
+        'code': Field('代码', 'str', ''),
+        'name': Field('名称', 'str', ''),
+        'price': Field('最新价'),
+        'change_percent': Field('涨跌幅', 'percent'),
+    },
+    # 行业成分股（行业分析页面）
+    'stock_board_industry_cons_em': {
+        'code': Field('代码', 'str', ''),
+        'name': Field('名称', 'str', ''),
+        'price': Field('最新价'),
+        'change': Field('涨跌幅', 'percent'),
+        'change_amount': Field('涨跌额'),
+        'volume': Field('成交量'),
+        'turnover': Field('成交额'),
+        'amplitude': Field('振幅', 'percent'),
+        'turnover_rate': Field('换手率', 'percent'),
+    },
+    # 行业资金流（即时）
+    'stock_fund_flow_industry:即时': {
+        'rank': Field('序号', 'int', 0),
+        'industry': Field('行业', 'str', ''),
+        'index': Field('行业指数'),
+        'change': Field('行业-涨跌幅', 'percent_text', '0.00'),
+        'inflow': Field('流入资金'),
+        'outflow': Field('流出资金'),
+        'netFlow': Field('净额'),
+        'companyCount': Field('公司家数', 'int', 0),
+        'leadingStock': Field('领涨股', 'str', '', optional=True),
+        'leadingStockChange': Field('领涨股-涨跌幅', 'percent_text', '0.00', optional=True),
+        'leadingStockPrice': Field('当前价', optional=True),
+    },
+    # 行业资金流（3日/5日/10日/20日排行）
+    'stock_fund_flow_industry:阶段': {
+        'rank': Field('序号', 'int', 0),
+        'industry': Field('行业', 'str', ''),
+        'companyCount': Field('公司家数', 'int', 0),
+        'index': Field('行业指数'),
+        'change': Field('阶段涨跌幅', 'percent_text', '0.00'),
+        'inflow': Field('流入资金'),
+        'outflow': Field('流出资金'),
+        'netFlow': Field('净额'),
+    },
+    # 财联社电报
+    'stock_info_global_cls': {
+        'title': Field('标题', 'str', ''),
+        'content': Field('内容', 'str', ''),
+        'date': Field('发布日期', 'text', ''),
+        'time': Field('发布时间', 'text', ''),
+    },
+}
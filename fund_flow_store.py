@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 全市场资金流向快照存储
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- 每个统计周期（今日/3日/5日/10日）只调用一次全市场个股资金流排名接口，
+  转为以股票代码为索引的列式 DataFrame
+- 快照写入 CapitalFlowData 表（按 代码+交易日+周期 upsert），重启后直接从数据库恢复
+- 交易时段内按 FUND_FLOW_INTRADAY_TTL 刷新，收盘后保留到下一交易日开盘
+- lookup 按代码列表批量取行，供批量评分使用
+
+环境变量：
+- FUND_FLOW_INTRADAY_TTL: 交易时段内快照的有效秒数（默认1800）
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, time as dt_time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from data_provider import get_data_provider
+from data_service import data_service
+from database import USE_DATABASE, CapitalFlowData, bulk_upsert
+from database_optimizer import get_optimized_session
+from frame_schema import fund_flow_prefix
+from trading_calendar import get_last_trading_day, get_next_trading_day, is_trading_day
+
+logger = logging.getLogger(__name__)
+
+FUND_FLOW_INTRADAY_TTL = int(os.getenv('FUND_FLOW_INTRADAY_TTL', '1800'))
+
+# 排名接口支持的统计周期
+FUND_FLOW_PERIODS = ('今日', '3日', '5日', '10日')
+
+MARKET_OPEN = dt_time(9, 30)
+MARKET_CLOSE = dt_time(15, 0)
+
+# 排名表列名（去掉周期前缀后） -> 快照列
+RANK_FLOW_COLUMNS = {
+    '主力净流入-净额': 'main_net_flow',
+    '主力净流入-净占比': 'main_net_pct',
+    '超大单净流入-净额': 'super_large_net_flow',
+    '超大单净流入-净占比': 'super_large_net_pct',
+    '大单净流入-净额': 'large_net_flow',
+    '大单净流入-净占比': 'large_net_pct',
+    '中单净流入-净额': 'medium_net_flow',
+    '中单净流入-净占比': 'medium_net_pct',
+    '小单净流入-净额': 'small_net_flow',
+    '小单净流入-净占比': 'small_net_pct',
+}
+SNAPSHOT_COLUMNS = ['stock_name', 'price', 'change_pct'] + list(RANK_FLOW_COLUMNS.values())
+
+
+def snapshot_trade_date(now: datetime = None) -> str:
+    """快照对应的交易日：交易日开盘后为当天，否则为上一交易日"""
+    now = now or datetime.now()
+    today = now.date()
+    if is_trading_day(today) and now.time() >= MARKET_OPEN:
+        return today.strftime('%Y-%m-%d')
+    return get_last_trading_day(today).strftime('%Y-%m-%d')
+
+
+def snapshot_expiry(now: datetime = None) -> datetime:
+    """交易时段内短期有效，收盘后到下一交易日开盘前都有效"""
+    now = now or datetime.now()
+    today = now.date()
+    if is_trading_day(today):
+        if MARKET_OPEN <= now.time() < MARKET_CLOSE:
+            return now + timedelta(seconds=FUND_FLOW_INTRADAY_TTL)
+        if now.time() < MARKET_OPEN:
+            return datetime.combine(today, MARKET_OPEN)
+    return datetime.combine(get_next_trading_day(today), MARKET_OPEN)
+
+
+class FundFlowStore:
+    """全市场资金流向快照存储"""
+
+    def __init__(self, market_type: str = 'A'):
+        self.market_type = market_type
+        self._lock = threading.Lock()
+        self._period_locks: Dict[str, threading.Lock] = {}
+        # 周期 -> (快照, 交易日, 过期时间)
+        self._snapshots: Dict[str, Tuple[pd.DataFrame, str, datetime]] = {}
+        self.stats = {'memory_hits': 0, 'database_hits': 0, 'upstream_calls': 0, 'rows_persisted': 0}
+
+    def _period_lock(self, period: str) -> threading.Lock:
+        with self._lock:
+            return self._period_locks.setdefault(period, threading.Lock())
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _cached(self, period: str) -> Optional[Tuple[pd.DataFrame, str]]:
+        cached = self._snapshots.get(period)
+        if cached and cached[2] > datetime.now():
+            return cached[0], cached[1]
+        return None
+
+    def get_snapshot(self, period: str = '10日') -> pd.DataFrame:
+        """获取某统计周期的全市场快照，索引为股票代码"""
+        cached = self._cached(period)
+        if cached is not None:
+            self._count('memory_hits')
+            return cached[0]
+
+        # 同一周期只允许一个线程访问上游，其余线程等待后直接读内存
+        with self._period_lock(period):
+            cached = self._cached(period)
+            if cached is not None:
+                self._count('memory_hits')
+                return cached[0]
+
+            trade_date = snapshot_trade_date()
+            loaded = self._load_from_db(period, trade_date) if USE_DATABASE else None
+            if loaded is not None:
+                # 沿用入库时的过期时间，重启不延长盘中快照的有效期
+                self._count('database_hits')
+                frame, expires_at = loaded
+            else:
+                frame, expires_at = self.ingest(period, trade_date)
+
+            self._snapshots[period] = (frame, trade_date, expires_at)
+            return frame
+
+    def get_trade_date(self, period: str = '10日') -> Optional[str]:
+        cached = self._snapshots.get(period)
+        return cached[1] if cached else None
+
+    def ingest(self, period: str, trade_date: str = None) -> Tuple[pd.DataFrame, datetime]:
+        """调用一次上游排名接口，转为快照并持久化"""
+        trade_date = trade_date or snapshot_trade_date()
+        provider = get_data_provider()
+        self._count('upstream_calls')
+        raw = data_service._retry_api_call(provider.stock_individual_fund_flow_rank, indicator=period)
+        frame = self._to_snapshot(raw, period)
+        expires_at = snapshot_expiry()
+        logger.info(f"资金流向快照 {period}@{trade_date}: {len(frame)} 只股票")
+        if USE_DATABASE:
+            self._save_to_db(frame, period, trade_date, expires_at)
+        return frame, expires_at
+
+    @staticmethod
+    def _to_snapshot(raw: pd.DataFrame, period: str) -> pd.DataFrame:
+        """排名表转为列式快照，数值列统一为 float"""
+        prefix = fund_flow_prefix(period)
+        columns = {f'{prefix}{name}': field for name, field in RANK_FLOW_COLUMNS.items()}
+        columns.update({'名称': 'stock_name', '最新价': 'price', f'{prefix}涨跌幅': 'change_pct'})
+
+        frame = raw.rename(columns=columns).reindex(columns=['代码'] + SNAPSHOT_COLUMNS)
+        frame['代码'] = frame['代码'].astype(str).str.zfill(6)
+        numeric = SNAPSHOT_COLUMNS[1:]
+        frame[numeric] = frame[numeric].apply(pd.to_numeric, errors='coerce')
+        return frame.drop_duplicates('代码').set_index('代码').rename_axis('stock_code')
+
+    def to_records(self, frame: pd.DataFrame, period: str, trade_date: str, expires_at: datetime) -> List[Dict]:
+        """快照转为 CapitalFlowData 行，散户净流入为中单与小单之和"""
+        records = frame.assign(
+            retail_net_flow=frame['medium_net_flow'] + frame['small_net_flow'],
+            market_type=self.market_type, trade_date=trade_date, period=period, expires_at=expires_at
+        ).reset_index()
+        return records.astype(object).where(records.notna(), None).to_dict('records')
+
+    def _save_to_db(self, frame: pd.DataFrame, period: str, trade_date: str, expires_at: datetime):
+        try:
+            records = self.to_records(frame, period, trade_date, expires_at)
+            self._count('rows_persisted', bulk_upsert(CapitalFlowData, records))
+        except Exception as e:
+            logger.error(f"保存资金流向快照失败: {e}")
+
+    def _load_from_db(self, period: str, trade_date: str) -> Optional[Tuple[pd.DataFrame, datetime]]:
+        """读取未过期的快照，返回 (快照, 过期时间)；过期时间取这批记录中最早的 expires_at"""
+        try:
+            with get_optimized_session() as session:
+                rows = session.query(CapitalFlowData).filter(
+                    CapitalFlowData.market_type == self.market_type,
+                    CapitalFlowData.period == period,
+                    CapitalFlowData.trade_date == trade_date,
+                    CapitalFlowData.expires_at > datetime.now()
+                ).all()
+                records = [row.to_dict() for row in rows]
+                expires_at = min((row.expires_at for row in rows), default=None)
+        except Exception as e:
+            logger.error(f"读取资金流向快照失败: {e}")
+            return None
+        if not records:
+            return None
+        frame = pd.DataFrame(records).set_index('stock_code')
+        return frame.reindex(columns=SNAPSHOT_COLUMNS), expires_at
+
+    def lookup(self, stock_codes: List[str], period: str = '10日') -> pd.DataFrame:
+        """按代码批量取快照行，缺失的股票为 NaN 行"""
+        codes = [str(code).split('.')[0].zfill(6) for code in stock_codes]
+        return self.get_snapshot(period).reindex(codes)
+
+    def invalidate(self, period: str = None):
+        with self._lock:
+            if period is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(period, None)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['snapshots'] = {
+                period: {'trade_date': trade_date, 'stocks': len(frame),
+                         'expires_at': expires_at.strftime('%Y-%m-%d %H:%M:%S')}
+                for period, (frame, trade_date, expires_at) in self._snapshots.items()
+            }
+        return stats
+
+
+# 全局资金流向快照存储
+fund_flow_store = FundFlowStore()
@@ -6,7 +6,6 @@
 许可证：MIT License
 """
 # fundamental_analyzer.py
-import akshare as ak
 import pandas as pd
 import numpy as np
 import logging
@@ -22,26 +21,31 @@ class FundamentalAnalyzer:
         self.data_cache = {}
 
     def get_financial_indicators(self, stock_code):
-        """获取财务指标数据"""
+        """获取财务指标数据
+
+        财务数据经由数据访问层按报告期缓存，估值指标缓存到下一个收盘后，
+        同一股票重复评分不会再访问上游。
+        """
         try:
-            # 获取基本财务指标
-            financial_data = ak.stock_financial_analysis_indicator(symbol=stock_code,start_year="2022")
+            financial_data = data_service.get_financial_data(stock_code) or []
+            valuation = data_service.get_stock_valuation(stock_code) or {}
 
-            # 获取最新估值指标
-            valuation = ak.stock_value_em(symbol=stock_code)
+            # 最新报告期可能只有摘要（营收、净利润），各指标分别取有值的最近报告期
+            def latest(field):
+                return next((p[field] for p in reversed(financial_data) if p.get(field) is not None), None)
 
-            # 整合数据
+            # 整合数据，缺失的指标不输出，由评分逻辑跳过
             indicators = {
-                'pe_ttm': float(valuation['PE(TTM)'].iloc[0]),
-                'pb': float(valuation['市净率'].iloc[0]),
-                'ps_ttm': float(valuation['市销率'].iloc[0]),
-                'roe': float(financial_data['加权净资产收益率(%)'].iloc[0]),
-                'gross_margin': float(financial_data['销售毛利率(%)'].iloc[0]),
-                'net_profit_margin': float(financial_data['总资产净利润率(%)'].iloc[0]),
-                'debt_ratio': float(financial_data['资产负债率(%)'].iloc[0])
+                'pe_ttm': valuation.get('pe_ttm'),
+                'pb': valuation.get('pb'),
+                'ps_ttm': valuation.get('ps_ttm'),
+                'roe': latest('roe'),
+                'gross_margin': latest('gross_margin'),
+                'net_profit_margin': latest('roa'),
+                'debt_ratio': latest('debt_ratio')
             }
 
-            return indicators
+            return {k: v for k, v in indicators.items() if v is not None}
         except Exception as e:
             print(f"获取财务指标出错: {str(e)}")
             return {}
@@ -49,12 +53,13 @@ class FundamentalAnalyzer:
     def get_growth_data(self, stock_code):
         """获取成长性数据"""
         try:
-            # 获取历年财务数据
-            financial_data = ak.stock_financial_abstract(symbol=stock_code)
+            # 使用年报（Q4）数据，最新年度在前
+            annual = [p for p in data_service.get_financial_data(stock_code)
+                      if p['report_period'].endswith('-Q4')][::-1]
 
             # 计算各项成长率
-            revenue = financial_data['营业收入'].astype(float)
-            net_profit = financial_data['净利润'].astype(float)
+            revenue = pd.Series([p.get('revenue') for p in annual], dtype=float).dropna()
+            net_profit = pd.Series([p.get('net_profit') for p in annual], dtype=float).dropna()
 
             growth = {
                 'revenue_growth_3y': self._calculate_cagr(revenue, 3),
@@ -68,6 +73,10 @@ class FundamentalAnalyzer:
             print(f"获取成长数据出错: {str(e)}")
             return {}
 
+    def prefetch(self, stock_codes, max_workers=4):
+        """批量预取一组股票的财务数据，供批量评分前调用"""
+        return data_service.prefetch_financial_data(stock_codes, max_workers=max_workers)
+
     def _calculate_cagr(self, series, years):
         """计算复合年增长率"""
         if len(series) < years:
@@ -6,13 +6,22 @@
 许可证：MIT License
 """
 # industry_analyzer.py
+import contextvars
 import logging
+import os
 import random
-import akshare as ak
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+from data_provider import get_data_provider
+from data_service import data_service
+from frame_schema import get_schema, to_records
+
+# 行业比较时并发获取板块日线的线程数
+INDUSTRY_COMPARE_WORKERS = int(os.getenv('INDUSTRY_COMPARE_WORKERS', '8'))
+
 
 class IndustryAnalyzer:
     def __init__(self):
@@ -41,58 +50,14 @@ class IndustryAnalyzer:
 
             # 获取行业资金流向数据
             self.logger.info(f"从API获取行业资金流向数据: {symbol}")
-            fund_flow_data = ak.stock_fund_flow_industry(symbol=symbol)
+            fund_flow_data = get_data_provider().stock_fund_flow_industry(symbol=symbol)
 
             # 打印列名以便调试
             self.logger.info(f"行业资金流向数据列名: {fund_flow_data.columns.tolist()}")
 
-            # 转换为字典列表
-            result = []
-
-            if symbol == "即时":
-                for _, row in fund_flow_data.iterrows():
-                    try:
-                        # 安全地将值转换为对应的类型
-                        item = {
-                            "rank": self._safe_int(row["序号"]),
-                            "industry": str(row["行业"]),
-                            "index": self._safe_float(row["行业指数"]),
-                            "change": self._safe_percent(row["行业-涨跌幅"]),
-                            "inflow": self._safe_float(row["流入资金"]),
-                            "outflow": self._safe_float(row["流出资金"]),
-                            "netFlow": self._safe_float(row["净额"]),
-                            "companyCount": self._safe_int(row["公司家数"])
-                        }
-
-                        # 添加领涨股相关数据，如果存在
-                        if "领涨股" in row:
-                            item["leadingStock"] = str(row["领涨股"])
-                        if "领涨股-涨跌幅" in row:
-                            item["leadingStockChange"] = self._safe_percent(row["领涨股-涨跌幅"])
-                        if "当前价" in row:
-                            item["leadingStockPrice"] = self._safe_float(row["当前价"])
-
-                        result.append(item)
-                    except Exception as e:
-                        self.logger.warning(f"处理行业资金流向数据行时出错: {str(e)}")
-                        continue
-            else:
-                for _, row in fund_flow_data.iterrows():
-                    try:
-                        item = {
-                            "rank": self._safe_int(row["序号"]),
-                            "industry": str(row["行业"]),
-                            "companyCount": self._safe_int(row["公司家数"]),
-                            "index": self._safe_float(row["行业指数"]),
-                            "change": self._safe_percent(row["阶段涨跌幅"]),
-                            "inflow": self._safe_float(row["流入资金"]),
-                            "outflow": self._safe_float(row["流出资金"]),
-                            "netFlow": self._safe_float(row["净额"])
-                        }
-                        result.append(item)
-                    except Exception as e:
-                        self.logger.warning(f"处理行业资金流向数据行时出错: {str(e)}")
-                        continue
+            # 转换为字典列表（即时与阶段排行的列不同）
+            variant = "即时" if symbol == "即时" else "阶段"
+            result = to_records(fund_flow_data, get_schema('stock_fund_flow_industry', variant))
 
             # 缓存结果
             self.data_cache[cache_key] = (datetime.now(), result)
@@ -106,55 +71,29 @@ class IndustryAnalyzer:
             self.logger.error(traceback.format_exc())
             return []
 
-    def _safe_float(self, value):
-        """安全地将值转换为浮点数"""
-        try:
-            if pd.isna(value):
-                return 0.0
-            return float(value)
-        except:
-            return 0.0
-
-    def _safe_int(self, value):
-        """安全地将值转换为整数"""
-        try:
-            if pd.isna(value):
-                return 0
-            return int(value)
-        except:
-            return 0
-
-    def _safe_percent(self, value):
-        """安全地将百分比值转换为字符串格式"""
-        try:
-            if pd.isna(value):
-                return "0.00"
+    def _get_industry_boards(self):
+        """获取东方财富行业板块列表，同时构建行业名称到代码的映射"""
+        cache_key = "industry_boards"
+        if cache_key in self.data_cache:
+            cache_time, cached_data = self.data_cache[cache_key]
+            # 板块列表一天内基本不变
+            if (datetime.now() - cache_time).total_seconds() < 86400:
+                return cached_data
 
-            # 如果是字符串并包含%，移除%符号
-            if isinstance(value, str) and "%" in value:
-                return value.replace("%", "")
+        boards = data_service._retry_api_call(get_data_provider().stock_board_industry_name_em)
+        if '板块名称' in boards.columns and '板块代码' in boards.columns:
+            self.industry_code_map = dict(zip(boards['板块名称'], boards['板块代码']))
+            self.logger.info(f"成功获取到 {len(self.industry_code_map)} 个行业代码映射")
 
-            # 如果是数值，直接转换成字符串
-            return str(float(value))
-        except:
-            return "0.00"
+        self.data_cache[cache_key] = (datetime.now(), boards)
+        return boards
 
     def _get_industry_code(self, industry_name):
         """获取行业名称对应的板块代码"""
         try:
-            # 如果已经缓存了行业代码映射，直接使用
+            # 行业代码映射随板块列表一起构建并缓存
             if not self.industry_code_map:
-                # 获取东方财富行业板块名称及代码
-                industry_list = ak.stock_board_industry_name_em()
-
-                # 创建行业名称到代码的映射
-                for _, row in industry_list.iterrows():
-                    if '板块名称' in industry_list.columns and '板块代码' in industry_list.columns:
-                        name = row['板块名称']
-                        code = row['板块代码']
-                        self.industry_code_map[name] = code
-
-                self.logger.info(f"成功获取到 {len(self.industry_code_map)} 个行业代码映射")
+                self._get_industry_boards()
 
             # 尝试精确匹配
             if industry_name in self.industry_code_map:
@@ -197,7 +136,7 @@ class IndustryAnalyzer:
             try:
                 # 1. 首先尝试直接使用行业名称
                 try:
-                    stocks = ak.stock_board_industry_cons_em(symbol=industry)
+                    stocks = get_data_provider().stock_board_industry_cons_em(symbol=industry)
                     self.logger.info(f"使用行业名称 '{industry}' 成功获取成分股")
                 except Exception as direct_error:
                     self.logger.warning(f"使用行业名称获取成分股失败: {str(direct_error)}")
@@ -205,7 +144,7 @@ class IndustryAnalyzer:
                     industry_code = self._get_industry_code(industry)
                     if industry_code:
                         self.logger.info(f"尝试使用行业代码 {industry_code} 获取成分股")
-                        stocks = ak.stock_board_industry_cons_em(symbol=industry_code)
+                        stocks = get_data_provider().stock_board_industry_cons_em(symbol=industry_code)
                     else:
                         # 如果无法获取行业代码，抛出异常，进入模拟数据生成
                         raise ValueError(f"无法找到行业 '{industry}' 对应的代码")
@@ -215,23 +154,7 @@ class IndustryAnalyzer:
 
                 # 转换为字典列表
                 if not stocks.empty:
-                    for _, row in stocks.iterrows():
-                        try:
-                            item = {
-                                "code": str(row["代码"]),
-                                "name": str(row["名称"]),
-                                "price": self._safe_float(row["最新价"]),
-                                "change": self._safe_float(row["涨跌幅"]),
-                                "change_amount": self._safe_float(row["涨跌额"]) if "涨跌额" in row else 0.0,
-                                "volume": self._safe_float(row["成交量"]) if "成交量" in row else 0.0,
-                                "turnover": self._safe_float(row["成交额"]) if "成交额" in row else 0.0,
-                                "amplitude": self._safe_float(row["振幅"]) if "振幅" in row else 0.0,
-                                "turnover_rate": self._safe_float(row["换手率"]) if "换手率" in row else 0.0
-                            }
-                            result.append(item)
-                        except Exception as e:
-                            self.logger.warning(f"处理行业成分股数据行时出错: {str(e)}")
-                            continue
+                    result = to_records(stocks, get_schema('stock_board_industry_cons_em'))
 
             except Exception as e:
                 # 3. 如果上述方法都失败，生成模拟数据
@@ -442,11 +365,15 @@ class IndustryAnalyzer:
             self.logger.error(f"生成行业投资建议时出错: {str(e)}")
             return "无法生成投资建议"
 
-    def compare_industries(self, limit=10):
-        """比较不同行业的表现"""
+    def compare_industries(self, limit=None):
+        """比较不同行业的表现
+
+        板块日线经由数据访问层按日缓存，多个行业并发获取（并发数 INDUSTRY_COMPARE_WORKERS），
+        全部约90个行业也只在每个交易日首次比较时访问上游。
+        """
         try:
             # 获取行业板块数据
-            industry_data = ak.stock_board_industry_name_em()
+            industry_data = self._get_industry_boards()
 
             # 提取行业名称列表
             industries = industry_data['板块名称'].tolist() if '板块名称' in industry_data.columns else []
@@ -457,69 +384,38 @@ class IndustryAnalyzer:
             # 限制分析的行业数量
             industries = industries[:limit] if limit else industries
 
-            # 分析各行业情况
-            industry_results = []
-
-            for industry in industries:
-                try:
-                    # 尝试获取行业板块代码
-                    industry_code = None
-                    for _, row in industry_data.iterrows():
-                        if row['板块名称'] == industry:
-                            industry_code = row['板块代码']
-                            break
-
-                    if not industry_code:
-                        self.logger.warning(f"未找到行业 {industry} 的板块代码")
+            # 并发获取各行业日线，只取最新一行
+            def fetch_latest(industry):
+                history = data_service.get_industry_board_history(industry, self.industry_code_map.get(industry))
+                if history is None or history.empty:
+                    return None
+                return history.iloc[-1]
+
+            latest_rows = {}
+            with ThreadPoolExecutor(max_workers=INDUSTRY_COMPARE_WORKERS, thread_name_prefix='industry') as executor:
+                futures = {
+                    executor.submit(contextvars.copy_context().run, fetch_latest, industry): industry
+                    for industry in industries
+                }
+                for future, industry in futures.items():
+                    try:
+                        latest = future.result()
+                    except Exception as e:
+                        self.logger.error(f"分析行业 {industry} 时出错: {str(e)}")
                         continue
+                    if latest is not None:
+                        latest_rows[industry] = latest
 
-                    # 尝试使用不同的参数来获取行业数据 - 不使用"3m"
-                    try:
-                        # 尝试不使用period参数
-                        industry_info = ak.stock_board_industry_hist_em(symbol=industry_code)
-                    except Exception as e1:
-                        try:
-                            # 尝试使用daily参数
-                            industry_info = ak.stock_board_industry_hist_em(symbol=industry_code, period="daily")
-                        except Exception as e2:
-                            self.logger.warning(f"分析行业 {industry} 历史数据失败: {str(e1)}, {str(e2)}")
-                            continue
-
-                    # 计算行业涨跌幅
-                    if not industry_info.empty:
-                        latest = industry_info.iloc[0]
-
-                        # 尝试获取涨跌幅，列名可能有变化
-                        change = 0.0
-                        if '涨跌幅' in latest.index:
-                            change = latest['涨跌幅']
-                        elif '涨跌幅' in industry_info.columns:
-                            change = latest['涨跌幅']
-
-                        # 尝试获取成交量和成交额
-                        volume = 0.0
-                        turnover = 0.0
-                        if '成交量' in latest.index:
-                            volume = latest['成交量']
-                        elif '成交量' in industry_info.columns:
-                            volume = latest['成交量']
-
-                        if '成交额' in latest.index:
-                            turnover = latest['成交额']
-                        elif '成交额' in industry_info.columns:
-                            turnover = latest['成交额']
-
-                        industry_results.append({
-                            "industry": industry,
-                            "change": float(change) if change else 0.0,
-                            "volume": float(volume) if volume else 0.0,
-                            "turnover": float(turnover) if turnover else 0.0
-                        })
-                except Exception as e:
-                    self.logger.error(f"分析行业 {industry} 时出错: {str(e)}")
-
-            # 按涨跌幅排序
-            industry_results.sort(key=lambda x: x.get('change', 0), reverse=True)
+            if not latest_rows:
+                industry_results = []
+            else:
+                # 汇总为一张表后整列转换和排序
+                latest = pd.DataFrame.from_dict(latest_rows, orient='index')
+                frame = pd.DataFrame({"industry": latest.index}, index=latest.index)
+                for column, field in (('涨跌幅', 'change'), ('成交量', 'volume'), ('成交额', 'turnover')):
+                    values = latest[column] if column in latest.columns else pd.Series(0.0, index=latest.index)
+                    frame[field] = pd.to_numeric(values, errors='coerce').fillna(0.0).astype(float)
+                industry_results = frame.sort_values('change', ascending=False, kind='stable').to_dict('records')
 
             return {
                 "count": len(industry_results),
@@ -530,4 +426,4 @@ class IndustryAnalyzer:
 
         except Exception as e:
             self.logger.error(f"比较行业表现时出错: {str(e)}")
-            return {"error": f"比较行业表现时出错: {str(e)}"}
\ No newline at end of file
+            return {"error": f"比较行业表现时出错: {str(e)}"}
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 异步日志管道
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- QueueHandler/QueueListener：请求线程只把日志记录放入内存队列，文件和控制台写入在后台线程完成
+- 按 logger 采样和限流（令牌桶），INFO 及以下级别超出配额的记录直接丢弃，WARNING 及以上始终保留
+- 被丢弃的记录不会格式化消息；被限流的条数附在该 logger 下一条放行的日志上
+- 结构化字段：extra={'fields': {...}} 和当前追踪ID以 key=value 形式附在消息后
+- 统计入队耗时、写入耗时、放行/采样/限流/队列满丢弃条数，供 /api/system/logging 查看
+
+环境变量：
+- LOG_ASYNC: true（默认）使用异步队列；false 时同步写入（仍然采样和限流）
+- LOG_QUEUE_SIZE: 队列容量（默认10000），队列满时丢弃 INFO 及以下级别
+- LOG_RATE_LIMIT: 每个 logger 每秒放行的 INFO 及以下日志条数（默认20，0 表示不限流）
+- LOG_RATE_BURST: 令牌桶容量（默认100）
+- LOG_SAMPLE_RATES: 按 logger 前缀设置采样率，如 "web_server.tasks=0.1,data_service=0.5"
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
+
+from tracing import current_trace_id
+
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() == 'true'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_RATE_LIMIT = float(os.getenv('LOG_RATE_LIMIT', '20'))
+LOG_RATE_BURST = int(os.getenv('LOG_RATE_BURST', '100'))
+LOG_FORMAT = '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """解析 "logger=rate,logger=rate" 形式的采样配置"""
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, rate = item.split('=', 1)
+        try:
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+class LogStats:
+    """日志管道统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.passed = 0
+            self.sampled_out = 0
+            self.rate_limited = 0
+            self.queue_dropped = 0
+            self.enqueue_seconds = 0.0
+            self.written = 0
+            self.write_seconds = 0.0
+            self.by_logger = defaultdict(lambda: {'passed': 0, 'suppressed': 0})
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            top = sorted(self.by_logger.items(), key=lambda kv: kv[1]['passed'] + kv[1]['suppressed'], reverse=True)
+            return {
+                'passed': self.passed,
+                'sampled_out': self.sampled_out,
+                'rate_limited': self.rate_limited,
+                'queue_dropped': self.queue_dropped,
+                'written': self.written,
+                'avg_enqueue_us': round(self.enqueue_seconds / self.passed * 1e6, 2) if self.passed else 0.0,
+                'avg_write_us': round(self.write_seconds / self.written * 1e6, 2) if self.written else 0.0,
+                'loggers': {name: dict(counts) for name, counts in top[:20]}
+            }
+
+
+class SamplingRateLimitFilter(logging.Filter):
+    """按 logger 采样和限流，只作用于 INFO 及以下级别"""
+
+    def __init__(self, rate_limit: float = LOG_RATE_LIMIT, burst: int = LOG_RATE_BURST,
+                 sample_rates: Dict[str, float] = None, stats: LogStats = None):
+        super().__init__()
+        self.rate_limit = rate_limit
+        self.burst = burst
+        # 前缀越长越优先匹配
+        self.sample_rates = sorted((sample_rates or {}).items(), key=lambda kv: len(kv[0]), reverse=True)
+        self.stats = stats or LogStats()
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, List[float]] = {}
+        self._sample_acc: Dict[str, float] = defaultdict(float)
+        self._suppressed: Dict[str, int] = defaultdict(int)
+
+    def _sample_rate(self, name: str) -> float:
+        for prefix, rate in self.sample_rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        name = record.name
+        with self._lock:
+            if record.levelno >= logging.WARNING:
+                return self._accept(record, name)
+
+            rate = self._sample_rate(name)
+            if rate < 1.0:
+                # 累加器采样：每条记录累加采样率，满 1 放行一条，结果确定且均匀
+                self._sample_acc[name] += rate
+                if self._sample_acc[name] < 1.0 - 1e-9:
+                    self._reject(name, sampled=True)
+                    return False
+                self._sample_acc[name] -= 1.0
+
+            if self.rate_limit > 0:
+                now = time.monotonic()
+                bucket = self._buckets.get(name)
+                if bucket is None:
+                    bucket = self._buckets[name] = [float(self.burst), now]
+                tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_limit)
+                bucket[1] = now
+                if tokens < 1.0:
+                    bucket[0] = tokens
+                    self._reject(name, sampled=False)
+                    return False
+                bucket[0] = tokens - 1.0
+            return self._accept(record, name)
+
+    def _reject(self, name: str, sampled: bool):
+        self._suppressed[name] += 1
+        with self.stats.lock:
+            if sampled:
+                self.stats.sampled_out += 1
+            else:
+                self.stats.rate_limited += 1
+            self.stats.by_logger[name]['suppressed'] += 1
+
+    def _accept(self, record: logging.LogRecord, name: str) -> bool:
+        suppressed = self._suppressed.pop(name, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        # 追踪ID保存在调用线程的上下文中，必须在入队前读取
+        record.trace_id = current_trace_id()
+        with self.stats.lock:
+            self.stats.passed += 1
+            self.stats.by_logger[name]['passed'] += 1
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """在消息后附加结构化字段、追踪ID和被限流条数"""
+
+    def __init__(self, fmt: str = LOG_FORMAT, datefmt: str = None):
+        super().__init__(fmt, datefmt)
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extras = []
+        trace_id = getattr(record, 'trace_id', None)
+        if trace_id:
+            extras.append(f"trace_id={trace_id}")
+        fields = getattr(record, 'fields', None)
+        if isinstance(fields, dict):
+            extras.extend(f"{key}={value}" for key, value in fields.items())
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            extras.append(f"suppressed={suppressed}")
+        if not extras:
+            return text
+        # 异常堆栈在首行之后，字段放在首行末尾便于检索
+        first, sep, rest = text.partition('\n')
+        return f"{first} | {' '.join(extras)}{sep}{rest}"
+
+
+class AsyncQueueHandler(QueueHandler):
+    """只在调用线程完成消息合并，时间格式化、异常堆栈渲染和写入都交给后台线程"""
+
+    def __init__(self, log_queue, stats: LogStats):
+        super().__init__(log_queue)
+        self.stats = stats
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 合并参数后丢弃，避免后台线程格式化时参数对象已被调用方修改
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                try:
+                    self.queue.put(record, timeout=0.5)
+                    return
+                except queue.Full:
+                    pass
+            with self.stats.lock:
+                self.stats.queue_dropped += 1
+
+    def emit(self, record: logging.LogRecord):
+        start_time = time.perf_counter()
+        super().emit(record)
+        with self.stats.lock:
+            self.stats.enqueue_seconds += time.perf_counter() - start_time
+
+
+class _TimedQueueListener(QueueListener):
+    """统计后台写入耗时"""
+
+    def __init__(self, log_queue, *handlers, stats: LogStats):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.stats = stats
+
+    def start(self):
+        self._thread = threading.Thread(target=self._monitor, name='log-queue-listener', daemon=True)
+        self._thread.start()
+
+    def handle(self, record: logging.LogRecord):
+        start_time = time.perf_counter()
+        super().handle(record)
+        with self.stats.lock:
+            self.stats.written += 1
+            self.stats.write_seconds += time.perf_counter() - start_time
+
+
+class _SyncFanoutHandler(logging.Handler):
+    """同步模式下把一条记录分发给所有处理器，采样限流只执行一次"""
+
+    def __init__(self, handlers: List[logging.Handler]):
+        super().__init__()
+        self.handlers = handlers
+
+    def emit(self, record: logging.LogRecord):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class LogPipeline:
+    """把一个 logger（默认根 logger）的输出接入采样限流和异步队列"""
+
+    def __init__(self, logger: logging.Logger = None, handlers: List[logging.Handler] = None,
+                 async_mode: bool = LOG_ASYNC, queue_size: int = LOG_QUEUE_SIZE,
+                 rate_limit: float = LOG_RATE_LIMIT, burst: int = LOG_RATE_BURST,
+                 sample_rates: Dict[str, float] = None):
+        self.logger = logger if logger is not None else logging.getLogger()
+        self.handlers = list(handlers or [])
+        self.async_mode = async_mode
+        self.queue_size = queue_size
+        self.stats = LogStats()
+        self.filter = SamplingRateLimitFilter(rate_limit, burst, sample_rates, self.stats)
+        self.handler = None
+        self.listener = None
+        self._started = False
+
+    def start(self):
+        if self._started:
+            return self
+        formatter = StructuredFormatter()
+        for handler in self.handlers:
+            if handler.formatter is None or type(handler.formatter) is logging.Formatter:
+                handler.setFormatter(formatter)
+
+        if self.async_mode:
+            log_queue = queue.Queue(self.queue_size)
+            self.handler = AsyncQueueHandler(log_queue, self.stats)
+            self.listener = _TimedQueueListener(log_queue, *self.handlers, stats=self.stats)
+            self.listener.start()
+        else:
+            self.handler = _SyncFanoutHandler(self.handlers)
+        self.handler.addFilter(self.filter)
+        self.logger.addHandler(self.handler)
+        self._started = True
+        return self
+
+    def stop(self):
+        """停止后台线程并写完队列中剩余的记录"""
+        if not self._started:
+            return
+        self.logger.removeHandler(self.handler)
+        if self.listener is not None:
+            self.listener.stop()
+        for handler in self.handlers:
+            handler.flush()
+        self._started = False
+
+    def get_stats(self) -> Dict:
+        stats = self.stats.snapshot()
+        stats.update({
+            'async': self.async_mode,
+            'queue_size': self.handler.queue.qsize() if self.listener else 0,
+            'queue_capacity': self.queue_size if self.async_mode else 0,
+            'rate_limit': self.filter.rate_limit,
+            'burst': self.filter.burst
+        })
+        return stats
+
+
+# 全局日志管道
+_pipeline: Optional[LogPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def setup_logging(log_file: str = None, level: int = logging.INFO, file_logger: str = None,
+                  max_bytes: int = 10000000, backup_count: int = 5) -> LogPipeline:
+    """
+    把根 logger 接入异步日志管道（只生效一次）
+
+    Args:
+        log_file: 滚动日志文件路径
+        level: 根 logger 级别
+        file_logger: 只有该 logger 及其子 logger 的记录写入文件（与原先挂在 app.logger 上的文件日志一致）
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            return _pipeline
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        # 已有的根处理器（各模块 basicConfig 创建的控制台输出）移入管道
+        handlers = [h for h in root.handlers if not isinstance(h, (QueueHandler, _SyncFanoutHandler))]
+        for handler in handlers:
+            root.removeHandler(handler)
+        if not handlers:
+            handlers.append(logging.StreamHandler())
+        if log_file:
+            file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                               encoding='utf-8')
+            if file_logger:
+                file_handler.addFilter(logging.Filter(file_logger))
+            handlers.append(file_handler)
+
+        _pipeline = LogPipeline(root, handlers, sample_rates=parse_sample_rates(os.getenv('LOG_SAMPLE_RATES')))
+        _pipeline.start()
+        atexit.register(_pipeline.stop)
+        return _pipeline
+
+
+def get_log_stats() -> Dict:
+    """获取全局日志管道统计（未启用时返回空统计）"""
+    if _pipeline is None:
+        return {'enabled': False}
+    return {'enabled': True, **_pipeline.get_stats()}
@@ -7,6 +7,9 @@
 """
 
 import logging
+import math
+import threading
+import time
 from datetime import datetime, timedelta, date
 from typing import Dict, List, Optional, Set
 import pandas as pd
@@ -18,6 +21,9 @@ from smart_cache_manager import smart_cache_manager
 
 logger = logging.getLogger(__name__)
 
+# 请求频率半衰期（秒）：3天前的一次请求权重减半
+REQUEST_FREQUENCY_HALF_LIFE = 3 * 86400
+
 class MarketScanCacheManager:
     """市场扫描专用缓存管理器"""
     
@@ -31,6 +37,29 @@ class MarketScanCacheManager:
             'min_data_days': 60,     # 最少需要60天数据进行技术分析
             'update_threshold_hours': 6,  # 6小时内的数据认为是新鲜的
         }
+
+        # 按股票记录的衰减请求计数 {stock_code: (count, last_update_ts)}，用于预缓存优先级
+        self._request_counts: Dict[str, tuple] = {}
+        self._request_lock = threading.Lock()
+
+    def _decay(self, count: float, since: float, now: float) -> float:
+        return count * math.pow(0.5, (now - since) / REQUEST_FREQUENCY_HALF_LIFE)
+
+    def record_request(self, stock_code: str):
+        """记录一次用户对该股票的数据请求"""
+        now = time.time()
+        with self._request_lock:
+            count, since = self._request_counts.get(stock_code, (0.0, now))
+            self._request_counts[stock_code] = (self._decay(count, since, now) + 1.0, now)
+
+    def get_request_frequency(self, stock_codes: List[str]) -> Dict[str, float]:
+        """获取股票的衰减请求计数，未请求过的为0"""
+        now = time.time()
+        with self._request_lock:
+            return {
+                code: self._decay(*self._request_counts[code], now) if code in self._request_counts else 0.0
+                for code in stock_codes
+            }
         
     def should_update_for_market_scan(self, stock_code: str, market_type: str = 'A') -> Dict:
         """
@@ -191,8 +220,8 @@ class MarketScanCacheManager:
             
         Returns:
             Dict: {
-                'no_data': [],      # 无数据，最高优先级
-                'stale': [],        # 数据过时，高优先级
+                'no_data': [],      # 无数据或检查失败，最高优先级
+                'stale': [],        # 数据过时或数据量不足，高优先级
                 'outdated': [],     # 数据滞后，中优先级
                 'acceptable': [],   # 数据可接受，低优先级
                 'good': []          # 数据良好，无需更新
@@ -210,9 +239,10 @@ class MarketScanCacheManager:
         
         for stock_code, status in cache_status.items():
             quality = status['data_quality']
-            if quality == 'none':
+            if quality in ('none', 'unknown', 'error'):
+                # 检查失败的按无数据处理，避免被当作良好数据跳过
                 priority_groups['no_data'].append(stock_code)
-            elif quality == 'stale':
+            elif quality in ('stale', 'insufficient'):
                 priority_groups['stale'].append(stock_code)
             elif quality == 'outdated':
                 priority_groups['outdated'].append(stock_code)
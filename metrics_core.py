@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 低开销指标核心
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- 计数器和固定桶直方图按线程分片，记录路径不加锁，读取时合并
+- 支持标签（接口、缓存层级、分析阶段等），每组标签一个独立序列
+- 直方图按桶估算 p50/p95/p99 尾延迟
+- 输出 Prometheus 文本格式（text/plain; version=0.0.4）
+"""
+
+import bisect
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 默认延迟桶（秒），覆盖缓存命中到外部API超时
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+# 单个序列保留的线程分片数超过该值时，合并已退出线程的分片
+MAX_LIVE_SHARDS = 64
+
+
+class _Shard:
+    """单线程独占的计数单元，只有所属线程写入"""
+
+    __slots__ = ('thread', 'value', 'count', 'max', 'buckets')
+
+    def __init__(self, thread: Optional[threading.Thread], bucket_count: int = 0):
+        self.thread = thread
+        self.value = 0.0
+        self.count = 0
+        self.max = 0.0
+        self.buckets = [0] * bucket_count
+
+
+class _ShardedSeries:
+    """按线程分片的序列基类
+
+    每个线程第一次写入时登记一个分片，之后只写自己的分片，不需要加锁；
+    读取时把所有分片相加。已退出线程的分片在读取或登记时并入 retired。
+    """
+
+    bucket_count = 0
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard(None, self.bucket_count)
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard(threading.current_thread(), self.bucket_count)
+            with self._lock:
+                if len(self._shards) >= MAX_LIVE_SHARDS:
+                    self._compact()
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _compact(self):
+        """把已退出线程的分片并入 retired（调用方持有锁）"""
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                self._merge_into(self._retired, shard)
+        self._shards = alive
+
+    @staticmethod
+    def _merge_into(target: _Shard, source: _Shard):
+        target.value += source.value
+        target.count += source.count
+        if source.max > target.max:
+            target.max = source.max
+        for i, bucket_count in enumerate(source.buckets):
+            target.buckets[i] += bucket_count
+
+    def _merged(self) -> _Shard:
+        with self._lock:
+            self._compact()
+            merged = _Shard(None, self.bucket_count)
+            self._merge_into(merged, self._retired)
+            for shard in self._shards:
+                self._merge_into(merged, shard)
+        return merged
+
+    def reset(self):
+        """清零（各线程分片原地清零，保留线程本地引用）"""
+        with self._lock:
+            for shard in self._shards + [self._retired]:
+                shard.value = 0.0
+                shard.count = 0
+                shard.max = 0.0
+                shard.buckets = [0] * self.bucket_count
+
+
+class CounterSeries(_ShardedSeries):
+    """单调递增计数器"""
+
+    def inc(self, amount: float = 1):
+        self._shard().value += amount
+
+    def get(self) -> float:
+        return self._merged().value
+
+
+class HistogramSeries(_ShardedSeries):
+    """固定桶直方图"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.bucket_count = len(self.bounds)
+        super().__init__()
+
+    def observe(self, value: float):
+        shard = self._shard()
+        shard.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        shard.value += value
+        shard.count += 1
+        if value > shard.max:
+            shard.max = value
+
+    def snapshot(self) -> Dict:
+        merged = self._merged()
+        return {
+            'count': merged.count,
+            'sum': merged.value,
+            'max': merged.max,
+            'buckets': merged.buckets,
+        }
+
+    def percentile(self, q: float, snapshot: Dict = None) -> float:
+        """按桶线性插值估算分位数，结果不超过观测到的最大值"""
+        snapshot = snapshot or self.snapshot()
+        count = snapshot['count']
+        if count == 0:
+            return 0.0
+        target = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.bounds, snapshot['buckets']):
+            if bucket_count and cumulative + bucket_count >= target:
+                if bound == float('inf'):
+                    return snapshot['max']
+                fraction = (target - cumulative) / bucket_count
+                return min(lower + (bound - lower) * fraction, snapshot['max'])
+            cumulative += bucket_count
+            if bound != float('inf'):
+                lower = bound
+        return snapshot['max']
+
+    def summary(self) -> Dict:
+        """汇总：次数、均值、最大值和 p50/p95/p99（秒）"""
+        snapshot = self.snapshot()
+        count = snapshot['count']
+        return {
+            'count': count,
+            'sum': round(snapshot['sum'], 6),
+            'avg': round(snapshot['sum'] / count, 6) if count else 0.0,
+            'max': round(snapshot['max'], 6),
+            'p50': round(self.percentile(0.50, snapshot), 6),
+            'p95': round(self.percentile(0.95, snapshot), 6),
+            'p99': round(self.percentile(0.99, snapshot), 6),
+        }
+
+
+class MetricFamily:
+    """同名指标族，按标签值区分序列"""
+
+    def __init__(self, name: str, documentation: str, metric_type: str,
+                 labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = None):
+        self.name = name
+        self.documentation = documentation
+        self.type = metric_type
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets or DEFAULT_LATENCY_BUCKETS)
+        self._children: Dict[Tuple[str, ...], _ShardedSeries] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs) -> _ShardedSeries:
+        """取得（必要时创建）标签对应的序列；命中时只有一次字典查找"""
+        if kwargs:
+            values = tuple(str(kwargs.get(name, '')) for name in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    if len(values) != len(self.labelnames):
+                        raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}")
+                    if self.type == 'histogram':
+                        child = HistogramSeries(self.buckets)
+                    else:
+                        child = CounterSeries()
+                    self._children[values] = child
+        return child
+
+    def inc(self, amount: float = 1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def observe(self, value: float, **labels):
+        self.labels(**labels).observe(value)
+
+    def children(self) -> List[Tuple[Dict[str, str], _ShardedSeries]]:
+        with self._lock:
+            items = list(self._children.items())
+        return [(dict(zip(self.labelnames, values)), child) for values, child in items]
+
+    def reset(self):
+        for _, child in self.children():
+            child.reset()
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._families: Dict[str, MetricFamily] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name: str, documentation: str, metric_type: str,
+                  labelnames: Iterable[str], buckets=None) -> MetricFamily:
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = MetricFamily(name, documentation, metric_type, labelnames, buckets)
+                self._families[name] = family
+            elif family.type != metric_type or family.labelnames != tuple(labelnames):
+                raise ValueError(f"指标 {name} 已以不同类型或标签注册")
+            return family
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> MetricFamily:
+        """注册（或取得已注册的）计数器"""
+        return self._register(name, documentation, 'counter', labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = None) -> MetricFamily:
+        """注册（或取得已注册的）直方图"""
+        return self._register(name, documentation, 'histogram', labelnames, buckets)
+
+    def get(self, name: str) -> Optional[MetricFamily]:
+        return self._families.get(name)
+
+    def families(self) -> List[MetricFamily]:
+        with self._lock:
+            return list(self._families.values())
+
+    def reset(self):
+        for family in self.families():
+            family.reset()
+
+    def snapshot(self) -> Dict:
+        """JSON友好的快照：计数器给出数值，直方图给出分位数汇总"""
+        result = {}
+        for family in self.families():
+            series = []
+            for labels, child in family.children():
+                if family.type == 'histogram':
+                    series.append({'labels': labels, **child.summary()})
+                else:
+                    series.append({'labels': labels, 'value': child.get()})
+            result[family.name] = {'type': family.type, 'series': series}
+        return result
+
+    def render_prometheus(self) -> str:
+        """输出 Prometheus 文本格式"""
+        lines = []
+        for family in self.families():
+            lines.append(f'# HELP {family.name} {family.documentation}')
+            lines.append(f'# TYPE {family.name} {family.type}')
+            for labels, child in family.children():
+                if family.type == 'histogram':
+                    snapshot = child.snapshot()
+                    cumulative = 0
+                    for bound, bucket_count in zip(child.bounds, snapshot['buckets']):
+                        cumulative += bucket_count
+                        bucket_labels = dict(labels, le=_format_value(bound))
+                        lines.append(f'{family.name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+                    lines.append(f'{family.name}_sum{_format_labels(labels)} {_format_value(snapshot["sum"])}')
+                    lines.append(f'{family.name}_count{_format_labels(labels)} {snapshot["count"]}')
+                else:
+                    lines.append(f'{family.name}{_format_labels(labels)} {_format_value(child.get())}')
+        return '\n'.join(lines) + '\n'
+
+
+# 全局指标注册表
+metrics_registry = MetricsRegistry()
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# 便捷函数
+def render_metrics() -> str:
+    """输出全局注册表的 Prometheus 文本"""
+    return metrics_registry.render_prometheus()
+
+
+def get_metrics_snapshot() -> Dict:
+    """获取全局注册表的JSON快照"""
+    return metrics_registry.snapshot()
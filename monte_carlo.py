@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 向量化蒙特卡洛价格模拟
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- 一次生成成千上万条对数价格路径（几何布朗运动或历史收益率自助抽样）
+- 使用可设定种子的 np.random.Generator，结果可复现
+- 输出每日分位数带和目标价触及/收盘概率
+- 多个情景共用同一组零漂移随机冲击，情景之间只差一个线性漂移项：
+  分位数满足 q(X + c) = q(X) + c，因此每个情景的分位数带无需重新模拟
+- 按时间分块生成，内存占用上限为 n_paths × 块长 个浮点数，适用于长周期
+- 路径按 (天数, 路径数) 行优先存放，每日分位数通过按行排序后线性插值得到，
+  比 np.percentile(axis=0) 快数倍
+"""
+
+import logging
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+# 单块随机冲击矩阵的内存上限
+DEFAULT_MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+SUPPORTED_METHODS = ('gbm', 'bootstrap')
+
+
+class MonteCarloEngine:
+    """向量化蒙特卡洛模拟器"""
+
+    def __init__(self, n_paths: int = 10000, method: str = 'gbm', seed: Optional[int] = None,
+                 max_chunk_bytes: int = DEFAULT_MAX_CHUNK_BYTES):
+        if method not in SUPPORTED_METHODS:
+            raise ValueError(f"不支持的模拟方法: {method}，可选: {SUPPORTED_METHODS}")
+        self.n_paths = int(n_paths)
+        self.method = method
+        self.seed = seed
+        self.max_chunk_bytes = max_chunk_bytes
+
+    def _block_days(self, days: int) -> int:
+        return max(1, min(days, self.max_chunk_bytes // (self.n_paths * 8)))
+
+    def _shock_blocks(self, rng: np.random.Generator, days: int, sigma: float,
+                      centered_returns: Optional[np.ndarray]):
+        """按时间分块产出零漂移的日对数收益率冲击 (block × n_paths)"""
+        block_days = self._block_days(days)
+        for start in range(0, days, block_days):
+            block = min(block_days, days - start)
+            if self.method == 'bootstrap':
+                idx = rng.integers(0, len(centered_returns), size=(block, self.n_paths))
+                yield start, centered_returns[idx]
+            else:
+                shocks = rng.standard_normal((block, self.n_paths))
+                shocks *= sigma
+                yield start, shocks
+
+    def _row_quantiles(self, paths: np.ndarray, percentiles) -> np.ndarray:
+        """逐行（逐日）线性插值分位数，结果形状 (len(percentiles), block)"""
+        ordered = np.sort(paths, axis=1)
+        positions = np.asarray(percentiles, dtype=float) / 100 * (self.n_paths - 1)
+        lower = np.floor(positions).astype(int)
+        upper = np.minimum(lower + 1, self.n_paths - 1)
+        weight = (positions - lower)[:, None]
+        return ordered[:, lower].T * (1 - weight) + ordered[:, upper].T * weight
+
+    def simulate(self, current_price: float, days: int, drifts: Dict[str, float],
+                 sigma: float = None, historical_log_returns: Iterable[float] = None,
+                 targets: Dict[str, float] = None,
+                 percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict:
+        """模拟价格路径
+
+        Args:
+            current_price: 当前价格
+            days: 模拟天数
+            drifts: {情景名: 日对数漂移}，所有情景共用同一组随机冲击
+            sigma: 日对数收益率标准差（gbm 方法必需，bootstrap 缺省时取历史标准差）
+            historical_log_returns: 历史日对数收益率（bootstrap 方法必需）
+            targets: {目标名: 目标价}，对每个情景计算触及概率和期末达到概率
+            percentiles: 输出的分位数
+
+        Returns:
+            {
+              'n_paths', 'days', 'method', 'seed',
+              'scenarios': {情景名: {'bands': {'p5': [...]}, 'mean_final', 'hit_probability': {...},
+                                     'end_probability': {...}}}
+            }
+            bands 长度为 days + 1（第0天为当前价）
+        """
+        if days <= 0:
+            raise ValueError("模拟天数必须大于0")
+        percentiles = tuple(percentiles)
+        targets = targets or {}
+
+        centered = None
+        if self.method == 'bootstrap':
+            if historical_log_returns is None:
+                raise ValueError("bootstrap 方法需要历史收益率")
+            hist = np.asarray(historical_log_returns, dtype=float)
+            hist = hist[np.isfinite(hist)]
+            if len(hist) < 2:
+                raise ValueError("历史收益率样本不足")
+            centered = hist - hist.mean()
+            if sigma is None:
+                sigma = float(hist.std(ddof=1))
+        elif sigma is None:
+            raise ValueError("gbm 方法需要 sigma")
+
+        rng = np.random.default_rng(self.seed)
+        names = list(drifts)
+        drift_values = np.array([drifts[name] for name in names], dtype=float)
+        log_targets = {name: np.log(price / current_price) for name, price in targets.items() if price > 0}
+
+        # 零漂移累计对数收益率的每日分位数
+        quantiles = np.empty((len(percentiles), days + 1))
+        quantiles[:, 0] = 0.0
+        running_max = np.zeros((len(names), self.n_paths))
+        running_min = np.zeros((len(names), self.n_paths))
+        level = np.zeros(self.n_paths)
+
+        for start, shocks in self._shock_blocks(rng, days, sigma, centered):
+            block = shocks.shape[0]
+            paths = np.cumsum(shocks, axis=0, out=shocks)
+            paths += level
+            level = paths[-1].copy()
+
+            quantiles[:, start + 1:start + 1 + block] = self._row_quantiles(paths, percentiles)
+
+            # 各情景的路径极值（加上线性漂移后）
+            t = np.arange(start + 1, start + 1 + block, dtype=float)[:, None]
+            for i, drift in enumerate(drift_values):
+                shifted = paths + drift * t
+                np.maximum(running_max[i], shifted.max(axis=0), out=running_max[i])
+                np.minimum(running_min[i], shifted.min(axis=0), out=running_min[i])
+            del paths
+
+        final_level = level
+        scenarios = {}
+        for i, name in enumerate(names):
+            drift = drift_values[i]
+            shift = drift * np.arange(days + 1)
+            bands = {
+                f'p{int(p) if float(p).is_integer() else p}': (current_price * np.exp(quantiles[j] + shift)).tolist()
+                for j, p in enumerate(percentiles)
+            }
+            final_log = final_level + drift * days
+            hit_probability = {}
+            end_probability = {}
+            for target_name, log_target in log_targets.items():
+                if log_target >= 0:
+                    hit_probability[target_name] = float(np.mean(running_max[i] >= log_target))
+                    end_probability[target_name] = float(np.mean(final_log >= log_target))
+                else:
+                    hit_probability[target_name] = float(np.mean(running_min[i] <= log_target))
+                    end_probability[target_name] = float(np.mean(final_log <= log_target))
+            scenarios[name] = {
+                'bands': bands,
+                'mean_final': float(current_price * np.mean(np.exp(final_log))),
+                'hit_probability': hit_probability,
+                'end_probability': end_probability
+            }
+
+        return {
+            'n_paths': self.n_paths,
+            'days': days,
+            'method': self.method,
+            'seed': self.seed,
+            'daily_sigma': float(sigma),
+            'scenarios': scenarios
+        }
+
+
+def log_returns_from_prices(close) -> np.ndarray:
+    """收盘价序列转日对数收益率"""
+    close = np.asarray(close, dtype=float)
+    close = close[np.isfinite(close) & (close > 0)]
+    if len(close) < 2:
+        return np.array([])
+    return np.diff(np.log(close))
@@ -2,184 +2,93 @@
 # -*- coding: utf-8 -*-
 """
 智能分析系统（股票） - 新闻数据获取模块
-功能: 获取财联社电报新闻数据并缓存到本地，避免重复内容
+功能: 获取财联社电报新闻数据追加到本地新闻库（news_store），避免重复内容
 """
 
-import os
-import json
 import logging
-import time
-import hashlib
-from datetime import datetime, timedelta, date
-import akshare as ak
-import pandas as pd
+import os
+from datetime import datetime
+
+from data_provider import get_data_provider
+from frame_schema import convert_frame, get_schema
+from news_store import NewsStore, NewsTagger, content_hash
 
 # 设置日志
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('news_fetcher')
 
-# 自定义JSON编码器，处理日期类型
-class DateEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        if pd.isna(obj):  # 处理pandas中的NaN
-            return None
-        return super(DateEncoder, self).default(obj)
+# 按股票检索本地新闻的默认天数
+NEWS_SEARCH_DAYS = int(os.getenv('NEWS_SEARCH_DAYS', '7'))
+# 本地新闻库中提到该股票的新闻达到此条数时不再调用远程搜索（个股分析和问答共用）
+NEWS_LOCAL_MIN_HITS = int(os.getenv('NEWS_LOCAL_MIN_HITS', '2'))
+# 打标签用的股票/行业词表刷新间隔（秒）
+NEWS_TAGGER_TTL = 86400
 
 class NewsFetcher:
     def __init__(self, save_dir="data/news"):
         """初始化新闻获取器"""
         self.save_dir = save_dir
-        # 确保保存目录存在
-        os.makedirs(self.save_dir, exist_ok=True)
         self.last_fetch_time = None
-
-        # 哈希集合用于快速判断新闻是否已存在
-        self.news_hashes = set()
-        # 加载已有的新闻哈希
-        self._load_existing_hashes()
-
-    def _load_existing_hashes(self):
-        """加载已有文件中的新闻哈希值"""
+        # 新闻追加写入 SQLite，按内容哈希唯一索引去重
+        self.store = NewsStore(save_dir)
+        logger.info(f"新闻库已打开: {self.store.db_path}，共 {self.store.count()} 条")
+
+    def _refresh_tagger(self):
+        """加载或按天刷新打标签用的股票名称和行业名称词表，并给词表缺失期间入库的新闻补打标签"""
+        tagger = self.store.tagger
+        if tagger.loaded_at and (datetime.now() - tagger.loaded_at).total_seconds() < NEWS_TAGGER_TTL:
+            return
+        provider = get_data_provider()
         try:
-            # 获取最近3天的文件来加载哈希值
-            today = datetime.now()
-            for i in range(3):  # 检查今天和前两天的数据
-                date = today - timedelta(days=i)
-                filename = self.get_news_filename(date)
-
-                if os.path.exists(filename):
-                    with open(filename, 'r', encoding='utf-8') as f:
-                        try:
-                            news_data = json.load(f)
-                            for item in news_data:
-                                # 如果有哈希字段就直接使用，否则计算新的哈希
-                                if 'hash' in item:
-                                    self.news_hashes.add(item['hash'])
-                                else:
-                                    content_hash = self._calculate_hash(item['content'])
-                                    self.news_hashes.add(content_hash)
-                        except json.JSONDecodeError:
-                            logger.warning(f"文件 {filename} 格式错误，跳过加载哈希值")
-
-            logger.info(f"已加载 {len(self.news_hashes)} 条新闻哈希值")
+            stock_df = provider.stock_info_a_code_name()
+            stocks = dict(zip(stock_df['code'].astype(str).str.zfill(6), stock_df['name'].astype(str)))
+        except Exception as e:
+            logger.warning(f"加载股票名称词表失败: {str(e)}")
+            return
+        try:
+            industries = provider.stock_board_industry_name_em()['板块名称'].tolist()
         except Exception as e:
-            logger.error(f"加载现有新闻哈希值时出错: {str(e)}")
-            # 出错时清空哈希集合，保证程序可以继续运行
-            self.news_hashes = set()
+            logger.warning(f"加载行业名称词表失败，只按股票打标签: {str(e)}")
+            industries = []
+        self.store.set_tagger(NewsTagger(stocks, industries))
+        logger.info(f"新闻标签词表已加载: {len(stocks)} 只股票, {len(industries)} 个行业")
 
     def _calculate_hash(self, content):
         """计算新闻内容的哈希值"""
-        # 使用MD5哈希算法计算内容的哈希值
         # 对于财经新闻，内容通常是唯一的标识，所以只对内容计算哈希
-        return hashlib.md5(str(content).encode('utf-8')).hexdigest()
-
-    def get_news_filename(self, date=None):
-        """获取指定日期的新闻文件名"""
-        if date is None:
-            date = datetime.now().strftime('%Y%m%d')
-        else:
-            date = date.strftime('%Y%m%d')
-        return os.path.join(self.save_dir, f"news_{date}.json")
+        return content_hash(content)
 
     def fetch_and_save(self):
-        """获取新闻并保存到JSON文件，避免重复内容"""
+        """获取新闻并追加到新闻库，避免重复内容"""
         try:
             # 获取当前时间
             now = datetime.now()
 
-            # 调用AKShare API获取财联社电报数据
+            # 经数据提供方获取财联社电报数据
             logger.info("开始获取财联社电报数据")
-            stock_info_global_cls_df = ak.stock_info_global_cls(symbol="全部")
+            stock_info_global_cls_df = get_data_provider().stock_info_global_cls(symbol="全部")
 
             if stock_info_global_cls_df.empty:
                 logger.warning("获取的财联社电报数据为空")
                 return False
 
-            # 打印DataFrame的信息和类型，帮助调试
-            logger.info(f"获取的数据形状: {stock_info_global_cls_df.shape}")
-            logger.info(f"数据列: {stock_info_global_cls_df.columns.tolist()}")
-            logger.info(f"数据类型: \n{stock_info_global_cls_df.dtypes}")
-
-            # 计数器
-            total_count = 0
-            new_count = 0
-
-            # 转换为列表字典格式并添加哈希值
-            news_list = []
-            for _, row in stock_info_global_cls_df.iterrows():
-                total_count += 1
-
-                # 安全获取内容，确保为字符串
-                content = str(row.get("内容", ""))
-
-                # 计算内容哈希值
-                content_hash = self._calculate_hash(content)
-
-                # 检查是否已存在相同内容的新闻
-                if content_hash in self.news_hashes:
-                    continue  # 跳过已存在的新闻
-
-                # 添加新的哈希值到集合
-                self.news_hashes.add(content_hash)
-                new_count += 1
-
-                # 安全获取日期和时间，确保为字符串格式
-                pub_date = row.get("发布日期", "")
-                if isinstance(pub_date, (datetime, date)):
-                    pub_date = pub_date.isoformat()
-                else:
-                    pub_date = str(pub_date)
-
-                pub_time = row.get("发布时间", "")
-                if isinstance(pub_time, (datetime, date)):
-                    pub_time = pub_time.isoformat()
-                else:
-                    pub_time = str(pub_time)
+            # 按列整体转换，过滤本批次内重复的新闻；与库中重复的由哈希唯一索引忽略
+            frame = convert_frame(stock_info_global_cls_df, get_schema('stock_info_global_cls'))
+            total_count = len(frame)
+            frame["hash"] = [self._calculate_hash(content) for content in frame["content"]]
+            frame = frame[~frame["hash"].duplicated()]
 
-                # 创建新闻项并添加哈希值
-                news_item = {
-                    "title": str(row.get("标题", "")),
-                    "content": content,
-                    "date": pub_date,
-                    "time": pub_time,
-                    "datetime": f"{pub_date} {pub_time}",
-                    "fetch_time": now.strftime('%Y-%m-%d %H:%M:%S'),
-                    "hash": content_hash  # 保存哈希值以便后续使用
-                }
-                news_list.append(news_item)
+            frame = frame.assign(datetime=frame["date"] + " " + frame["time"],
+                                 fetch_time=now.strftime('%Y-%m-%d %H:%M:%S'))
+            news_list = frame[["title", "content", "date", "time", "datetime", "fetch_time", "hash"]].to_dict('records')
 
-            # 如果没有新的新闻，直接返回
-            if not news_list:
+            self._refresh_tagger()
+            new_count = self.store.append(news_list)
+            if not new_count:
                 logger.info(f"没有新的新闻数据需要保存 (共检查 {total_count} 条)")
-                return True
-
-            # 获取文件名
-            filename = self.get_news_filename()
-
-            # 如果文件已存在，则合并新旧数据
-            if os.path.exists(filename):
-                with open(filename, 'r', encoding='utf-8') as f:
-                    try:
-                        existing_data = json.load(f)
-                        # 合并数据，已经确保news_list中的内容都是新的
-                        merged_news = existing_data + news_list
-                        # 按时间排序
-                        merged_news.sort(key=lambda x: x['datetime'], reverse=True)
-                    except json.JSONDecodeError:
-                        logger.warning(f"文件 {filename} 格式错误，使用新数据替换")
-                        merged_news = sorted(news_list, key=lambda x: x['datetime'], reverse=True)
             else:
-                # 如果文件不存在，直接使用新数据
-                merged_news = sorted(news_list, key=lambda x: x['datetime'], reverse=True)
-
-            # 保存合并后的数据，使用自定义编码器处理日期
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(merged_news, f, ensure_ascii=False, indent=2, cls=DateEncoder)
-
-            logger.info(f"成功保存 {new_count} 条新闻数据 (共检查 {total_count} 条，过滤重复 {total_count - new_count} 条)")
+                logger.info(f"成功保存 {new_count} 条新闻数据 (共检查 {total_count} 条，过滤重复 {total_count - new_count} 条)")
             self.last_fetch_time = now
             return True
 
@@ -190,63 +99,24 @@ class NewsFetcher:
             return False
 
     def get_latest_news(self, days=1, limit=50):
-        """获取最近几天的新闻数据，并去除重复项"""
-        news_data = []
-        today = datetime.now()
-        # 记录已处理的日期，便于日志
-        processed_dates = []
-
-        # 获取指定天数内的所有新闻
-        for i in range(days):
-            date = today - timedelta(days=i)
-            date_str = date.strftime('%Y%m%d')
-            filename = self.get_news_filename(date)
-
-            if os.path.exists(filename):
-                try:
-                    with open(filename, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        news_data.extend(data)
-                        processed_dates.append(date_str)
-                        logger.info(f"已加载 {date_str} 新闻数据 {len(data)} 条")
-                except Exception as e:
-                    logger.error(f"读取文件 {filename} 时出错: {str(e)}")
-            else:
-                logger.warning(f"日期 {date_str} 的新闻文件不存在: {filename}")
-
-        # 排序前记录总数
-        total_before_sort = len(news_data)
-
-        # 去除重复项
-        # 使用内容哈希或已有的哈希字段作为唯一标识
-        unique_news = {}
-        duplicate_count = 0
-
-        for item in news_data:
-            # 优先使用已有的哈希值，如果没有则计算内容哈希
-            item_hash = item.get('hash')
-            if not item_hash and 'content' in item:
-                item_hash = self._calculate_hash(item['content'])
-
-            # 如果是新的哈希值，则添加到结果中
-            if item_hash and item_hash not in unique_news:
-                unique_news[item_hash] = item
-            else:
-                duplicate_count += 1
-
-        # 转换回列表并按时间排序
-        deduplicated_news = list(unique_news.values())
-        deduplicated_news.sort(key=lambda x: x.get('datetime', ''), reverse=True)
-
-        # 限制返回条数
-        result = deduplicated_news[:limit]
-
-        logger.info(f"获取最近 {days} 天新闻(处理日期:{','.join(processed_dates)}), "
-                    f"共 {total_before_sort} 条, 去重后 {len(deduplicated_news)} 条, "
-                    f"移除重复 {duplicate_count} 条, 返回最新 {len(result)} 条")
-
+        """获取最近几天的新闻数据（入库时已去重），按发布时间倒序"""
+        result = self.store.latest(days, limit)
+        logger.debug(f"获取最近 {days} 天新闻, 返回最新 {len(result)} 条")
         return result
 
+    def search_stock_news(self, stock_code, industry=None, query=None, days=NEWS_SEARCH_DAYS, limit=5):
+        """在本地新闻库中检索与股票相关的近期新闻
+
+        返回 {'news': 提到该股票或命中 query 的新闻, 'industry_news': 只提到所属行业的新闻}，
+        各自按相关度和发布时间排序，最多 limit 条。
+        """
+        items = self.store.search(stock_code=stock_code, industry=industry, query=query,
+                                  days=days, limit=limit * 2)
+        news = [item for item in items if item['matched'] != 'industry'][:limit]
+        industry_news = [item for item in items if item['matched'] == 'industry'][:limit]
+        logger.debug(f"本地新闻检索 {stock_code}: 相关 {len(news)} 条, 行业 {len(industry_news)} 条")
+        return {'news': news, 'industry_news': industry_news}
+
 # 单例模式的新闻获取器
 news_fetcher = NewsFetcher()
 
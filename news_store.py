@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 新闻存储
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- 财联社电报追加写入独立的 SQLite 文件（WAL），不再每次读出整天的 JSON 合并、排序后重写
+- 内容哈希唯一索引去重：写入只处理本批新闻，INSERT OR IGNORE 由索引判断是否已存在
+- 发布时间索引：最近N天、最多limit条按索引倒序读取，耗时与库中总条数无关
+- 首次打开时导入旧版按日 JSON 文件（news_YYYYMMDD.json），已导入的文件记录在库中
+- 入库时按股票代码、股票名称和行业名称打标签（news_tags），按股票检索相关新闻走标签索引
+- FTS5 全文索引（trigram 分词，支持中文子串）；SQLite 不支持 FTS5 时退化为最近新闻的 LIKE 匹配
+
+环境变量：
+- NEWS_DB_PATH: 新闻库文件（默认 <新闻目录>/news.db）
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+NEWS_DB_PATH = os.getenv('NEWS_DB_PATH')
+
+NEWS_COLUMNS = ('hash', 'title', 'content', 'date', 'time', 'datetime', 'fetch_time')
+
+# 标签权重：提到股票（代码或名称）比只提到所属行业更相关
+STOCK_TAG_WEIGHT = 3
+INDUSTRY_TAG_WEIGHT = 1
+# 全文检索命中的附加权重
+TEXT_MATCH_WEIGHT = 2
+
+# 没有股票列表时只认沪深主板、中小板、创业板、科创板的代码前缀
+_A_SHARE_PREFIXES = ('00', '30', '60', '68')
+_CODE_PATTERN = re.compile(r'(?<!\d)(\d{6})(?!\d)')
+# 每批打标签的新闻条数
+_TAG_BATCH = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS news (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash TEXT NOT NULL UNIQUE,
+    title TEXT,
+    content TEXT,
+    date TEXT,
+    time TEXT,
+    datetime TEXT,
+    fetch_time TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_news_datetime ON news (datetime);
+CREATE TABLE IF NOT EXISTS news_tags (
+    tag TEXT NOT NULL,
+    news_id INTEGER NOT NULL,
+    weight INTEGER NOT NULL,
+    PRIMARY KEY (tag, news_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS imported_files (
+    name TEXT PRIMARY KEY,
+    imported_at TEXT
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_FTS_SCHEMA = ("CREATE VIRTUAL TABLE news_fts USING fts5("
+               "title, content, content='news', content_rowid='id', tokenize='trigram')")
+
+
+def content_hash(content) -> str:
+    """新闻内容的 MD5，作为去重标识"""
+    return hashlib.md5(str(content).encode('utf-8')).hexdigest()
+
+
+class NewsTagger:
+    """按股票代码、股票名称和行业名称给新闻打标签
+
+    名称匹配按词表中出现过的名称长度逐一切片查字典，不依赖分词库，单条电报约0.1毫秒。
+    """
+
+    def __init__(self, stocks: Optional[Dict[str, str]] = None, industries: Iterable[str] = ()):
+        self.loaded_at = None
+        self.set_vocabulary(stocks or {}, industries)
+
+    def set_vocabulary(self, stocks: Dict[str, str], industries: Iterable[str]):
+        """stocks 为 {代码: 名称}，industries 为行业名称"""
+        terms = {}
+        for industry in industries:
+            industry = str(industry).strip()
+            if len(industry) >= 2:
+                terms[industry] = f'industry:{industry}'
+        # 股票名称与行业同名时按股票处理
+        for code, name in stocks.items():
+            name = str(name).replace(' ', '')
+            if len(name) >= 2:
+                terms[name] = f'code:{code}'
+        self._codes = set(stocks)
+        self._terms = terms
+        self._lengths = sorted({len(term) for term in terms})
+        if terms:
+            self.loaded_at = datetime.now()
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._terms)
+
+    def tag(self, text: str) -> Dict[str, int]:
+        """返回 {标签: 权重}，标签形如 code:600519、industry:白酒"""
+        text = text or ''
+        tags = {}
+        for code in _CODE_PATTERN.findall(text):
+            known = code in self._codes if self._codes else code.startswith(_A_SHARE_PREFIXES)
+            if known:
+                tags[f'code:{code}'] = STOCK_TAG_WEIGHT
+        for length in self._lengths:
+            for start in range(len(text) - length + 1):
+                tag = self._terms.get(text[start:start + length])
+                if tag and tag not in tags:
+                    tags[tag] = STOCK_TAG_WEIGHT if tag.startswith('code:') else INDUSTRY_TAG_WEIGHT
+        return tags
+
+
+class NewsStore:
+    """追加写入、带哈希索引、时间索引、标签索引和全文索引的新闻库"""
+
+    def __init__(self, save_dir: str = "data/news", db_path: Optional[str] = None,
+                 tagger: Optional[NewsTagger] = None):
+        self.save_dir = save_dir
+        self.db_path = db_path or NEWS_DB_PATH or os.path.join(save_dir, 'news.db')
+        self.tagger = tagger or NewsTagger()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 新闻库读写量小，单连接加锁即可
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(_SCHEMA)
+            self.fts_enabled = self._ensure_fts()
+        self.import_legacy_files()
+
+    def _ensure_fts(self) -> bool:
+        """创建全文索引；已有新闻的旧库首次创建时重建索引"""
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'news_fts'").fetchone()
+        if exists:
+            return True
+        try:
+            self._conn.execute(_FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite 不支持 FTS5 trigram 分词，全文检索退化为 LIKE 匹配: {e}")
+            return False
+        self._conn.execute("INSERT INTO news_fts(news_fts) VALUES ('rebuild')")
+        return True
+
+    def _get_meta(self, key: str, default: str = None) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def append(self, items: Iterable[Dict]) -> int:
+        """追加新闻，已存在的哈希直接忽略，返回实际写入条数；新写入的新闻同时建立全文索引和标签"""
+        rows = [tuple(item.get(column) for column in NEWS_COLUMNS) for item in items]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            last_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM news").fetchone()[0]
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO news ({', '.join(NEWS_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(NEWS_COLUMNS))})", rows)
+            new_rows = self._conn.execute(
+                "SELECT id, title, content FROM news WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+            if self.fts_enabled and new_rows:
+                self._conn.executemany("INSERT INTO news_fts (rowid, title, content) VALUES (?, ?, ?)",
+                                       [tuple(row) for row in new_rows])
+            self._tag_pending()
+            return len(new_rows)
+
+    def _tag_pending(self) -> int:
+        """给尚未打标签的新闻打标签（需在锁和事务内调用）；词表未加载时留待加载后处理"""
+        if not self.tagger.loaded:
+            return 0
+        tagged = 0
+        tagged_upto = int(self._get_meta('tagged_upto', '0'))
+        while True:
+            rows = self._conn.execute(
+                "SELECT id, title, content FROM news WHERE id > ? ORDER BY id LIMIT ?",
+                (tagged_upto, _TAG_BATCH)).fetchall()
+            if not rows:
+                break
+            tag_rows = [(tag, row['id'], weight)
+                        for row in rows
+                        for tag, weight in self.tagger.tag(f"{row['title'] or ''} {row['content'] or ''}").items()]
+            self._conn.executemany("INSERT OR IGNORE INTO news_tags (tag, news_id, weight) VALUES (?, ?, ?)",
+                                   tag_rows)
+            tagged_upto = rows[-1]['id']
+            tagged += len(rows)
+        self._set_meta('tagged_upto', tagged_upto)
+        return tagged
+
+    def set_tagger(self, tagger: NewsTagger) -> int:
+        """更换词表，并给词表加载前入库的新闻补打标签"""
+        with self._lock, self._conn:
+            self.tagger = tagger
+            tagged = self._tag_pending()
+        if tagged:
+            logger.info(f"已为 {tagged} 条新闻补打标签")
+        return tagged
+
+    def latest(self, days: int = 1, limit: int = 50) -> List[Dict]:
+        """最近 days 个自然日（含今天）的新闻，按发布时间倒序，最多 limit 条"""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(NEWS_COLUMNS)} FROM news WHERE datetime >= ? "
+                f"ORDER BY datetime DESC LIMIT ?", (self._since(days), limit))
+            return [dict(row) for row in cursor]
+
+    @staticmethod
+    def _since(days: int) -> str:
+        return (datetime.now() - timedelta(days=max(days, 1) - 1)).strftime('%Y-%m-%d')
+
+    def search(self, stock_code: str = None, industry: str = None, query: str = None,
+               days: int = 7, limit: int = 10) -> List[Dict]:
+        """检索与股票相关的近期新闻，按相关度和发布时间倒序
+
+        相关度 = 标签权重之和（提到该股票 3，提到所属行业 1）+ 全文命中 query 的附加权重 2。
+        每条结果带 relevance 和 matched（stock / industry / text）。
+        """
+        since = self._since(days)
+        columns = ', '.join(f'n.{column}' for column in NEWS_COLUMNS)
+        hits: Dict[int, Dict] = {}
+        tags = [tag for tag in (stock_code and f'code:{stock_code}', industry and f'industry:{industry}') if tag]
+
+        with self._lock:
+            if tags:
+                cursor = self._conn.execute(
+                    f"SELECT n.id, {columns}, SUM(t.weight) AS relevance, "
+                    f"MAX(t.tag LIKE 'code:%') AS stock_hit "
+                    f"FROM news_tags t JOIN news n ON n.id = t.news_id "
+                    f"WHERE t.tag IN ({', '.join('?' * len(tags))}) AND n.datetime >= ? "
+                    f"GROUP BY n.id ORDER BY relevance DESC, n.datetime DESC LIMIT ?",
+                    (*tags, since, limit * 3))
+                for row in cursor:
+                    item = dict(row)
+                    item['matched'] = 'stock' if item.pop('stock_hit') else 'industry'
+                    hits[item.pop('id')] = item
+
+            for row in self._match_text(query, since, limit * 3, columns):
+                item = dict(row)
+                news_id = item.pop('id')
+                if news_id in hits:
+                    hits[news_id]['relevance'] += TEXT_MATCH_WEIGHT
+                else:
+                    hits[news_id] = dict(item, relevance=TEXT_MATCH_WEIGHT, matched='text')
+
+        results = sorted(hits.values(), key=lambda item: (item['relevance'], item['datetime'] or ''), reverse=True)
+        return results[:limit]
+
+    def _match_text(self, query: Optional[str], since: str, limit: int, columns: str):
+        """全文检索：3个字及以上的词走 FTS5 trigram 索引，否则在时间范围内 LIKE 匹配"""
+        terms = [term for term in (query or '').split() if term]
+        if not terms:
+            return []
+        if self.fts_enabled and all(len(term) >= 3 for term in terms):
+            match = ' OR '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+            return self._conn.execute(
+                f"SELECT n.id, {columns} FROM news_fts f JOIN news n ON n.id = f.rowid "
+                f"WHERE news_fts MATCH ? AND n.datetime >= ? ORDER BY bm25(news_fts) LIMIT ?",
+                (match, since, limit)).fetchall()
+        # 转义用户输入中的通配符，% 和 _ 按字面匹配
+        conditions = ' OR '.join("n.title LIKE ? ESCAPE '\\' OR n.content LIKE ? ESCAPE '\\'" for _ in terms)
+        escaped = [term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') for term in terms]
+        params = [pattern for term in escaped for pattern in (f'%{term}%', f'%{term}%')]
+        return self._conn.execute(
+            f"SELECT n.id, {columns} FROM news n WHERE n.datetime >= ? AND ({conditions}) "
+            f"ORDER BY n.datetime DESC LIMIT ?", (since, *params, limit)).fetchall()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM news").fetchone()[0]
+
+    def import_legacy_files(self) -> int:
+        """导入旧版按日 JSON 文件，每个文件只导入一次"""
+        imported = 0
+        for filename in sorted(glob.glob(os.path.join(self.save_dir, 'news_*.json'))):
+            name = os.path.basename(filename)
+            with self._lock:
+                done = self._conn.execute("SELECT 1 FROM imported_files WHERE name = ?", (name,)).fetchone()
+            if done:
+                continue
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    items = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"旧版新闻文件 {filename} 无法读取，跳过: {e}")
+                continue
+            # 早期文件没有 hash 字段，按内容计算
+            count = self.append(
+                item if item.get('hash') else dict(item, hash=content_hash(item.get('content', '')))
+                for item in items if isinstance(item, dict))
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO imported_files (name, imported_at) VALUES (?, ?)",
+                                   (name, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            imported += count
+            logger.info(f"已导入旧版新闻文件 {name}: {count} 条")
+        return imported
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
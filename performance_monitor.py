@@ -8,45 +8,72 @@
 """
 
 import time
+import functools
 import threading
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from collections import defaultdict, deque
+from itertools import islice
 import json
 import os
 
+from metrics_core import MetricsRegistry, metrics_registry
+from service_registry import register_worker
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+METRIC_KEYS = (
+    'cache_hits',
+    'cache_misses',
+    'api_calls',
+    'db_queries',
+    'errors',
+    'total_requests',
+    'slow_queries',       # 慢查询计数
+    'timeout_errors',     # 超时错误计数
+    'analysis_count',     # 分析次数
+    'concurrent_requests' # 并发请求数
+)
+
+
 class PerformanceMonitor:
-    """性能监控器"""
+    """性能监控器
+
+    计数和延迟直方图写入 metrics_core 的线程分片指标，记录路径不加全局锁；
+    读取时合并，可给出按接口、缓存层级、分析阶段的 p50/p95/p99。
+    time_series 仅保留最近明细用于趋势和错误查询（deque.append 本身线程安全）。
+    """
     
-    def __init__(self, max_history_size: int = 1000):
+    def __init__(self, max_history_size: int = 1000, registry: MetricsRegistry = None):
         self.max_history_size = max_history_size
+        self.registry = registry or metrics_registry
         self.lock = threading.Lock()
-        
+
         # 性能指标
-        self.metrics = {
-            'cache_hits': 0,
-            'cache_misses': 0,
-            'api_calls': 0,
-            'db_queries': 0,
-            'errors': 0,
-            'total_requests': 0,
-            'slow_queries': 0,  # 慢查询计数
-            'timeout_errors': 0,  # 超时错误计数
-            'analysis_count': 0,  # 分析次数
-            'concurrent_requests': 0  # 并发请求数
-        }
+        self.events = self.registry.counter(
+            'stock_monitor_events_total', '性能监控事件计数', ('event',))
+        self._event_counters = {key: self.events.labels(key) for key in METRIC_KEYS}
+        self.api_latency = self.registry.histogram(
+            'stock_api_call_seconds', '外部API调用耗时（秒）', ('endpoint', 'status'))
+        self.db_latency = self.registry.histogram(
+            'stock_db_query_seconds', '数据库查询耗时（秒）', ('operation', 'status'))
+        self.cache_latency = self.registry.histogram(
+            'stock_cache_lookup_seconds', '缓存查询耗时（秒）', ('level', 'result'))
+        self.analysis_latency = self.registry.histogram(
+            'stock_analysis_stage_seconds', '分析阶段耗时（秒）', ('stage', 'status'))
+        self.request_latency = self.registry.histogram(
+            'stock_http_request_seconds', 'HTTP请求耗时（秒）', ('endpoint', 'method', 'status'))
         
         # 时间序列数据
         self.time_series = {
             'api_call_times': deque(maxlen=max_history_size),
             'db_query_times': deque(maxlen=max_history_size),
             'cache_query_times': deque(maxlen=max_history_size),
-            'error_times': deque(maxlen=max_history_size)
+            'error_times': deque(maxlen=max_history_size),
+            'analysis_times': deque(maxlen=max_history_size)
         }
         
         # 错误统计
@@ -62,6 +89,25 @@ class PerformanceMonitor:
         
         # 启动监控线程
         self._start_monitoring()
+
+    @property
+    def metrics(self) -> Dict[str, int]:
+        """合并后的计数器快照"""
+        return {key: int(counter.get()) for key, counter in self._event_counters.items()}
+
+    def _inc(self, key: str, amount: int = 1):
+        self._event_counters[key].inc(amount)
+
+    def _record_error(self, error_type: str, error: Optional[str]):
+        self._inc('errors')
+        self.time_series['error_times'].append({
+            'time': time.time(),
+            'type': error_type,
+            'error': error
+        })
+        if error:
+            with self.lock:
+                self.error_stats[error] += 1
     
     def _start_monitoring(self):
         """启动监控线程"""
@@ -73,98 +119,107 @@ class PerformanceMonitor:
                 except Exception as e:
                     logger.error(f"性能监控任务失败: {e}")
         
-        monitor_thread = threading.Thread(target=monitor_task, daemon=True)
-        monitor_thread.start()
+        # 由服务注册表在服务就绪后启动，避免导入阶段启动线程
+        register_worker('performance_monitor.alerts',
+                        lambda: threading.Thread(target=monitor_task, daemon=True).start())
     
-    def record_cache_hit(self, query_time: float = 0.0):
+    def record_cache_hit(self, query_time: float = 0.0, level: str = 'memory'):
         """记录缓存命中"""
-        with self.lock:
-            self.metrics['cache_hits'] += 1
-            self.metrics['total_requests'] += 1
-            if query_time > 0:
-                self.time_series['cache_query_times'].append({
-                    'time': time.time(),
-                    'duration': query_time
-                })
+        self._inc('cache_hits')
+        self._inc('total_requests')
+        if query_time > 0:
+            self.cache_latency.labels(level, 'hit').observe(query_time)
+            self.time_series['cache_query_times'].append({
+                'time': time.time(),
+                'duration': query_time
+            })
     
-    def record_cache_miss(self):
+    def record_cache_miss(self, query_time: float = 0.0, level: str = 'memory'):
         """记录缓存未命中"""
-        with self.lock:
-            self.metrics['cache_misses'] += 1
-            self.metrics['total_requests'] += 1
+        self._inc('cache_misses')
+        self._inc('total_requests')
+        if query_time > 0:
+            self.cache_latency.labels(level, 'miss').observe(query_time)
     
-    def record_api_call(self, duration: float, success: bool = True, error: str = None):
+    def record_api_call(self, duration: float, success: bool = True, error: str = None,
+                        endpoint: str = 'unknown'):
         """记录API调用"""
-        with self.lock:
-            self.metrics['api_calls'] += 1
-            self.time_series['api_call_times'].append({
-                'time': time.time(),
-                'duration': duration,
-                'success': success
-            })
-            
-            if not success:
-                self.metrics['errors'] += 1
-                self.time_series['error_times'].append({
-                    'time': time.time(),
-                    'type': 'api_call',
-                    'error': error
-                })
-                if error:
-                    self.error_stats[error] += 1
+        self._inc('api_calls')
+        self.api_latency.labels(endpoint, 'ok' if success else 'error').observe(duration)
+        self.time_series['api_call_times'].append({
+            'time': time.time(),
+            'duration': duration,
+            'success': success
+        })
+        if not success:
+            self._record_error('api_call', error)
     
-    def record_db_query(self, duration: float, success: bool = True, error: str = None):
+    def record_db_query(self, duration: float, success: bool = True, error: str = None,
+                        operation: str = 'query'):
         """记录数据库查询"""
-        with self.lock:
-            self.metrics['db_queries'] += 1
-            self.time_series['db_query_times'].append({
-                'time': time.time(),
-                'duration': duration,
-                'success': success
-            })
-            
-            if not success:
-                self.metrics['errors'] += 1
-                self.time_series['error_times'].append({
-                    'time': time.time(),
-                    'type': 'db_query',
-                    'error': error
-                })
-                if error:
-                    self.error_stats[error] += 1
+        self._inc('db_queries')
+        self.db_latency.labels(operation, 'ok' if success else 'error').observe(duration)
+        self.time_series['db_query_times'].append({
+            'time': time.time(),
+            'duration': duration,
+            'success': success
+        })
+        if not success:
+            self._record_error('db_query', error)
+
+    def record_request(self, endpoint: str, method: str, status_code: int, duration: float):
+        """记录HTTP请求耗时（按路由模板聚合，避免标签基数膨胀）"""
+        self.request_latency.labels(endpoint, method, status_code).observe(duration)
     
     def get_cache_hit_rate(self) -> float:
         """获取缓存命中率"""
-        total_cache_requests = self.metrics['cache_hits'] + self.metrics['cache_misses']
+        metrics = self.metrics
+        total_cache_requests = metrics['cache_hits'] + metrics['cache_misses']
         if total_cache_requests == 0:
             return 0.0
-        return self.metrics['cache_hits'] / total_cache_requests
+        return metrics['cache_hits'] / total_cache_requests
     
     def get_error_rate(self) -> float:
         """获取错误率"""
-        if self.metrics['total_requests'] == 0:
+        metrics = self.metrics
+        if metrics['total_requests'] == 0:
+            return 0.0
+        return metrics['errors'] / metrics['total_requests']
+
+    def _recent_avg(self, series: str, last_n: int) -> float:
+        recent = list(islice(reversed(self.time_series[series]), last_n))
+        if not recent:
             return 0.0
-        return self.metrics['errors'] / self.metrics['total_requests']
+        return sum(item['duration'] for item in recent) / len(recent)
     
     def get_avg_api_call_time(self, last_n: int = 100) -> float:
         """获取平均API调用时间"""
-        recent_calls = list(self.time_series['api_call_times'])[-last_n:]
-        if not recent_calls:
-            return 0.0
-        return sum(call['duration'] for call in recent_calls) / len(recent_calls)
+        return self._recent_avg('api_call_times', last_n)
     
     def get_avg_db_query_time(self, last_n: int = 100) -> float:
         """获取平均数据库查询时间"""
-        recent_queries = list(self.time_series['db_query_times'])[-last_n:]
-        if not recent_queries:
-            return 0.0
-        return sum(query['duration'] for query in recent_queries) / len(recent_queries)
+        return self._recent_avg('db_query_times', last_n)
+
+    def get_latency_percentiles(self) -> Dict[str, List[Dict]]:
+        """按标签汇总各类延迟的 p50/p95/p99（秒）"""
+        result = {}
+        for name, family in (('api_call', self.api_latency), ('db_query', self.db_latency),
+                             ('cache', self.cache_latency), ('analysis', self.analysis_latency),
+                             ('http_request', self.request_latency)):
+            result[name] = [
+                {'labels': labels, **series.summary()}
+                for labels, series in family.children()
+            ]
+        return result
     
     def get_performance_summary(self) -> Dict:
         """获取性能摘要"""
+        with self.lock:
+            top_errors = dict(sorted(self.error_stats.items(),
+                                     key=lambda x: x[1], reverse=True)[:5])
         return {
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'metrics': self.metrics.copy(),
+            'metrics': self.metrics,
             'rates': {
                 'cache_hit_rate': self.get_cache_hit_rate(),
                 'error_rate': self.get_error_rate()
@@ -173,8 +228,8 @@ class PerformanceMonitor:
                 'api_call_time': self.get_avg_api_call_time(),
                 'db_query_time': self.get_avg_db_query_time()
             },
-            'top_errors': dict(sorted(self.error_stats.items(), 
-                                    key=lambda x: x[1], reverse=True)[:5])
+            'latency': self.get_latency_percentiles(),
+            'top_errors': top_errors
         }
     
     def _check_performance_alerts(self):
@@ -220,7 +275,8 @@ class PerformanceMonitor:
                 'api_call_times': list(self.time_series['api_call_times']),
                 'db_query_times': list(self.time_series['db_query_times']),
                 'cache_query_times': list(self.time_series['cache_query_times']),
-                'error_times': list(self.time_series['error_times'])
+                'error_times': list(self.time_series['error_times']),
+                'analysis_times': list(self.time_series['analysis_times'])
             },
             'error_stats': dict(self.error_stats)
         }
@@ -236,54 +292,44 @@ class PerformanceMonitor:
     
     def record_analysis(self, stock_code: str, analysis_type: str, duration: float, success: bool = True):
         """记录分析性能"""
-        with self.lock:
-            self.metrics['analysis_count'] += 1
-            if not success:
-                self.metrics['errors'] += 1
+        self._inc('analysis_count')
+        self.analysis_latency.labels(analysis_type, 'ok' if success else 'error').observe(duration)
+        if not success:
+            self._inc('errors')
+            with self.lock:
                 self.error_stats[f"analysis_{analysis_type}"] += 1
 
-            # 记录分析时间
-            self.time_series['analysis_times'] = getattr(self.time_series, 'analysis_times', deque(maxlen=self.max_history_size))
-            self.time_series['analysis_times'].append({
-                'timestamp': time.time(),
-                'stock_code': stock_code,
-                'analysis_type': analysis_type,
-                'duration': duration,
-                'success': success
-            })
+        # 记录分析时间
+        self.time_series['analysis_times'].append({
+            'time': time.time(),
+            'stock_code': stock_code,
+            'analysis_type': analysis_type,
+            'duration': duration,
+            'success': success
+        })
 
     def record_slow_query(self, query_type: str, duration: float):
         """记录慢查询"""
-        with self.lock:
-            self.metrics['slow_queries'] += 1
-            logger.warning(f"慢查询检测: {query_type} 耗时 {duration:.2f}秒")
+        self._inc('slow_queries')
+        logger.warning(f"慢查询检测: {query_type} 耗时 {duration:.2f}秒")
 
     def record_timeout_error(self, operation: str, timeout_duration: float):
         """记录超时错误"""
+        self._inc('timeout_errors')
         with self.lock:
-            self.metrics['timeout_errors'] += 1
             self.error_stats[f"timeout_{operation}"] += 1
-            logger.error(f"超时错误: {operation} 超时 {timeout_duration:.2f}秒")
+        logger.error(f"超时错误: {operation} 超时 {timeout_duration:.2f}秒")
 
     def reset_metrics(self):
         """重置性能指标"""
+        for family in (self.events, self.api_latency, self.db_latency, self.cache_latency,
+                       self.analysis_latency, self.request_latency):
+            family.reset()
+
+        for key in self.time_series:
+            self.time_series[key].clear()
+
         with self.lock:
-            self.metrics = {
-                'cache_hits': 0,
-                'cache_misses': 0,
-                'api_calls': 0,
-                'db_queries': 0,
-                'errors': 0,
-                'total_requests': 0,
-                'slow_queries': 0,
-                'timeout_errors': 0,
-                'analysis_count': 0,
-                'concurrent_requests': 0
-            }
-
-            for key in self.time_series:
-                self.time_series[key].clear()
-            
             self.error_stats.clear()
         
         logger.info("性能指标已重置")
@@ -319,32 +365,38 @@ performance_monitor = PerformanceMonitor()
 
 def monitor_api_call(func):
     """API调用监控装饰器"""
+    endpoint = func.__name__
+
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         try:
             result = func(*args, **kwargs)
-            duration = time.time() - start_time
-            performance_monitor.record_api_call(duration, success=True)
+            duration = time.perf_counter() - start_time
+            performance_monitor.record_api_call(duration, success=True, endpoint=endpoint)
             return result
         except Exception as e:
-            duration = time.time() - start_time
-            performance_monitor.record_api_call(duration, success=False, error=str(e))
+            duration = time.perf_counter() - start_time
+            performance_monitor.record_api_call(duration, success=False, error=str(e), endpoint=endpoint)
             raise
     return wrapper
 
 
 def monitor_db_query(func):
     """数据库查询监控装饰器"""
+    operation = func.__name__
+
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         try:
             result = func(*args, **kwargs)
-            duration = time.time() - start_time
-            performance_monitor.record_db_query(duration, success=True)
+            duration = time.perf_counter() - start_time
+            performance_monitor.record_db_query(duration, success=True, operation=operation)
             return result
         except Exception as e:
-            duration = time.time() - start_time
-            performance_monitor.record_db_query(duration, success=False, error=str(e))
+            duration = time.perf_counter() - start_time
+            performance_monitor.record_db_query(duration, success=False, error=str(e), operation=operation)
             raise
     return wrapper
 
@@ -367,30 +419,31 @@ def record_timeout_error(operation: str, timeout_duration: float):
 def get_hf_spaces_performance_report():
     """获取HF Spaces环境的性能报告"""
     summary = performance_monitor.get_performance_summary()
+    metrics = summary['metrics']
 
     # 添加HF Spaces特定的性能指标
     hf_report = {
         **summary,
         'hf_spaces_optimizations': {
-            'timeout_errors': performance_monitor.metrics['timeout_errors'],
-            'slow_queries': performance_monitor.metrics['slow_queries'],
-            'analysis_count': performance_monitor.metrics['analysis_count'],
-            'concurrent_requests': performance_monitor.metrics['concurrent_requests'],
+            'timeout_errors': metrics['timeout_errors'],
+            'slow_queries': metrics['slow_queries'],
+            'analysis_count': metrics['analysis_count'],
+            'concurrent_requests': metrics['concurrent_requests'],
         },
         'recommendations': []
     }
 
     # 生成优化建议
-    if summary['cache_hit_rate'] < 70:
+    if summary['rates']['cache_hit_rate'] < 0.7:
         hf_report['recommendations'].append("建议增加缓存大小或延长缓存TTL")
 
-    if summary['avg_api_time'] > 30:
+    if summary['avg_times']['api_call_time'] > 30:
         hf_report['recommendations'].append("API调用时间过长，建议优化网络配置或增加重试机制")
 
-    if performance_monitor.metrics['timeout_errors'] > 0:
+    if metrics['timeout_errors'] > 0:
         hf_report['recommendations'].append("检测到超时错误，建议延长超时时间配置")
 
-    if performance_monitor.metrics['slow_queries'] > 0:
+    if metrics['slow_queries'] > 0:
         hf_report['recommendations'].append("检测到慢查询，建议优化数据库索引或查询语句")
 
     return hf_report
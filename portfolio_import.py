@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 投资组合CSV导入
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- 流式读取持仓CSV：只用文件开头的样本判断编码，之后按块读取代码列，不整体解码、不反复物化文件内容；
+  开头是纯ASCII、后面才出现GBK中文时，读到解码错误后按GBK从头重读
+- 代码列整列正则提取6位股票代码（603316.XSHG、SZ000001、000001 等），无法识别的单独列出
+- 按转换后的代码去重，保留首次出现的原始代码
+- 导入的股票作为一个作业提交到共享分析线程池（analysis_executor），并发有上限、可查询进度和结果
+
+环境变量：
+- PORTFOLIO_IMPORT_CHUNK_ROWS: 每次读取的CSV行数（默认5000）
+"""
+
+import codecs
+import io
+import logging
+import os
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from analysis_executor import AnalysisJob, analysis_executor
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_IMPORT_CHUNK_ROWS = int(os.getenv('PORTFOLIO_IMPORT_CHUNK_ROWS', '5000'))
+
+# 依次尝试的编码：utf-8-sig 兼容带BOM和不带BOM的UTF-8，gbk 兼容 gb2312
+CSV_ENCODINGS = ('utf-8-sig', 'gbk')
+# 按样本判断的编码在后文解码失败时改用的编码
+FALLBACK_ENCODING = 'gbk'
+# 判断编码时读取的字节数
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+STOCK_CODE_PATTERN = r'(\d{6})'
+
+
+def detect_encoding(stream: BinaryIO, sample_bytes: int = ENCODING_SAMPLE_BYTES) -> str:
+    """用文件开头的样本判断编码，读取后回到文件开头"""
+    sample = stream.read(sample_bytes)
+    stream.seek(0)
+    if not sample:
+        raise ValueError('CSV文件为空')
+    for encoding in CSV_ENCODINGS:
+        try:
+            # 增量解码，样本末尾被截断的多字节字符不算解码失败
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError('CSV文件编码不支持，请使用UTF-8或GBK编码')
+
+
+def iter_code_chunks(stream: BinaryIO, column: str = 'secID',
+                     chunk_rows: int = PORTFOLIO_IMPORT_CHUNK_ROWS,
+                     encoding: Optional[str] = None) -> Iterator[pd.Series]:
+    """按块读取CSV中的代码列（字符串），只解析这一列；未指定编码时按文件开头判断，后文解码失败抛出 UnicodeDecodeError"""
+    encoding = encoding or detect_encoding(stream)
+    text = io.TextIOWrapper(stream, encoding=encoding, newline='')
+    try:
+        try:
+            # 不把 N/A、NULL 等当作缺失值，只跳过空单元格，其余无法识别的代码如实列出
+            reader = pd.read_csv(text, usecols=[column], dtype=str, keep_default_na=False,
+                                 chunksize=chunk_rows)
+        except pd.errors.EmptyDataError:
+            raise ValueError('CSV文件为空')
+        except UnicodeDecodeError:
+            # UnicodeDecodeError 是 ValueError 的子类，交给调用方按备用编码重读
+            raise
+        except ValueError:
+            # usecols 中的列不存在
+            raise ValueError(f'CSV文件必须包含{column}列')
+        for chunk in reader:
+            yield chunk[column]
+    finally:
+        # 不随包装器关闭上传文件
+        text.detach()
+
+
+def normalize_stock_codes(codes: pd.Series) -> pd.Series:
+    """整列提取6位股票代码，无法识别的为 NaN"""
+    return codes.astype(str).str.strip().str.upper().str.extract(STOCK_CODE_PATTERN, expand=False)
+
+
+def import_portfolio_csv(stream: BinaryIO, column: str = 'secID',
+                         chunk_rows: int = PORTFOLIO_IMPORT_CHUNK_ROWS) -> Dict:
+    """
+    解析持仓CSV，返回转换后的股票代码（已去重）和无法识别的代码
+
+    参数:
+        stream: 二进制文件流（需支持 seek）
+        column: 股票代码所在列
+        chunk_rows: 每块行数
+    """
+    encoding = detect_encoding(stream)
+    try:
+        return _collect_codes(iter_code_chunks(stream, column, chunk_rows, encoding))
+    except UnicodeDecodeError:
+        if encoding == FALLBACK_ENCODING:
+            raise ValueError('CSV文件编码不支持，请使用UTF-8或GBK编码')
+    # 开头样本按UTF-8可解码（如纯ASCII），中文名称出现在后面且为GBK编码
+    logger.info(f"CSV按 {encoding} 解码失败，改用 {FALLBACK_ENCODING} 重新读取")
+    stream.seek(0)
+    try:
+        return _collect_codes(iter_code_chunks(stream, column, chunk_rows, FALLBACK_ENCODING))
+    except UnicodeDecodeError:
+        raise ValueError('CSV文件编码不支持，请使用UTF-8或GBK编码')
+
+
+def _collect_codes(chunks: Iterator[pd.Series]) -> Dict:
+    """逐块转换代码并去重，汇总导入结果"""
+    total = 0
+    duplicates = 0
+    seen = set()
+    converted: List[Dict] = []
+    failed: List[Dict] = []
+
+    for chunk in chunks:
+        original = chunk[chunk.notna()].str.strip()
+        original = original[original != '']
+        total += len(original)
+
+        normalized = normalize_stock_codes(original)
+        unknown = normalized.isna()
+        failed.extend({'code': code, 'reason': '代码格式无法识别'} for code in original[unknown])
+
+        recognized = pd.DataFrame({'original_code': original[~unknown], 'converted_code': normalized[~unknown]})
+        unique = recognized.drop_duplicates('converted_code')
+        unique = unique[~unique['converted_code'].isin(seen)]
+        duplicates += len(recognized) - len(unique)
+        seen.update(unique['converted_code'])
+        converted.extend(unique.to_dict('records'))
+
+    logger.info(f"CSV导入: {total} 行，转换 {len(converted)} 只，重复 {duplicates}，无法识别 {len(failed)}")
+    return {
+        'total_count': total,
+        'converted_count': len(converted),
+        'duplicate_count': duplicates,
+        'failed_count': len(failed),
+        'converted_stocks': converted,
+        'failed_stocks': failed
+    }
+
+
+def submit_portfolio_analysis(stock_codes: List[str], score_func: Callable,
+                              market_type: str = 'A') -> AnalysisJob:
+    """把导入的股票作为一个作业提交到共享分析线程池，立即返回作业（进度见 /api/analysis_jobs/<job_id>）"""
+    return analysis_executor.submit('portfolio_import', score_func,
+                                    [(code, market_type) for code in stock_codes])
@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 """
-API限流器 - 防止API滥用，支持多种限流策略
+API限流器 - 防止API滥用，基于GCRA算法，支持进程内和Redis存储
 """
 
+import math
 import time
 import threading
-from collections import defaultdict, deque
 from functools import wraps
 from flask import request, jsonify, g
 import hashlib
@@ -15,13 +15,143 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# 锁分段数量：按客户端哈希分散到不同分段，避免所有请求争用同一把锁
+RATE_LIMIT_STRIPES = int(os.getenv('RATE_LIMIT_STRIPES', '64'))
+
+# GCRA 原子检查脚本：KEYS[1]=限流键，ARGV=[发射间隔, 窗口, 当前时间(可选)]
+GCRA_LUA_SCRIPT = """
+local key = KEYS[1]
+local interval = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+if not now then
+    local t = redis.call('TIME')
+    now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+end
+local tat = tonumber(redis.call('GET', key))
+if not tat or tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - window
+if now < allow_at then
+    return {0, tostring(tat), tostring(now)}
+end
+redis.call('SET', key, tostring(new_tat), 'PX', math.ceil(window * 1000))
+return {1, tostring(new_tat), tostring(now)}
+"""
+
+
+class MemoryGCRABackend:
+    """进程内 GCRA 存储：每个 (客户端, 端点) 只保存一个理论到达时间，按客户端哈希分段加锁"""
+
+    def __init__(self, stripes=RATE_LIMIT_STRIPES):
+        self.stripes = max(1, stripes)
+        self._tats = [dict() for _ in range(self.stripes)]
+        self._locks = [threading.Lock() for _ in range(self.stripes)]
+
+    def _stripe(self, key):
+        return hash(key[0]) % self.stripes
+
+    def acquire(self, key, interval, window, now):
+        """执行一次 GCRA 检查，允许时记录本次请求
+
+        Returns:
+            (是否允许, 理论到达时间)
+        """
+        index = self._stripe(key)
+        tats = self._tats[index]
+        with self._locks[index]:
+            tat = tats.get(key, now)
+            if tat < now:
+                tat = now
+            new_tat = tat + interval
+            if now < new_tat - window:
+                return False, tat
+            tats[key] = new_tat
+            return True, new_tat
+
+    def peek(self, key, now):
+        """读取理论到达时间，不消耗配额"""
+        index = self._stripe(key)
+        with self._locks[index]:
+            return max(self._tats[index].get(key, now), now)
+
+    def cleanup(self, now):
+        """删除已完全恢复的记录（理论到达时间早于当前时间）"""
+        removed = 0
+        for tats, lock in zip(self._tats, self._locks):
+            with lock:
+                expired = [key for key, tat in tats.items() if tat <= now]
+                for key in expired:
+                    del tats[key]
+                removed += len(expired)
+        return removed
+
+    def size(self):
+        return sum(len(tats) for tats in self._tats)
+
+
+class RedisGCRABackend:
+    """Redis GCRA 存储：单个 Lua 脚本完成读取-判断-写入，多 worker 共享同一限流状态"""
+
+    def __init__(self, client, prefix='ratelimit:', use_server_time=True):
+        self.client = client
+        self.prefix = prefix
+        self.use_server_time = use_server_time
+        self._script = client.register_script(GCRA_LUA_SCRIPT)
+
+    def _redis_key(self, key):
+        return f"{self.prefix}{key[0]}|{key[1] or '*'}"
+
+    def acquire(self, key, interval, window, now):
+        args = [repr(interval), repr(window)]
+        if not self.use_server_time:
+            args.append(repr(now))
+        allowed, tat, _ = self._script(keys=[self._redis_key(key)], args=args)
+        return bool(int(allowed)), float(tat)
+
+    def peek(self, key, now):
+        tat = self.client.get(self._redis_key(key))
+        return max(float(tat), now) if tat is not None else now
+
+    def cleanup(self, now):
+        # Redis 键自带过期时间，无需清理
+        return 0
+
+    def size(self):
+        return None
+
+
+def create_rate_limit_backend():
+    """根据环境变量创建限流存储，Redis 不可用时降级为进程内存储"""
+    backend = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+    redis_url = os.getenv('RATE_LIMIT_REDIS_URL') or os.getenv('REDIS_URL')
+
+    if backend == 'redis' and redis_url:
+        try:
+            import redis
+            client = redis.Redis.from_url(redis_url)
+            client.ping()
+            logger.info("限流器使用Redis存储")
+            return RedisGCRABackend(client)
+        except Exception as e:
+            logger.warning(f"Redis限流存储不可用，使用进程内存储: {e}")
+
+    return MemoryGCRABackend()
+
+
 class RateLimiter:
-    """API限流器 - 支持滑动窗口和令牌桶算法"""
+    """API限流器 - 基于 GCRA（通用信元速率算法）
+
+    每个 (客户端, 端点) 只保存一个理论到达时间（TAT），检查是 O(1) 时间和内存；
+    允许在窗口内突发 requests 次，之后按 window/requests 的间隔匀速放行，
+    与原令牌桶容量一致。
+    """
     
-    def __init__(self):
-        self.requests = defaultdict(deque)  # 存储请求时间戳
-        self.tokens = defaultdict(dict)     # 令牌桶存储
-        self.lock = threading.RLock()
+    def __init__(self, backend=None):
+        self.backend = backend or create_rate_limit_backend()
+        self.lock = threading.RLock()  # 仅保护配置修改
         
         # 默认限流配置
         self.default_limits = {
@@ -63,111 +193,60 @@ class RateLimiter:
             # 使用IP地址作为标识符
             return f"ip:{request.remote_addr}"
     
-    def sliding_window_check(self, client_id, limit_config):
-        """滑动窗口限流检查"""
-        current_time = time.time()
-        window_start = current_time - limit_config['window']
-        
-        with self.lock:
-            # 清理过期的请求记录
-            while (self.requests[client_id] and 
-                   self.requests[client_id][0] < window_start):
-                self.requests[client_id].popleft()
-            
-            # 检查是否超过限制
-            if len(self.requests[client_id]) >= limit_config['requests']:
-                return False, len(self.requests[client_id])
-            
-            # 记录当前请求
-            self.requests[client_id].append(current_time)
-            return True, len(self.requests[client_id])
-    
-    def token_bucket_check(self, client_id, limit_config):
-        """令牌桶限流检查"""
-        current_time = time.time()
-        bucket_key = f"{client_id}:bucket"
-        
-        with self.lock:
-            if bucket_key not in self.tokens:
-                # 初始化令牌桶
-                self.tokens[bucket_key] = {
-                    'tokens': limit_config['requests'],
-                    'last_refill': current_time,
-                    'capacity': limit_config['requests'],
-                    'refill_rate': limit_config['requests'] / limit_config['window']
-                }
-            
-            bucket = self.tokens[bucket_key]
-            
-            # 计算需要添加的令牌数
-            time_passed = current_time - bucket['last_refill']
-            tokens_to_add = time_passed * bucket['refill_rate']
-            
-            # 更新令牌数量
-            bucket['tokens'] = min(bucket['capacity'], 
-                                 bucket['tokens'] + tokens_to_add)
-            bucket['last_refill'] = current_time
-            
-            # 检查是否有足够的令牌
-            if bucket['tokens'] >= 1:
-                bucket['tokens'] -= 1
-                return True, bucket['tokens']
-            else:
-                return False, bucket['tokens']
-    
-    def check_rate_limit(self, endpoint=None):
-        """检查是否超过限流"""
-        client_id = self.get_client_id()
-        api_key = request.headers.get('X-API-Key')
-        
-        # 确定限流配置
+    def get_limit_config(self, api_key=None, endpoint=None):
+        """确定限流配置，返回 (配置, 限流键中的端点部分)"""
         if api_key:
             user_tier = self.get_user_tier(api_key)
-            limit_config = self.default_limits[user_tier].copy()
+            limit_config = self.default_limits[user_tier]
         else:
-            limit_config = self.default_limits['ip'].copy()
+            limit_config = self.default_limits['ip']
         
-        # 检查端点特定限制
+        # 端点更严格时使用端点限制，并按端点单独计数
         if endpoint and endpoint in self.endpoint_limits:
             endpoint_config = self.endpoint_limits[endpoint]
-            # 使用更严格的限制
             if endpoint_config['requests'] < limit_config['requests']:
-                limit_config = endpoint_config
+                return endpoint_config, endpoint
+        
+        return limit_config, None
+    
+    def gcra_check(self, client_id, limit_config, endpoint=None, now=None):
+        """GCRA 限流检查
+
+        Returns:
+            Dict: allowed / limit / remaining / reset_time / retry_after
+        """
+        now = time.time() if now is None else now
+        limit = limit_config['requests']
+        window = float(limit_config['window'])
+        interval = window / limit
         
-        # 执行限流检查（使用滑动窗口算法）
-        allowed, current_count = self.sliding_window_check(client_id, limit_config)
+        allowed, tat = self.backend.acquire((client_id, endpoint), interval, window, now)
         
-        # 计算重置时间
-        reset_time = int(time.time()) + limit_config['window']
-        remaining = max(0, limit_config['requests'] - current_count)
+        # 剩余配额 = 当前还能突发的请求数
+        remaining = max(0, int((window - (tat - now)) / interval + 1e-9))
+        if not allowed:
+            remaining = 0
+        retry_after = 0.0 if allowed else max(0.0, tat + interval - window - now)
         
         return {
             'allowed': allowed,
-            'limit': limit_config['requests'],
+            'limit': limit,
             'remaining': remaining,
-            'reset_time': reset_time,
-            'current_count': current_count
+            'reset_time': int(math.ceil(tat)),
+            'retry_after': round(retry_after, 3),
+            'current_count': limit - remaining
         }
     
+    def check_rate_limit(self, endpoint=None):
+        """检查是否超过限流"""
+        client_id = self.get_client_id()
+        api_key = request.headers.get('X-API-Key')
+        limit_config, limit_endpoint = self.get_limit_config(api_key, endpoint)
+        return self.gcra_check(client_id, limit_config, limit_endpoint)
+    
     def cleanup_expired_records(self):
-        """清理过期的限流记录"""
-        current_time = time.time()
-        
-        with self.lock:
-            # 清理请求记录
-            for client_id in list(self.requests.keys()):
-                while (self.requests[client_id] and 
-                       self.requests[client_id][0] < current_time - 3600):
-                    self.requests[client_id].popleft()
-                
-                # 删除空的记录
-                if not self.requests[client_id]:
-                    del self.requests[client_id]
-            
-            # 清理令牌桶记录
-            for bucket_key in list(self.tokens.keys()):
-                if self.tokens[bucket_key]['last_refill'] < current_time - 7200:
-                    del self.tokens[bucket_key]
+        """清理已完全恢复配额的限流记录"""
+        return self.backend.cleanup(time.time())
 
 
 # 全局限流器实例
@@ -190,7 +269,8 @@ def require_rate_limit(endpoint=None):
                         'message': '请求频率超过限制',
                         'details': {
                             'limit': result['limit'],
-                            'reset_time': result['reset_time']
+                            'reset_time': result['reset_time'],
+                            'retry_after': result.get('retry_after', 0)
                         }
                     }
                 })
@@ -200,6 +280,7 @@ def require_rate_limit(endpoint=None):
                 response.headers['X-RateLimit-Limit'] = str(result['limit'])
                 response.headers['X-RateLimit-Remaining'] = str(result['remaining'])
                 response.headers['X-RateLimit-Reset'] = str(result['reset_time'])
+                response.headers['Retry-After'] = str(int(math.ceil(result.get('retry_after', 0))))
                 
                 return response
             
@@ -256,41 +337,31 @@ def adaptive_rate_limit(base_limit=None):
 
 
 def get_rate_limit_status():
-    """获取当前限流状态"""
+    """获取当前限流状态（不消耗配额）"""
     client_id = rate_limiter.get_client_id()
     api_key = request.headers.get('X-API-Key')
-    
-    if api_key:
-        user_tier = rate_limiter.get_user_tier(api_key)
-        limit_config = rate_limiter.default_limits[user_tier]
-    else:
-        limit_config = rate_limiter.default_limits['ip']
+    limit_config, limit_endpoint = rate_limiter.get_limit_config(api_key)
     
     current_time = time.time()
-    window_start = current_time - limit_config['window']
+    limit = limit_config['requests']
+    window = limit_config['window']
+    interval = window / limit
     
-    with rate_limiter.lock:
-        # 清理过期记录
-        while (rate_limiter.requests[client_id] and 
-               rate_limiter.requests[client_id][0] < window_start):
-            rate_limiter.requests[client_id].popleft()
-        
-        current_count = len(rate_limiter.requests[client_id])
-        remaining = max(0, limit_config['requests'] - current_count)
-        reset_time = int(current_time) + limit_config['window']
-        
-        return {
-            'limit': limit_config['requests'],
-            'remaining': remaining,
-            'reset_time': reset_time,
-            'current_count': current_count,
-            'window_seconds': limit_config['window']
-        }
+    tat = rate_limiter.backend.peek((client_id, limit_endpoint), current_time)
+    remaining = max(0, min(limit, int((window - (tat - current_time)) / interval + 1e-9)))
+    
+    return {
+        'limit': limit,
+        'remaining': remaining,
+        'reset_time': int(math.ceil(tat)),
+        'current_count': limit - remaining,
+        'window_seconds': window
+    }
 
 
 # 定期清理过期记录的后台任务
-def start_cleanup_scheduler():
-    """启动清理调度器"""
+def _start_cleanup_thread():
+    """启动清理线程"""
     def cleanup_worker():
         while True:
             try:
@@ -306,6 +377,12 @@ def start_cleanup_scheduler():
     logger.info("限流记录清理调度器已启动")
 
 
-# 启动清理调度器
+def start_cleanup_scheduler():
+    """登记清理调度器，由服务注册表在服务就绪后启动，重复调用只启动一次"""
+    from service_registry import register_worker
+    register_worker('rate_limiter.cleanup', _start_cleanup_thread)
+
+
+# 登记清理调度器
 if __name__ != '__main__':
     start_cleanup_scheduler()
@@ -6,23 +6,41 @@
 许可证：MIT License
 """
 # risk_monitor.py
+import os
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from statistics import NormalDist
+
+from tracing import span, wrap_context
+from data_provider import get_data_provider
+
+# 组合风险并发获取行情的线程数
+RISK_FETCH_WORKERS = int(os.getenv('RISK_FETCH_WORKERS', '16'))
+# 组合风险使用的收益率窗口（交易日）
+RISK_LOOKBACK_DAYS = int(os.getenv('RISK_LOOKBACK_DAYS', '250'))
+TRADING_DAYS_PER_YEAR = 252
+
 
 class RiskMonitor:
     def __init__(self, analyzer):
         self.analyzer = analyzer
 
-    def analyze_stock_risk(self, stock_code, market_type='A'):
-        """分析单只股票的风险"""
+    def analyze_stock_risk(self, stock_code, market_type='A', df=None, stock_name=None, industry=None):
+        """分析单只股票的风险
+
+        组合分析时由调用方传入已获取并计算过指标的 df 和基本信息，避免重复获取。
+        """
         try:
             # 获取股票数据和技术指标
-            df = self.analyzer.get_stock_data(stock_code, market_type)
-            df = self.analyzer.calculate_indicators(df)
+            if df is None:
+                df = self.analyzer.get_stock_data(stock_code, market_type)
+                df = self.analyzer.calculate_indicators(df)
 
             # 获取股票基本信息
-            stock_name, industry = self._get_stock_basic_info(stock_code, market_type)
+            if stock_name is None or industry is None:
+                stock_name, industry = self._get_stock_basic_info(stock_code, market_type)
 
             # 计算各类风险指标
             volatility_risk = self._analyze_volatility_risk(df)
@@ -265,32 +283,53 @@ class RiskMonitor:
             "risk_level": "高" if score >= 60 else "中" if score >= 30 else "低"
         }
 
-    def analyze_portfolio_risk(self, portfolio):
-        """分析投资组合整体风险"""
+    def analyze_portfolio_risk(self, portfolio, confidence=0.95):
+        """分析投资组合整体风险
+
+        所有持仓并发获取一次行情和基本信息，单股风险与组合层面的协方差、VaR/CVaR、
+        风险贡献共用同一份数据。总耗时约等于最慢的一次获取。
+        """
         try:
             if not portfolio or len(portfolio) == 0:
                 return {"error": "投资组合为空"}
 
-            # 分析每只股票的风险
-            stock_risks = {}
-            total_weight = 0
-            weighted_risk_score = 0
-
+            # 合并重复持仓，保留首次出现的顺序
+            holdings = {}
             for stock in portfolio:
                 stock_code = stock.get('stock_code')
-                weight = stock.get('weight', 1)
-                market_type = stock.get('market_type', 'A')
-
                 if not stock_code:
                     continue
+                if stock_code in holdings:
+                    holdings[stock_code]['weight'] += stock.get('weight', 1)
+                else:
+                    holdings[stock_code] = {
+                        'weight': stock.get('weight', 1),
+                        'market_type': stock.get('market_type', 'A')
+                    }
+
+            if not holdings:
+                return {"error": "投资组合为空"}
+
+            # 并发获取行情、指标和基本信息
+            fetched = self._fetch_holdings(holdings)
+
+            # 分析每只股票的风险
+            stock_risks = {}
+            total_weight = 0
+            weighted_risk_score = 0
 
-                # 分析股票风险
-                risk = self.analyze_stock_risk(stock_code, market_type)
+            for stock_code, holding in holdings.items():
+                item = fetched[stock_code]
+                if 'error' in item:
+                    risk = {"error": f"分析风险时出错: {item['error']}"}
+                else:
+                    risk = self.analyze_stock_risk(stock_code, holding['market_type'], df=item['df'],
+                                                   stock_name=item['stock_name'], industry=item['industry'])
                 stock_risks[stock_code] = risk
 
                 # 计算加权风险分数
-                total_weight += weight
-                weighted_risk_score += risk.get('total_risk_score', 50) * weight
+                total_weight += holding['weight']
+                weighted_risk_score += risk.get('total_risk_score', 50) * holding['weight']
 
             # 计算组合总风险分数
             if total_weight > 0:
@@ -331,7 +370,11 @@ class RiskMonitor:
                     })
 
             # 分析风险集中度
-            risk_concentration = self._analyze_risk_concentration(portfolio, stock_risks)
+            risk_concentration = self._analyze_risk_concentration(holdings, stock_risks, fetched)
+
+            # 组合层面的协方差风险
+            with span('risk.portfolio_metrics', holdings=len(holdings)):
+                portfolio_metrics = self._calculate_portfolio_metrics(holdings, fetched, confidence)
 
             return {
                 "portfolio_risk_score": portfolio_risk_score,
@@ -339,6 +382,7 @@ class RiskMonitor:
                 "high_risk_stocks": high_risk_stocks,
                 "alerts": all_alerts,
                 "risk_concentration": risk_concentration,
+                "portfolio_metrics": portfolio_metrics,
                 "stock_risks": stock_risks
             }
 
@@ -348,15 +392,190 @@ class RiskMonitor:
                 "error": f"分析投资组合风险时出错: {str(e)}"
             }
 
-    def _analyze_risk_concentration(self, portfolio, stock_risks):
-        """分析风险集中度"""
+    def _fetch_holding(self, stock_code, market_type):
+        """获取单只持仓的行情、指标和基本信息"""
+        try:
+            df = self.analyzer.get_stock_data(stock_code, market_type)
+            df = self.analyzer.calculate_indicators(df)
+            stock_name, industry = self._get_stock_basic_info(stock_code, market_type)
+            return {'df': df, 'stock_name': stock_name, 'industry': industry}
+        except Exception as e:
+            print(f"获取持仓 {stock_code} 数据出错: {str(e)}")
+            return {'error': str(e)}
+
+    def _fetch_holdings(self, holdings):
+        """并发获取所有持仓数据"""
+        with span('risk.fetch_holdings', holdings=len(holdings)):
+            workers = max(1, min(RISK_FETCH_WORKERS, len(holdings)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    code: executor.submit(wrap_context(self._fetch_holding), code, holding['market_type'])
+                    for code, holding in holdings.items()
+                }
+                return {code: future.result() for code, future in futures.items()}
+
+    @staticmethod
+    def build_returns_matrix(price_frames, lookback=RISK_LOOKBACK_DAYS):
+        """把各持仓收盘价按日期对齐为日收益率矩阵（只保留所有持仓都有数据的日期）"""
+        closes = []
+        for stock_code, df in price_frames.items():
+            if df is None or 'close' not in df.columns or len(df) < 2:
+                continue
+            index = pd.to_datetime(df['date']) if 'date' in df.columns else df.index
+            closes.append(pd.Series(df['close'].to_numpy(dtype=float), index=index, name=stock_code))
+
+        if not closes:
+            return pd.DataFrame()
+
+        prices = pd.concat(closes, axis=1, join='inner').sort_index()
+        prices = prices[~prices.index.duplicated(keep='last')]
+        returns = prices.pct_change().iloc[1:]
+        returns = returns.replace([np.inf, -np.inf], np.nan).dropna(how='any')
+        return returns.iloc[-lookback:]
+
+    @staticmethod
+    def compute_risk_metrics(returns, weights, confidence=0.95):
+        """基于收益率矩阵和权重向量计算组合风险指标
+
+        Args:
+            returns: T x N 日收益率矩阵
+            weights: 长度 N 的权重（内部归一化）
+            confidence: VaR/CVaR 置信水平
+
+        Returns:
+            dict，日频指标以小数表示，年化波动率按 252 个交易日换算
+        """
+        returns = np.asarray(returns, dtype=float)
+        weights = np.asarray(weights, dtype=float)
+        weights = weights / weights.sum()
+
+        mean = returns.mean(axis=0)
+        cov = np.atleast_2d(np.cov(returns, rowvar=False, ddof=1))
+        asset_vol = np.sqrt(np.diag(cov))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(asset_vol, asset_vol)
+        corr = np.nan_to_num(corr)
+        np.fill_diagonal(corr, 1.0)
+
+        portfolio_var = float(weights @ cov @ weights)
+        portfolio_vol = float(np.sqrt(max(portfolio_var, 0.0)))
+        portfolio_returns = returns @ weights
+
+        # 历史模拟 VaR/CVaR（损失记为正数）
+        tail_cutoff = np.quantile(portfolio_returns, 1 - confidence)
+        historical_var = float(-tail_cutoff)
+        tail = portfolio_returns[portfolio_returns <= tail_cutoff]
+        historical_cvar = float(-tail.mean()) if len(tail) else historical_var
+
+        # 参数法（正态）VaR/CVaR
+        z = NormalDist().inv_cdf(confidence)
+        portfolio_mean = float(mean @ weights)
+        parametric_var = float(z * portfolio_vol - portfolio_mean)
+        parametric_cvar = float(portfolio_vol * np.exp(-z * z / 2) / (np.sqrt(2 * np.pi) * (1 - confidence))
+                                - portfolio_mean)
+
+        # 风险贡献：边际贡献 = Σw / σp，成分贡献 = w * 边际贡献，合计等于 σp
+        if portfolio_vol > 0:
+            marginal = cov @ weights / portfolio_vol
+            component = weights * marginal
+            pct_contribution = component / portfolio_vol
+            diversification_ratio = float(weights @ asset_vol / portfolio_vol)
+        else:
+            marginal = component = pct_contribution = np.zeros_like(weights)
+            diversification_ratio = 1.0
+
+        n = len(weights)
+        if n > 1:
+            upper = corr[np.triu_indices(n, k=1)]
+            avg_correlation = float(upper.mean())
+        else:
+            avg_correlation = 1.0
+
+        annual_factor = np.sqrt(TRADING_DAYS_PER_YEAR)
+        return {
+            'weights': weights,
+            'asset_volatility': asset_vol * annual_factor,
+            'covariance': cov,
+            'correlation': corr,
+            'portfolio_volatility': portfolio_vol * annual_factor,
+            'portfolio_daily_volatility': portfolio_vol,
+            'historical_var': historical_var,
+            'historical_cvar': historical_cvar,
+            'parametric_var': parametric_var,
+            'parametric_cvar': parametric_cvar,
+            'marginal_contribution': marginal * annual_factor,
+            'component_contribution': component * annual_factor,
+            'pct_contribution': pct_contribution,
+            'diversification_ratio': diversification_ratio,
+            'average_correlation': avg_correlation
+        }
+
+    def _calculate_portfolio_metrics(self, holdings, fetched, confidence=0.95):
+        """组合波动率、相关性、VaR/CVaR 和风险贡献"""
+        price_frames = {code: item['df'] for code, item in fetched.items() if 'error' not in item}
+        returns = self.build_returns_matrix(price_frames)
+        if returns.empty or len(returns) < 20:
+            return {"error": "有效的共同交易日不足，无法计算组合协方差风险"}
+
+        codes = list(returns.columns)
+        weights = np.array([holdings[code]['weight'] for code in codes], dtype=float)
+        if weights.sum() <= 0:
+            return {"error": "持仓权重无效"}
+
+        metrics = self.compute_risk_metrics(returns.to_numpy(), weights, confidence)
+
+        # 相关性最高的持仓对
+        corr = metrics['correlation']
+        pairs = []
+        if len(codes) > 1:
+            rows, cols = np.triu_indices(len(codes), k=1)
+            order = np.argsort(corr[rows, cols])[::-1][:5]
+            pairs = [
+                {"pair": [codes[rows[i]], codes[cols[i]]], "correlation": round(float(corr[rows[i], cols[i]]), 4)}
+                for i in order
+            ]
+
+        contributions = [
+            {
+                "stock_code": code,
+                "weight": round(float(metrics['weights'][i]), 4),
+                "volatility": round(float(metrics['asset_volatility'][i]) * 100, 2),
+                "marginal_contribution": round(float(metrics['marginal_contribution'][i]) * 100, 4),
+                "risk_contribution": round(float(metrics['component_contribution'][i]) * 100, 4),
+                "risk_contribution_pct": round(float(metrics['pct_contribution'][i]) * 100, 2)
+            }
+            for i, code in enumerate(codes)
+        ]
+        contributions.sort(key=lambda x: x['risk_contribution_pct'], reverse=True)
+
+        return {
+            "observations": len(returns),
+            "start_date": returns.index[0].strftime('%Y-%m-%d'),
+            "end_date": returns.index[-1].strftime('%Y-%m-%d'),
+            "confidence": confidence,
+            "annual_volatility": round(metrics['portfolio_volatility'] * 100, 2),
+            "daily_var": round(metrics['historical_var'] * 100, 2),
+            "daily_cvar": round(metrics['historical_cvar'] * 100, 2),
+            "parametric_var": round(metrics['parametric_var'] * 100, 2),
+            "parametric_cvar": round(metrics['parametric_cvar'] * 100, 2),
+            "diversification_ratio": round(metrics['diversification_ratio'], 4),
+            "average_correlation": round(metrics['average_correlation'], 4),
+            "top_correlated_pairs": pairs,
+            "risk_contributions": contributions,
+            "correlation_matrix": {
+                "codes": codes,
+                "values": np.round(corr, 4).tolist()
+            },
+            "excluded": [code for code in holdings if code not in codes]
+        }
+
+    def _analyze_risk_concentration(self, holdings, stock_risks, fetched):
+        """分析风险集中度（行业信息取自已获取的持仓数据）"""
         # 分析行业集中度
         industries = {}
-        for stock in portfolio:
-            stock_code = stock.get('stock_code')
-            stock_info = self.analyzer.get_stock_info(stock_code)
-            industry = stock_info.get('行业', '未知')
-            weight = stock.get('weight', 1)
+        for stock_code, holding in holdings.items():
+            industry = fetched.get(stock_code, {}).get('industry') or '未知'
+            weight = holding['weight']
 
             if industry in industries:
                 industries[industry] += weight
@@ -368,10 +587,9 @@ class RiskMonitor:
 
         # 计算高风险股票总权重
         high_risk_weight = 0
-        for stock in portfolio:
-            stock_code = stock.get('stock_code')
+        for stock_code, holding in holdings.items():
             if stock_code in stock_risks and stock_risks[stock_code].get('total_risk_score', 0) >= 60:
-                high_risk_weight += stock.get('weight', 1)
+                high_risk_weight += holding['weight']
 
         return {
             "max_industry": max_industry[0],
@@ -394,10 +612,10 @@ class RiskMonitor:
         except Exception as e:
             print(f"数据服务层获取股票信息失败: {str(e)}")
 
-        # 备用方法：直接使用AKShare API
+        # 备用方法：直接调用上游接口
         print(f"使用备用方法获取股票 {stock_code} 信息")
         try:
-            import akshare as ak
+            provider = get_data_provider()
 
             # 获取股票名称
             stock_name = stock_code  # 默认值
@@ -406,7 +624,7 @@ class RiskMonitor:
             # 尝试获取股票名称
             try:
                 print("尝试获取股票名称...")
-                stock_name_df = ak.stock_info_a_code_name()
+                stock_name_df = provider.stock_info_a_code_name()
                 if not stock_name_df.empty:
                     print(f"股票名称数据列: {stock_name_df.columns.tolist()}")
                     # 检查列名
@@ -426,7 +644,7 @@ class RiskMonitor:
             # 尝试获取行业信息
             try:
                 print("尝试获取行业信息...")
-                stock_info = ak.stock_individual_info_em(symbol=stock_code)
+                stock_info = provider.stock_individual_info_em(symbol=stock_code)
                 if not stock_info.empty:
                     print(f"股票信息数据形状: {stock_info.shape}")
                     # 处理数据
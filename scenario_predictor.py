@@ -13,6 +13,8 @@ from datetime import datetime, timedelta
 import openai
 import logging
 from logging.handlers import RotatingFileHandler
+
+from monte_carlo import MonteCarloEngine, log_returns_from_prices
 """
 
 """
@@ -21,6 +23,13 @@ from logging.handlers import RotatingFileHandler
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 蒙特卡洛模拟配置
+SCENARIO_MC_PATHS = int(os.getenv('SCENARIO_MC_PATHS', '10000'))
+SCENARIO_MC_METHOD = os.getenv('SCENARIO_MC_METHOD', 'bootstrap')  # bootstrap 或 gbm
+SCENARIO_MC_SEED = os.getenv('SCENARIO_MC_SEED')
+# 用于估计波动率和自助抽样的历史窗口（交易日）
+SCENARIO_MC_LOOKBACK = int(os.getenv('SCENARIO_MC_LOOKBACK', '250'))
+
 class ScenarioPredictor:
     def __init__(self, analyzer, openai_api_key=None, openai_model=None):
         self.analyzer = analyzer
@@ -29,7 +38,7 @@ class ScenarioPredictor:
         self.openai_model = os.getenv('OPENAI_API_MODEL', 'gemini-2.0-pro-exp-02-05')
         # logging.info(f"scenario_predictor初始化完成：「{self.openai_api_key} {self.openai_api_url} {self.openai_model}」")
 
-    def generate_scenarios(self, stock_code, market_type='A', days=60):
+    def generate_scenarios(self, stock_code, market_type='A', days=60, seed=None):
         """生成乐观、中性、悲观三种市场情景预测"""
         try:
             # 获取股票数据和技术指标
@@ -48,7 +57,7 @@ class ScenarioPredictor:
             avg_volatility = df['Volatility'].mean()
 
             # 根据历史波动率计算情景
-            scenarios = self._calculate_scenarios(df, days)
+            scenarios = self._calculate_scenarios(df, days, seed=seed)
 
             # 使用AI生成各情景的分析
             if self.openai_api_key:
@@ -67,15 +76,16 @@ class ScenarioPredictor:
             traceback.print_exc()
             return self._get_error_response(f"生成情景预测失败: {str(e)}")
 
-    def _calculate_scenarios(self, df, days):
-        """基于历史数据计算三种情景的价格预测"""
-        current_price = df.iloc[-1]['close']
+    def _calculate_scenarios(self, df, days, seed=None):
+        """基于历史数据计算三种情景的价格预测
 
-        # 计算历史波动率和移动均线
-        volatility = df['Volatility'].mean() / 100  # 转换为小数
-        daily_volatility = volatility / np.sqrt(252)  # 转换为日波动率
+        目标价沿用布林带/均线规则；价格路径由蒙特卡洛模拟给出：
+        各情景以"中位数到达目标价"的漂移模拟，path 为中位数路径，percentile_bands 为分位数带；
+        probability / end_probability 是按历史漂移模拟时期间触及、期末达到该目标价的概率。
+        """
+        days = int(days)
+        current_price = float(df.iloc[-1]['close'])
         ma20 = df.iloc[-1]['MA20']
-        ma60 = df.iloc[-1]['MA60']
 
         # 计算乐观情景（上涨至压力位或突破）
         optimistic_return = 0.15  # 15%上涨
@@ -94,56 +104,68 @@ class ScenarioPredictor:
         else:
             pessimistic_target = current_price * (1 + pessimistic_return)
 
-        # 计算预期时间
-        time_periods = np.arange(1, days + 1)
-
-        # 生成乐观路径
-        opt_path = [current_price]
-        for _ in range(days):
-            daily_return = (optimistic_target / current_price) ** (1 / days) - 1
-            random_component = np.random.normal(0, daily_volatility)
-            new_price = opt_path[-1] * (1 + daily_return + random_component / 2)
-            opt_path.append(new_price)
-
-        # 生成中性路径
-        neu_path = [current_price]
-        for _ in range(days):
-            daily_return = (neutral_target / current_price) ** (1 / days) - 1
-            random_component = np.random.normal(0, daily_volatility)
-            new_price = neu_path[-1] * (1 + daily_return + random_component)
-            neu_path.append(new_price)
-
-        # 生成悲观路径
-        pes_path = [current_price]
-        for _ in range(days):
-            daily_return = (pessimistic_target / current_price) ** (1 / days) - 1
-            random_component = np.random.normal(0, daily_volatility)
-            new_price = pes_path[-1] * (1 + daily_return + random_component / 2)
-            pes_path.append(new_price)
+        targets = {
+            'optimistic': float(optimistic_target),
+            'neutral': float(neutral_target),
+            'pessimistic': float(pessimistic_target)
+        }
+
+        # 历史日对数收益率，用于波动率估计和自助抽样
+        log_returns = log_returns_from_prices(df['close'].to_numpy()[-(SCENARIO_MC_LOOKBACK + 1):])
+        if len(log_returns) >= 20:
+            daily_sigma = float(log_returns.std(ddof=1))
+            historical_drift = float(log_returns.mean())
+            method = SCENARIO_MC_METHOD
+        else:
+            # 数据不足时退回到 ATR 波动率估计和 GBM
+            daily_sigma = float(df['Volatility'].mean() / 100 / np.sqrt(252))
+            historical_drift = 0.0
+            method = 'gbm'
+
+        drifts = {'historical': historical_drift}
+        for name, target in targets.items():
+            drifts[name] = float(np.log(target / current_price) / days)
+
+        if seed is None and SCENARIO_MC_SEED:
+            seed = int(SCENARIO_MC_SEED)
+        engine = MonteCarloEngine(n_paths=SCENARIO_MC_PATHS, method=method, seed=seed)
+        simulation = engine.simulate(
+            current_price, days, drifts,
+            sigma=daily_sigma,
+            historical_log_returns=log_returns if method == 'bootstrap' else None,
+            targets=targets
+        )
 
         # 生成日期序列
         start_date = datetime.now()
         dates = [(start_date + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days + 1)]
 
-        # 组织结果
-        return {
-            'current_price': current_price,
-            'optimistic': {
-                'target_price': optimistic_target,
-                'change_percent': (optimistic_target / current_price - 1) * 100,
-                'path': dict(zip(dates, opt_path))
-            },
-            'neutral': {
-                'target_price': neutral_target,
-                'change_percent': (neutral_target / current_price - 1) * 100,
-                'path': dict(zip(dates, neu_path))
-            },
-            'pessimistic': {
-                'target_price': pessimistic_target,
-                'change_percent': (pessimistic_target / current_price - 1) * 100,
-                'path': dict(zip(dates, pes_path))
+        def bands_by_date(bands):
+            return {name: dict(zip(dates, values)) for name, values in bands.items()}
+
+        historical = simulation['scenarios']['historical']
+        result = {'current_price': current_price}
+        for name, target in targets.items():
+            scenario = simulation['scenarios'][name]
+            result[name] = {
+                'target_price': target,
+                'change_percent': (target / current_price - 1) * 100,
+                'path': dict(zip(dates, scenario['bands']['p50'])),
+                'percentile_bands': bands_by_date(scenario['bands']),
+                'probability': historical['hit_probability'].get(name, 0.0),
+                'end_probability': historical['end_probability'].get(name, 0.0)
             }
+
+        result['simulation'] = {
+            'n_paths': simulation['n_paths'],
+            'method': simulation['method'],
+            'seed': simulation['seed'],
+            'daily_volatility': daily_sigma,
+            'historical_drift': historical_drift,
+            'expected_price': historical['mean_final'],
+            'percentile_bands': bands_by_date(historical['bands'])
         }
+        return result
 
     def _generate_ai_analysis(self, stock_code, stock_info, df, scenarios):
         """使用AI生成各情景的分析说明，包含风险和机会因素"""
@@ -170,9 +192,9 @@ class ScenarioPredictor:
     - MACD: {macd}, Signal: {signal}
     
     2. 预测目标价:
-    - 乐观情景: {scenarios['optimistic']['target_price']:.2f} ({scenarios['optimistic']['change_percent']:.2f}%)
-    - 中性情景: {scenarios['neutral']['target_price']:.2f} ({scenarios['neutral']['change_percent']:.2f}%)
-    - 悲观情景: {scenarios['pessimistic']['target_price']:.2f} ({scenarios['pessimistic']['change_percent']:.2f}%)
+    - 乐观情景: {scenarios['optimistic']['target_price']:.2f} ({scenarios['optimistic']['change_percent']:.2f}%，模拟触及概率 {scenarios['optimistic'].get('probability', 0):.0%})
+    - 中性情景: {scenarios['neutral']['target_price']:.2f} ({scenarios['neutral']['change_percent']:.2f}%，模拟触及概率 {scenarios['neutral'].get('probability', 0):.0%})
+    - 悲观情景: {scenarios['pessimistic']['target_price']:.2f} ({scenarios['pessimistic']['change_percent']:.2f}%，模拟触及概率 {scenarios['pessimistic'].get('probability', 0):.0%})
     
     请提供以下内容，格式为JSON:
     {{
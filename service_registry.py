@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 延迟初始化服务注册表
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- register / lazy_service：登记服务工厂，首次使用时才构造（含模块导入），线程安全且只构造一次
+- LazyService 代理转发属性访问，原有 `analyzer.xxx()` 形式的调用无需修改
+- register_worker：登记后台线程（定时清理、新闻抓取等），由 start_workers 在服务开始
+  接收请求后按间隔依次启动，避免启动时所有线程同时访问上游
+- Web 服务导入业务模块前调用 hold_workers，由它负责触发；预缓存调度器、命令行脚本等
+  独立入口不调用，首个工作线程登记时即按启动延迟错峰启动，缓存清理不会缺席
+- 记录每个服务的构造耗时和工作线程启动时间，供 /api/system/services 查看
+
+环境变量：
+- LAZY_SERVICES: true（默认）延迟初始化；false 时在导入阶段构造全部服务并立即启动工作线程
+- WORKER_START_DELAY: 触发后首个工作线程启动前的等待秒数（默认5）
+- WORKER_STAGGER_SECONDS: 相邻工作线程的启动间隔秒数（默认3）
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LAZY_SERVICES = os.getenv('LAZY_SERVICES', 'true').lower() == 'true'
+WORKER_START_DELAY = float(os.getenv('WORKER_START_DELAY', '5'))
+WORKER_STAGGER_SECONDS = float(os.getenv('WORKER_STAGGER_SECONDS', '3'))
+
+
+class ServiceRegistry:
+    """服务与后台工作线程注册表"""
+
+    def __init__(self, hold_workers: bool = True):
+        self._lock = threading.RLock()
+        self._factories: Dict[str, Callable[[], Any]] = OrderedDict()
+        self._instances: Dict[str, Any] = {}
+        self._init_seconds: Dict[str, float] = {}
+        self._init_locks: Dict[str, threading.Lock] = {}
+        self._workers: Dict[str, Dict] = OrderedDict()
+        self._workers_triggered = False
+        # 为 True 时登记的工作线程等待 start_workers 触发，否则登记即触发
+        self._hold_workers = hold_workers
+        self._auto_started = 0
+
+    # ==================== 服务 ====================
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """登记服务工厂，重复登记时覆盖尚未构造的工厂"""
+        with self._lock:
+            self._factories[name] = factory
+            self._init_locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        """获取服务实例，首次调用时构造"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            if name not in self._factories:
+                raise KeyError(f"未登记的服务: {name}")
+            init_lock = self._init_locks[name]
+
+        # 每个服务单独加锁，构造慢的服务不阻塞其他服务
+        with init_lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                start_time = time.perf_counter()
+                instance = self._factories[name]()
+                elapsed = time.perf_counter() - start_time
+                self._init_seconds[name] = elapsed
+                self._instances[name] = instance
+                logger.info(f"服务 {name} 已初始化，耗时 {elapsed * 1000:.1f}ms")
+        return instance
+
+    def is_initialized(self, name: str) -> bool:
+        return name in self._instances
+
+    def initialize_all(self):
+        """构造全部已登记服务（LAZY_SERVICES=false 或预热时使用）"""
+        for name in list(self._factories):
+            self.get(name)
+
+    # ==================== 后台工作线程 ====================
+
+    def register_worker(self, name: str, start: Callable[[], Any]):
+        """登记后台工作线程的启动函数，同名只登记一次；触发后登记的立即排队启动"""
+        with self._lock:
+            if name in self._workers:
+                return
+            self._workers[name] = {'start': start, 'started_at': None, 'error': None}
+            triggered = self._workers_triggered
+            order = None
+            if not self._hold_workers:
+                order = self._auto_started
+                self._auto_started += 1
+        if triggered:
+            self._launch([name], delay=0.0, stagger=0.0)
+        elif not LAZY_SERVICES:
+            self._start_worker(name)
+        elif order is not None:
+            # 没有服务进程负责触发（独立脚本、预缓存调度器等）：登记后按启动延迟和间隔依次启动
+            self._launch([name], delay=WORKER_START_DELAY + order * WORKER_STAGGER_SECONDS, stagger=0.0)
+
+    def hold_workers(self):
+        """登记的工作线程等待 start_workers 触发；需在导入登记工作线程的模块之前调用"""
+        with self._lock:
+            self._hold_workers = True
+
+    def start_workers(self, delay: float = None, stagger: float = None) -> bool:
+        """按间隔依次启动所有工作线程，只生效一次；返回本次是否触发"""
+        with self._lock:
+            if self._workers_triggered:
+                return False
+            self._workers_triggered = True
+            names = [n for n, w in self._workers.items() if w['started_at'] is None]
+        self._launch(names,
+                     WORKER_START_DELAY if delay is None else delay,
+                     WORKER_STAGGER_SECONDS if stagger is None else stagger)
+        return True
+
+    def _launch(self, names, delay: float, stagger: float):
+        def launcher():
+            time.sleep(delay)
+            for i, name in enumerate(names):
+                if i and stagger:
+                    time.sleep(stagger)
+                self._start_worker(name)
+
+        threading.Thread(target=launcher, name='service-worker-launcher', daemon=True).start()
+
+    def _start_worker(self, name: str):
+        # 检查和标记在同一把锁内完成，启动线程与触发后登记的调用不会重复启动同一线程
+        with self._lock:
+            worker = self._workers[name]
+            if worker['started_at'] is not None:
+                return
+            worker['started_at'] = datetime.now()
+        try:
+            worker['start']()
+            logger.info(f"后台工作线程 {name} 已启动")
+        except Exception as e:
+            worker['error'] = str(e)
+            logger.error(f"后台工作线程 {name} 启动失败: {e}")
+
+    # ==================== 状态 ====================
+
+    def status(self) -> Dict:
+        with self._lock:
+            services = {
+                name: {
+                    'initialized': name in self._instances,
+                    'init_ms': round(self._init_seconds[name] * 1000, 2) if name in self._init_seconds else None
+                }
+                for name in self._factories
+            }
+            workers = {
+                name: {
+                    'started_at': w['started_at'].strftime('%Y-%m-%d %H:%M:%S') if w['started_at'] else None,
+                    'error': w['error']
+                }
+                for name, w in self._workers.items()
+            }
+        return {
+            'lazy': LAZY_SERVICES,
+            'workers_triggered': self._workers_triggered,
+            'services': services,
+            'workers': workers
+        }
+
+
+class LazyService:
+    """服务代理：首次访问属性时从注册表构造真实实例"""
+
+    __slots__ = ('_registry', '_name')
+
+    def __init__(self, registry: ServiceRegistry, name: str):
+        object.__setattr__(self, '_registry', registry)
+        object.__setattr__(self, '_name', name)
+
+    def resolve(self) -> Any:
+        return self._registry.get(self._name)
+
+    def __getattr__(self, item):
+        return getattr(self._registry.get(self._name), item)
+
+    def __setattr__(self, key, value):
+        setattr(self._registry.get(self._name), key, value)
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        state = 'initialized' if self._registry.is_initialized(self._name) else 'pending'
+        return f"<LazyService {self._name} ({state})>"
+
+
+# 全局服务注册表：默认登记即启动工作线程，Web 服务导入时调用 hold_workers 改为等待触发
+service_registry = ServiceRegistry(hold_workers=False)
+
+
+def lazy_service(name: str, factory: Callable[[], Any]) -> LazyService:
+    """登记服务并返回代理；LAZY_SERVICES=false 时立即构造"""
+    service_registry.register(name, factory)
+    if not LAZY_SERVICES:
+        service_registry.get(name)
+    return LazyService(service_registry, name)
+
+
+def register_worker(name: str, start: Callable[[], Any]):
+    """登记后台工作线程（便捷函数）"""
+    service_registry.register_worker(name, start)
+
+
+def start_workers(delay: Optional[float] = None, stagger: Optional[float] = None) -> bool:
+    """触发后台工作线程启动（便捷函数）"""
+    return service_registry.start_workers(delay, stagger)
@@ -9,6 +9,7 @@
 import logging
 from datetime import datetime, timedelta, date
 from typing import Optional, Dict, List, Tuple
+import numpy as np
 import pandas as pd
 from sqlalchemy import func, desc
 
@@ -66,11 +67,9 @@ class SmartCacheManager:
                 if not records:
                     # 没有任何数据，需要全量获取
                     result['needs_update'] = True
-                    result['missing_dates'] = [d.strftime('%Y-%m-%d') 
-                                             for d in get_trading_days_between(
-                                                 datetime.strptime(start_date, '%Y-%m-%d').date(),
-                                                 datetime.strptime(end_date, '%Y-%m-%d').date()
-                                             )]
+                    result['missing_dates'] = trading_calendar.get_trading_day_strings_between(
+                        start_date, end_date, market_type
+                    ).tolist()
                     return result
                 
                 # 转换为DataFrame
@@ -85,26 +84,13 @@ class SmartCacheManager:
                 latest_date_str = latest_record.trade_date
                 result['latest_date'] = f"{latest_date_str[:4]}-{latest_date_str[4:6]}-{latest_date_str[6:8]}"
                 
-                # 检查数据完整性
-                start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
-                end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
-                latest_dt = datetime.strptime(result['latest_date'], '%Y-%m-%d').date()
-                
-                # 获取应该有的所有交易日
-                expected_trading_days = get_trading_days_between(start_dt, end_dt)
-                
-                # 获取数据库中已有的交易日
-                existing_dates = set()
-                for record in records:
-                    date_str = record.trade_date
-                    formatted_date = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
-                    existing_dates.add(formatted_date)
-                
-                # 找出缺失的交易日
-                missing_dates = []
-                for trading_day in expected_trading_days:
-                    if trading_day.strftime('%Y-%m-%d') not in existing_dates:
-                        missing_dates.append(trading_day.strftime('%Y-%m-%d'))
+                # 检查数据完整性：应有交易日与已有交易日做向量化差集
+                expected_trading_days = trading_calendar.get_trading_day_strings_between(
+                    start_date, end_date, market_type, fmt='%Y%m%d'
+                )
+                existing_dates = np.array([record.trade_date for record in records])
+                missing = expected_trading_days[~np.isin(expected_trading_days, existing_dates)]
+                missing_dates = [f"{d[:4]}-{d[4:6]}-{d[6:8]}" for d in missing.tolist()]
                 
                 result['missing_dates'] = missing_dates
                 result['needs_update'] = len(missing_dates) > 0
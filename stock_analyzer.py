@@ -21,11 +21,32 @@ import json
 import threading
 
 # 导入新的数据访问层
+from data_provider import get_data_provider
 from data_service import data_service
+from market_scan_cache_manager import market_scan_cache_manager
+from tracing import traced, span, set_span_attribute
 
 # 线程局部存储
 thread_local = threading.local()
 
+# 新闻情绪关键词
+NEWS_SENTIMENT_KEYWORDS = {
+    'bullish': ['上涨', '增长', '利好', '突破', '强势', '看好', '机会', '利润'],
+    'slightly_bullish': ['回升', '改善', '企稳', '向好', '期待'],
+    'neutral': ['稳定', '平稳', '持平', '不变'],
+    'slightly_bearish': ['回调', '承压', '谨慎', '风险', '下滑'],
+    'bearish': ['下跌', '亏损', '跌破', '利空', '警惕', '危机', '崩盘']
+}
+
+
+def news_sentiment(text):
+    """按关键词出现的种类数判断新闻的主导情绪"""
+    scores = {sentiment: sum(1 for keyword in keywords if keyword in text)
+              for sentiment, keywords in NEWS_SENTIMENT_KEYWORDS.items()}
+    if all(score == 0 for score in scores.values()):
+        return "neutral"
+    return max(scores.items(), key=lambda x: x[1])[0]
+
 
 class StockAnalyzer:
     """
@@ -63,9 +84,12 @@ class StockAnalyzer:
 
         # JSON匹配标志
         self.json_match_flag = True
+    @traced('analyzer.get_stock_data')
     def get_stock_data(self, stock_code, market_type='A', start_date=None, end_date=None, timeout=30):
         """获取股票数据，使用新的数据访问层"""
         self.logger.info(f"开始获取股票 {stock_code} 数据，市场类型: {market_type}")
+        # 记录请求频率，夜间预缓存优先处理常被请求的股票
+        market_scan_cache_manager.record_request(stock_code)
 
         # 格式化日期参数
         if start_date is None:
@@ -93,6 +117,7 @@ class StockAnalyzer:
                 raise Exception(f"获取股票 {stock_code} 数据为空")
 
             self.logger.info(f"成功获取股票 {stock_code} 数据，共 {len(df)} 条记录")
+            set_span_attribute('rows', len(df))
             return df
 
         except Exception as e:
@@ -116,14 +141,14 @@ class StockAnalyzer:
     def get_north_flow_history(self, stock_code, start_date=None, end_date=None):
         """获取单个股票的北向资金历史持股数据"""
         try:
-            import akshare as ak
+            provider = get_data_provider()
 
             # 获取历史持股数据
             if start_date is None and end_date is None:
                 # 默认获取近90天数据
-                north_hist_data = ak.stock_hsgt_hist_em(symbol=stock_code)
+                north_hist_data = provider.stock_hsgt_hist_em(symbol=stock_code)
             else:
-                north_hist_data = ak.stock_hsgt_hist_em(symbol=stock_code, start_date=start_date, end_date=end_date)
+                north_hist_data = provider.stock_hsgt_hist_em(symbol=stock_code, start_date=start_date, end_date=end_date)
 
             if north_hist_data.empty:
                 return {"history": []}
@@ -209,6 +234,7 @@ class StockAnalyzer:
 
         return df
 
+    @traced('analyzer.calculate_indicators')
     def calculate_indicators(self, df):
         """计算技术指标"""
 
@@ -251,6 +277,7 @@ class StockAnalyzer:
             self.logger.error(f"计算技术指标时出错: {str(e)}")
             raise
 
+    @traced('analyzer.calculate_score')
     def calculate_score(self, df, market_type='A'):
         """
         计算股票评分 - 使用时空共振交易系统增强
@@ -695,6 +722,7 @@ class StockAnalyzer:
             # 返回保守的默认仓位大小（出错时）
             return 5.0
 
+    @traced('analyzer.get_recommendation')
     def get_recommendation(self, score, market_type='A', technical_data=None, news_data=None):
         """
         根据得分和附加信息生成投资建议
@@ -912,6 +940,36 @@ class StockAnalyzer:
         except:
             return 0  # 默认中性情绪
 
+    def _get_local_news(self, stock_code, industry, market_type='A', limit=5):
+        """从本地新闻库检索股票相关新闻；提到该股票的新闻不足 NEWS_LOCAL_MIN_HITS 条时返回 None"""
+        if market_type != 'A':
+            return None
+        try:
+            from news_fetcher import NEWS_LOCAL_MIN_HITS, news_fetcher
+            local = news_fetcher.search_stock_news(stock_code, industry=industry, limit=limit)
+        except Exception as e:
+            self.logger.warning(f"本地新闻检索失败: {str(e)}")
+            return None
+        if len(local['news']) < NEWS_LOCAL_MIN_HITS:
+            return None
+
+        def to_news(item):
+            content = item['content'] or ''
+            return {"title": item['title'] or content[:40], "date": item['date'],
+                    "source": "财联社", "summary": content}
+
+        news = [to_news(item) for item in local['news']]
+        self.logger.info(f"本地新闻库命中 {stock_code}: {len(news)} 条相关新闻，跳过远程搜索")
+        return {
+            'news': news,
+            'announcements': [],
+            'industry_news': [to_news(item) for item in local['industry_news']],
+            'market_sentiment': news_sentiment(" ".join(n['title'] + " " + n['summary'] for n in news)),
+            'source': 'local',
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+    @traced('analyzer.get_stock_news')
     def get_stock_news(self, stock_code, market_type='A', limit=5):
         """
         获取股票相关新闻和实时信息，通过OpenAI API调用function calling方式获取
@@ -937,6 +995,15 @@ class StockAnalyzer:
             stock_name = stock_info.get('股票名称', '未知')
             industry = stock_info.get('行业', '未知')
 
+            # 优先使用本地新闻库（财联社电报，入库时已按股票和行业打标签），命中不足时再远程搜索
+            local_news = self._get_local_news(stock_code, industry, market_type, limit)
+            if local_news is not None:
+                self.data_cache[cache_key] = {
+                    'data': local_news,
+                    'timestamp': datetime.now()
+                }
+                return local_news
+
             # 构建新闻查询的prompt
             market_name = "A股" if market_type == 'A' else "港股" if market_type == 'HK' else "美股"
             query = f"""请帮我搜索以下股票的最新相关新闻和信息:
@@ -1161,29 +1228,9 @@ class StockAnalyzer:
                     # 获取公告信息 (这部分保持不变)
                     announcements = []
 
-                    # 分析市场情绪 (保持原有逻辑)
-                    sentiment_keywords = {
-                        'bullish': ['上涨', '增长', '利好', '突破', '强势', '看好', '机会', '利润'],
-                        'slightly_bullish': ['回升', '改善', '企稳', '向好', '期待'],
-                        'neutral': ['稳定', '平稳', '持平', '不变'],
-                        'slightly_bearish': ['回调', '承压', '谨慎', '风险', '下滑'],
-                        'bearish': ['下跌', '亏损', '跌破', '利空', '警惕', '危机', '崩盘']
-                    }
-
-                    # 计算情绪得分
-                    sentiment_scores = {k: 0 for k in sentiment_keywords.keys()}
+                    # 分析市场情绪
                     all_text = " ".join([n.get("title", "") + " " + n.get("snippet", "") for n in unique_news])
-
-                    for sentiment, keywords in sentiment_keywords.items():
-                        for keyword in keywords:
-                            if keyword in all_text:
-                                sentiment_scores[sentiment] += 1
-
-                    # 确定主导情绪
-                    if not sentiment_scores or all(score == 0 for score in sentiment_scores.values()):
-                        market_sentiment = "neutral"
-                    else:
-                        market_sentiment = max(sentiment_scores.items(), key=lambda x: x[1])[0]
+                    market_sentiment = news_sentiment(all_text)
 
                     self.logger.info(f"搜索完成，共获取到 {len(unique_news)} 条新闻和 {len(unique_industry_news)} 条行业新闻")
 
@@ -1268,7 +1315,8 @@ class StockAnalyzer:
 
             # 等待结果，最多等待240秒
             try:
-                result = result_queue.get(timeout=240)
+                with span('ai.chat_completion', model=self.function_call_model, purpose='news'):
+                    result = result_queue.get(timeout=240)
 
                 # 检查结果是否为异常
                 if isinstance(result, Exception):
@@ -1349,6 +1397,7 @@ class StockAnalyzer:
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
 
+    @traced('analyzer.get_ai_analysis')
     def get_ai_analysis(self, df, stock_code, market_type='A'):
         """
         使用AI进行增强分析
@@ -1500,7 +1549,8 @@ class StockAnalyzer:
 
             # 等待结果，最多等待240秒
             try:
-                result = result_queue.get(timeout=240)
+                with span('ai.chat_completion', model=self.openai_model, purpose='analysis'):
+                    result = result_queue.get(timeout=240)
 
                 # 检查结果是否为异常
                 if isinstance(result, Exception):
@@ -1568,6 +1618,7 @@ class StockAnalyzer:
         return formatted
 
     # 原有API：保持接口不变
+    @traced('analyzer.analyze_stock')
     def analyze_stock(self, stock_code, market_type='A'):
         """分析单个股票"""
         try:
@@ -1719,6 +1770,7 @@ class StockAnalyzer:
     #         self.logger.error(f"快速分析股票 {stock_code} 时出错: {str(e)}")
     #         raise
 
+    @traced('analyzer.quick_analyze_stock')
     def quick_analyze_stock(self, stock_code, market_type='A', timeout=60):
         """快速分析股票，用于市场扫描，增加超时控制和错误处理"""
         start_time = time.time()
@@ -1732,6 +1784,7 @@ class StockAnalyzer:
                 # 检查缓存是否过期（5分钟）
                 if time.time() - cached_result.get('timestamp', 0) < 300:
                     self.logger.info(f"使用缓存的快速分析结果: {stock_code}")
+                    set_span_attribute('cache_level', 'ANALYZER_MEMORY')
                     return cached_result['data']
 
             # 获取股票数据（增加超时时间）
@@ -1827,6 +1880,7 @@ class StockAnalyzer:
 
     # ======================== 新增功能 ========================#
 
+    @traced('analyzer.get_stock_info')
     def get_stock_info(self, stock_code, market_type='A'):
         """获取股票基本信息，使用新的数据访问层"""
         try:
@@ -1872,6 +1926,7 @@ class StockAnalyzer:
 
             return {"股票名称": "未知", "行业": "未知", "地区": "未知"}
 
+    @traced('analyzer.identify_support_resistance')
     def identify_support_resistance(self, df):
         """识别支撑位和压力位"""
         latest_price = df['close'].iloc[-1]
@@ -2050,6 +2105,7 @@ class StockAnalyzer:
             self.logger.error(f"错误详情: {traceback.format_exc()}")
             return {'total': 0, 'trend': 0, 'indicators': 0, 'support_resistance': 0, 'volatility_volume': 0}
 
+    @traced('analyzer.perform_enhanced_analysis')
     def perform_enhanced_analysis(self, stock_code, market_type='A'):
         """执行增强版分析"""
         try:
@@ -1,28 +1,37 @@
 # -*- coding: utf-8 -*-
 """
 股票数据预缓存调度器
-用于定时预缓存上证指数成分股数据，提升市场扫描性能
+用于定时预缓存指数成分股数据，提升市场扫描性能
+
+- 固定大小的工作线程池并发预缓存，上游调用统一经过自适应令牌桶限速（失败时降速、成功后逐步恢复）
+- 按缓存新鲜度（MarketScanCacheManager.get_market_scan_priority_list）、指数权重和近期请求频率排序
+- 数据良好的股票跳过历史行情，其余只做增量刷新；收盘后不拉取全市场实时快照
+- 进度写入状态文件，中断后同一交易日再次运行时跳过已完成的股票
+
+环境变量：
+- PRECACHE_WORKERS: 工作线程数（默认8）
+- PRECACHE_RATE: 每秒上游调用数上限（默认10）
+- PRECACHE_BURST: 令牌桶容量（默认20）
+- PRECACHE_STATE_FILE: 进度文件（默认 data/precache_state.json）
+- PRECACHE_INDEX / PRECACHE_MAX_STOCKS: 每日任务的指数和股票数（默认中证800全部）
 """
 
+import json
 import time
 import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 import traceback
 import os
 
-# 尝试导入可选依赖
-try:
-    import akshare as ak
-    AKSHARE_AVAILABLE = True
-except ImportError:
-    AKSHARE_AVAILABLE = False
-    ak = None
+from token_bucket import AdaptiveTokenBucket
 
 try:
-    from data_service import data_service
+    from data_service import data_service, upstream_budget
     DATA_SERVICE_AVAILABLE = True
 except ImportError:
+    from contextlib import nullcontext as upstream_budget
     DATA_SERVICE_AVAILABLE = False
     data_service = None
 
@@ -46,59 +55,186 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+PRECACHE_WORKERS = int(os.getenv('PRECACHE_WORKERS', '8'))
+PRECACHE_RATE = float(os.getenv('PRECACHE_RATE', '10'))
+PRECACHE_BURST = int(os.getenv('PRECACHE_BURST', '20'))
+PRECACHE_STATE_FILE = os.getenv('PRECACHE_STATE_FILE', os.path.join('data', 'precache_state.json'))
+PRECACHE_INDEX = os.getenv('PRECACHE_INDEX', '000906')
+PRECACHE_MAX_STOCKS = int(os.getenv('PRECACHE_MAX_STOCKS', '800'))
+
+# 缓存新鲜度分组的紧迫程度，越大越先处理；good 组跳过历史行情刷新
+STALENESS_RANK = {'no_data': 4, 'stale': 3, 'outdated': 2, 'acceptable': 1, 'good': 0}
+# 同一新鲜度分组内，指数权重和请求频率的加权比例
+WEIGHT_FACTOR = 0.6
+FREQUENCY_FACTOR = 0.4
+
+# 支持的指数：中证800、沪深300、中证500、上证指数、深证成指
+INDEX_NAMES = {
+    '000906': '中证800',
+    '000300': '沪深300',
+    '000905': '中证500',
+    '000001': '上证指数',
+    '399001': '深证成指'
+}
+
+FALLBACK_STOCKS = [
+    '000001', '000002', '600000', '600036', '000858',
+    '002415', '000063', '600519', '000166', '600276',
+    '600887', '000725', '002304', '600031', '000568',
+    '600104', '002142', '600009', '000776', '600028'
+]
+
+
+class PrecacheProgress:
+    """预缓存进度文件：记录当日已完成的股票，中断后可继续"""
+
+    def __init__(self, path: str = PRECACHE_STATE_FILE):
+        self.path = path
+        self.state = None
+        self.lock = threading.Lock()
+        self._dirty = 0
+
+    def load(self, index_code: str, run_date: str) -> set:
+        """读取同一指数、同一日期未完成的进度，返回已完成的股票代码"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        if state.get('index_code') != index_code or state.get('run_date') != run_date or state.get('finished'):
+            return set()
+        return set(state.get('completed', []))
+
+    def begin(self, index_code: str, run_date: str, completed: set, total: int):
+        with self.lock:
+            self.state = {
+                'index_code': index_code,
+                'run_date': run_date,
+                'total': total,
+                'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'completed': sorted(completed),
+                'failed': {},
+                'finished': False
+            }
+            self._save()
+
+    def mark(self, stock_code: str, success: bool, error: str = None, flush_every: int = 20):
+        with self.lock:
+            if success:
+                self.state['completed'].append(stock_code)
+                self.state['failed'].pop(stock_code, None)
+            else:
+                self.state['failed'][stock_code] = error or 'unknown'
+            self._dirty += 1
+            if self._dirty >= flush_every:
+                self._save()
+
+    def finish(self, cancelled: bool = False):
+        with self.lock:
+            self.state['finished'] = not cancelled
+            self.state['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._save()
+
+    def _save(self):
+        self._dirty = 0
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"保存预缓存进度失败: {e}")
+
+
+def prioritize_stocks(stock_codes, weights=None, request_frequency=None, priority_groups=None):
+    """
+    生成预缓存计划：先按缓存新鲜度分组，组内按指数权重和近期请求频率的加权得分排序
+
+    Returns:
+        List[Dict]: [{'stock_code', 'group', 'priority', 'refresh_history'}]，按处理顺序排列
+    """
+    weights = weights or {}
+    request_frequency = request_frequency or {}
+    group_of = {}
+    for group, codes in (priority_groups or {}).items():
+        for code in codes:
+            group_of[code] = group
+
+    max_weight = max((weights.get(c, 0.0) for c in stock_codes), default=0.0) or 1.0
+    max_frequency = max((request_frequency.get(c, 0.0) for c in stock_codes), default=0.0) or 1.0
+
+    plan = []
+    for code in stock_codes:
+        group = group_of.get(code, 'no_data')
+        score = (WEIGHT_FACTOR * weights.get(code, 0.0) / max_weight
+                 + FREQUENCY_FACTOR * request_frequency.get(code, 0.0) / max_frequency)
+        plan.append({
+            'stock_code': code,
+            'group': group,
+            'priority': round(STALENESS_RANK.get(group, 4) + score, 4),
+            'refresh_history': group != 'good'
+        })
+    plan.sort(key=lambda item: item['priority'], reverse=True)
+    return plan
+
+
 class StockPrecacheScheduler:
     """股票数据预缓存调度器"""
 
-    def __init__(self):
+    def __init__(self, max_workers: int = PRECACHE_WORKERS, rate: float = PRECACHE_RATE,
+                 burst: int = PRECACHE_BURST, state_file: str = PRECACHE_STATE_FILE):
         self.is_running = False
         self.scheduler_thread = None
+        self.max_workers = max_workers
+        self.rate = rate
+        self.burst = burst
+        self.progress = PrecacheProgress(state_file)
+        self._task_lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._bucket = None
         self.precache_stats = {
             'last_run': None,
             'total_stocks': 0,
             'success_count': 0,
             'failed_count': 0,
-            'duration': 0
+            'duration': 0,
+            'task_running': False,
+            'processed': 0,
+            'resumed': 0,
+            'history_skipped': 0
         }
         self.scheduled_time = "00:00"  # 默认凌晨12点执行
-    
+        self.index_code = PRECACHE_INDEX
+        self.max_stocks = PRECACHE_MAX_STOCKS
+
+    def get_index_constituents(self, index_code='000300'):
+        """获取指数成分股及权重，返回 [(股票代码, 权重)]，按权重从高到低排列"""
+        logger.info(f"开始获取指数 {index_code}（{INDEX_NAMES.get(index_code, '未知指数')}）成分股列表")
+        # 成分股列表在数据访问层按天缓存，与指数分析共用
+        constituents = data_service.get_index_constituents(index_code) if DATA_SERVICE_AVAILABLE else []
+        if constituents:
+            logger.info(f"成功获取 {len(constituents)} 只成分股")
+            return list(constituents)
+
+        logger.error(f"获取指数 {index_code} 成分股失败，使用常见大盘股")
+        # 返回一些常见的大盘股作为备选
+        return [(code, float(len(FALLBACK_STOCKS) - i)) for i, code in enumerate(FALLBACK_STOCKS)]
+
     def get_index_stocks(self, index_code='000300'):
         """获取指数成分股列表"""
-        try:
-            logger.info(f"开始获取指数 {index_code} 成分股列表")
-
-            if AKSHARE_AVAILABLE and ak:
-                if index_code == '000300':  # 沪深300
-                    df = ak.index_stock_cons(symbol="000300")
-                    stock_codes = df['品种代码'].tolist()
-                elif index_code == '000001':  # 上证指数
-                    df = ak.index_stock_cons(symbol="000001")
-                    stock_codes = df['品种代码'].tolist()
-                elif index_code == '399001':  # 深证成指
-                    df = ak.index_stock_cons(symbol="399001")
-                    stock_codes = df['品种代码'].tolist()
-                else:
-                    # 默认使用沪深300前50只股票
-                    df = ak.index_stock_cons(symbol="000300")
-                    stock_codes = df['品种代码'].head(50).tolist()
-
-                logger.info(f"成功获取 {len(stock_codes)} 只成分股")
-                return stock_codes
-            else:
-                logger.warning("AKShare不可用，使用预定义股票列表")
-                raise Exception("AKShare不可用")
+        return [code for code, _ in self.get_index_constituents(index_code)]
 
-        except Exception as e:
-            logger.error(f"获取指数成分股失败: {e}")
-            # 返回一些常见的大盘股作为备选
-            return [
-                '000001', '000002', '600000', '600036', '000858',
-                '002415', '000063', '600519', '000166', '600276',
-                '600887', '000725', '002304', '600031', '000568',
-                '600104', '002142', '600009', '000776', '600028'
-            ]
-    
-    def precache_stock_data(self, stock_code, market_type='A'):
-        """预缓存单只股票的数据"""
+    def precache_stock_data(self, stock_code, market_type='A', refresh_history=True, include_realtime=False):
+        """
+        预缓存单只股票的数据
+
+        Args:
+            refresh_history: 是否刷新历史行情（数据服务只补齐缺失的交易日）
+            include_realtime: 是否缓存实时行情，收盘后的批量任务无需获取
+        """
         try:
             logger.debug(f"开始预缓存股票 {stock_code} 数据")
 
@@ -106,76 +242,131 @@ class StockPrecacheScheduler:
                 logger.warning("数据服务不可用，跳过预缓存")
                 return False
 
-            # 1. 预缓存基本信息
+            # 1. 预缓存基本信息（已缓存时不访问上游）
             basic_info = data_service.get_stock_basic_info(stock_code, market_type)
             if basic_info:
                 logger.debug(f"股票 {stock_code} 基本信息缓存成功")
 
-            # 2. 预缓存历史价格数据（最近1年）
-            end_date = datetime.now().strftime('%Y-%m-%d')
-            start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+            # 2. 增量刷新历史价格数据（最近1年）
+            if refresh_history:
+                end_date = datetime.now().strftime('%Y-%m-%d')
+                start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
 
-            price_data = data_service.get_stock_price_history(
-                stock_code, market_type, start_date, end_date
-            )
-            if price_data is not None and len(price_data) > 0:
+                price_data = data_service.get_stock_price_history(
+                    stock_code, market_type, start_date, end_date
+                )
+                if price_data is None or len(price_data) == 0:
+                    logger.warning(f"股票 {stock_code} 价格历史数据为空")
+                    return False
                 logger.debug(f"股票 {stock_code} 价格历史数据缓存成功，共 {len(price_data)} 条记录")
 
             # 3. 预缓存实时数据
-            realtime_data = data_service.get_stock_realtime_data(stock_code, market_type)
-            if realtime_data:
-                logger.debug(f"股票 {stock_code} 实时数据缓存成功")
+            if include_realtime:
+                realtime_data = data_service.get_stock_realtime_data(stock_code, market_type)
+                if realtime_data:
+                    logger.debug(f"股票 {stock_code} 实时数据缓存成功")
 
             return True
 
         except Exception as e:
             logger.error(f"预缓存股票 {stock_code} 数据失败: {e}")
             return False
-    
-    def run_precache_task(self, index_code='000300', max_stocks=100):
-        """执行预缓存任务"""
+
+    def _plan(self, stock_codes, weights, market_type):
+        """按缓存新鲜度、指数权重和请求频率排序"""
+        try:
+            from market_scan_cache_manager import market_scan_cache_manager
+            priority_groups = market_scan_cache_manager.get_market_scan_priority_list(stock_codes, market_type)
+            request_frequency = market_scan_cache_manager.get_request_frequency(stock_codes)
+        except Exception as e:
+            logger.warning(f"获取缓存新鲜度失败，全部按需要刷新处理: {e}")
+            priority_groups, request_frequency = {}, {}
+        return prioritize_stocks(stock_codes, weights, request_frequency, priority_groups)
+
+    def _precache_with_budget(self, item, market_type, include_realtime):
+        if self._cancel_event.is_set():
+            return None
+        with upstream_budget(self._bucket):
+            return self.precache_stock_data(item['stock_code'], market_type, item['refresh_history'],
+                                            include_realtime)
+
+    def run_precache_task(self, index_code='000300', max_stocks=100, resume=True, stock_codes=None,
+                          market_type='A', include_realtime=False):
+        """
+        执行预缓存任务
+
+        Args:
+            index_code: 指数代码，stock_codes 为空时从该指数获取成分股
+            max_stocks: 最多处理的股票数（按权重取前N只）
+            resume: 是否跳过同一交易日已完成的股票
+            stock_codes: 直接指定股票列表
+            include_realtime: 是否同时缓存实时行情
+        """
+        if not self._task_lock.acquire(blocking=False):
+            logger.warning("预缓存任务已在运行中，忽略本次请求")
+            return self.get_stats()
+
         start_time = time.time()
-        logger.info("="*60)
+        self._cancel_event.clear()
+        self._bucket = AdaptiveTokenBucket(self.rate, self.burst)
+        self.precache_stats.update({'task_running': True, 'processed': 0, 'resumed': 0, 'history_skipped': 0,
+                                    'success_count': 0, 'failed_count': 0})
         logger.info("🚀 开始执行股票数据预缓存任务")
-        logger.info("="*60)
-        
+
         try:
-            # 获取指数成分股
-            stock_codes = self.get_index_stocks(index_code)
-            
-            # 限制股票数量
-            if len(stock_codes) > max_stocks:
-                stock_codes = stock_codes[:max_stocks]
+            if stock_codes:
+                constituents = [(code, float(len(stock_codes) - i)) for i, code in enumerate(stock_codes)]
+            else:
+                constituents = self.get_index_constituents(index_code)
+
+            # 限制股票数量（按权重取前N只）
+            if len(constituents) > max_stocks:
+                constituents = constituents[:max_stocks]
                 logger.info(f"限制预缓存股票数量为 {max_stocks} 只")
-            
-            total_stocks = len(stock_codes)
-            success_count = 0
-            failed_count = 0
-            
-            logger.info(f"开始预缓存 {total_stocks} 只股票的数据")
-            
-            # 分批处理，避免过度占用资源
-            batch_size = 10
-            for i in range(0, total_stocks, batch_size):
-                batch = stock_codes[i:i + batch_size]
-                logger.info(f"处理批次 {i//batch_size + 1}/{(total_stocks + batch_size - 1)//batch_size}")
-                
-                for stock_code in batch:
+            weights = dict(constituents)
+            codes = list(weights)
+
+            run_date = datetime.now().strftime('%Y-%m-%d')
+            completed = self.progress.load(index_code, run_date) if resume else set()
+            completed &= set(codes)
+            pending = [code for code in codes if code not in completed]
+            if completed:
+                logger.info(f"继续未完成的预缓存任务，跳过已完成的 {len(completed)} 只股票")
+            self.progress.begin(index_code, run_date, completed, len(codes))
+
+            plan = self._plan(pending, weights, market_type)
+            history_skipped = sum(1 for item in plan if not item['refresh_history'])
+            total_stocks = len(codes)
+            self.precache_stats.update({'total_stocks': total_stocks, 'resumed': len(completed),
+                                        'history_skipped': history_skipped})
+            logger.info(f"开始预缓存 {len(plan)} 只股票（数据良好跳过历史行情 {history_skipped} 只），"
+                        f"工作线程 {self.max_workers}，上游限速 {self.rate}/秒")
+
+            success_count = failed_count = 0
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='precache') as executor:
+                futures = {executor.submit(self._precache_with_budget, item, market_type, include_realtime): item
+                           for item in plan}
+                for future in as_completed(futures):
+                    code = futures[future]['stock_code']
                     try:
-                        if self.precache_stock_data(stock_code):
-                            success_count += 1
-                            logger.info(f"✅ {stock_code} 预缓存成功 ({success_count}/{total_stocks})")
-                        else:
-                            failed_count += 1
-                            logger.warning(f"❌ {stock_code} 预缓存失败 ({failed_count}/{total_stocks})")
+                        ok = future.result()
+                        error = None
                     except Exception as e:
+                        ok, error = False, str(e)
+                    if ok is None:
+                        continue  # 已取消，保留为未完成
+                    if ok:
+                        success_count += 1
+                    else:
                         failed_count += 1
-                        logger.error(f"❌ {stock_code} 预缓存异常: {e}")
-                
-                # 批次间休息，避免API限流
-                if i + batch_size < total_stocks:
-                    time.sleep(2)
-            
+                    self.progress.mark(code, ok, error)
+                    self.precache_stats.update({'processed': success_count + failed_count,
+                                                'success_count': success_count,
+                                                'failed_count': failed_count})
+
+            cancelled = self._cancel_event.is_set()
+            self.progress.finish(cancelled=cancelled)
+
             # 更新统计信息
             duration = time.time() - start_time
             self.precache_stats.update({
@@ -183,32 +374,40 @@ class StockPrecacheScheduler:
                 'total_stocks': total_stocks,
                 'success_count': success_count,
                 'failed_count': failed_count,
-                'duration': duration
+                'duration': duration,
+                'cancelled': cancelled,
+                **self._bucket.get_stats()
             })
-            
-            logger.info("="*60)
-            logger.info("📊 预缓存任务完成统计")
-            logger.info("="*60)
-            logger.info(f"总股票数: {total_stocks}")
-            logger.info(f"成功缓存: {success_count}")
-            logger.info(f"失败数量: {failed_count}")
-            logger.info(f"成功率: {(success_count/total_stocks*100):.1f}%")
-            logger.info(f"总耗时: {duration:.1f}秒")
-            logger.info(f"平均每只: {duration/total_stocks:.2f}秒")
-            
+
+            processed = max(success_count + failed_count, 1)
+            logger.info(f"📊 预缓存任务{'已取消' if cancelled else '完成'}: 总股票数 {total_stocks}, "
+                        f"成功 {success_count}, 失败 {failed_count}, 续跑跳过 {len(completed)}, "
+                        f"成功率 {success_count / processed * 100:.1f}%, 总耗时 {duration:.1f}秒, "
+                        f"上游调用 {self._bucket.acquired} 次")
+
         except Exception as e:
             logger.error(f"预缓存任务执行失败: {e}")
             logger.error(traceback.format_exc())
-    
-    def schedule_daily_precache(self, time_str="00:00", index_code='000300'):
+        finally:
+            self.precache_stats['task_running'] = False
+            self._task_lock.release()
+
+        return self.get_stats()
+
+    def cancel_task(self):
+        """取消正在运行的预缓存任务，已完成的进度保留"""
+        self._cancel_event.set()
+
+    def schedule_daily_precache(self, time_str="00:00", index_code=PRECACHE_INDEX, max_stocks=PRECACHE_MAX_STOCKS):
         """安排每日预缓存任务"""
         logger.info(f"安排每日 {time_str} 执行预缓存任务")
 
         self.scheduled_time = time_str
         self.index_code = index_code
+        self.max_stocks = max_stocks
 
         logger.info(f"预缓存任务已安排在每天 {time_str} 执行")
-    
+
     def start_scheduler(self):
         """启动调度器"""
         if self.is_running:
@@ -225,7 +424,7 @@ class StockPrecacheScheduler:
                     current_time = datetime.now().strftime("%H:%M")
                     if current_time == self.scheduled_time:
                         logger.info("到达预定时间，开始执行预缓存任务")
-                        self.run_precache_task(getattr(self, 'index_code', '000300'))
+                        self.run_precache_task(self.index_code, self.max_stocks)
                         # 等待一分钟，避免重复执行
                         time.sleep(60)
 
@@ -238,26 +437,30 @@ class StockPrecacheScheduler:
         self.scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
         self.scheduler_thread.start()
         logger.info("预缓存调度器已启动")
-    
+
     def stop_scheduler(self):
         """停止调度器"""
         if not self.is_running:
             logger.warning("调度器未在运行")
             return
-        
+
         self.is_running = False
+        self.cancel_task()
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=5)
         logger.info("预缓存调度器已停止")
-    
+
     def get_stats(self):
         """获取预缓存统计信息"""
-        return self.precache_stats.copy()
-    
-    def manual_precache(self, index_code='000300', max_stocks=50):
+        stats = self.precache_stats.copy()
+        if self._bucket is not None and stats.get('task_running'):
+            stats.update(self._bucket.get_stats())
+        return stats
+
+    def manual_precache(self, index_code='000300', max_stocks=50, resume=True):
         """手动执行预缓存任务"""
         logger.info("手动执行预缓存任务")
-        self.run_precache_task(index_code, max_stocks)
+        return self.run_precache_task(index_code, max_stocks, resume=resume)
 
 # 全局调度器实例
 precache_scheduler = StockPrecacheScheduler()
@@ -265,8 +468,8 @@ precache_scheduler = StockPrecacheScheduler()
 def init_precache_scheduler():
     """初始化预缓存调度器"""
     try:
-        # 安排每天凌晨12点执行预缓存
-        precache_scheduler.schedule_daily_precache("00:00", "000300")
+        # 安排每天凌晨12点执行预缓存（默认中证800）
+        precache_scheduler.schedule_daily_precache("00:00", PRECACHE_INDEX, PRECACHE_MAX_STOCKS)
         
         # 启动调度器
         precache_scheduler.start_scheduler()
@@ -10,11 +10,103 @@ stock_qa.py - 提供股票相关问题的智能问答功能，支持联网搜索
 
 import os
 import json
+import threading
+import time
 import traceback
 import openai
+from collections import OrderedDict
 from urllib.parse import urlparse
 from datetime import datetime
 
+from trading_calendar import MARKET_SESSIONS, get_last_trading_day, is_trading_day
+
+# 股票上下文（行情、指标、评分、支撑压力位、基本面）的缓存秒数，出现新K线时提前失效
+QA_CONTEXT_TTL = int(os.getenv('QA_CONTEXT_TTL', '300'))
+# 同时保留的对话数上限，超出时淘汰最久未使用的对话
+QA_MAX_CONVERSATIONS = int(os.getenv('QA_MAX_CONVERSATIONS', '1000'))
+# 对话闲置超过该秒数后淘汰
+QA_CONVERSATION_TTL = int(os.getenv('QA_CONVERSATION_TTL', '3600'))
+
+
+def latest_bar_date(market_type='A', now=None):
+    """当前应有的最新日K线日期：交易日开盘后为当天，否则为上一交易日"""
+    now = now or datetime.now()
+    today = now.date()
+    sessions = MARKET_SESSIONS.get(market_type, MARKET_SESSIONS['A'])
+    if is_trading_day(today, market_type) and now.time() >= sessions[0][0]:
+        return today
+    return get_last_trading_day(today, market_type)
+
+
+class ConversationStore:
+    """有界的对话历史存储：按最近使用排序，超出上限或闲置超时的对话被淘汰"""
+
+    def __init__(self, max_conversations=QA_MAX_CONVERSATIONS, ttl=QA_CONVERSATION_TTL):
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._items = OrderedDict()  # conversation_id -> (最近使用时间, 消息列表)
+
+    def _evict(self, now):
+        # 最久未使用的在队首，遇到未过期的即可停止
+        while self._items:
+            conversation_id, (last_used, _) = next(iter(self._items.items()))
+            if len(self._items) <= self.max_conversations and now - last_used <= self.ttl:
+                break
+            self._items.popitem(last=False)
+
+    def get(self, conversation_id, default=None):
+        with self.lock:
+            now = time.time()
+            self._evict(now)
+            if conversation_id not in self._items:
+                return default
+            messages = self._items[conversation_id][1]
+            self._items[conversation_id] = (now, messages)
+            self._items.move_to_end(conversation_id)
+            return messages
+
+    def __getitem__(self, conversation_id):
+        messages = self.get(conversation_id)
+        if messages is None:
+            raise KeyError(conversation_id)
+        return messages
+
+    def __setitem__(self, conversation_id, messages):
+        with self.lock:
+            now = time.time()
+            self._items[conversation_id] = (now, messages)
+            self._items.move_to_end(conversation_id)
+            self._evict(now)
+
+    def __delitem__(self, conversation_id):
+        with self.lock:
+            del self._items[conversation_id]
+
+    def pop(self, conversation_id, default=None):
+        """删除并返回对话消息；对话不存在或已被淘汰时返回 default，检查与删除在同一把锁内完成"""
+        with self.lock:
+            self._evict(time.time())
+            item = self._items.pop(conversation_id, None)
+            return default if item is None else item[1]
+
+    def __contains__(self, conversation_id):
+        return self.get(conversation_id) is not None
+
+    def __len__(self):
+        with self.lock:
+            self._evict(time.time())
+            return len(self._items)
+
+    def keys(self):
+        with self.lock:
+            self._evict(time.time())
+            return list(self._items.keys())
+
+    def clear(self):
+        with self.lock:
+            self._items.clear()
+
 
 class StockQA:
     def __init__(self, analyzer, openai_api_key=None, openai_model=None):
@@ -27,8 +119,15 @@ class StockQA:
         self.tavily_api_key = os.getenv('TAVILY_API_KEY')
         self.max_qa_rounds = int(os.getenv('MAX_QA', '10'))  # 默认保留10轮对话
         
-        # 对话历史存储 - 使用字典存储不同股票的对话历史
-        self.conversation_history = {}
+        # 对话历史存储 - 按对话ID保存，数量有上限，闲置过久自动淘汰
+        self.conversation_history = ConversationStore()
+
+        # 股票上下文缓存：(股票代码, 市场) -> (生成时间, 最新K线日期, 上下文)
+        self._context_cache = {}
+        self._context_lock = threading.Lock()
+
+        # 基本面分析器在首次提问时创建，之后复用（财务数据由数据访问层缓存）
+        self._fundamental_analyzer = None
         
         # 设置日志记录
         import logging
@@ -59,10 +158,12 @@ class StockQA:
                 conversation_id = f"{stock_code}_{uuid.uuid4().hex[:8]}"
             
             # 获取或创建对话历史
-            if clear_history or conversation_id not in self.conversation_history:
-                self.conversation_history[conversation_id] = []
+            history = None if clear_history else self.conversation_history.get(conversation_id)
+            if history is None:
+                history = []
+                self.conversation_history[conversation_id] = history
             
-            # 获取股票信息和技术指标 - 每次都获取最新数据
+            # 获取股票信息和技术指标 - 同一股票的追问复用缓存的上下文
             stock_context = self._get_stock_context(stock_code, market_type)
             stock_name = stock_context.get("stock_name", "未知")
                 
@@ -122,7 +223,7 @@ class StockQA:
             ]
             
             # 添加对话历史记录
-            messages.extend(self.conversation_history[conversation_id])
+            messages.extend(history)
             
             # 添加当前问题
             messages.append({"role": "user", "content": question})
@@ -190,13 +291,14 @@ class StockQA:
                 assistant_message = {"role": "assistant", "content": response_content}
             
             # 更新对话历史
-            self.conversation_history[conversation_id].append({"role": "user", "content": question})
-            self.conversation_history[conversation_id].append(assistant_message)
+            history.append({"role": "user", "content": question})
+            history.append(assistant_message)
             
             # 限制对话历史长度
-            if len(self.conversation_history[conversation_id]) > self.max_qa_rounds * 2:
+            if len(history) > self.max_qa_rounds * 2:
                 # 保留最近的MAX_QA轮对话
-                self.conversation_history[conversation_id] = self.conversation_history[conversation_id][-self.max_qa_rounds * 2:]
+                history = history[-self.max_qa_rounds * 2:]
+            self.conversation_history[conversation_id] = history
             
             # 返回结果
             return {
@@ -206,7 +308,7 @@ class StockQA:
                 "stock_code": stock_code,
                 "stock_name": stock_name,
                 "used_search_tool": used_search_tool,
-                "conversation_length": len(self.conversation_history[conversation_id]) // 2  # 轮数
+                "conversation_length": len(history) // 2  # 轮数
             }
 
         except Exception as e:
@@ -219,8 +321,34 @@ class StockQA:
                 "error": str(e)
             }
 
+    def _get_fundamental_analyzer(self):
+        """获取复用的基本面分析器"""
+        if self._fundamental_analyzer is None:
+            from fundamental_analyzer import FundamentalAnalyzer
+            self._fundamental_analyzer = FundamentalAnalyzer()
+        return self._fundamental_analyzer
+
     def _get_stock_context(self, stock_code, market_type='A'):
-        """获取股票上下文信息"""
+        """获取股票上下文信息，缓存 QA_CONTEXT_TTL 秒，出现新K线时重新生成"""
+        key = (stock_code, market_type)
+        bar_date = latest_bar_date(market_type)
+        with self._context_lock:
+            cached = self._context_cache.get(key)
+        if cached and cached[1] == bar_date and time.time() - cached[0] < QA_CONTEXT_TTL:
+            return cached[2]
+
+        stock_context = self._build_stock_context(stock_code, market_type)
+        if stock_context.get("error") is None:
+            with self._context_lock:
+                now = time.time()
+                # 顺带清理过期条目，避免缓存随股票数增长
+                for stale in [k for k, v in self._context_cache.items() if now - v[0] >= QA_CONTEXT_TTL]:
+                    del self._context_cache[stale]
+                self._context_cache[key] = (now, bar_date, stock_context)
+        return stock_context
+
+    def _build_stock_context(self, stock_code, market_type='A'):
+        """生成股票上下文信息"""
         try:
             # 获取股票信息
             stock_info = self.analyzer.get_stock_info(stock_code)
@@ -271,9 +399,7 @@ class StockQA:
 
             # 尝试获取基本面数据
             try:
-                # 导入基本面分析器
-                from fundamental_analyzer import FundamentalAnalyzer
-                fundamental = FundamentalAnalyzer()
+                fundamental = self._get_fundamental_analyzer()
 
                 # 获取基本面数据
                 indicators = fundamental.get_financial_indicators(stock_code)
@@ -301,7 +427,8 @@ class StockQA:
             return {
                 "context": f"无法获取股票 {stock_code} 的完整信息: {str(e)}",
                 "stock_name": "未知",
-                "industry": "未知"
+                "industry": "未知",
+                "error": str(e)
             }
 
     def clear_conversation(self, conversation_id=None, stock_code=None):
@@ -312,17 +439,15 @@ class StockQA:
             conversation_id: 指定要清除的对话ID
             stock_code: 指定要清除的股票相关的所有对话
         """
-        if conversation_id and conversation_id in self.conversation_history:
+        if conversation_id and self.conversation_history.pop(conversation_id) is not None:
             # 清除特定对话
-            del self.conversation_history[conversation_id]
             return {"message": f"已清除对话 {conversation_id}"}
             
         elif stock_code:
             # 清除与特定股票相关的所有对话
             removed = []
             for conv_id in list(self.conversation_history.keys()):
-                if conv_id.startswith(f"{stock_code}_"):
-                    del self.conversation_history[conv_id]
+                if conv_id.startswith(f"{stock_code}_") and self.conversation_history.pop(conv_id) is not None:
                     removed.append(conv_id)
             return {"message": f"已清除与股票 {stock_code} 相关的 {len(removed)} 个对话"}
             
@@ -355,11 +480,53 @@ class StockQA:
             "round_count": len(history)
         }
 
+    def _search_local_news(self, query, stock_code, industry, market_type='A'):
+        """在本地新闻库中检索，提到该股票的新闻不足 NEWS_LOCAL_MIN_HITS 条时返回 None"""
+        if market_type != 'A':
+            return None
+        try:
+            from news_fetcher import NEWS_LOCAL_MIN_HITS, news_fetcher
+            local = news_fetcher.search_stock_news(stock_code, industry=industry, query=query, limit=5)
+        except Exception as e:
+            self.logger.warning(f"本地新闻检索失败: {str(e)}")
+            return None
+        if len(local['news']) < NEWS_LOCAL_MIN_HITS:
+            return None
+
+        results = []
+        for item in (local['news'] + local['industry_news'])[:5]:
+            content = item['content'] or ''
+            results.append({
+                "title": item['title'] or content[:40],
+                "date": item['date'],
+                "source": "财联社",
+                "snippet": content,
+                "link": ""
+            })
+
+        summary_text = ""
+        for i, item in enumerate(results):
+            summary_text += f"{i+1}、{item['title']}\n"
+            summary_text += f"{item['snippet']}\n"
+            summary_text += f"来源: {item['source']} {item['date']}\n\n"
+
+        self.logger.info(f"本地新闻库找到 {len(results)} 条相关新闻，跳过远程搜索")
+        return {
+            "message": f"本地新闻库找到 {len(results)} 条相关新闻",
+            "results": results,
+            "summary": summary_text
+        }
+
     def search_stock_news(self, query, stock_name, stock_code, industry, market_type='A'):
         """搜索股票相关新闻和实时信息"""
         try:
             self.logger.info(f"搜索股票新闻: {query}")
             
+            # 先查本地新闻库，有提到该股票或命中查询词的新闻时不再远程搜索
+            local_results = self._search_local_news(query, stock_code, industry, market_type)
+            if local_results:
+                return local_results
+
             # 确定市场名称
             market_name = "A股" if market_type == 'A' else "港股" if market_type == 'HK' else "美股"
             
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享分析线程池测试
+验证全指数分析的并发上限与成分股缓存、作业间轮转调度、超时取消、进度统计以及结束作业的保留时长和游标轮询
+"""
+
+import threading
+import time
+
+import data_provider
+from analysis_executor import AnalysisExecutor, analysis_executor
+from data_provider import ReplayProvider, set_data_provider
+
+
+class FakeAnalyzer:
+    """记录同时执行的分析数量"""
+
+    def __init__(self, delay=0.002):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.calls = 0
+
+    def quick_analyze_stock(self, stock_code, market_type='A'):
+        with self.lock:
+            self.running += 1
+            self.calls += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        return {'stock_code': stock_code, 'score': int(stock_code) % 100,
+                'price_change': int(stock_code) % 7 - 3}
+
+
+def test_full_index_runs_on_bounded_pool():
+    """中证1000全部成分股在固定线程数内完成，成分股列表只获取一次"""
+    from index_industry_analyzer import IndexIndustryAnalyzer
+
+    original = data_provider._provider
+    provider = ReplayProvider(seed=45)
+    set_data_provider(provider)
+    fake = FakeAnalyzer()
+    threads_before = threading.active_count()
+    try:
+        analyzer = IndexIndustryAnalyzer(fake)
+        full = analyzer.analyze_index('000852', limit=None)
+        top = analyzer.analyze_index('000852', limit=50)
+        calls = provider.get_stats()['endpoints']['index_stock_cons_weight_csindex']['calls']
+    finally:
+        data_provider._provider = original
+
+    assert full['stock_count'] == 1000 and full['partial'] is False
+    assert top['stock_count'] == 50
+    assert fake.calls == 1050
+    assert calls <= 1
+    assert fake.max_running <= analysis_executor.max_workers
+    assert threading.active_count() - threads_before <= analysis_executor.max_workers
+    # limit 取权重最大的成分股
+    assert min(r['weight'] for r in top['results']) >= max(
+        r['weight'] for r in full['results'] if r['stock_code'] not in {t['stock_code'] for t in top['results']})
+
+
+def test_jobs_share_workers_round_robin():
+    """后提交的小作业不必等前面的大作业全部完成"""
+    executor = AnalysisExecutor(max_workers=1, rate=1000, burst=1000)
+    order = []
+
+    def work(tag):
+        order.append(tag)
+        time.sleep(0.002)
+        return tag
+
+    big = executor.submit('big', work, [(f'a{i}',) for i in range(20)])
+    small = executor.submit('small', work, [(f'b{i}',) for i in range(3)])
+    assert small.wait(5) and big.wait(5)
+
+    assert big.results == [f'a{i}' for i in range(20)]
+    assert max(order.index(f'b{i}') for i in range(3)) < 10
+
+
+def test_timeout_cancels_remaining_items():
+    """等待超时后取消未开始的项，已完成的结果保留，失败单独计数"""
+    executor = AnalysisExecutor(max_workers=2, rate=1000, burst=1000)
+
+    def work(i):
+        if i == 0:
+            raise ValueError('bad stock')
+        time.sleep(0.01)
+        return i
+
+    start_time = time.perf_counter()
+    job = executor.run('slow', work, [(i,) for i in range(200)], timeout=0.1)
+    elapsed = time.perf_counter() - start_time
+
+    progress = executor.get_job(job.job_id)
+    assert job.cancelled and elapsed < 0.5
+    assert progress['status'] == 'cancelled' and progress['pending'] == 0 and progress['running'] == 0
+    assert job.failed == 1 and 0 < job.completed < 199
+    assert job.results.count(None) == 200 - job.completed
+    assert executor.get_stats()['cancelled_jobs'] == 1
+    assert executor.cancel(job.job_id) is False
+
+
+def test_finished_jobs_kept_by_retention_and_polled_by_cursor():
+    """结束的作业按保留时长查询，不因其他作业结束被挤掉；按游标只返回新完成的项"""
+    executor = AnalysisExecutor(max_workers=2, rate=1000, burst=1000, retention=0.3)
+
+    def work(i):
+        if i == 3:
+            raise ValueError('bad stock')
+        return i * 10
+
+    job = executor.submit('big', work, [(i,) for i in range(10)])
+    assert job.wait(5)
+    for n in range(30):
+        executor.run(f'small-{n}', work, [(0,)])
+
+    first = executor.get_job_results(job.job_id)
+    assert first['status'] == 'completed' and first['next_cursor'] == 10
+    assert sorted(item['index'] for item in first['results']) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert all(item['result'] == item['index'] * 10 for item in first['results'])
+    assert first['errors'] == {3: 'bad stock'}
+
+    later = executor.get_job_results(job.job_id, first['next_cursor'])
+    assert later['results'] == [] and later['errors'] == {} and later['next_cursor'] == 10
+    partial = executor.get_job_results(job.job_id, 7)
+    assert len(partial['results']) + len(partial['errors']) == 3
+
+    time.sleep(0.4)
+    assert executor.get_job_results(job.job_id) is None
+    assert executor.get_job(job.job_id) is None
+
+
+if __name__ == "__main__":
+    print("🚀 共享分析线程池测试")
+    print("=" * 40)
+    test_full_index_runs_on_bounded_pool()
+    test_jobs_share_workers_round_robin()
+    test_timeout_cancels_remaining_items()
+    test_finished_jobs_kept_by_retention_and_polled_by_cursor()
+    print("✅ 全部通过")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评分系统向量化回测测试
+验证评分面板与 StockAnalyzer.calculate_score 一致、停牌处理、交易成本和大股票池性能
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backtest_engine import (ACTIONS, VectorizedBacktester, compute_indicator_panel, compute_score_panel,
+                             load_price_history, score_to_action_codes)
+from database import Base, StockPriceHistory
+from stock_analyzer import StockAnalyzer
+
+
+def _synthetic_prices(n_stocks, n_days, seed=0, drop_days=0):
+    """生成随机游走行情长表，可随机删除部分交易日模拟停牌"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2021-01-04', periods=n_days)
+    frames = []
+    for i in range(n_stocks):
+        returns = rng.normal(0.0003, 0.02, n_days)
+        close = 10 * np.cumprod(1 + returns)
+        spread = np.abs(rng.normal(0, 0.01, n_days)) * close
+        frame = pd.DataFrame({
+            'stock_code': f'{600000 + i}',
+            'date': dates,
+            'open': close * (1 + rng.normal(0, 0.005, n_days)),
+            'high': close + spread,
+            'low': close - spread,
+            'close': close,
+            'volume': rng.uniform(1e5, 5e5, n_days)
+        })
+        if drop_days:
+            frame = frame.drop(rng.choice(np.arange(70, n_days), drop_days, replace=False))
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_score_panel_matches_stock_analyzer():
+    """每个截面的评分和建议动作与单只股票逐日调用 calculate_score 一致（含停牌缺口）"""
+    prices = _synthetic_prices(3, 160, seed=7, drop_days=10)
+    dense, ind = compute_indicator_panel(prices)
+    score = compute_score_panel(ind, 'A')
+    actions = score_to_action_codes(score.to_numpy(), ind['Volatility'].to_numpy(), 'A', ind['RSI'].to_numpy(),
+                                    ind['MACD'].to_numpy() > ind['Signal'].to_numpy())
+
+    analyzer = StockAnalyzer()
+    for column, code in enumerate(dense.codes):
+        df = prices[prices['stock_code'] == code].sort_values('date').reset_index(drop=True)
+        df = analyzer.calculate_indicators(df)
+        for row in range(61, len(df), 7):
+            expected = analyzer.calculate_score(df.iloc[:row + 1].copy(), 'A')
+            assert score.iat[row, column] == expected, (code, row)
+            latest = df.iloc[row]
+            tech_data = {
+                'RSI': latest['RSI'],
+                'MACD_signal': 'bullish' if latest['MACD'] > latest['Signal'] else 'bearish',
+                'Volatility': latest['Volatility']
+            }
+            recommendation = analyzer.get_recommendation(expected, 'A', tech_data)
+            assert recommendation.split(' ')[0] == _action_label(int(actions[row, column])), (code, row)
+
+
+def _action_label(code):
+    labels = {
+        'strong_buy': '强烈建议买入', 'buy': '建议买入', 'cautious_buy': '谨慎买入',
+        'hold': '持观望态度', 'cautious_hold': '谨慎持有', 'reduce': '建议减仓', 'sell': '建议卖出'
+    }
+    return labels[ACTIONS[code]]
+
+
+def test_transaction_costs_reduce_returns():
+    """相同信号下交易成本降低总收益，换手和仓位统计有效"""
+    prices = _synthetic_prices(20, 300, seed=3)
+    free = VectorizedBacktester(commission=0, slippage=0, sell_tax=0).run(prices=prices, start_date='2021-06-01')
+    costly = VectorizedBacktester(commission=0.003, slippage=0.002).run(prices=prices, start_date='2021-06-01')
+
+    assert free['trading_days'] == costly['trading_days']
+    assert costly['stats']['total_return'] < free['stats']['total_return']
+    assert free['stats']['avg_daily_turnover'] > 0
+    assert 0 < free['stats']['avg_exposure'] <= 100
+    assert sum(b['samples'] for b in free['score_analysis']['buckets']) > 0
+
+
+def test_load_price_history_from_cache_table():
+    """从 StockPriceHistory 一次读取整个股票池"""
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    prices = _synthetic_prices(2, 30, seed=1)
+
+    session = factory()
+    session.add_all([
+        StockPriceHistory(stock_code=row.stock_code, market_type='A', trade_date=row.date.strftime('%Y%m%d'),
+                          open_price=row.open, high_price=row.high, low_price=row.low,
+                          close_price=row.close, volume=int(row.volume))
+        for row in prices.itertuples()
+    ])
+    session.commit()
+    session.close()
+
+    loaded = load_price_history(['600000', '600001', '999999'], '2021-01-01', '2021-01-31',
+                                session_factory=factory)
+    assert set(loaded['stock_code']) == {'600000', '600001'}
+    assert loaded['date'].max() <= pd.Timestamp('2021-01-31')
+    assert np.allclose(loaded.sort_values(['stock_code', 'date'])['close'].to_numpy(),
+                       prices[prices['date'] <= '2021-01-31']['close'].to_numpy(), atol=1e-3)
+
+
+def test_large_universe_runs_in_seconds():
+    """300只股票 × 3年的完整回测在数秒内完成"""
+    prices = _synthetic_prices(300, 750, seed=11, drop_days=5)
+    start_time = time.time()
+    result = VectorizedBacktester().run(prices=prices, start_date='2021-06-01')
+    elapsed = time.time() - start_time
+    print(f"300只股票 × 750日回测耗时: {elapsed:.2f}秒 {result['timings']}")
+
+    assert result['stock_count'] == 300
+    assert elapsed < 10
+
+
+if __name__ == "__main__":
+    print("🚀 评分系统向量化回测测试")
+    print("=" * 40)
+    test_score_panel_matches_stock_analyzer()
+    test_transaction_costs_reduce_returns()
+    test_load_price_history_from_cache_table()
+    test_large_universe_runs_in_seconds()
+    print("✅ 全部通过")
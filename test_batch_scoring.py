@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量评分引擎测试
+验证整表计算的评分与逐只计算一致、缓存充足时不访问上游且100只在1秒内完成、
+数据不足单独报错、港股大陆市场情绪每批只取一次，以及后台任务的进度、结果、并发上限和取消
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import data_provider
+from batch_scoring import BatchScoringEngine
+from data_provider import ReplayProvider, set_data_provider
+from data_service import data_service
+
+CODES = [f'{601000 + i:06d}' for i in range(100)]
+
+
+def _with_replay(seed, func):
+    """在回放数据源下执行 func(provider)"""
+    original = data_provider._provider
+    provider = ReplayProvider(seed=seed)
+    set_data_provider(provider)
+    try:
+        return func(provider)
+    finally:
+        data_provider._provider = original
+
+
+def _warm(codes):
+    """按单只路径预热日线和基本信息缓存"""
+    for code in codes:
+        data_service.get_stock_price_history(code, 'A')
+        data_service.get_stock_basic_info(code, 'A')
+
+
+def test_scores_match_single_stock_path():
+    """整表计算的评分、分项得分和报告字段与 StockAnalyzer 逐只计算一致"""
+    from stock_analyzer import StockAnalyzer
+
+    analyzer = StockAnalyzer()
+    engine = BatchScoringEngine(analyzer)
+
+    def run(provider):
+        scored = engine.score_stocks(CODES[:40])
+        expected = {}
+        for code in CODES[:40]:
+            df = analyzer.calculate_indicators(analyzer.get_stock_data(code))
+            expected[code] = (analyzer.calculate_score(df), dict(analyzer.score_details), df)
+        return scored, expected
+
+    scored, expected = _with_replay(48, run)
+
+    assert not scored['errors'] and [r['stock_code'] for r in scored['results']] == CODES[:40]
+    for report in scored['results']:
+        score, details, df = expected[report['stock_code']]
+        latest, prev = df.iloc[-1], df.iloc[-2]
+        assert report['score'] == score
+        assert report['score_details'] == details
+        assert report['price'] == float(latest['close'])
+        assert report['price_change'] == float((latest['close'] - prev['close']) / prev['close'] * 100)
+        assert report['ma_trend'] == ('UP' if latest['MA5'] > latest['MA20'] else 'DOWN')
+        assert report['recommendation'] == analyzer.get_recommendation(score)
+
+
+def test_warm_batch_skips_upstream():
+    """缓存充足时100只股票不访问上游，1秒内完成；只有缺失的股票被补齐"""
+    engine = BatchScoringEngine()
+
+    def run(provider):
+        _warm(CODES[:-5])
+        warmed = provider.get_stats()['endpoints']['stock_zh_a_hist']['calls']
+        start_time = time.perf_counter()
+        warm = engine.score_stocks(CODES[:-5])
+        elapsed = time.perf_counter() - start_time
+        calls_after_warm = provider.get_stats()['endpoints']['stock_zh_a_hist']['calls']
+        mixed = engine.score_stocks(CODES)
+        calls_after_mixed = provider.get_stats()['endpoints']['stock_zh_a_hist']['calls']
+        return warmed, warm, elapsed, calls_after_warm, mixed, calls_after_mixed
+
+    warmed, warm, elapsed, calls_after_warm, mixed, calls_after_mixed = _with_replay(49, run)
+
+    assert calls_after_warm == warmed
+    assert warm['stats']['cache_hits'] == 95 and warm['stats']['fetched'] == 0
+    assert elapsed < 1.0
+    assert calls_after_mixed - calls_after_warm == 5
+    assert mixed['stats']['cache_hits'] == 95 and mixed['stats']['fetched'] == 5
+    assert len(mixed['results']) == 100
+
+
+def test_short_history_reported_as_error():
+    """只有一根K线的股票单独报错，不影响其他股票"""
+    engine = BatchScoringEngine()
+    start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    end_date = datetime.now().strftime('%Y-%m-%d')
+    short = pd.DataFrame({'date': [pd.Timestamp(end_date)], 'open': [10.0], 'close': [10.0],
+                          'high': [10.0], 'low': [10.0], 'volume': [1000.0]})
+    data_service._set_memory_cache(data_service._get_cache_key(
+        'price_history', stock_code='699999', market_type='A', start_date=start_date, end_date=end_date), short)
+
+    def run(provider):
+        _warm(CODES[:3])
+        return engine.score_stocks(['699999'] + CODES[:3])
+
+    scored = _with_replay(50, run)
+
+    assert list(scored['errors']) == ['699999'] and '数据不足' in scored['errors']['699999']
+    assert [r['stock_code'] for r in scored['results']] == CODES[:3]
+
+
+def test_async_task_reports_progress_and_result():
+    """后台任务模式立即返回任务ID，完成后结果写入任务管理器"""
+    from 任务存储不一致问题完整解决方案 import task_manager
+
+    engine = BatchScoringEngine()
+
+    def run(provider):
+        _warm(CODES[:20])
+        task_id = engine.start_task(task_manager, CODES[:20], 'A',
+                                    lambda scored: {'count': len(scored['results'])})
+        deadline = time.time() + 10
+        while task_manager.get_task(task_id)['status'] in ('pending', 'running') and time.time() < deadline:
+            time.sleep(0.05)
+        return task_manager.get_task(task_id)
+
+    task = _with_replay(51, run)
+
+    assert task['type'] == 'batch_score' and task['status'] == 'completed'
+    assert task['progress'] == 100 and task['result'] == {'count': 20}
+
+
+def test_task_runs_in_submitter_context():
+    """后台任务继承提交方的上下文：追踪 span 和上游令牌预算在任务内可见"""
+    from data_service import _upstream_budget, upstream_budget
+    from tracing import _current_span, start_trace
+    from 任务存储不一致问题完整解决方案 import task_manager
+
+    engine = BatchScoringEngine()
+    budget = object()
+
+    def run(provider):
+        _warm(CODES[:3])
+        seen = {}
+
+        def finalize(scored):
+            seen.update(budget=_upstream_budget.get(), span=_current_span.get())
+            return {}
+
+        with start_trace('test.batch_score') as trace, upstream_budget(budget):
+            task_id = engine.start_task(task_manager, CODES[:3], 'A', finalize)
+        deadline = time.time() + 10
+        while task_manager.get_task(task_id)['status'] in ('pending', 'running') and time.time() < deadline:
+            time.sleep(0.05)
+        return trace, seen
+
+    trace, seen = _with_replay(54, run)
+
+    assert seen['budget'] is budget
+    assert seen['span'] is not None and seen['span'].trace is trace
+
+
+def test_hk_sentiment_fetched_once_per_batch():
+    """港股的A股联动调整与逐只计算一致，大陆市场情绪每批只取一次"""
+    from stock_analyzer import StockAnalyzer
+
+    class CountingAnalyzer(StockAnalyzer):
+        sentiment_calls = 0
+
+        def _check_a_share_linkage(self, df, window=20):
+            return 0.8
+
+        def _get_mainland_market_sentiment(self):
+            CountingAnalyzer.sentiment_calls += 1
+            return -0.3
+
+    analyzer = CountingAnalyzer()
+    engine = BatchScoringEngine(analyzer)
+    codes = [f'{700 + i:05d}' for i in range(12)]
+
+    def run(provider):
+        scored = engine.score_stocks(codes, 'HK')
+        batch_calls = CountingAnalyzer.sentiment_calls
+        expected = {code: analyzer.calculate_score(analyzer.calculate_indicators(analyzer.get_stock_data(code, 'HK')),
+                                                   'HK')
+                    for code in codes}
+        return scored, batch_calls, expected
+
+    scored, batch_calls, expected = _with_replay(52, run)
+
+    assert batch_calls == 1
+    assert len(scored['results']) == len(codes)
+    assert {r['stock_code']: r['score'] for r in scored['results']} == expected
+
+
+def test_tasks_bounded_and_cancellable():
+    """后台任务在有界线程池中排队；排队中的任务立即取消，执行中的任务停止补齐剩余股票"""
+    from 任务存储不一致问题完整解决方案 import task_manager
+
+    engine = BatchScoringEngine(task_workers=1)
+    cold = [f'{688000 + i:06d}' for i in range(40)]
+
+    def run(provider):
+        provider.latency_ms = 50
+        running_id = engine.start_task(task_manager, cold, 'A', lambda scored: {'count': len(scored['results'])})
+        queued_id = engine.start_task(task_manager, CODES[:5], 'A', lambda scored: {})
+        deadline = time.time() + 5
+        while task_manager.get_task(running_id)['status'] != 'running' and time.time() < deadline:
+            time.sleep(0.01)
+        queued_status = task_manager.get_task(queued_id)['status']
+        assert engine.cancel_task(task_manager, queued_id)
+        time.sleep(0.3)
+        assert engine.cancel_task(task_manager, running_id)
+        deadline = time.time() + 10
+        while task_manager.get_task(running_id)['status'] == 'running' and time.time() < deadline:
+            time.sleep(0.05)
+        calls = provider.get_stats()['endpoints']['stock_zh_a_hist']['calls']
+        return running_id, queued_status, task_manager.get_task(queued_id), task_manager.get_task(running_id), calls
+
+    running_id, queued_status, queued, running, calls = _with_replay(53, run)
+
+    assert queued_status == 'pending' and queued['status'] == 'cancelled'
+    assert running['status'] == 'cancelled' and calls < len(cold)
+    assert engine.get_stats()['active_tasks'] == 0
+    assert engine.cancel_task(task_manager, running_id) is False
+
+
+if __name__ == "__main__":
+    print("🚀 批量评分引擎测试")
+    print("=" * 40)
+    test_scores_match_single_stock_path()
+    test_warm_batch_skips_upstream()
+    test_short_history_reported_as_error()
+    test_async_task_reports_progress_and_result()
+    test_task_runs_in_submitter_context()
+    test_hk_sentiment_fetched_once_per_batch()
+    test_tasks_bounded_and_cancellable()
+    print("✅ 全部通过")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量UPSERT测试
+使用内存SQLite验证快照表的插入、更新、去重和旧库唯一索引补齐
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, StockBasicInfo, StockRealtimeData, bulk_upsert, ensure_upsert_constraints
+
+
+def _make_engine():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def test_bulk_upsert_inserts_then_updates():
+    """同一批股票二次保存时只更新，不产生重复记录"""
+    engine = _make_engine()
+    rows = [{'stock_code': f'{i:06d}', 'market_type': 'A', 'current_price': 10.0 + i}
+            for i in range(120)]
+
+    assert bulk_upsert(StockRealtimeData, rows, bind=engine, chunk_size=50) == 120
+
+    session = sessionmaker(bind=engine)()
+    created_at = session.query(StockRealtimeData).filter_by(stock_code='000001').one().created_at
+    session.close()
+
+    updated = [dict(r, current_price=r['current_price'] + 1, unknown_field='x') for r in rows]
+    bulk_upsert(StockRealtimeData, updated, bind=engine, chunk_size=50)
+
+    session = sessionmaker(bind=engine)()
+    assert session.query(StockRealtimeData).count() == 120
+    record = session.query(StockRealtimeData).filter_by(stock_code='000001').one()
+    assert float(record.current_price) == 12.0
+    assert record.created_at == created_at
+    session.close()
+
+
+def test_bulk_upsert_dedups_and_keeps_markets_apart():
+    """批内重复保留最后一条，不同市场相同代码互不覆盖"""
+    engine = _make_engine()
+    rows = [
+        {'stock_code': '00700', 'market_type': 'HK', 'stock_name': '旧名'},
+        {'stock_code': '00700', 'market_type': 'HK', 'stock_name': '腾讯控股'},
+        {'stock_code': '00700', 'market_type': 'A', 'stock_name': '其他'},
+    ]
+    assert bulk_upsert(StockBasicInfo, rows, bind=engine) == 2
+
+    session = sessionmaker(bind=engine)()
+    assert session.query(StockBasicInfo).count() == 2
+    hk = session.query(StockBasicInfo).filter_by(market_type='HK').one()
+    assert hk.stock_name == '腾讯控股'
+    session.close()
+
+
+def test_ensure_upsert_constraints_repairs_legacy_table():
+    """旧库的重复记录被合并并补齐唯一索引"""
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE stock_realtime_data_cache (id INTEGER PRIMARY KEY, stock_code VARCHAR(10), "
+            "market_type VARCHAR(5), current_price NUMERIC, change_amount NUMERIC, change_pct FLOAT, "
+            "volume FLOAT, amount FLOAT, turnover_rate FLOAT, pe_ratio FLOAT, pb_ratio FLOAT, "
+            "created_at DATETIME, updated_at DATETIME, expires_at DATETIME)"
+        ))
+        for price in (1, 2, 3):
+            conn.execute(text(
+                "INSERT INTO stock_realtime_data_cache (stock_code, market_type, current_price) "
+                f"VALUES ('000001', 'A', {price})"
+            ))
+
+    ensure_upsert_constraints(bind=engine)
+
+    indexes = inspect(engine).get_indexes('stock_realtime_data_cache')
+    assert any(idx['unique'] for idx in indexes)
+
+    bulk_upsert(StockRealtimeData, [{'stock_code': '000001', 'market_type': 'A', 'current_price': 9,
+                                     'expires_at': datetime.now() + timedelta(minutes=5)}], bind=engine)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT current_price FROM stock_realtime_data_cache")).fetchall()
+    assert len(rows) == 1
+    assert float(rows[0][0]) == 9
+
+
+if __name__ == "__main__":
+    print("🚀 批量UPSERT测试")
+    print("=" * 40)
+    test_bulk_upsert_inserts_then_updates()
+    test_bulk_upsert_dedups_and_keeps_markets_apart()
+    test_ensure_upsert_constraints_repairs_legacy_table()
+    print("✅ 全部通过")
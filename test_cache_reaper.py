@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+过期缓存增量清理器测试
+使用内存SQLite验证分块删除和统计，不依赖外部数据库
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, StockRealtimeData, StockBasicInfo, StockPriceHistory, add_missing_columns
+from cache_reaper import ExpiredCacheReaper
+
+
+def _make_reaper(chunk_size=50):
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    reaper = ExpiredCacheReaper(session_factory=factory, chunk_size=chunk_size, pause_seconds=0)
+    return reaper, factory
+
+
+def test_reap_deletes_only_expired_rows_in_chunks():
+    """过期记录分块删除，未过期记录保留"""
+    reaper, factory = _make_reaper(chunk_size=50)
+    now = datetime.now()
+
+    session = factory()
+    for i in range(230):
+        session.add(StockRealtimeData(stock_code=f'{i:06d}', market_type='A',
+                                      expires_at=now - timedelta(minutes=1)))
+    for i in range(20):
+        session.add(StockRealtimeData(stock_code=f'9{i:05d}', market_type='A',
+                                      expires_at=now + timedelta(hours=1)))
+        session.add(StockBasicInfo(stock_code=f'9{i:05d}', market_type='A',
+                                   expires_at=now - timedelta(days=1)))
+    session.commit()
+    session.close()
+
+    stats = reaper.run_once()
+    print(f"清理统计: {stats}")
+
+    assert stats['tables']['realtime']['deleted'] == 230
+    assert stats['tables']['realtime']['chunks'] == 5
+    assert stats['tables']['basic_info']['deleted'] == 20
+    assert stats['total_deleted'] == 250
+    assert 'rows_per_sec' in stats
+
+    session = factory()
+    assert session.query(StockRealtimeData).count() == 20
+    assert session.query(StockBasicInfo).count() == 0
+    session.close()
+
+
+def test_reap_respects_deadline():
+    """达到单次时间上限时停止并标记截断"""
+    reaper, factory = _make_reaper(chunk_size=10)
+    reaper.max_seconds_per_run = 0.000001
+    now = datetime.now()
+
+    session = factory()
+    for i in range(50):
+        session.add(StockRealtimeData(stock_code=f'{i:06d}', market_type='A',
+                                      expires_at=now - timedelta(minutes=1)))
+    session.commit()
+    session.close()
+
+    stats = reaper.run_once()
+    assert stats['truncated'] is True
+    assert stats['total_deleted'] < 50
+
+
+def test_after_close_window():
+    """收盘后窗口判断"""
+    reaper, _ = _make_reaper()
+    saturday = datetime(2024, 3, 2, 10, 0)
+    assert reaper.is_after_close(saturday)
+
+
+def test_price_history_reap_uses_created_at_index():
+    """历史价格按写入时间分块清理走 created_at 索引；旧库启动时补建该索引"""
+    reaper, factory = _make_reaper(chunk_size=10)
+    engine = factory.kw['bind']
+    now = datetime.now()
+
+    session = factory()
+    for i in range(25):
+        session.add(StockPriceHistory(stock_code=f'{i:06d}', market_type='A', trade_date=now.date(),
+                                      created_at=now - timedelta(days=40 if i < 15 else 1)))
+    session.commit()
+    chunk_query = session.query(StockPriceHistory.id).filter(
+        StockPriceHistory.created_at < now - timedelta(days=30)
+    ).order_by(StockPriceHistory.created_at).limit(10)
+    sql = str(chunk_query.statement.compile(engine, compile_kwargs={'literal_binds': True}))
+    session.close()
+
+    with engine.connect() as conn:
+        plan = ' '.join(str(row) for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+    assert 'idx_price_created_at' in plan
+
+    deleted, chunks = reaper.reap_table(StockPriceHistory, 'created_at', now - timedelta(days=30))
+    assert deleted == 15 and chunks == 2
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX idx_price_created_at"))
+    add_missing_columns(engine)
+    indexes = {idx['name'] for idx in inspect(engine).get_indexes('stock_price_history_cache')}
+    assert 'idx_price_created_at' in indexes
+
+
+if __name__ == "__main__":
+    print("🚀 过期缓存增量清理器测试")
+    print("=" * 40)
+    test_reap_deletes_only_expired_rows_in_chunks()
+    test_reap_respects_deadline()
+    test_after_close_window()
+    test_price_history_reap_uses_created_at_index()
+    print("✅ 全部通过")
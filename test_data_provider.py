@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可插拔数据提供者测试
+验证回放数据的确定性、失败注入、录制回放往返、DataService 与分析器/接口/新闻抓取接入和基准回退判定
+"""
+
+import tempfile
+
+import pandas as pd
+import pytest
+
+import data_provider
+from benchmark_suite import compare_with_baseline
+from data_provider import (InjectedFailure, RecordingProvider, ReplayDataMissing, ReplayProvider,
+                           get_data_provider, set_data_provider)
+
+
+def test_synthetic_history_is_deterministic_and_range_independent():
+    """同一种子、同一代码同一日期的行情与请求区间无关"""
+    first = ReplayProvider(seed=7).stock_zh_a_hist(symbol='600519', start_date='20240101', end_date='20240630')
+    wide = ReplayProvider(seed=7).stock_zh_a_hist(symbol='600519', start_date='20230101', end_date='20241231')
+    other_seed = ReplayProvider(seed=8).stock_zh_a_hist(symbol='600519', start_date='20240101', end_date='20240630')
+
+    assert list(first.columns[:8]) == ['日期', '股票代码', '开盘', '收盘', '最高', '最低', '成交量', '成交额']
+    overlap = wide[wide['日期'].isin(first['日期'])].reset_index(drop=True)
+    pd.testing.assert_frame_equal(first, overlap)
+    assert not first['收盘'].equals(other_seed['收盘'])
+    assert (first['最高'] >= first['最低']).all()
+
+
+def test_failure_injection_is_deterministic():
+    """失败由 (接口, 参数, 调用次数) 决定，两次运行完全一致"""
+    def outcomes():
+        provider = ReplayProvider(failure_rate=0.5, seed=3)
+        result = []
+        for code in ('000001', '000002', '600000', '600036') * 3:
+            try:
+                provider.stock_individual_info_em(symbol=code)
+                result.append(True)
+            except InjectedFailure:
+                result.append(False)
+        return result, provider.get_stats()['endpoints']['stock_individual_info_em']
+
+    first, stats = outcomes()
+    second, _ = outcomes()
+    assert first == second
+    assert 0 < first.count(False) < len(first)
+    assert stats['failures'] == first.count(False)
+
+
+def test_recording_round_trip_and_missing_endpoint():
+    """录制的数据在回放时优先返回；没有录制也不支持模拟的接口报错"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        source = ReplayProvider(seed=1)
+        recorder = RecordingProvider(source, data_dir)
+        recorded = recorder.stock_zh_a_hist(symbol='000001', start_date='20240101', end_date='20240131')
+
+        replay = ReplayProvider(data_dir=data_dir, seed=99)
+        replayed = replay.stock_zh_a_hist(symbol='000001', start_date='20240101', end_date='20240131')
+        pd.testing.assert_frame_equal(recorded, replayed)
+        assert replay.get_stats()['endpoints']['stock_zh_a_hist']['recorded'] == 1
+
+        with pytest.raises(ReplayDataMissing):
+            replay.stock_board_concept_name_em()
+
+
+def test_data_service_reads_through_provider():
+    """DataService 通过全局提供者获取行情和基本信息"""
+    from data_service import data_service
+
+    original = data_provider._provider
+    provider = ReplayProvider(seed=5)
+    set_data_provider(provider)
+    try:
+        assert get_data_provider() is provider
+        df = data_service._fetch_api_price_data('600010', 'A', '2024-01-01', '2024-03-31')
+        info = data_service.get_stock_basic_info('600010', 'A', use_advanced_cache=False)
+    finally:
+        data_provider._provider = original
+
+    assert {'date', 'open', 'close', 'high', 'low', 'volume'} <= set(df.columns)
+    assert len(df) > 40
+    assert info['stock_name'] == '模拟600010'
+    assert provider.get_stats()['endpoints']['stock_zh_a_hist']['synthetic'] == 1
+
+
+def test_analyzer_endpoints_served_by_provider():
+    """北向持股、行业资金流、行业成分股和行业比较都经由提供者，回放模式下不访问网络"""
+    from industry_analyzer import IndustryAnalyzer
+    from stock_analyzer import StockAnalyzer
+
+    original = data_provider._provider
+    provider = ReplayProvider(seed=6)
+    set_data_provider(provider)
+    try:
+        north = StockAnalyzer().get_north_flow_history('600010')
+        industry = IndustryAnalyzer()
+        flow = industry.get_industry_fund_flow('即时')
+        stage_flow = industry.get_industry_fund_flow('5日')
+        members = industry.get_industry_stocks('银行')
+        compared = industry.compare_industries(limit=3)
+    finally:
+        data_provider._provider = original
+
+    assert len(north['history']) == 90 and north['history'][0]['holding'] > 0
+    assert flow and flow[0]['rank'] == 1 and 'leadingStock' in flow[0]
+    assert stage_flow and 'leadingStock' not in stage_flow[0]
+    assert members
+    assert compared['count'] == 3
+    # 行业比较的板块日线经由数据访问层按日缓存（见 test_industry_compare），此处不要求一定访问提供者
+    endpoints = provider.get_stats()['endpoints']
+    for endpoint in ('stock_hsgt_hist_em', 'stock_fund_flow_industry', 'stock_board_industry_cons_em',
+                     'stock_board_industry_name_em'):
+        assert endpoints[endpoint]['synthetic'] == endpoints[endpoint]['calls'] > 0
+    history = endpoints.get('stock_board_industry_hist_em', {'synthetic': 0, 'calls': 0})
+    assert history['synthetic'] == history['calls']
+
+
+def test_constituent_routes_and_news_fetch_served_by_provider():
+    """指数/行业成分股接口和财联社电报抓取经由提供者，回放模式下不访问网络"""
+    from news_fetcher import NewsFetcher
+    from web_server import app
+
+    original = data_provider._provider
+    provider = ReplayProvider(seed=6)
+    set_data_provider(provider)
+    try:
+        client = app.test_client()
+        index = client.get('/api/index_stocks?index_code=000905')
+        industry = client.get('/api/industry_stocks?industry=银行')
+        with tempfile.TemporaryDirectory() as save_dir:
+            fetcher = NewsFetcher(save_dir=save_dir)
+            assert fetcher.fetch_and_save()
+            assert fetcher.store.count() == 20
+            fetcher.store.close()
+    finally:
+        data_provider._provider = original
+
+    assert index.status_code == 200 and len(index.get_json()['stock_list']) == 500
+    assert industry.status_code == 200 and industry.get_json()['stock_list']
+    endpoints = provider.get_stats()['endpoints']
+    for endpoint in ('index_stock_cons_weight_csindex', 'stock_board_industry_cons_em', 'stock_info_global_cls'):
+        assert endpoints[endpoint]['synthetic'] == endpoints[endpoint]['calls'] > 0
+
+
+def test_baseline_comparison_flags_regressions():
+    """p95 或吞吐量超出容差时判定为回退"""
+    baseline = {'scenarios': {'analyze': {'p95_ms': 100.0, 'throughput_rps': 10.0, 'errors': 0}}}
+    ok = {'scenarios': {'analyze': {'p95_ms': 140.0, 'throughput_rps': 9.0, 'errors': 0}}}
+    slow = {'scenarios': {'analyze': {'p95_ms': 200.0, 'throughput_rps': 5.0, 'errors': 1}}}
+
+    assert compare_with_baseline(ok, baseline, tolerance=0.25) == []
+    assert len(compare_with_baseline(slow, baseline, tolerance=0.25)) == 3
+
+
+if __name__ == "__main__":
+    print("🚀 可插拔数据提供者测试")
+    print("=" * 40)
+    test_synthetic_history_is_deterministic_and_range_independent()
+    test_failure_injection_is_deterministic()
+    test_recording_round_trip_and_missing_endpoint()
+    test_data_service_reads_through_provider()
+    test_analyzer_endpoints_served_by_provider()
+    test_constituent_routes_and_news_fetch_served_by_provider()
+    test_baseline_comparison_flags_regressions()
+    print("✅ 全部通过")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列映射转换测试
+验证类型转换与默认值、百分号解析、可选字段、列名前缀和大表转换耗时
+"""
+
+import time
+from datetime import date, datetime, time as dt_time
+
+import numpy as np
+import pandas as pd
+
+from frame_schema import convert_frame, fund_flow_prefix, get_schema, to_records
+
+
+def test_coercion_defaults_and_percent_strings():
+    """无法解析的值取默认值，百分号字符串转为数值"""
+    df = pd.DataFrame({
+        '序号': [1, 2, None], '行业': ['半导体', None, '银行'], '公司家数': ['12', '-', 30],
+        '行业指数': ['1,234.5', 'abc', 900], '阶段涨跌幅': ['3.5%', '-1.25%', None],
+        '流入资金': [1.0, np.nan, 3.0], '流出资金': [1, 2, 3], '净额': [0.5, -0.5, 0]
+    })
+    records = to_records(df, get_schema('stock_fund_flow_concept'))
+
+    assert records[0] == {'rank': 1, 'sector': '半导体', 'company_count': 12, 'sector_index': 1234.5,
+                          'change_percent': 3.5, 'inflow': 1.0, 'outflow': 1.0, 'net_flow': 0.5}
+    assert records[1]['sector'] == '' and records[1]['company_count'] == 0
+    assert records[1]['sector_index'] == 0.0 and records[1]['change_percent'] == -1.25
+    assert records[2]['rank'] == 0 and records[2]['change_percent'] == 0.0
+    assert all(type(r['rank']) is int and type(r['inflow']) is float for r in records)
+
+
+def test_optional_and_text_fields():
+    """可选字段在缺列时不输出；百分比文本与日期时间按原有格式输出"""
+    immediate = pd.DataFrame({'序号': [1], '行业': ['煤炭'], '行业指数': [100.0], '行业-涨跌幅': ['2.5%'],
+                              '流入资金': [1.0], '流出资金': [2.0], '净额': [-1.0], '公司家数': [20],
+                              '领涨股': ['某股']})
+    record = to_records(immediate, get_schema('stock_fund_flow_industry', '即时'))[0]
+    assert record['change'] == '2.5' and record['leadingStock'] == '某股'
+    assert 'leadingStockPrice' not in record and 'leadingStockChange' not in record
+
+    news = pd.DataFrame({'标题': ['t'], '内容': ['c'], '发布日期': [date(2024, 5, 20)],
+                         '发布时间': [dt_time(9, 30, 5)]})
+    item = to_records(news, get_schema('stock_info_global_cls'))[0]
+    assert item == {'title': 't', 'content': 'c', 'date': '2024-05-20', 'time': '09:30:05'}
+
+    stamped = convert_frame(pd.DataFrame({'日期': [datetime(2024, 5, 20)]}), get_schema('stock_individual_fund_flow'))
+    assert stamped['date'].iloc[0] == '2024-05-20T00:00:00'
+    assert stamped['main_net_inflow'].iloc[0] == 0.0
+
+
+def test_full_rank_table_converts_in_milliseconds():
+    """5000行资金流排名表带周期前缀整表转换"""
+    rng = np.random.default_rng(4)
+    raw = pd.DataFrame({'序号': np.arange(1, 5001), '代码': [f'{i:06d}' for i in range(5000)],
+                        '名称': [f'股票{i}' for i in range(5000)], '最新价': rng.uniform(5, 100, 5000),
+                        '10日涨跌幅': [f'{v:.2f}%' for v in rng.normal(0, 5, 5000)]})
+    for name in ('主力', '超大单', '大单', '中单', '小单'):
+        raw[f'10日{name}净流入-净额'] = rng.normal(0, 1e7, 5000)
+        raw[f'10日{name}净流入-净占比'] = [f'{v:.2f}%' for v in rng.normal(0, 3, 5000)]
+    schema = get_schema('stock_individual_fund_flow_rank')
+
+    start = time.perf_counter()
+    records = to_records(raw, schema, prefix=fund_flow_prefix('10日'))
+    elapsed = time.perf_counter() - start
+
+    assert len(records) == 5000
+    first = raw.iloc[0]
+    assert records[0]['code'] == first['代码']
+    assert records[0]['main_net_inflow'] == first['10日主力净流入-净额']
+    assert records[0]['change_percent'] == float(first['10日涨跌幅'].rstrip('%'))
+    assert elapsed < 0.5
+
+
+if __name__ == "__main__":
+    print("🚀 列映射转换测试")
+    print("=" * 40)
+    test_coercion_defaults_and_percent_strings()
+    test_optional_and_text_fields()
+    test_full_rank_table_converts_in_milliseconds()
+    print("✅ 全部通过")
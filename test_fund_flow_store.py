@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+资金流向快照存储测试
+验证快照有效期、批量评分只调用一次上游、CapitalFlowData 写入、从数据库恢复时沿用入库的过期时间和旧表补齐新增列（不删表）
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+import data_provider
+from data_provider import ReplayProvider, set_data_provider
+from database import Base, CapitalFlowData, add_missing_columns, bulk_upsert
+from fund_flow_store import (FUND_FLOW_INTRADAY_TTL, FundFlowStore, fund_flow_store, snapshot_expiry,
+                             snapshot_trade_date)
+
+
+@contextmanager
+def _replay_provider(seed):
+    original = data_provider._provider
+    provider = ReplayProvider(seed=seed)
+    set_data_provider(provider)
+    fund_flow_store.invalidate()
+    try:
+        yield provider
+    finally:
+        data_provider._provider = original
+        fund_flow_store.invalidate()
+
+
+def test_snapshot_validity_follows_trading_sessions():
+    """盘中按TTL刷新，收盘后和休市日保留到下一交易日开盘"""
+    intraday = datetime(2024, 5, 20, 10, 0)
+    assert snapshot_expiry(intraday) == intraday + timedelta(seconds=FUND_FLOW_INTRADAY_TTL)
+    assert snapshot_expiry(datetime(2024, 5, 20, 8, 0)) == datetime(2024, 5, 20, 9, 30)
+    assert snapshot_expiry(datetime(2024, 5, 17, 16, 0)) == datetime(2024, 5, 20, 9, 30)
+    assert snapshot_expiry(datetime(2024, 5, 18, 12, 0)) == datetime(2024, 5, 20, 9, 30)
+
+    assert snapshot_trade_date(datetime(2024, 5, 20, 10, 0)) == '2024-05-20'
+    assert snapshot_trade_date(datetime(2024, 5, 20, 8, 0)) == '2024-05-17'
+    assert snapshot_trade_date(datetime(2024, 5, 18, 12, 0)) == '2024-05-17'
+
+
+def test_batch_scoring_costs_one_upstream_call():
+    """300只股票批量评分只调用一次排名接口，结果与单只评分结构一致"""
+    from capital_flow_analyzer import CapitalFlowAnalyzer
+
+    analyzer = CapitalFlowAnalyzer()
+    with _replay_provider(seed=21) as provider:
+        codes = provider.universe[:300]
+        scores = analyzer.batch_calculate_capital_flow_scores(codes + ['999999'])
+        again = analyzer.batch_calculate_capital_flow_scores(codes[:10])
+        ranking = analyzer.get_individual_fund_flow_rank('10日')
+
+        endpoints = provider.get_stats()['endpoints']
+        assert endpoints['stock_individual_fund_flow_rank']['calls'] == 1
+        assert 'stock_individual_fund_flow' not in endpoints
+
+    assert len(scores) == 301
+    assert scores['999999']['total'] == 0 and scores['999999']['details'] == {}
+    for code in codes:
+        score = scores[code]
+        assert score['total'] == score['main_force'] + score['large_order'] + score['small_order']
+        assert 0 <= score['main_force'] <= 40 and 0 <= score['large_order'] <= 30
+    assert all(again[code] == scores[code] for code in codes[:10])
+    assert len({s['total'] for s in scores.values()}) > 3
+
+    assert ranking[0]['rank'] == 1
+    assert ranking[0]['main_net_inflow'] >= ranking[-1]['main_net_inflow']
+
+
+def test_snapshot_rows_upsert_by_date_and_period():
+    """同一交易日同一周期重复写入只更新"""
+    store = FundFlowStore()
+    raw = ReplayProvider(seed=22).stock_individual_fund_flow_rank(indicator='5日')
+    frame = store._to_snapshot(raw, '5日')
+    expires_at = datetime.now() + timedelta(hours=1)
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    bulk_upsert(CapitalFlowData, store.to_records(frame, '5日', '2024-05-20', expires_at), bind=engine)
+    bulk_upsert(CapitalFlowData, store.to_records(frame, '5日', '2024-05-20', expires_at), bind=engine)
+    bulk_upsert(CapitalFlowData, store.to_records(frame, '今日', '2024-05-20', expires_at), bind=engine)
+
+    session = sessionmaker(bind=engine)()
+    assert session.query(CapitalFlowData).count() == 2 * len(frame)
+    record = session.query(CapitalFlowData).filter_by(stock_code=frame.index[0], period='5日').one()
+    assert record.main_net_flow == frame['main_net_flow'].iloc[0]
+    assert abs(record.retail_net_flow - (record.medium_net_flow + record.small_net_flow)) < 1e-6
+    session.close()
+
+
+def test_outdated_table_gets_missing_columns():
+    """旧库缺少新增列时逐列补齐，已有数据保留，新列取模型默认值"""
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE capital_flow_data_cache (id INTEGER PRIMARY KEY, stock_code VARCHAR(10), "
+            "market_type VARCHAR(5), trade_date VARCHAR(10), main_net_flow FLOAT, expires_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO capital_flow_data_cache (stock_code, market_type, trade_date, main_net_flow) "
+            "VALUES ('600000', 'A', '2024-05-20', 1.5)"
+        ))
+    add_missing_columns(engine)
+    add_missing_columns(engine)
+
+    columns = {c['name'] for c in inspect(engine).get_columns('capital_flow_data_cache')}
+    assert {'period', 'super_large_net_pct', 'stock_name'} <= columns
+    indexes = {idx['name'] for idx in inspect(engine).get_indexes('capital_flow_data_cache')}
+    assert 'idx_flow_period_date' in indexes
+    with engine.connect() as conn:
+        row = conn.execute(text(
+            "SELECT stock_code, main_net_flow, period, stock_name FROM capital_flow_data_cache"
+        )).one()
+    assert tuple(row) == ('600000', 1.5, '今日', None)
+
+def test_reloaded_snapshot_keeps_stored_expiry():
+    """从数据库恢复的快照沿用入库时的过期时间，不重新计算"""
+    import fund_flow_store as module
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    trade_date = snapshot_trade_date()
+    expires_at = (datetime.now() + timedelta(minutes=7)).replace(microsecond=0)
+
+    store = FundFlowStore()
+    with _replay_provider(seed=23) as provider:
+        raw = provider.stock_individual_fund_flow_rank(indicator='今日')
+    frame = store._to_snapshot(raw, '今日')
+    bulk_upsert(CapitalFlowData, store.to_records(frame, '今日', trade_date, expires_at), bind=engine)
+
+    @contextmanager
+    def session_scope():
+        session = factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    original = module.USE_DATABASE, module.get_optimized_session
+    module.USE_DATABASE, module.get_optimized_session = True, session_scope
+    try:
+        snapshot = store.get_snapshot('今日')
+    finally:
+        module.USE_DATABASE, module.get_optimized_session = original
+
+    assert store.stats['database_hits'] == 1 and store.stats['upstream_calls'] == 0
+    assert len(snapshot) == len(frame)
+    assert store.get_stats()['snapshots']['今日']['expires_at'] == expires_at.strftime('%Y-%m-%d %H:%M:%S')
+
+
+if __name__ == "__main__":
+    print("🚀 资金流向快照存储测试")
+    print("=" * 40)
+    test_snapshot_validity_follows_trading_sessions()
+    test_batch_scoring_costs_one_upstream_call()
+    test_snapshot_rows_upsert_by_date_and_period()
+    test_outdated_table_gets_missing_columns()
+    test_reloaded_snapshot_keeps_stored_expiry()
+    print("✅ 全部通过")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+财务数据缓存测试
+验证按披露窗口计算的过期时间、重复评分零上游调用、FinancialData 批量写入、批量预取和按指标回退报告期
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import data_provider
+from data_provider import ReplayProvider, set_data_provider
+from data_service import FINANCIAL_WINDOW_TTL, data_service, financial_data_expiry, next_close_expiry
+from database import Base, FinancialData, bulk_upsert
+
+FINANCIAL_ENDPOINTS = ('stock_financial_analysis_indicator', 'stock_financial_abstract', 'stock_value_em')
+
+
+@contextmanager
+def _replay_provider(seed):
+    original = data_provider._provider
+    provider = ReplayProvider(seed=seed)
+    set_data_provider(provider)
+    try:
+        yield provider
+    finally:
+        data_provider._provider = original
+
+
+def _financial_calls(provider):
+    endpoints = provider.get_stats()['endpoints']
+    return sum(endpoints.get(name, {}).get('calls', 0) for name in FINANCIAL_ENDPOINTS)
+
+
+def test_expiry_follows_disclosure_windows():
+    """披露窗口内按天刷新，窗口外保留到下个窗口开始"""
+    in_window = datetime(2024, 4, 15, 10, 0)
+    assert financial_data_expiry(in_window) == in_window + timedelta(seconds=FINANCIAL_WINDOW_TTL)
+
+    assert financial_data_expiry(datetime(2024, 5, 20)) == datetime(2024, 7, 1)
+    assert financial_data_expiry(datetime(2024, 9, 3)) == datetime(2024, 10, 1)
+    assert financial_data_expiry(datetime(2024, 11, 30)) == datetime(2025, 1, 1)
+
+    assert next_close_expiry(datetime(2024, 5, 20, 9, 0)) == datetime(2024, 5, 20, 15, 30)
+    assert next_close_expiry(datetime(2024, 5, 20, 16, 0)) == datetime(2024, 5, 21, 15, 30)
+
+
+def test_repeated_scoring_costs_no_upstream_calls():
+    """同一股票第二次基本面评分完全命中缓存"""
+    from fundamental_analyzer import FundamentalAnalyzer
+
+    analyzer = FundamentalAnalyzer()
+    with _replay_provider(seed=11) as provider:
+        first = analyzer.calculate_fundamental_score('600777')
+        calls = _financial_calls(provider)
+        second = analyzer.calculate_fundamental_score('600777')
+
+        assert calls == 3
+        assert _financial_calls(provider) == calls
+
+    assert first == second
+    indicators = first['details']['indicators']
+    assert {'pe_ttm', 'pb', 'roe', 'debt_ratio'} <= set(indicators)
+    assert first['details']['growth']['revenue_growth_3y'] is not None
+
+
+def test_financial_rows_upsert_by_report_period():
+    """财务数据按 (代码, 市场, 报告期) 写入，重复保存只更新"""
+    with _replay_provider(seed=12):
+        periods = data_service._fetch_financial_data('000778')
+
+    assert [p['report_period'] for p in periods] == sorted(p['report_period'] for p in periods)
+    assert all({'roe', 'revenue', 'net_profit'} <= set(p) for p in periods)
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    expires_at = financial_data_expiry()
+    rows = data_service._financial_rows('000778', 'A', periods, expires_at)
+    bulk_upsert(FinancialData, rows, bind=engine)
+    bulk_upsert(FinancialData, [dict(r, roe=1.0) for r in rows], bind=engine)
+
+    session = sessionmaker(bind=engine)()
+    assert session.query(FinancialData).count() == len(periods)
+    assert {r.roe for r in session.query(FinancialData)} == {1.0}
+    session.close()
+
+
+def test_prefetch_fills_cache_for_universe():
+    """批量预取后逐只读取不再访问上游"""
+    codes = ['600781', '600782', '600783']
+    with _replay_provider(seed=13) as provider:
+        stats = data_service.prefetch_financial_data(codes, max_workers=2)
+        calls = _financial_calls(provider)
+        again = data_service.prefetch_financial_data(codes)
+        periods = [data_service.get_financial_data(code) for code in codes]
+
+        assert _financial_calls(provider) == calls
+
+    assert stats['fetched'] == 3 and stats['failed'] == 0
+    assert again['memory'] == 3
+    assert all(periods)
+
+
+def test_indicators_skip_newer_abstract_only_period():
+    """最新报告期只有摘要时，各指标取有值的最近报告期"""
+    from fundamental_analyzer import FundamentalAnalyzer
+
+    periods = [
+        {'report_period': '2024-Q3', 'roe': 8.0, 'gross_margin': 30.0, 'roa': 5.0, 'debt_ratio': 40.0,
+         'revenue': 9e9, 'net_profit': 1e9},
+        {'report_period': '2024-Q4', 'roe': 11.0, 'gross_margin': None, 'roa': 6.0, 'debt_ratio': 42.0,
+         'revenue': 1.2e10, 'net_profit': 1.3e9},
+        {'report_period': '2025-Q1', 'roe': None, 'gross_margin': None, 'roa': None, 'debt_ratio': None,
+         'revenue': 3e9, 'net_profit': 3e8},
+    ]
+    original_financial, original_valuation = data_service.get_financial_data, data_service.get_stock_valuation
+    data_service.get_financial_data = lambda stock_code: periods
+    data_service.get_stock_valuation = lambda stock_code: {'pe_ttm': 15.0, 'pb': 2.0}
+    try:
+        indicators = FundamentalAnalyzer().get_financial_indicators('600784')
+    finally:
+        data_service.get_financial_data, data_service.get_stock_valuation = original_financial, original_valuation
+
+    assert indicators == {'pe_ttm': 15.0, 'pb': 2.0, 'roe': 11.0, 'gross_margin': 30.0,
+                          'net_profit_margin': 6.0, 'debt_ratio': 42.0}
+
+
+if __name__ == "__main__":
+    print("🚀 财务数据缓存测试")
+    print("=" * 40)
+    test_expiry_follows_disclosure_windows()
+    test_repeated_scoring_costs_no_upstream_calls()
+    test_financial_rows_upsert_by_report_period()
+    test_prefetch_fills_cache_for_universe()
+    test_indicators_skip_newer_abstract_only_period()
+    print("✅ 全部通过")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行业比较测试
+验证全部行业并发比较、按日缓存后零上游调用，以及按板块代码的回退查询
+"""
+
+import pandas as pd
+
+import data_provider
+from data_provider import DataProvider, ReplayProvider, set_data_provider
+from data_service import data_service
+
+
+def test_compare_all_industries_then_hit_cache():
+    """全部90个行业只在首次比较时访问上游，结果按涨跌幅降序"""
+    from industry_analyzer import IndustryAnalyzer
+
+    original = data_provider._provider
+    provider = ReplayProvider(seed=31)
+    set_data_provider(provider)
+    try:
+        analyzer = IndustryAnalyzer()
+        first = analyzer.compare_industries()
+        calls = provider.get_stats()['endpoints']['stock_board_industry_hist_em']['calls']
+        second = IndustryAnalyzer().compare_industries(limit=20)
+        board_stats = provider.get_stats()['endpoints']
+    finally:
+        data_provider._provider = original
+
+    assert first['count'] == 90 and calls <= 90
+    changes = [item['change'] for item in first['results']]
+    assert changes == sorted(changes, reverse=True)
+    assert set(first['results'][0]) == {'industry', 'change', 'volume', 'turnover'}
+    assert board_stats['stock_board_industry_hist_em']['calls'] == calls
+    assert second['count'] == 20
+
+
+def test_history_falls_back_to_board_code():
+    """按名称查询失败时用板块代码重试"""
+    class CodeOnlyProvider(DataProvider):
+        name = 'code_only'
+
+        def __init__(self):
+            self.symbols = []
+
+        def stock_board_industry_hist_em(self, symbol, **kwargs):
+            self.symbols.append(symbol)
+            if not symbol.startswith('BK'):
+                raise ValueError('unknown board')
+            return pd.DataFrame({'日期': ['2024-05-21', '2024-05-20'], '涨跌幅': [1.5, -0.5]})
+
+    original = data_provider._provider
+    original_retries = data_service.max_retries
+    provider = CodeOnlyProvider()
+    set_data_provider(provider)
+    data_service.max_retries = 1
+    try:
+        history = data_service.get_industry_board_history('回退测试行业', 'BK9999')
+        cached = data_service.get_industry_board_history('回退测试行业', 'BK9999')
+    finally:
+        data_provider._provider = original
+        data_service.max_retries = original_retries
+
+    assert provider.symbols == ['回退测试行业', 'BK9999']
+    assert history['日期'].tolist() == ['2024-05-20', '2024-05-21']
+    assert cached is history
+
+
+if __name__ == "__main__":
+    print("🚀 行业比较测试")
+    print("=" * 40)
+    test_compare_all_industries_then_hit_cache()
+    test_history_falls_back_to_board_code()
+    print("✅ 全部通过")
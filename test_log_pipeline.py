@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步日志管道测试
+验证限流和采样控制日志量、丢弃的记录不格式化、慢速写入不阻塞调用线程，以及结构化字段输出
+"""
+
+import io
+import logging
+import time
+
+from log_pipeline import LogPipeline, StructuredFormatter
+from tracing import start_trace
+
+
+class _SlowHandler(logging.Handler):
+    """每条记录写入耗时 5ms 的处理器"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        time.sleep(0.005)
+        self.messages.append(self.format(record))
+
+
+class _CountingArg:
+    """记录被转换为字符串的次数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return 'arg'
+
+
+def _pipeline(name, handler, **kwargs):
+    logger = logging.getLogger(f'test_log_pipeline.{name}')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger, LogPipeline(logger, [handler], **kwargs).start()
+
+
+def test_rate_limit_bounds_volume_and_keeps_warnings():
+    """1000只股票规模的 INFO 日志被限制在令牌桶容量附近，WARNING 全部保留并带抑制计数"""
+    stream = io.StringIO()
+    logger, pipeline = _pipeline('rate', logging.StreamHandler(stream), rate_limit=10, burst=50)
+    counted = _CountingArg()
+    for i in range(1000):
+        logger.info("股票 %s 分析完成 %s", i, counted)
+    logger.warning("扫描完成")
+    pipeline.stop()
+
+    stats = pipeline.get_stats()
+    lines = stream.getvalue().splitlines()
+    assert 50 <= stats['passed'] - 1 <= 60
+    assert stats['rate_limited'] == 1000 - (stats['passed'] - 1)
+    # 被限流的记录不会格式化参数
+    assert counted.calls == stats['passed'] - 1
+    assert lines[-1].startswith('[') and '扫描完成' in lines[-1]
+    assert f"suppressed={stats['rate_limited']}" in lines[-1]
+
+
+def test_sampling_is_deterministic_per_logger():
+    """按前缀采样：子 logger 按比例放行，其他 logger 不受影响"""
+    stream = io.StringIO()
+    logger, pipeline = _pipeline('sample', logging.StreamHandler(stream), rate_limit=0,
+                                 sample_rates={'test_log_pipeline.sample.tasks': 0.1})
+    tasks = logging.getLogger('test_log_pipeline.sample.tasks')
+    for i in range(1000):
+        tasks.debug("任务 %s 进度更新", i)
+        logger.info("其他日志 %s", i)
+    pipeline.stop()
+
+    loggers = pipeline.get_stats()['loggers']
+    assert loggers['test_log_pipeline.sample.tasks'] == {'passed': 100, 'suppressed': 900}
+    assert loggers['test_log_pipeline.sample']['passed'] == 1000
+
+
+def test_slow_handler_does_not_block_callers():
+    """写入在后台线程完成，调用方只承担入队开销，停止时写完剩余记录"""
+    handler = _SlowHandler()
+    logger, pipeline = _pipeline('async', handler, rate_limit=0)
+    start_time = time.perf_counter()
+    for i in range(100):
+        logger.info("记录 %s", i)
+    elapsed = time.perf_counter() - start_time
+    pipeline.stop()
+
+    assert elapsed < 0.25  # 同步写入至少需要 0.5 秒
+    assert len(handler.messages) == 100
+    stats = pipeline.get_stats()
+    assert stats['written'] == 100
+    assert stats['avg_write_us'] > stats['avg_enqueue_us']
+
+
+def test_structured_fields_and_trace_id():
+    """结构化字段和当前追踪ID附加在首行末尾"""
+    handler = _SlowHandler()
+    handler.setFormatter(StructuredFormatter('%(levelname)s %(message)s'))
+    logger, pipeline = _pipeline('fields', handler, rate_limit=0)
+    with start_trace('test.logging', trace_id='trace-abc'):
+        logger.info("任务状态更新", extra={'fields': {'task_id': 't1', 'status': 'completed'}})
+    pipeline.stop()
+
+    assert handler.messages == ['INFO 任务状态更新 | trace_id=trace-abc task_id=t1 status=completed']
+
+
+if __name__ == "__main__":
+    print("🚀 异步日志管道测试")
+    print("=" * 40)
+    test_rate_limit_bounds_volume_and_keeps_warnings()
+    test_sampling_is_deterministic_per_logger()
+    test_slow_handler_does_not_block_callers()
+    test_structured_fields_and_trace_id()
+    print("✅ 全部通过")
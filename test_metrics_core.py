@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+低开销指标核心测试
+验证线程分片计数的合并、直方图分位数、Prometheus文本输出和性能监控器接入
+"""
+
+import threading
+
+from metrics_core import MetricsRegistry, HistogramSeries
+from performance_monitor import PerformanceMonitor
+
+
+def test_counter_merges_thread_shards():
+    """多线程无锁累加，读取时合并结果准确"""
+    registry = MetricsRegistry()
+    counter = registry.counter('test_events_total', '测试计数', ('event',))
+
+    def worker():
+        series = counter.labels('hit')
+        for _ in range(10000):
+            series.inc()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.labels('hit').get() == 80000
+    # 已退出线程的分片被合并后数值不变
+    assert counter.labels('hit').get() == 80000
+
+
+def test_histogram_percentiles():
+    """固定桶直方图给出合理的尾延迟估计"""
+    histogram = HistogramSeries((0.01, 0.1, 1.0, float('inf')))
+    for _ in range(90):
+        histogram.observe(0.005)
+    for _ in range(9):
+        histogram.observe(0.05)
+    histogram.observe(2.0)
+
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert summary['p50'] <= 0.01
+    assert 0.01 < summary['p95'] <= 0.1
+    assert summary['max'] == 2.0
+    assert histogram.percentile(1.0) == 2.0
+
+
+def test_prometheus_exposition():
+    """文本输出包含累计桶、sum 和 count"""
+    registry = MetricsRegistry()
+    latency = registry.histogram('test_latency_seconds', '测试耗时', ('endpoint',),
+                                 buckets=(0.1, 1.0, float('inf')))
+    latency.observe(0.05, endpoint='/api/a')
+    latency.observe(0.5, endpoint='/api/a')
+    registry.counter('test_total', '测试').labels().inc(3)
+
+    text = registry.render_prometheus()
+    assert '# TYPE test_latency_seconds histogram' in text
+    assert 'test_latency_seconds_bucket{endpoint="/api/a",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{endpoint="/api/a",le="+Inf"} 2' in text
+    assert 'test_latency_seconds_count{endpoint="/api/a"} 2' in text
+    assert 'test_total 3' in text
+
+
+def test_performance_monitor_uses_registry():
+    """性能监控器的计数和分位数来自指标注册表"""
+    monitor = PerformanceMonitor(registry=MetricsRegistry())
+    monitor.record_cache_hit(0.001, level='L1_MEMORY')
+    monitor.record_cache_miss()
+    monitor.record_api_call(0.2, endpoint='stock_zh_a_hist')
+    monitor.record_api_call(1.5, success=False, error='Timeout', endpoint='stock_zh_a_hist')
+    monitor.record_analysis('600519', 'enhanced', 3.0)
+
+    summary = monitor.get_performance_summary()
+    assert summary['metrics']['cache_hits'] == 1
+    assert summary['metrics']['api_calls'] == 2
+    assert summary['metrics']['errors'] == 1
+    assert summary['rates']['cache_hit_rate'] == 0.5
+    endpoints = {tuple(s['labels'].values()): s for s in summary['latency']['api_call']}
+    assert endpoints[('stock_zh_a_hist', 'error')]['count'] == 1
+
+    monitor.reset_metrics()
+    assert monitor.metrics['api_calls'] == 0
+
+
+def test_memory_cache_lookups_recorded_in_latency_histogram():
+    """数据服务的内存缓存命中和未命中都带耗时样本，MEMORY 级别直方图不为空"""
+    from data_service import data_service
+    from performance_monitor import performance_monitor
+
+    def memory_counts():
+        series = performance_monitor.get_latency_percentiles()['cache']
+        return {s['labels']['result']: s['count'] for s in series if s['labels']['level'] == 'MEMORY'}
+
+    before = memory_counts()
+    cache_key = data_service._get_cache_key('metrics_test', code='600519')
+    assert data_service._check_memory_cache(cache_key, 60) is None
+    data_service._set_memory_cache(cache_key, {'ok': True})
+    assert data_service._check_memory_cache(cache_key, 60) == {'ok': True}
+    after = memory_counts()
+
+    assert after.get('miss', 0) == before.get('miss', 0) + 1
+    assert after.get('hit', 0) == before.get('hit', 0) + 1
+
+
+if __name__ == "__main__":
+    print("🚀 低开销指标核心测试")
+    print("=" * 40)
+    test_counter_merges_thread_shards()
+    test_histogram_percentiles()
+    test_prometheus_exposition()
+    test_performance_monitor_uses_registry()
+    test_memory_cache_lookups_recorded_in_latency_histogram()
+    print("✅ 全部通过")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+向量化蒙特卡洛模拟测试
+验证可复现性、分块一致性、分位数带、触及概率和情景预测接入
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from monte_carlo import MonteCarloEngine
+from scenario_predictor import ScenarioPredictor
+
+
+def test_seeded_and_chunked_runs_are_identical():
+    """相同种子结果一致，分块模拟与整块模拟一致"""
+    drifts = {'base': 0.0, 'up': 0.002}
+    targets = {'up': 11.0}
+    whole = MonteCarloEngine(5000, 'gbm', seed=7).simulate(10, 60, drifts, sigma=0.02, targets=targets)
+    chunked = MonteCarloEngine(5000, 'gbm', seed=7, max_chunk_bytes=5000 * 8 * 7).simulate(
+        10, 60, drifts, sigma=0.02, targets=targets)
+
+    assert np.allclose(whole['scenarios']['up']['bands']['p50'], chunked['scenarios']['up']['bands']['p50'])
+    assert whole['scenarios']['up']['hit_probability'] == chunked['scenarios']['up']['hit_probability']
+
+
+def test_bands_and_probabilities_match_theory():
+    """零漂移 GBM 的中位数约等于现价，分位数带有序，触及概率大于期末概率"""
+    result = MonteCarloEngine(20000, 'gbm', seed=1).simulate(
+        100, 60, {'base': 0.0}, sigma=0.02, targets={'up': 110, 'down': 90})
+    base = result['scenarios']['base']
+    bands = base['bands']
+
+    assert len(bands['p50']) == 61
+    assert bands['p50'][0] == 100
+    assert abs(bands['p50'][-1] - 100) < 1.5
+    assert all(bands['p5'][-1] < bands[p][-1] for p in ('p25', 'p50', 'p75', 'p95'))
+    # 60日对数收益率标准差约 0.155，p95 约为 exp(1.645 * 0.155)
+    assert abs(bands['p95'][-1] / 100 - np.exp(1.645 * 0.02 * np.sqrt(60))) < 0.02
+    assert base['hit_probability']['up'] > base['end_probability']['up'] > 0.2
+    assert base['hit_probability']['down'] > base['end_probability']['down']
+
+
+def test_bootstrap_and_speed():
+    """自助抽样方法可用，10k路径×60天在百毫秒内完成"""
+    history = np.random.default_rng(3).normal(0.0005, 0.02, 250)
+    engine = MonteCarloEngine(10000, 'bootstrap', seed=3)
+    engine.simulate(10, 60, {'base': 0.0}, historical_log_returns=history)
+
+    start_time = time.perf_counter()
+    result = engine.simulate(10, 60, {'base': 0.0, 'up': 0.003, 'down': -0.003},
+                             historical_log_returns=history, targets={'up': 12, 'down': 8})
+    elapsed = time.perf_counter() - start_time
+    print(f"10k路径×60天耗时: {elapsed * 1000:.1f}ms")
+
+    assert elapsed < 0.1
+    assert abs(result['daily_sigma'] - history.std(ddof=1)) < 1e-12
+
+
+def test_scenario_predictor_uses_simulation():
+    """情景预测返回中位数路径、分位数带和概率"""
+    dates = pd.bdate_range('2024-01-01', periods=260)
+    close = 10 * np.exp(np.cumsum(np.random.default_rng(5).normal(0, 0.015, 260)))
+    df = pd.DataFrame({'date': dates, 'close': close})
+    df['MA20'] = df['close'].rolling(20, min_periods=1).mean()
+    df['MA60'] = df['close'].rolling(60, min_periods=1).mean()
+    std = df['close'].rolling(20, min_periods=1).std().fillna(0)
+    df['BB_upper'] = df['MA20'] + 2 * std
+    df['BB_lower'] = df['MA20'] - 2 * std
+    df['Volatility'] = 2.0
+
+    predictor = ScenarioPredictor(analyzer=None)
+    scenarios = predictor._calculate_scenarios(df, 30, seed=11)
+
+    optimistic = scenarios['optimistic']
+    assert len(optimistic['path']) == 31
+    assert abs(list(optimistic['path'].values())[-1] / optimistic['target_price'] - 1) < 0.02
+    assert set(optimistic['percentile_bands']) == {'p5', 'p25', 'p50', 'p75', 'p95'}
+    assert 0 <= optimistic['probability'] <= 1
+    assert scenarios['simulation']['n_paths'] > 0
+
+    again = predictor._calculate_scenarios(df, 30, seed=11)
+    assert again['neutral']['path'] == scenarios['neutral']['path']
+
+
+if __name__ == "__main__":
+    print("🚀 向量化蒙特卡洛模拟测试")
+    print("=" * 40)
+    test_seeded_and_chunked_runs_are_identical()
+    test_bands_and_probabilities_match_theory()
+    test_bootstrap_and_speed()
+    test_scenario_predictor_uses_simulation()
+    print("✅ 全部通过")
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+新闻存储测试
+验证按哈希去重的追加写入、按时间索引的最新新闻读取、旧版JSON导入、大库读取耗时，
+以及入库打标签、按股票检索和全文检索
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from news_store import NewsStore, NewsTagger, content_hash
+
+
+def _news(content, when):
+    return {'hash': content_hash(content), 'title': '', 'content': content,
+            'date': when.strftime('%Y-%m-%d'), 'time': when.strftime('%H:%M:%S'),
+            'datetime': when.strftime('%Y-%m-%d %H:%M:%S'), 'fetch_time': when.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def test_append_ignores_known_hashes_and_reads_latest():
+    """重复内容不再写入；最新新闻按发布时间倒序并限制天数和条数"""
+    now = datetime.now().replace(microsecond=0)
+    with tempfile.TemporaryDirectory() as save_dir:
+        store = NewsStore(save_dir)
+        first = [_news(f'今日{i}', now - timedelta(seconds=2 * i)) for i in range(5)]
+        old = [_news(f'三天前{i}', now - timedelta(days=3, minutes=i)) for i in range(3)]
+
+        assert store.append(first + old) == 8
+        assert store.append(first[:2] + [_news('新增', now - timedelta(seconds=1))]) == 1
+        assert store.count() == 9
+
+        latest = store.latest(days=1, limit=3)
+        assert [item['content'] for item in latest] == ['今日0', '新增', '今日1']
+        assert len(store.latest(days=1, limit=100)) == 6
+        assert len(store.latest(days=4, limit=100)) == 9
+        assert set(latest[0]) == {'hash', 'title', 'content', 'date', 'time', 'datetime', 'fetch_time'}
+        store.close()
+
+
+def test_legacy_json_files_imported_once():
+    """旧版按日JSON文件首次打开时导入，缺少hash的条目按内容补算"""
+    now = datetime.now().replace(microsecond=0)
+    with tempfile.TemporaryDirectory() as save_dir:
+        legacy = [_news('旧闻A', now), dict(_news('旧闻B', now), hash=None)]
+        with open(os.path.join(save_dir, f"news_{now.strftime('%Y%m%d')}.json"), 'w', encoding='utf-8') as f:
+            json.dump(legacy, f, ensure_ascii=False)
+
+        store = NewsStore(save_dir)
+        assert store.count() == 2
+        assert {item['hash'] for item in store.latest()} == {content_hash('旧闻A'), content_hash('旧闻B')}
+        store.close()
+
+        reopened = NewsStore(save_dir)
+        assert reopened.import_legacy_files() == 0 and reopened.count() == 2
+        reopened.close()
+
+
+def test_latest_read_does_not_scan_store():
+    """5万条新闻的库中读取最新50条只走时间索引"""
+    start_day = datetime.now().replace(microsecond=0) - timedelta(days=60)
+    with tempfile.TemporaryDirectory() as save_dir:
+        store = NewsStore(save_dir)
+        store.append(_news(f'电报{i}', start_day + timedelta(minutes=2 * i)) for i in range(50000))
+
+        start_time = time.perf_counter()
+        for _ in range(20):
+            latest = store.latest(days=1, limit=50)
+        elapsed = (time.perf_counter() - start_time) / 20
+
+        plan = store._conn.execute("EXPLAIN QUERY PLAN SELECT * FROM news WHERE datetime >= ? "
+                                   "ORDER BY datetime DESC LIMIT 50", ('2024-01-01',)).fetchall()
+        store.close()
+
+    assert len(latest) == 50
+    assert latest[0]['datetime'] > latest[-1]['datetime']
+    assert any('idx_news_datetime' in row[-1] for row in plan)
+    assert elapsed < 0.01
+
+
+def _tagger():
+    return NewsTagger({'600519': '贵州茅台', '000001': '平安银行', '000858': '五 粮 液'}, ['白酒', '银行'])
+
+
+def test_search_ranks_stock_then_industry_news():
+    """提到股票（代码或名称）的新闻排在只提到行业的新闻之前，全文命中加权"""
+    now = datetime.now().replace(microsecond=0)
+    with tempfile.TemporaryDirectory() as save_dir:
+        store = NewsStore(save_dir, tagger=_tagger())
+        store.append([
+            _news('贵州茅台发布年度分红方案，白酒龙头业绩稳健', now - timedelta(minutes=1)),
+            _news('600519 盘中成交额突破百亿', now - timedelta(minutes=2)),
+            _news('白酒板块午后走强，五粮液涨超3%', now - timedelta(minutes=3)),
+            _news('平安银行一季度净利润增长', now - timedelta(minutes=4)),
+            _news('央行开展逆回购操作', now - timedelta(minutes=5)),
+            _news('贵州茅台三年前的旧闻', now - timedelta(days=30)),
+        ])
+
+        results = store.search(stock_code='600519', industry='白酒', days=7, limit=10)
+        assert [r['content'][:4] for r in results] == ['贵州茅台', '6005', '白酒板块']
+        assert [r['matched'] for r in results] == ['stock', 'stock', 'industry']
+        assert results[0]['relevance'] == 4 and results[1]['relevance'] == 3
+
+        texts = store.search(stock_code='000858', query='逆回购操作', days=7)
+        assert [r['matched'] for r in texts] == ['stock', 'text']
+        assert texts[1]['content'] == '央行开展逆回购操作'
+        # 少于3个字的查询词按 LIKE 匹配
+        assert [r['content'] for r in store.search(query='央行')] == ['央行开展逆回购操作']
+        store.close()
+
+
+def test_like_search_matches_wildcards_literally():
+    """LIKE 回退检索中的 % 和 _ 按字面匹配，不当作通配符"""
+    now = datetime.now().replace(microsecond=0)
+    with tempfile.TemporaryDirectory() as save_dir:
+        store = NewsStore(save_dir, tagger=_tagger())
+        store.append([
+            _news('沪指收涨1%，成交放量', now - timedelta(minutes=1)),
+            _news('两市成交额连续缩量', now - timedelta(minutes=2)),
+            _news('新规涉及A_B类份额', now - timedelta(minutes=3)),
+            _news('新规涉及AxB类份额', now - timedelta(minutes=4)),
+        ])
+
+        assert [r['content'] for r in store.search(query='%')] == ['沪指收涨1%，成交放量']
+        assert [r['content'] for r in store.search(query='A_')] == ['新规涉及A_B类份额']
+        store.close()
+
+
+def test_tags_backfilled_and_fts_rebuilt_for_existing_store():
+    """词表加载前入库的新闻补打标签；没有全文索引的旧库打开时重建索引"""
+    now = datetime.now().replace(microsecond=0)
+    with tempfile.TemporaryDirectory() as save_dir:
+        db_path = os.path.join(save_dir, 'news.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE news (id INTEGER PRIMARY KEY AUTOINCREMENT, hash TEXT NOT NULL UNIQUE, "
+                     "title TEXT, content TEXT, date TEXT, time TEXT, datetime TEXT, fetch_time TEXT)")
+        item = _news('平安银行召开业绩说明会', now)
+        conn.execute("INSERT INTO news (hash, title, content, date, time, datetime, fetch_time) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", [item[c] for c in ('hash', 'title', 'content', 'date',
+                                                                       'time', 'datetime', 'fetch_time')])
+        conn.commit()
+        conn.close()
+
+        store = NewsStore(save_dir)
+        assert store.search(query='业绩说明会')[0]['content'] == '平安银行召开业绩说明会'
+        assert store.search(stock_code='000001') == []
+
+        store.append([_news('000001 大宗交易成交', now)])
+        assert store.set_tagger(_tagger()) == 2
+        assert len(store.search(stock_code='000001', industry='银行')) == 2
+        store.close()
+
+
+def test_stock_search_reads_tag_index():
+    """2万条新闻中按股票检索在毫秒级完成"""
+    names = {f'{600000 + i:06d}': f'股票{i:04d}' for i in range(500)}
+    tagger = NewsTagger(names, ['银行', '半导体'])
+    start_day = datetime.now().replace(microsecond=0) - timedelta(days=30)
+    with tempfile.TemporaryDirectory() as save_dir:
+        store = NewsStore(save_dir, tagger=tagger)
+        store.append(_news(f'股票{i % 500:04d}发布公告，半导体行业第{i}条电报', start_day + timedelta(minutes=2 * i))
+                     for i in range(20000))
+
+        start_time = time.perf_counter()
+        for _ in range(20):
+            results = store.search(stock_code='600007', industry='半导体', days=7, limit=5)
+        elapsed = (time.perf_counter() - start_time) / 20
+        store.close()
+
+    assert len(results) == 5 and all(r['matched'] == 'stock' for r in results)
+    assert elapsed < 0.05
+
+
+def _swap_search(results, calls):
+    """把全局新闻获取器的检索替换为返回固定结果并记录参数，返回原方法"""
+    import news_fetcher
+    original = news_fetcher.news_fetcher.search_stock_news
+
+    def search(stock_code, industry=None, query=None, days=7, limit=5):
+        calls.append({'days': days, 'limit': limit})
+        return results
+
+    news_fetcher.news_fetcher.search_stock_news = search
+    return original
+
+
+def _restore_search(original):
+    import news_fetcher
+    news_fetcher.news_fetcher.search_stock_news = original
+
+
+def test_stock_news_route_validates_and_clamps_params():
+    """非整数的 days/limit 返回 400，超出上限的按上限检索"""
+    from web_server import STOCK_NEWS_MAX_DAYS, STOCK_NEWS_MAX_LIMIT, app
+
+    calls = []
+    original = _swap_search({'news': [], 'industry_news': []}, calls)
+    try:
+        client = app.test_client()
+        bad_days = client.get('/api/stock_news?stock_code=600519&days=abc')
+        bad_limit = client.get('/api/stock_news?stock_code=600519&limit=1.5')
+        clamped = client.get('/api/stock_news?stock_code=600519&days=100000&limit=100000')
+    finally:
+        _restore_search(original)
+
+    assert bad_days.status_code == 400 and bad_limit.status_code == 400
+    assert clamped.status_code == 200
+    assert calls == [{'days': STOCK_NEWS_MAX_DAYS, 'limit': STOCK_NEWS_MAX_LIMIT}]
+
+
+def test_qa_local_news_needs_min_hits():
+    """问答与个股分析一致：提到该股票的本地新闻不足 NEWS_LOCAL_MIN_HITS 条时走远程搜索"""
+    from news_fetcher import NEWS_LOCAL_MIN_HITS
+    from stock_qa import StockQA
+
+    now = datetime.now()
+    item = {'title': '', 'content': '贵州茅台发布公告', 'date': now.strftime('%Y-%m-%d')}
+    qa = StockQA(None, openai_api_key='test')
+    found = {}
+    for hits in (NEWS_LOCAL_MIN_HITS - 1, NEWS_LOCAL_MIN_HITS):
+        original = _swap_search({'news': [item] * hits, 'industry_news': []}, [])
+        try:
+            found[hits] = qa._search_local_news('分红', '600519', '白酒')
+        finally:
+            _restore_search(original)
+
+    assert found[NEWS_LOCAL_MIN_HITS - 1] is None
+    assert len(found[NEWS_LOCAL_MIN_HITS]['results']) == NEWS_LOCAL_MIN_HITS
+
+
+if __name__ == "__main__":
+    print("🚀 新闻存储测试")
+    print("=" * 40)
+    test_append_ignores_known_hashes_and_reads_latest()
+    test_legacy_json_files_imported_once()
+    test_latest_read_does_not_scan_store()
+    test_search_ranks_stock_then_industry_news()
+    test_like_search_matches_wildcards_literally()
+    test_tags_backfilled_and_fts_rebuilt_for_existing_store()
+    test_stock_search_reads_tag_index()
+    test_stock_news_route_validates_and_clamps_params()
+    test_qa_local_news_needs_min_hits()
+    print("✅ 全部通过")
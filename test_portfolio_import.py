@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+投资组合CSV导入测试
+验证流式读取与编码判断（含后文GBK回退）、整列代码转换与去重、2000行持仓文件的导入耗时，以及导入后的批量评分作业
+"""
+
+import io
+import time
+
+import pandas as pd
+
+from analysis_executor import analysis_executor
+from portfolio_import import import_portfolio_csv, normalize_stock_codes, submit_portfolio_analysis
+
+
+def _csv(rows, encoding='utf-8', header='secID,名称,持仓'):
+    lines = [header] + [f'{code},股票,100' for code in rows]
+    return io.BytesIO('\n'.join(lines).encode(encoding))
+
+
+def test_normalize_codes_whole_column():
+    """各种代码写法整列转换，无法识别的为空"""
+    codes = pd.Series(['603316.XSHG', ' 000001.xshe ', 'SZ300750', '600519', 'ABC', '12345'])
+    result = normalize_stock_codes(codes)
+    assert result.iloc[:4].tolist() == ['603316', '000001', '300750', '600519']
+    assert result.iloc[4:].isna().all()
+
+
+def test_import_dedups_and_reports_failures():
+    """跨块去重保留首次出现的原始代码；空行跳过，无法识别的单独列出；GBK和带BOM的UTF-8都能读取"""
+    rows = ['600519.XSHG', '000001.XSHE', '', '600519', 'N/A', '000001.XSHE', '300750.XSHE']
+    for encoding in ('gbk', 'utf-8-sig'):
+        result = import_portfolio_csv(_csv(rows, encoding), chunk_rows=2)
+        assert result['total_count'] == 6
+        assert result['converted_stocks'] == [
+            {'original_code': '600519.XSHG', 'converted_code': '600519'},
+            {'original_code': '000001.XSHE', 'converted_code': '000001'},
+            {'original_code': '300750.XSHE', 'converted_code': '300750'},
+        ]
+        assert result['duplicate_count'] == 2
+        assert result['failed_stocks'] == [{'code': 'N/A', 'reason': '代码格式无法识别'}]
+
+    for data, message in ((io.BytesIO(b''), '为空'), (_csv(['600519'], header='code,名称,持仓'), 'secID'),
+                          (io.BytesIO(b'secID\n\xff\xfe\xfa\n'), '编码')):
+        try:
+            import_portfolio_csv(data)
+            raise AssertionError('应当抛出 ValueError')
+        except ValueError as e:
+            assert message in str(e)
+
+
+def test_gbk_after_ascii_sample_falls_back():
+    """文件开头64KB是纯ASCII、后面才出现GBK中文名称时按GBK重新读取，不拒绝整个文件"""
+    head = ''.join(f'{600000 + i % 3000:06d}.XSHG,ABC,100\n' for i in range(5000))
+    tail = '000001.XSHE,平安银行,100\n300750.XSHE,宁德时代,100\n'
+    data = b'secID,name,qty\n' + head.encode('ascii') + tail.encode('gbk')
+    assert len(data) > 64 * 1024
+
+    result = import_portfolio_csv(io.BytesIO(data), chunk_rows=1000)
+    assert result['total_count'] == 5002
+    assert result['converted_count'] == 3002 and result['duplicate_count'] == 2000
+    assert result['converted_stocks'][-1] == {'original_code': '300750.XSHE', 'converted_code': '300750'}
+
+
+def test_import_2000_lines_is_fast():
+    """2000行持仓文件（含重复）一次导入，不逐行转换"""
+    rows = [f'{600000 + i % 1500:06d}.XSHG' for i in range(2000)]
+    data = _csv(rows, 'gbk').getvalue()
+
+    start_time = time.perf_counter()
+    result = import_portfolio_csv(io.BytesIO(data))
+    elapsed = time.perf_counter() - start_time
+
+    assert result['total_count'] == 2000
+    assert result['converted_count'] == 1500 and result['duplicate_count'] == 500
+    assert elapsed < 0.5
+
+
+def test_imported_stocks_scored_as_one_job():
+    """导入的股票作为一个作业评分，结果带导入序号，失败单独计数"""
+    def score(stock_code, market_type):
+        if stock_code == '000002':
+            raise ValueError('no data')
+        return {'stock_code': stock_code, 'market_type': market_type, 'score': int(stock_code) % 100}
+
+    codes = [f'{i:06d}' for i in range(1, 41)]
+    job = submit_portfolio_analysis(codes, score, 'A')
+    assert job.wait(10)
+
+    progress = analysis_executor.get_job_results(job.job_id)
+    assert progress['status'] == 'completed'
+    assert progress['completed'] == 39 and progress['failed'] == 1
+    results = sorted(progress['results'], key=lambda item: item['index'])
+    assert [item['result']['stock_code'] for item in results] == [c for c in codes if c != '000002']
+    assert list(progress['errors']) == [1] and progress['next_cursor'] == 40
+    assert analysis_executor.get_job_results('missing') is None
+
+
+if __name__ == "__main__":
+    print("🚀 投资组合CSV导入测试")
+    print("=" * 40)
+    test_normalize_codes_whole_column()
+    test_import_dedups_and_reports_failures()
+    test_gbk_after_ascii_sample_falls_back()
+    test_import_2000_lines_is_fast()
+    test_imported_stocks_scored_as_one_job()
+    print("✅ 全部通过")
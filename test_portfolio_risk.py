@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+组合风险引擎测试
+使用模拟行情验证并发获取、收益率对齐、协方差风险指标和风险贡献
+"""
+
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+
+from risk_monitor import RiskMonitor
+
+
+class _FakeAnalyzer:
+    """按股票代码生成确定性行情的模拟分析器"""
+
+    def __init__(self, fetch_delay=0.0):
+        self.fetch_delay = fetch_delay
+        self.fetch_counts = {}
+        self.lock = threading.Lock()
+
+    def get_stock_data(self, stock_code, market_type='A'):
+        with self.lock:
+            self.fetch_counts[stock_code] = self.fetch_counts.get(stock_code, 0) + 1
+        time.sleep(self.fetch_delay)
+        rng = np.random.default_rng(int(stock_code))
+        dates = pd.bdate_range('2024-01-01', periods=260)
+        market = np.random.default_rng(0).normal(0, 0.01, len(dates))
+        returns = 0.7 * market + rng.normal(0, 0.01, len(dates))
+        close = 10 * np.cumprod(1 + returns)
+        return pd.DataFrame({'date': dates, 'close': close, 'volume': rng.uniform(1e5, 2e5, len(dates))})
+
+    def calculate_indicators(self, df):
+        df = df.copy()
+        for window in (5, 20, 60):
+            df[f'MA{window}'] = df['close'].rolling(window, min_periods=1).mean()
+        df['RSI'] = 50.0
+        df['MACD'] = df['MA5'] - df['MA20']
+        df['Signal'] = df['MACD'].rolling(9, min_periods=1).mean()
+        df['Volatility'] = df['close'].pct_change().rolling(20, min_periods=1).std().fillna(0.01) * 100
+        return df
+
+    def get_stock_info(self, stock_code, market_type='A'):
+        return {'股票名称': f'股票{stock_code}', '行业': '银行' if int(stock_code) % 2 else '医药'}
+
+
+def test_risk_metrics_match_direct_formulas():
+    """风险贡献之和等于组合波动率，VaR/CVaR 关系正确"""
+    rng = np.random.default_rng(42)
+    returns = rng.normal(0.0005, 0.02, size=(500, 4))
+    weights = np.array([4, 3, 2, 1], dtype=float)
+
+    metrics = RiskMonitor.compute_risk_metrics(returns, weights, confidence=0.95)
+
+    w = weights / weights.sum()
+    expected_vol = np.sqrt(w @ np.cov(returns, rowvar=False) @ w) * np.sqrt(252)
+    assert np.isclose(metrics['portfolio_volatility'], expected_vol)
+    assert np.isclose(metrics['component_contribution'].sum(), metrics['portfolio_volatility'])
+    assert np.isclose(metrics['pct_contribution'].sum(), 1.0)
+    assert metrics['historical_cvar'] >= metrics['historical_var'] > 0
+    assert metrics['parametric_cvar'] > metrics['parametric_var']
+    assert metrics['diversification_ratio'] >= 1.0
+
+
+def test_portfolio_fetches_each_holding_once_concurrently():
+    """每只持仓只获取一次，且并发执行"""
+    analyzer = _FakeAnalyzer(fetch_delay=0.2)
+    monitor = RiskMonitor(analyzer)
+    portfolio = [{'stock_code': f'{600000 + i}', 'weight': 1 + i % 3} for i in range(16)]
+
+    start_time = time.time()
+    result = monitor.analyze_portfolio_risk(portfolio)
+    elapsed = time.time() - start_time
+    print(f"16只持仓组合风险耗时: {elapsed:.2f}秒")
+
+    assert 'error' not in result
+    assert all(count == 1 for count in analyzer.fetch_counts.values())
+    assert elapsed < 0.2 * 16 / 2
+
+    metrics = result['portfolio_metrics']
+    assert metrics['observations'] >= 200
+    assert len(metrics['risk_contributions']) == 16
+    assert abs(sum(c['risk_contribution_pct'] for c in metrics['risk_contributions']) - 100) < 0.1
+    assert metrics['average_correlation'] > 0.2
+    assert result['risk_concentration']['max_industry'] in ('银行', '医药')
+
+
+def test_returns_matrix_aligns_on_common_dates():
+    """只保留所有持仓都有数据的交易日"""
+    dates = pd.bdate_range('2024-01-01', periods=30)
+    frames = {
+        'A': pd.DataFrame({'date': dates, 'close': np.linspace(10, 12, 30)}),
+        'B': pd.DataFrame({'date': dates[5:], 'close': np.linspace(20, 21, 25)}),
+    }
+    returns = RiskMonitor.build_returns_matrix(frames)
+    assert list(returns.columns) == ['A', 'B']
+    assert len(returns) == 24
+    assert not returns.isna().any().any()
+
+
+if __name__ == "__main__":
+    print("🚀 组合风险引擎测试")
+    print("=" * 40)
+    test_risk_metrics_match_direct_formulas()
+    test_portfolio_fetches_each_holding_once_concurrently()
+    test_returns_matrix_aligns_on_common_dates()
+    print("✅ 全部通过")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预缓存调度器测试
+验证令牌桶限速与自适应降速、按新鲜度/权重/请求频率排序、并发预缓存和中断续跑
+"""
+
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import data_provider
+from data_provider import ReplayProvider, set_data_provider
+from stock_precache_scheduler import StockPrecacheScheduler, prioritize_stocks
+from token_bucket import AdaptiveTokenBucket
+
+
+def test_token_bucket_limits_rate_and_backs_off():
+    """令牌用完后按速率放行，失败时速率减半、成功后逐步恢复"""
+    bucket = AdaptiveTokenBucket(rate=50, capacity=1)
+    start_time = time.perf_counter()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.perf_counter() - start_time >= 0.18
+
+    bucket.on_failure()
+    assert bucket.rate == 25
+    for _ in range(20):
+        bucket.on_success()
+    assert bucket.rate == 50
+    assert bucket.get_stats()['upstream_calls'] == 11
+
+
+def test_priority_order_staleness_then_weight_and_frequency():
+    """无数据优先于过时数据；同组内权重和请求频率高的优先；数据良好的跳过历史行情"""
+    groups = {'no_data': ['000002', '000003'], 'stale': ['000001'], 'good': ['000004']}
+    weights = {'000001': 10.0, '000002': 1.0, '000003': 2.0, '000004': 5.0}
+    frequency = {'000002': 30.0}
+
+    plan = prioritize_stocks(['000001', '000002', '000003', '000004'], weights, frequency, groups)
+
+    assert [item['stock_code'] for item in plan] == ['000002', '000003', '000001', '000004']
+    assert [item['refresh_history'] for item in plan] == [True, True, True, False]
+
+
+def test_concurrent_precache_with_resume():
+    """并发预缓存明显快于逐只处理；同日再次运行时跳过已完成的股票"""
+    codes = [f'{600100 + i:06d}' for i in range(24)]
+    original = data_provider._provider
+    set_data_provider(ReplayProvider(latency_ms=40, jitter_ms=0, seed=9))
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            state_file = os.path.join(data_dir, 'precache_state.json')
+            scheduler = StockPrecacheScheduler(max_workers=8, rate=200, burst=50, state_file=state_file)
+
+            # 模拟中断：前一半股票已在今天完成
+            with open(state_file, 'w', encoding='utf-8') as f:
+                json.dump({'index_code': 'test', 'run_date': datetime.now().strftime('%Y-%m-%d'),
+                           'completed': codes[:12], 'failed': {}, 'finished': False}, f)
+
+            start_time = time.perf_counter()
+            stats = scheduler.run_precache_task('test', max_stocks=100, stock_codes=codes)
+            elapsed = time.perf_counter() - start_time
+
+            with open(state_file, encoding='utf-8') as f:
+                state = json.load(f)
+    finally:
+        data_provider._provider = original
+
+    assert stats['resumed'] == 12
+    assert stats['success_count'] == 12 and stats['failed_count'] == 0
+    assert stats['upstream_calls'] >= 12
+    assert state['finished'] is True and sorted(state['completed']) == codes
+    # 每只股票至少两次 40ms 的上游调用，逐只处理需要约1秒
+    assert elapsed < 0.8
+
+
+if __name__ == "__main__":
+    print("🚀 预缓存调度器测试")
+    print("=" * 40)
+    test_token_bucket_limits_rate_and_backs_off()
+    test_priority_order_staleness_then_weight_and_frequency()
+    test_concurrent_precache_with_resume()
+    print("✅ 全部通过")
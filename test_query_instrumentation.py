@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语句级查询统计测试
+验证指纹归一化、延迟直方图和连接池等待统计
+"""
+
+from sqlalchemy import create_engine, text
+
+from database_optimizer import QueryInstrumentation, LatencyHistogram, fingerprint_statement
+
+
+def test_fingerprint_collapses_literals_and_in_lists():
+    """字面量和IN列表被归一化"""
+    a = fingerprint_statement("SELECT * FROM t WHERE code IN (?, ?, ?) AND d > '2024-01-01'")
+    b = fingerprint_statement("SELECT *  FROM t WHERE code IN (?, ?) AND d > '2025-06-30'")
+    c = fingerprint_statement("SELECT * FROM t WHERE code IN (%s, %s) AND d > %(d)s")
+    assert a == b == c == "SELECT * FROM t WHERE code IN (?+) AND d > ?"
+
+
+def test_histogram_percentiles():
+    """分位数按桶上界估算"""
+    hist = LatencyHistogram()
+    for _ in range(95):
+        hist.observe(0.5)
+    for _ in range(5):
+        hist.observe(300)
+    stats = hist.to_dict()
+    assert stats['count'] == 100
+    assert stats['p50_ms'] == 1  # 0.5ms 落在 1ms 桶内
+    assert stats['p99_ms'] == 300
+    assert stats['buckets']['1'] == 95
+
+
+def test_instrumentation_records_statements_and_pool_wait():
+    """引擎事件钩子按语句指纹聚合"""
+    engine = create_engine('sqlite://')
+    instrumentation = QueryInstrumentation()
+    instrumentation.install(engine)
+    instrumentation.install(engine)  # 重复安装无副作用
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, code TEXT)"))
+        for i in range(10):
+            conn.execute(text("INSERT INTO t (code) VALUES (:code)"), {'code': f'{i:06d}'})
+        conn.execute(text("UPDATE t SET code = 'x' WHERE id < 4"))
+
+    stats = instrumentation.get_stats(order_by='count')
+    top = stats['top_statements'][0]
+    assert top['fingerprint'] == 'INSERT INTO t (code) VALUES (?)'
+    assert top['count'] == 10
+    assert top['rows'] == 10
+
+    update = [s for s in stats['top_statements'] if s['fingerprint'].startswith('UPDATE')][0]
+    assert update['rows'] == 3
+    assert stats['pool_checkout_wait']['count'] >= 1
+
+    instrumentation.reset()
+    assert instrumentation.get_stats()['statement_count'] == 0
+
+
+def test_failed_statement_does_not_leak_start_time():
+    """执行失败的语句不残留开始时间，后续语句计时不错位"""
+    engine = create_engine('sqlite://')
+    instrumentation = QueryInstrumentation()
+    instrumentation.install(engine)
+
+    with engine.connect() as conn:
+        for _ in range(3):
+            try:
+                conn.execute(text("SELECT * FROM missing_table"))
+            except Exception:
+                pass
+        conn.execute(text("SELECT 1"))
+        assert conn.info.get('query_start_time') == []
+
+    stats = instrumentation.get_stats()
+    assert [s['fingerprint'] for s in stats['top_statements']] == ['SELECT ?']
+    assert stats['pool_checkout_wait']['count'] == 1
+
+
+if __name__ == "__main__":
+    print("🚀 语句级查询统计测试")
+    print("=" * 40)
+    test_fingerprint_collapses_literals_and_in_lists()
+    test_histogram_percentiles()
+    test_instrumentation_records_statements_and_pool_wait()
+    test_failed_statement_does_not_leak_start_time()
+    print("✅ 全部通过")
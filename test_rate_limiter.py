@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GCRA限流器测试
+验证突发配额、匀速放行、O(1)存储以及Redis Lua脚本（使用fakeredis作为本地替身）
+"""
+
+import pytest
+
+from rate_limiter import RateLimiter, MemoryGCRABackend, RedisGCRABackend
+
+LIMIT = {'requests': 10, 'window': 60}
+
+
+def _drain(limiter, client_id, now, count):
+    return [limiter.gcra_check(client_id, LIMIT, now=now)['allowed'] for _ in range(count)]
+
+
+def _check_gcra_semantics(limiter):
+    now = 1_000_000.0
+
+    results = _drain(limiter, 'api_key:a', now, 12)
+    assert results == [True] * 10 + [False] * 2
+
+    denied = limiter.gcra_check('api_key:a', LIMIT, now=now)
+    assert denied['remaining'] == 0
+    assert denied['retry_after'] == pytest.approx(6.0)
+
+    # 一个发射间隔（6秒）后恰好恢复一次配额
+    assert limiter.gcra_check('api_key:a', LIMIT, now=now + 6.0)['allowed']
+    assert not limiter.gcra_check('api_key:a', LIMIT, now=now + 6.0)['allowed']
+
+    # 其他客户端、其他端点互不影响
+    assert limiter.gcra_check('api_key:b', LIMIT, now=now)['allowed']
+    assert limiter.gcra_check('api_key:a', LIMIT, endpoint='/x', now=now)['allowed']
+
+    # 整个窗口过后配额完全恢复
+    fresh = limiter.gcra_check('api_key:a', LIMIT, now=now + 120)
+    assert fresh['allowed'] and fresh['remaining'] == 9
+
+
+def test_memory_backend_gcra_semantics():
+    """进程内存储的突发与匀速放行"""
+    _check_gcra_semantics(RateLimiter(backend=MemoryGCRABackend(stripes=8)))
+
+
+def test_memory_backend_is_constant_size_per_client():
+    """大量请求只保存一个时间戳，恢复后可被清理"""
+    backend = MemoryGCRABackend()
+    limiter = RateLimiter(backend=backend)
+    big = {'requests': 10000, 'window': 3600}
+    for _ in range(10000):
+        limiter.gcra_check('api_key:enterprise_x', big, now=0.0)
+    assert backend.size() == 1
+    assert backend.cleanup(now=10_000.0) == 1
+    assert backend.size() == 0
+
+
+def test_redis_backend_lua_script():
+    """Redis Lua脚本与进程内实现语义一致"""
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    backend = RedisGCRABackend(fakeredis.FakeRedis(), use_server_time=False)
+    _check_gcra_semantics(RateLimiter(backend=backend))
+
+
+if __name__ == "__main__":
+    print("🚀 GCRA限流器测试")
+    print("=" * 40)
+    test_memory_backend_gcra_semantics()
+    test_memory_backend_is_constant_size_per_client()
+    test_redis_backend_lua_script()
+    print("✅ 全部通过")
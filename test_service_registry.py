@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+延迟初始化服务注册表测试
+验证服务只构造一次、代理转发属性、工作线程延后错峰启动、独立入口登记即启动，
+以及 web_server 导入时不再构造分析器和启动线程
+"""
+
+import subprocess
+import sys
+import threading
+import time
+
+import service_registry
+from service_registry import LazyService, ServiceRegistry
+
+
+def test_service_constructed_once_on_first_use():
+    """并发首次访问只调用一次工厂，代理透明转发属性"""
+    registry = ServiceRegistry()
+    calls = []
+
+    class Service:
+        value = 42
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return Service()
+
+    registry.register('svc', factory)
+    proxy = LazyService(registry, 'svc')
+    assert not registry.is_initialized('svc')
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(proxy.value)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [42] * 8
+    assert len(calls) == 1
+    assert registry.status()['services']['svc']['init_ms'] >= 50
+
+
+def test_workers_start_after_trigger_with_stagger():
+    """工作线程在触发前不启动，触发后按间隔依次启动，同名只登记一次"""
+    registry = ServiceRegistry()
+    started = []
+    registry.register_worker('a', lambda: started.append(('a', time.perf_counter())))
+    registry.register_worker('b', lambda: started.append(('b', time.perf_counter())))
+    registry.register_worker('a', lambda: started.append(('dup', time.perf_counter())))
+
+    time.sleep(0.05)
+    assert started == []
+
+    assert registry.start_workers(delay=0.02, stagger=0.05) is True
+    assert registry.start_workers() is False
+    deadline = time.time() + 2
+    while len(started) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert [name for name, _ in started] == ['a', 'b']
+    assert started[1][1] - started[0][1] >= 0.04
+
+    # 触发后登记的工作线程直接排队启动
+    registry.register_worker('late', lambda: started.append(('late', time.perf_counter())))
+    deadline = time.time() + 2
+    while len(started) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    assert started[-1][0] == 'late'
+
+
+def test_worker_started_once_under_concurrent_calls():
+    """多个线程同时启动同一工作线程时只启动一次"""
+    registry = ServiceRegistry()
+    calls = []
+    registry.register_worker('w', lambda: (time.sleep(0.01), calls.append(1)))
+    barrier = threading.Barrier(16)
+
+    def start():
+        barrier.wait()
+        registry._start_worker('w')
+
+    threads = [threading.Thread(target=start) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == [1]
+    assert registry.status()['workers']['w']['started_at'] is not None
+
+
+def test_standalone_entrypoint_starts_workers_on_registration():
+    """没有 Web 服务触发时（预缓存调度器、命令行脚本），登记工作线程即错峰启动"""
+    original_delay, original_stagger = service_registry.WORKER_START_DELAY, service_registry.WORKER_STAGGER_SECONDS
+    service_registry.WORKER_START_DELAY, service_registry.WORKER_STAGGER_SECONDS = 0.05, 0.05
+    try:
+        registry = ServiceRegistry(hold_workers=False)
+        started = []
+        registry.register_worker('a', lambda: started.append('a'))
+        registry.register_worker('b', lambda: started.append('b'))
+        assert started == []
+    finally:
+        service_registry.WORKER_START_DELAY, service_registry.WORKER_STAGGER_SECONDS = original_delay, original_stagger
+
+    probe = (
+        "import os, time\n"
+        "os.environ['WORKER_START_DELAY'] = '0'\n"
+        "os.environ['WORKER_STAGGER_SECONDS'] = '0'\n"
+        "from data_service import data_service\n"
+        "from service_registry import service_registry\n"
+        "deadline = time.time() + 10\n"
+        "worker = lambda: service_registry.status()['workers']['data_service.cache_cleanup']\n"
+        "while worker()['started_at'] is None and time.time() < deadline:\n"
+        "    time.sleep(0.05)\n"
+        "print(worker()['started_at'] is not None)\n"
+    )
+    completed = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    assert completed.stdout.strip().splitlines()[-1] == 'True'
+
+    deadline = time.time() + 10
+    while len(started) < 2 and time.time() < deadline:
+        time.sleep(0.05)
+    assert started == ['a', 'b']
+
+
+def test_web_server_import_is_lazy():
+    """导入 web_server 后不加载分析器模块、除日志队列外不启动后台线程"""
+    probe = (
+        "import sys, threading, web_server\n"
+        "heavy = [m for m in ('stock_analyzer', 'akshare', 'news_fetcher') if m in sys.modules]\n"
+        "threads = [t.name for t in threading.enumerate() if t.name != 'log-queue-listener']\n"
+        "print(heavy, len(threads), web_server.service_registry.is_initialized('analyzer'))\n"
+    )
+    completed = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    assert completed.stdout.strip().splitlines()[-1] == '[] 1 False'
+
+
+if __name__ == "__main__":
+    print("🚀 延迟初始化服务注册表测试")
+    print("=" * 40)
+    test_service_constructed_once_on_first_use()
+    test_workers_start_after_trigger_with_stagger()
+    test_worker_started_once_under_concurrent_calls()
+    test_standalone_entrypoint_starts_workers_on_registration()
+    test_web_server_import_is_lazy()
+    print("✅ 全部通过")
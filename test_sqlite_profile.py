@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite WAL性能配置测试
+验证PRAGMA设置、读写分离会话（含会话读取自己已flush的写入）以及写事务进行中读操作不被阻塞
+"""
+
+import os
+import sys
+import subprocess
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+
+from database import create_sqlite_engines
+
+
+def test_sqlite_engines_enable_wal_and_pragmas():
+    """读写引擎均启用WAL和调优PRAGMA"""
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'test.db')}"
+        read_engine, write_engine = create_sqlite_engines(url)
+
+        with read_engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar().lower() == 'wal'
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA cache_size")).scalar() < 0
+
+        assert write_engine.pool.size() == 1
+        read_engine.dispose()
+        write_engine.dispose()
+
+
+def test_reads_not_blocked_by_open_write_transaction():
+    """写事务未提交时，读连接仍能立即读取已提交数据"""
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'test.db')}"
+        read_engine, write_engine = create_sqlite_engines(url)
+
+        with write_engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, v INTEGER)"))
+            conn.execute(text("INSERT INTO t (v) VALUES (1)"))
+
+        write_started = threading.Event()
+        release_write = threading.Event()
+
+        def long_write():
+            with write_engine.begin() as conn:
+                conn.execute(text("INSERT INTO t (v) VALUES (2)"))
+                write_started.set()
+                release_write.wait(5)
+
+        writer = threading.Thread(target=long_write)
+        writer.start()
+        write_started.wait(5)
+
+        start_time = time.time()
+        with read_engine.connect() as conn:
+            count = conn.execute(text("SELECT COUNT(*) FROM t")).scalar()
+        elapsed = time.time() - start_time
+
+        release_write.set()
+        writer.join()
+
+        print(f"写事务进行中读取耗时: {elapsed * 1000:.1f} ms")
+        assert count == 1
+        assert elapsed < 1.0
+
+        read_engine.dispose()
+        write_engine.dispose()
+
+
+def test_module_profile_routes_writes_through_writer():
+    """以WAL配置加载database模块时，ORM写入和写队列均可用"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'app.db')}",
+                   USE_DATABASE='true', SQLITE_PROFILE='wal',
+                   PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        script = (
+            "import database as d\n"
+            "assert d.write_engine is not d.engine\n"
+            "s = d.get_session()\n"
+            "s.add(d.StockInfo(stock_code='000001'))\n"
+            "s.commit()\n"
+            "assert s.query(d.StockInfo).count() == 1\n"
+            "s.close()\n"
+            "d.bulk_upsert(d.StockRealtimeData, [{'stock_code': '000001', 'market_type': 'A'}])\n"
+            "s = d.get_session()\n"
+            "assert s.query(d.StockRealtimeData).count() == 1\n"
+            "print('OK')\n"
+        )
+        result = subprocess.run([sys.executable, '-c', script], env=env, cwd=tmp,
+                                capture_output=True, text=True, timeout=60)
+        assert 'OK' in result.stdout, result.stderr
+
+
+def test_session_reads_own_flushed_writes():
+    """同一会话 flush 后的读取走写连接，能看到本事务未提交的写入；提交后恢复走读引擎"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'app.db')}",
+                   USE_DATABASE='true', SQLITE_PROFILE='wal',
+                   PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        script = (
+            "import database as d\n"
+            "s = d.get_session()\n"
+            "assert s.get_bind() is d.engine\n"
+            "s.add(d.StockInfo(stock_code='000001'))\n"
+            "s.flush()\n"
+            "assert s.query(d.StockInfo).count() == 1\n"
+            "assert s.get_bind() is d.write_engine\n"
+            "s.rollback()\n"
+            "assert s.get_bind() is d.engine\n"
+            "assert s.query(d.StockInfo).count() == 0\n"
+            "s.add(d.StockInfo(stock_code='000002'))\n"
+            "s.flush()\n"
+            "s.commit()\n"
+            "assert s.get_bind() is d.engine\n"
+            "s.close()\n"
+            "d.bulk_upsert(d.StockRealtimeData, [{'stock_code': '000001', 'market_type': 'A'}])\n"
+            "s = d.get_session()\n"
+            "assert s.query(d.StockInfo).count() == 1\n"
+            "assert s.query(d.StockRealtimeData).count() == 1\n"
+            "print('OK')\n"
+        )
+        result = subprocess.run([sys.executable, '-c', script], env=env, cwd=tmp,
+                                capture_output=True, text=True, timeout=60)
+        assert 'OK' in result.stdout, result.stderr
+
+
+def test_pinned_session_fails_fast_on_queued_write():
+    """会话占用写连接时，同线程的 bulk_upsert 立即报错而不是卡满连接池超时；其他线程的写入不受影响"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'app.db')}",
+                   USE_DATABASE='true', SQLITE_PROFILE='wal', DATABASE_POOL_TIMEOUT='5',
+                   PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        script = (
+            "import time, threading\n"
+            "import database as d\n"
+            "d.init_db()\n"
+            "rows = [{'stock_code': '000001', 'market_type': 'A'}]\n"
+            "s = d.get_session()\n"
+            "s.add(d.StockInfo(stock_code='000001'))\n"
+            "s.flush()\n"
+            "start = time.time()\n"
+            "try:\n"
+            "    d.bulk_upsert(d.StockRealtimeData, rows)\n"
+            "    raise SystemExit('no error')\n"
+            "except RuntimeError:\n"
+            "    pass\n"
+            "assert time.time() - start < 1\n"
+            "s.commit()\n"
+            "d.bulk_upsert(d.StockRealtimeData, rows)\n"
+            "s.add(d.StockInfo(stock_code='000002'))\n"
+            "s.flush()\n"
+            "other = []\n"
+            "t = threading.Thread(target=lambda: other.append(d.submit_write(lambda conn: 1)))\n"
+            "t.start(); t.join()\n"
+            "assert other and not other[0].done()\n"
+            "s.commit()\n"
+            "assert other[0].result(timeout=5) == 1\n"
+            "s.close()\n"
+            "print('OK')\n"
+        )
+        result = subprocess.run([sys.executable, '-c', script], env=env, cwd=tmp,
+                                capture_output=True, text=True, timeout=60)
+        assert 'OK' in result.stdout, result.stderr
+
+
+if __name__ == "__main__":
+    print("🚀 SQLite WAL性能配置测试")
+    print("=" * 40)
+    test_sqlite_engines_enable_wal_and_pragmas()
+    test_reads_not_blocked_by_open_write_transaction()
+    test_module_profile_routes_writes_through_writer()
+    test_session_reads_own_flushed_writes()
+    test_pinned_session_fails_fast_on_queued_write()
+    print("✅ 全部通过")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+智能问答上下文测试
+验证同一股票的追问复用缓存的上下文、新K线和过期时重新生成，以及对话历史的数量上限和闲置淘汰
+"""
+
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+import stock_qa
+from stock_qa import ConversationStore, StockQA, latest_bar_date
+
+
+class FakeAnalyzer:
+    """记录行情获取次数的分析器"""
+
+    def __init__(self):
+        self.data_calls = 0
+
+    def get_stock_info(self, stock_code):
+        return {'股票名称': '测试股票', '行业': '银行'}
+
+    def get_stock_data(self, stock_code, market_type='A'):
+        self.data_calls += 1
+        close = np.linspace(10, 12, 30)
+        return pd.DataFrame({'close': close})
+
+    def calculate_indicators(self, df):
+        for column in ('MA5', 'MA20', 'MA60', 'RSI', 'MACD', 'Signal', 'BB_upper', 'BB_middle',
+                       'BB_lower', 'Volatility'):
+            df[column] = df['close']
+        return df
+
+    def calculate_score(self, df):
+        return 60
+
+    def identify_support_resistance(self, df):
+        levels = {'short_term': [10.5], 'medium_term': [10.0]}
+        return {'support_levels': levels, 'resistance_levels': levels}
+
+
+class FailingAnalyzer(FakeAnalyzer):
+    def get_stock_data(self, stock_code, market_type='A'):
+        self.data_calls += 1
+        raise ValueError('upstream down')
+
+
+def _qa(analyzer):
+    qa = StockQA(analyzer, openai_api_key='test')
+    # 基本面不访问上游
+    qa._fundamental_analyzer = type('Fundamental', (), {'get_financial_indicators': lambda self, code: {}})()
+    return qa
+
+
+def test_follow_up_reuses_context():
+    """同一股票同一市场的追问不再重新获取行情，换股票或换市场单独缓存"""
+    analyzer = FakeAnalyzer()
+    qa = _qa(analyzer)
+
+    first = qa._get_stock_context('600000', 'A')
+    second = qa._get_stock_context('600000', 'A')
+    assert second is first and analyzer.data_calls == 1
+    assert '测试股票' in first['context']
+
+    qa._get_stock_context('600001', 'A')
+    qa._get_stock_context('600000', 'HK')
+    assert analyzer.data_calls == 3
+
+
+def test_context_rebuilt_on_new_bar_or_expiry():
+    """最新K线日期变化或超过缓存时间后重新生成；失败的上下文不缓存"""
+    analyzer = FakeAnalyzer()
+    qa = _qa(analyzer)
+
+    original_bar_date, original_ttl = stock_qa.latest_bar_date, stock_qa.QA_CONTEXT_TTL
+    try:
+        stock_qa.latest_bar_date = lambda market_type='A': date(2024, 5, 20)
+        qa._get_stock_context('600000')
+        stock_qa.latest_bar_date = lambda market_type='A': date(2024, 5, 21)
+        qa._get_stock_context('600000')
+        qa._get_stock_context('600000')
+        assert analyzer.data_calls == 2
+
+        stock_qa.QA_CONTEXT_TTL = 0
+        qa._get_stock_context('600000')
+        assert analyzer.data_calls == 3
+    finally:
+        stock_qa.latest_bar_date, stock_qa.QA_CONTEXT_TTL = original_bar_date, original_ttl
+
+    failing = FailingAnalyzer()
+    qa = _qa(failing)
+    assert 'error' in qa._get_stock_context('600000')
+    qa._get_stock_context('600000')
+    assert failing.data_calls == 2
+
+
+def test_latest_bar_date_follows_session_open():
+    """交易日开盘前仍是上一交易日的K线，开盘后为当天"""
+    # 2024-05-20 为周一
+    assert latest_bar_date('A', datetime(2024, 5, 20, 9, 0)) == date(2024, 5, 17)
+    assert latest_bar_date('A', datetime(2024, 5, 20, 9, 31)) == date(2024, 5, 20)
+    assert latest_bar_date('A', datetime(2024, 5, 19, 12, 0)) == date(2024, 5, 17)
+
+
+def test_conversation_store_bounded_and_expires():
+    """超出上限时淘汰最久未使用的对话，闲置超时的对话被淘汰"""
+    store = ConversationStore(max_conversations=3, ttl=3600)
+    for i in range(3):
+        store[f'c{i}'] = [i]
+    assert store.get('c0') == [0]  # c0 变为最近使用
+    store['c3'] = [3]
+    assert len(store) == 3 and 'c1' not in store
+    assert store.keys() == ['c2', 'c0', 'c3']
+
+    del store['c2']
+    assert store.keys() == ['c0', 'c3']
+
+    expiring = ConversationStore(max_conversations=100, ttl=0.05)
+    expiring['old'] = []
+    time.sleep(0.1)
+    expiring['new'] = []
+    assert expiring.keys() == ['new'] and 'old' not in expiring
+
+    qa = _qa(FakeAnalyzer())
+    qa.conversation_history = store
+    assert qa.clear_conversation()['message'] == '已清除所有 2 个对话'
+    assert len(store) == 0
+
+
+def test_clear_conversation_tolerates_concurrent_eviction():
+    """清除对话时对话恰好被淘汰也不抛 KeyError"""
+    store = ConversationStore(max_conversations=100, ttl=3600)
+    store['600519_1'] = ['q']
+    assert store.pop('600519_1') == ['q']
+    assert store.pop('600519_1') is None and store.pop('missing', []) == []
+
+    expiring = ConversationStore(max_conversations=100, ttl=0.05)
+    expiring['600519_1'] = []
+    expiring['600519_2'] = []
+    qa = _qa(FakeAnalyzer())
+    qa.conversation_history = expiring
+    original_keys = expiring.keys
+    # 列出对话后、删除前对话已过期被淘汰
+    expiring.keys = lambda: (original_keys(), time.sleep(0.1))[0]
+    assert qa.clear_conversation(stock_code='600519')['message'] == '已清除与股票 600519 相关的 0 个对话'
+
+    store['600519_3'] = ['q']
+    qa.conversation_history = store
+    assert qa.clear_conversation(conversation_id='600519_3')['message'] == '已清除对话 600519_3'
+    assert '600519_3' not in store
+
+
+if __name__ == "__main__":
+    print("🚀 智能问答上下文测试")
+    print("=" * 40)
+    test_follow_up_reuses_context()
+    test_context_rebuilt_on_new_bar_or_expiry()
+    test_latest_bar_date_follows_session_open()
+    test_conversation_store_bounded_and_expires()
+    test_clear_conversation_tolerates_concurrent_eviction()
+    print("✅ 全部通过")
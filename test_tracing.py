@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求级阶段追踪测试
+验证 span 嵌套、属性、线程池上下文传递、上限截断和空操作路径
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from tracing import start_trace, span, traced, set_span_attribute, wrap_context, get_trace
+
+
+class _FakeAnalyzer:
+    @traced('fake.fetch')
+    def fetch(self):
+        set_span_attribute('cache_level', 'MEMORY')
+        set_span_attribute('rows', 250)
+        return 250
+
+    @traced()
+    def analyze(self):
+        rows = self.fetch()
+        with span('fake.score', rows=rows):
+            return rows * 2
+
+
+def test_nested_spans_and_attributes():
+    """装饰器和上下文管理器生成嵌套的阶段树"""
+    analyzer = _FakeAnalyzer()
+    with start_trace('task.test', stock_code='600519') as trace:
+        assert analyzer.analyze() == 500
+
+    tree = get_trace(trace.trace_id)
+    assert tree['finished'] is True
+    analyze_span = tree['root']['children'][0]
+    assert analyze_span['name'] == '_FakeAnalyzer.analyze'
+    fetch_span, score_span = analyze_span['children']
+    assert fetch_span['attributes'] == {'cache_level': 'MEMORY', 'rows': 250}
+    assert score_span['attributes']['rows'] == 250
+
+    summary = trace.summary()
+    assert summary['stages']['fake.fetch']['count'] == 1
+
+
+def test_span_is_noop_without_trace():
+    """没有活动追踪时不记录"""
+    with span('orphan') as current:
+        assert current is None
+    assert _FakeAnalyzer().analyze() == 500
+
+
+def test_context_propagates_to_thread_pool():
+    """wrap_context 让线程池中的调用挂到当前追踪下"""
+    analyzer = _FakeAnalyzer()
+    with start_trace('task.pool') as trace:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(wrap_context(analyzer.fetch)) for _ in range(6)]
+            results = [f.result() for f in futures]
+    assert results == [250] * 6
+    assert len(trace.root.children) == 6
+
+
+def test_span_limit_and_error_recording():
+    """超出上限的 span 被丢弃，异常记录在 span 上"""
+    original = tracing.MAX_SPANS_PER_TRACE
+    tracing.MAX_SPANS_PER_TRACE = 3
+    try:
+        with start_trace('task.limit') as trace:
+            for _ in range(5):
+                with span('step'):
+                    pass
+            try:
+                with span('boom'):
+                    raise ValueError('bad')
+            except ValueError:
+                pass
+    finally:
+        tracing.MAX_SPANS_PER_TRACE = original
+
+    assert trace.span_count == 3
+    assert trace.dropped_spans == 3
+
+    with start_trace('task.error') as trace:
+        try:
+            with span('boom'):
+                raise ValueError('bad')
+        except ValueError:
+            pass
+    assert trace.root.children[0].error == 'ValueError: bad'
+
+
+if __name__ == "__main__":
+    print("🚀 请求级阶段追踪测试")
+    print("=" * 40)
+    test_nested_spans_and_attributes()
+    test_span_is_noop_without_trace()
+    test_context_propagates_to_thread_pool()
+    test_span_limit_and_error_recording()
+    print("✅ 全部通过")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+交易日历测试
+验证规则日历、持久化日历覆盖、区间查询以及1000只股票完整性检查级别的查询开销
+"""
+
+import time
+import tempfile
+from datetime import date, datetime, timedelta
+
+from trading_calendar import TradingCalendar
+
+
+def _calendar(tmp):
+    return TradingCalendar(data_dir=tmp, offline=True)
+
+
+def test_a_share_rules_and_known_holidays():
+    """周末、固定节假日和已知休市日"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cal = _calendar(tmp)
+        assert not cal.is_trading_day(date(2024, 3, 2))      # 周六
+        assert not cal.is_trading_day('2024-10-01')           # 国庆
+        assert not cal.is_trading_day('2025-01-29')           # 春节
+        assert cal.is_trading_day(datetime(2024, 3, 4, 10))   # 周一
+
+
+def test_range_queries_match_day_by_day_walk():
+    """区间计数、列举、前后交易日与逐日遍历一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cal = _calendar(tmp)
+        start, end = date(2024, 1, 1), date(2024, 12, 31)
+
+        walked = []
+        current = start
+        while current <= end:
+            if cal.is_trading_day(current):
+                walked.append(current)
+            current += timedelta(days=1)
+
+        assert cal.get_trading_days_between(start, end) == walked
+        assert cal.count_trading_days_between(start, end) == len(walked)
+        assert cal.get_trading_day_strings_between(start, end, fmt='%Y%m%d')[0] == walked[0].strftime('%Y%m%d')
+
+        assert cal.get_last_trading_day(date(2024, 10, 8)) == date(2024, 9, 30)
+        assert cal.get_next_trading_day(date(2024, 9, 30)) == date(2024, 10, 8)
+        assert cal.trading_days_ago(5, date(2024, 3, 11)) == date(2024, 3, 4)
+
+
+def test_hk_and_us_markets():
+    """港股、美股规则节假日"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cal = _calendar(tmp)
+        assert not cal.is_trading_day(date(2024, 7, 4), market='US')     # Independence Day
+        assert not cal.is_trading_day(date(2024, 11, 28), market='US')   # Thanksgiving
+        assert not cal.is_trading_day(date(2024, 3, 29), market='US')    # Good Friday
+        assert not cal.is_trading_day(date(2024, 7, 1), market='HK')
+        assert cal.is_trading_day(date(2024, 7, 1), market='US')
+        assert cal.is_market_open_time(datetime(2024, 7, 2, 15, 30), market='HK')
+        assert not cal.is_market_open_time(datetime(2024, 7, 2, 15, 30), market='A')
+
+
+def test_persisted_calendar_overrides_rules():
+    """持久化的官方日历在其范围内覆盖规则日历"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cal = _calendar(tmp)
+        # 模拟官方日历：2024-03-04 临时休市
+        official = [d for d in cal.get_trading_days_between(date(2024, 1, 1), date(2024, 12, 31))
+                    if d != date(2024, 3, 4)]
+        cal.save_trading_days('A', official)
+
+        reloaded = _calendar(tmp)
+        assert reloaded.get_index('A').source == 'persisted'
+        assert not reloaded.is_trading_day(date(2024, 3, 4))
+        assert reloaded.is_trading_day(date(2023, 3, 6))   # 范围外仍用规则
+
+
+def test_completeness_checks_spend_little_time_in_calendar():
+    """1000只股票的完整性检查在日历上的耗时可以忽略"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cal = _calendar(tmp)
+        cal.get_index('A')
+        start_time = time.time()
+        for _ in range(1000):
+            cal.get_trading_day_strings_between('2024-01-01', '2024-12-31', fmt='%Y%m%d')
+            cal.is_trading_day(date(2024, 6, 3))
+            cal.get_last_trading_day(date(2024, 6, 3))
+        elapsed = time.time() - start_time
+        print(f"1000次完整性检查日历耗时: {elapsed * 1000:.1f} ms")
+        assert elapsed < 1.0
+
+
+if __name__ == "__main__":
+    print("🚀 交易日历测试")
+    print("=" * 40)
+    test_a_share_rules_and_known_holidays()
+    test_range_queries_match_day_by_day_walk()
+    test_hk_and_us_markets()
+    test_persisted_calendar_overrides_rules()
+    test_completeness_checks_spend_little_time_in_calendar()
+    print("✅ 全部通过")
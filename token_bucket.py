@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 上游调用自适应令牌桶
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- 按速率放行上游调用，令牌用完时阻塞等待
+- 上游报错时速率减半，连续成功后逐步恢复到上限（AIMD）
+- 预缓存调度器和共享分析线程池各自持有一个实例；本模块不配置日志、不依赖其他业务模块
+"""
+
+import threading
+import time
+
+
+class AdaptiveTokenBucket:
+    """上游调用令牌桶：失败时速率减半，连续成功后逐步恢复到上限"""
+
+    def __init__(self, rate: float = 10.0, capacity: int = 20, min_rate: float = None):
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else max(rate / 10, 0.2)
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.acquired = 0
+        self.failures = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """阻塞直到取得一个令牌"""
+        start_time = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    self.acquired += 1
+                    self.wait_seconds += now - start_time
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            # 加性恢复：每次成功提升上限的5%
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_failure(self):
+        with self.lock:
+            self.failures += 1
+            # 乘性降速：上游报错多半是限流或过载
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'upstream_calls': self.acquired,
+                'upstream_failures': self.failures,
+                'current_rate': round(self.rate, 2),
+                'max_rate': self.max_rate,
+                'wait_seconds': round(self.wait_seconds, 2)
+            }
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+智能分析系统（股票） - 请求级阶段追踪
+开发者：熊猫大侠
+版本：v1.0.0
+许可证：MIT License
+
+功能：
+- start_trace 为一次请求或后台任务开启追踪，结束后保存在有界的 TraceStore 中
+- span 上下文管理器 / traced 装饰器记录嵌套的计时阶段及属性（缓存层级、行数、上游接口等）
+- 当前 span 通过 contextvars 传递；提交到线程池时用 wrap_context 携带上下文
+- 没有活动追踪时 span 为空操作，调用开销只有一次 ContextVar 读取
+- 每个 span 的耗时同时写入 metrics_core 直方图，可在 /metrics 中查看各阶段尾延迟
+"""
+
+import contextvars
+import functools
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics_core import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# 单个追踪最多记录的 span 数，超出部分只计数不保存（如全市场扫描）
+MAX_SPANS_PER_TRACE = 2000
+# 保留最近完成的追踪数量
+MAX_STORED_TRACES = 200
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+span_latency = metrics_registry.histogram(
+    'stock_trace_span_seconds', '追踪阶段耗时（秒）', ('span',))
+
+
+class Span:
+    """一个计时阶段"""
+
+    __slots__ = ('trace', 'name', 'attributes', 'children', 'start_time', 'end_time',
+                 'thread_name', 'error')
+
+    def __init__(self, trace: 'Trace', name: str, attributes: Dict[str, Any] = None):
+        self.trace = trace
+        self.name = name
+        self.attributes = dict(attributes) if attributes else {}
+        self.children: List['Span'] = []
+        self.start_time = time.perf_counter()
+        self.end_time: Optional[float] = None
+        self.thread_name = threading.current_thread().name
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        return end_time - self.start_time
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+        span_latency.labels(self.name).observe(self.end_time - self.start_time)
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'offset_ms': round((self.start_time - self.trace.root.start_time) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3),
+            'thread': self.thread_name,
+            'attributes': self.attributes,
+            'error': self.error,
+            'children': [child.to_dict() for child in list(self.children)]
+        }
+
+
+class Trace:
+    """一次请求或任务的 span 树"""
+
+    def __init__(self, name: str, trace_id: str = None, attributes: Dict[str, Any] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.started_at = datetime.now()
+        self.span_count = 0
+        self.dropped_spans = 0
+        self.root = Span(self, name, attributes)
+
+    def new_span(self, parent: Span, name: str, attributes: Dict[str, Any] = None) -> Optional[Span]:
+        # 计数竞争只会让上限略有偏差，不需要加锁
+        if self.span_count >= MAX_SPANS_PER_TRACE:
+            self.dropped_spans += 1
+            return None
+        self.span_count += 1
+        span = Span(self, name, attributes)
+        parent.children.append(span)
+        return span
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.root.name,
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration_ms': round(self.root.duration * 1000, 3),
+            'finished': self.root.end_time is not None,
+            'span_count': self.span_count,
+            'dropped_spans': self.dropped_spans,
+            'root': self.root.to_dict()
+        }
+
+    def summary(self) -> Dict:
+        """按 span 名称汇总耗时，用于附加到任务结果"""
+        stages: Dict[str, Dict] = {}
+
+        def walk(span: Span):
+            for child in list(span.children):
+                stage = stages.setdefault(child.name, {'count': 0, 'total_ms': 0.0})
+                stage['count'] += 1
+                stage['total_ms'] += child.duration * 1000
+                walk(child)
+
+        walk(self.root)
+        for stage in stages.values():
+            stage['total_ms'] = round(stage['total_ms'], 3)
+        return {
+            'trace_id': self.trace_id,
+            'duration_ms': round(self.root.duration * 1000, 3),
+            'stages': stages
+        }
+
+
+class TraceStore:
+    """保存最近的追踪（进行中和已完成）"""
+
+    def __init__(self, max_traces: int = MAX_STORED_TRACES):
+        self.max_traces = max_traces
+        self.lock = threading.Lock()
+        self.traces: 'OrderedDict[str, Trace]' = OrderedDict()
+
+    def add(self, trace: Trace):
+        with self.lock:
+            self.traces[trace.trace_id] = trace
+            while len(self.traces) > self.max_traces:
+                self.traces.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self.lock:
+            return self.traces.get(trace_id)
+
+    def list_recent(self, limit: int = 50, name: str = None) -> List[Dict]:
+        with self.lock:
+            traces = list(self.traces.values())
+        traces.reverse()
+        if name:
+            traces = [t for t in traces if t.root.name == name]
+        return [
+            {
+                'trace_id': t.trace_id,
+                'name': t.root.name,
+                'started_at': t.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'duration_ms': round(t.root.duration * 1000, 3),
+                'finished': t.root.end_time is not None,
+                'span_count': t.span_count,
+                'attributes': t.root.attributes
+            }
+            for t in traces[:limit]
+        ]
+
+
+# 全局追踪存储
+trace_store = TraceStore()
+
+
+@contextmanager
+def start_trace(name: str, trace_id: str = None, **attributes):
+    """开启一次追踪；已在追踪中时退化为普通 span"""
+    parent = _current_span.get()
+    if parent is not None:
+        with span(name, **attributes) as child:
+            yield child.trace if child is not None else parent.trace
+        return
+
+    trace = Trace(name, trace_id, attributes)
+    trace_store.add(trace)
+    token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.root.finish()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """记录一个阶段；不在追踪中时返回 None 且不计时"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = parent.trace.new_span(parent, name, attributes)
+    if child is None:
+        yield None
+        return
+
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        child.finish()
+
+
+def traced(name: str = None):
+    """span 装饰器，默认以 类名.方法名 命名"""
+    def decorator(func: Callable):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_span_attribute(key: str, value: Any):
+    """给当前 span 设置属性（不在追踪中时忽略）"""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+
+def wrap_context(func: Callable) -> Callable:
+    """把当前上下文（含活动 span）带入线程池中执行的函数"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # 同一个 Context 不能被多个线程同时进入，每次调用使用副本
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def get_trace(trace_id: str) -> Optional[Dict]:
+    """按ID获取追踪树"""
+    trace = trace_store.get(trace_id)
+    return trace.to_dict() if trace else None
@@ -3,257 +3,530 @@
 
 """
 交易日历工具
-用于判断A股市场的交易日，支持节假日和特殊休市日的识别
+用于判断A股、港股、美股市场的交易日，支持节假日和特殊休市日的识别
+
+交易日列表在首次使用时一次性加载为有序 NumPy 序数数组和按日位图：
+- is_trading_day: O(1) 位图查找
+- 区间计数/列举、前后交易日、N个交易日前: O(log n) 二分查找
+数据来源优先级：本地持久化文件 > 内置规则日历；A股官方日历在后台从AKShare刷新并持久化，
+查询路径上从不发起网络请求。
 """
 
+import os
+import json
 import logging
-from datetime import datetime, timedelta, date
-from typing import List, Set, Optional
-import akshare as ak
+import threading
+from datetime import datetime, timedelta, date, time as dt_time
+from typing import Dict, List, Optional, Set
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# 持久化目录及刷新周期
+CALENDAR_DATA_DIR = os.getenv('TRADING_CALENDAR_DIR', os.path.join('data', 'trading_calendar'))
+CALENDAR_REFRESH_DAYS = int(os.getenv('TRADING_CALENDAR_REFRESH_DAYS', '30'))
+CALENDAR_OFFLINE = os.getenv('TRADING_CALENDAR_OFFLINE', 'False').lower() == 'true'
+
+# 规则日历覆盖的年份范围
+CALENDAR_START_YEAR = 1990
+CALENDAR_EXTRA_YEARS = 1
+
+SUPPORTED_MARKETS = ('A', 'HK', 'US')
+
+# 各市场交易时段（市场当地时间）
+MARKET_SESSIONS = {
+    'A': [(dt_time(9, 30), dt_time(11, 30)), (dt_time(13, 0), dt_time(15, 0))],
+    'HK': [(dt_time(9, 30), dt_time(12, 0)), (dt_time(13, 0), dt_time(16, 0))],
+    'US': [(dt_time(9, 30), dt_time(16, 0))],
+}
+
+# 固定节假日（每年相同的日期）
+FIXED_HOLIDAYS = {
+    'A': {
+        (1, 1): "元旦",
+        (5, 1): "劳动节",
+        (10, 1): "国庆节",
+        (10, 2): "国庆节",
+        (10, 3): "国庆节"
+    },
+    'HK': {
+        (1, 1): "元旦",
+        (5, 1): "劳动节",
+        (7, 1): "香港特别行政区成立纪念日",
+        (10, 1): "国庆节",
+        (12, 25): "圣诞节",
+        (12, 26): "圣诞节翌日"
+    },
+    'US': {
+        (1, 1): "New Year's Day",
+        (7, 4): "Independence Day",
+        (12, 25): "Christmas Day"
+    },
+}
+
+# 已知的特殊休市安排（农历节假日等无法用规则推算的日期）
+SPECIAL_HOLIDAYS = {
+    'A': {
+        # 2024年
+        "2024-02-09", "2024-02-10", "2024-02-11", "2024-02-12",
+        "2024-02-13", "2024-02-14", "2024-02-15", "2024-02-16", "2024-02-17",
+        "2024-04-04", "2024-04-05", "2024-04-06",
+        "2024-05-02", "2024-05-03",
+        "2024-06-10",
+        "2024-09-15", "2024-09-16", "2024-09-17",
+        "2024-10-04", "2024-10-07",
+        # 2025年
+        "2025-01-28", "2025-01-29", "2025-01-30", "2025-01-31",
+        "2025-02-03", "2025-02-04",
+        "2025-04-04",
+        "2025-05-02", "2025-05-05",
+        "2025-06-02",
+        "2025-10-06", "2025-10-07", "2025-10-08",
+    },
+    'HK': set(),
+    'US': set(),
+}
+
+
+def _to_date(value) -> Optional[date]:
+    """把字符串/datetime/date统一转换为date"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        if len(value) == 8 and value.isdigit():
+            return datetime.strptime(value, '%Y%m%d').date()
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    if isinstance(value, np.datetime64):
+        return value.astype('datetime64[D]').astype(date)
+    raise TypeError(f"不支持的日期类型: {type(value)}")
+
+
+def _easter_sunday(year: int) -> date:
+    """计算复活节日期（公历，匿名算法）"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """某月第n个星期几；n<0表示倒数"""
+    if n > 0:
+        first = date(year, month, 1)
+        offset = (weekday - first.weekday()) % 7
+        return first + timedelta(days=offset + 7 * (n - 1))
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    last = next_month - timedelta(days=1)
+    offset = (last.weekday() - weekday) % 7
+    return last - timedelta(days=offset + 7 * (-n - 1))
+
+
+def _observed(holiday: date) -> date:
+    """美股节假日遇周末的顺延规则"""
+    if holiday.weekday() == 5:
+        return holiday - timedelta(days=1)
+    if holiday.weekday() == 6:
+        return holiday + timedelta(days=1)
+    return holiday
+
+
+def _rule_holidays(market: str, year: int) -> Set[date]:
+    """按规则推算某市场某年的休市日（不含周末）"""
+    holidays = set()
+    fixed = FIXED_HOLIDAYS.get(market, {})
+
+    if market == 'US':
+        for month, day in fixed:
+            holidays.add(_observed(date(year, month, day)))
+        holidays.add(_nth_weekday(year, 1, 0, 3))    # Martin Luther King Jr. Day
+        holidays.add(_nth_weekday(year, 2, 0, 3))    # Presidents' Day
+        holidays.add(_easter_sunday(year) - timedelta(days=2))  # Good Friday
+        holidays.add(_nth_weekday(year, 5, 0, -1))   # Memorial Day
+        if year >= 2022:
+            holidays.add(_observed(date(year, 6, 19)))  # Juneteenth
+        holidays.add(_nth_weekday(year, 9, 0, 1))    # Labor Day
+        holidays.add(_nth_weekday(year, 11, 3, 4))   # Thanksgiving
+    else:
+        for month, day in fixed:
+            holidays.add(date(year, month, day))
+        if market == 'HK':
+            easter = _easter_sunday(year)
+            holidays.add(easter - timedelta(days=2))  # 耶稣受难节
+            holidays.add(easter - timedelta(days=1))
+            holidays.add(easter + timedelta(days=1))  # 复活节星期一
+
+    return holidays
+
+
+def build_rule_based_days(market: str, start_year: int, end_year: int) -> np.ndarray:
+    """生成规则日历的交易日序数数组"""
+    start = np.datetime64(f'{start_year}-01-01', 'D')
+    end = np.datetime64(f'{end_year + 1}-01-01', 'D')
+    days = np.arange(start, end, dtype='datetime64[D]')
+    days = days[np.is_busday(days)]
+
+    closed = set()
+    for year in range(start_year, end_year + 1):
+        closed.update(_rule_holidays(market, year))
+    closed.update(_to_date(d) for d in SPECIAL_HOLIDAYS.get(market, ()))
+    if closed:
+        closed_arr = np.array(sorted(closed), dtype='datetime64[D]')
+        days = days[~np.isin(days, closed_arr)]
+
+    return _datetime64_to_ordinals(days)
+
+
+_ORDINAL_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def _datetime64_to_ordinals(days: np.ndarray) -> np.ndarray:
+    """datetime64[D] 数组转为 date.toordinal() 序数数组"""
+    return days.astype('datetime64[D]').astype(np.int64) + _ORDINAL_EPOCH
+
+
+def _ordinals_to_datetime64(ordinals: np.ndarray) -> np.ndarray:
+    return (np.asarray(ordinals, dtype=np.int64) - _ORDINAL_EPOCH).astype('datetime64[D]')
+
+
+class TradingDayIndex:
+    """单个市场的交易日索引：有序序数数组 + 按日位图"""
+
+    def __init__(self, ordinals: np.ndarray, source: str = 'rules'):
+        ordinals = np.unique(np.asarray(ordinals, dtype=np.int64))
+        if len(ordinals) == 0:
+            raise ValueError("交易日列表为空")
+        self.ordinals = ordinals
+        self.source = source
+        self.first = int(ordinals[0])
+        self.last = int(ordinals[-1])
+
+        bitmap = np.zeros(self.last - self.first + 1, dtype=np.uint8)
+        bitmap[ordinals - self.first] = 1
+        # bytes 的标量下标访问比 NumPy 标量更快
+        self._bits = bitmap.tobytes()
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def covers(self, ordinal: int) -> bool:
+        return self.first <= ordinal <= self.last
+
+    def is_trading_day(self, ordinal: int) -> bool:
+        return self.first <= ordinal <= self.last and self._bits[ordinal - self.first] == 1
+
+    def _left(self, ordinal: int) -> int:
+        return int(np.searchsorted(self.ordinals, ordinal, side='left'))
+
+    def _right(self, ordinal: int) -> int:
+        return int(np.searchsorted(self.ordinals, ordinal, side='right'))
+
+    def slice_between(self, start_ordinal: int, end_ordinal: int) -> np.ndarray:
+        return self.ordinals[self._left(start_ordinal):self._right(end_ordinal)]
+
+    def count_between(self, start_ordinal: int, end_ordinal: int) -> int:
+        if end_ordinal < start_ordinal:
+            return 0
+        return self._right(end_ordinal) - self._left(start_ordinal)
+
+    def prev(self, ordinal: int, n: int = 1) -> Optional[int]:
+        """严格早于 ordinal 的第 n 个交易日"""
+        index = self._left(ordinal) - n
+        return int(self.ordinals[index]) if index >= 0 else None
+
+    def next(self, ordinal: int, n: int = 1) -> Optional[int]:
+        """严格晚于 ordinal 的第 n 个交易日"""
+        index = self._right(ordinal) + n - 1
+        return int(self.ordinals[index]) if index < len(self.ordinals) else None
+
+
 class TradingCalendar:
-    """A股交易日历管理器"""
-    
-    def __init__(self):
+    """交易日历管理器（A股、港股、美股）"""
+
+    def __init__(self, data_dir: str = CALENDAR_DATA_DIR, offline: bool = CALENDAR_OFFLINE):
         self.logger = logging.getLogger(__name__)
-        self._trading_days_cache = {}  # 缓存交易日数据
-        self._cache_expiry = {}  # 缓存过期时间
-        
-        # 固定节假日（每年相同的日期）
-        self.fixed_holidays = {
-            (1, 1): "元旦",
-            (5, 1): "劳动节", 
-            (10, 1): "国庆节",
-            (10, 2): "国庆节",
-            (10, 3): "国庆节"
-        }
-        
-        # 2024年特殊休市安排（示例，实际应从官方获取）
-        self.special_holidays_2024 = {
-            # 春节
-            "2024-02-09", "2024-02-10", "2024-02-11", "2024-02-12", 
-            "2024-02-13", "2024-02-14", "2024-02-15", "2024-02-16", "2024-02-17",
-            # 清明节
-            "2024-04-04", "2024-04-05", "2024-04-06",
-            # 端午节
-            "2024-06-10",
-            # 中秋节
-            "2024-09-15", "2024-09-16", "2024-09-17"
+        self.data_dir = data_dir
+        self.offline = offline
+        self._indexes: Dict[str, TradingDayIndex] = {}
+        self._lock = threading.Lock()
+        self._refreshing: Set[str] = set()
+
+        # 兼容旧属性
+        self.fixed_holidays = FIXED_HOLIDAYS['A']
+        self.special_holidays_2024 = {d for d in SPECIAL_HOLIDAYS['A'] if d.startswith('2024')}
+
+    # ==================== 索引加载 ====================
+
+    def _calendar_file(self, market: str) -> str:
+        return os.path.join(self.data_dir, f'trading_days_{market}.json')
+
+    def get_index(self, market: str = 'A') -> TradingDayIndex:
+        """获取市场交易日索引（首次调用时加载）"""
+        index = self._indexes.get(market)
+        if index is not None:
+            return index
+
+        if market not in SUPPORTED_MARKETS:
+            # 未知市场按A股日历处理
+            self.logger.warning(f"不支持的市场类型 {market}，使用A股交易日历")
+            return self.get_index('A')
+
+        needs_refresh = False
+        with self._lock:
+            index = self._indexes.get(market)
+            if index is None:
+                index, needs_refresh = self._load_index(market)
+                self._indexes[market] = index
+
+        if needs_refresh:
+            self.refresh_async(market)
+        return index
+
+    def _load_index(self, market: str):
+        """构建市场索引，返回 (索引, 是否需要后台刷新)"""
+        end_year = date.today().year + CALENDAR_EXTRA_YEARS
+        rule_days = build_rule_based_days(market, CALENDAR_START_YEAR, end_year)
+
+        persisted, fetched_at = self._read_persisted(market)
+        if persisted is not None and len(persisted):
+            # 持久化的官方日历覆盖其日期范围，范围之外用规则日历补齐
+            merged = np.concatenate([
+                rule_days[rule_days < persisted[0]],
+                persisted,
+                rule_days[rule_days > persisted[-1]],
+            ])
+            index = TradingDayIndex(merged, source='persisted')
+            stale = fetched_at is None or datetime.now() - fetched_at > timedelta(days=CALENDAR_REFRESH_DAYS)
+        else:
+            index = TradingDayIndex(rule_days, source='rules')
+            stale = True
+
+        self.logger.info(f"加载{market}交易日历: {len(index)}个交易日, 来源={index.source}")
+        return index, stale and market == 'A' and not self.offline
+
+    def _read_persisted(self, market: str):
+        path = self._calendar_file(market)
+        if not os.path.exists(path):
+            return None, None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            days = np.array(payload['trading_days'], dtype='datetime64[D]')
+            fetched_at = datetime.strptime(payload['fetched_at'], '%Y-%m-%d %H:%M:%S')
+            return np.sort(_datetime64_to_ordinals(days)), fetched_at
+        except Exception as e:
+            self.logger.warning(f"读取{market}交易日历文件失败: {e}")
+            return None, None
+
+    def save_trading_days(self, market: str, trading_days, source: str = 'akshare') -> TradingDayIndex:
+        """持久化交易日列表并替换内存索引"""
+        days = np.unique(np.array([_to_date(d) for d in trading_days], dtype='datetime64[D]'))
+        os.makedirs(self.data_dir, exist_ok=True)
+        payload = {
+            'market': market,
+            'source': source,
+            'fetched_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'trading_days': [str(d) for d in days],
         }
-        
-    def is_trading_day(self, check_date: Optional[date] = None) -> bool:
+        path = self._calendar_file(market)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._indexes.pop(market, None)
+        return self.get_index(market)
+
+    def refresh_from_akshare(self, market: str = 'A') -> bool:
+        """从AKShare下载官方交易日历并持久化（仅A股）"""
+        if market != 'A':
+            return False
+        try:
+            import akshare as ak
+
+            df = ak.tool_trade_date_hist_sina()
+            if df is None or len(df) == 0:
+                return False
+            self.save_trading_days(market, df['trade_date'].astype(str).tolist())
+            self.logger.info(f"已刷新A股官方交易日历: {len(df)}个交易日")
+            return True
+        except Exception as e:
+            self.logger.warning(f"无法从AKShare获取交易日历: {e}")
+            return False
+
+    def refresh_async(self, market: str = 'A'):
+        """后台刷新交易日历，不阻塞查询"""
+        with self._lock:
+            if market in self._refreshing:
+                return
+            self._refreshing.add(market)
+
+        def worker():
+            try:
+                self.refresh_from_akshare(market)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(market)
+
+        threading.Thread(target=worker, daemon=True, name=f'calendar-refresh-{market}').start()
+
+    # ==================== 查询接口 ====================
+
+    def is_trading_day(self, check_date: Optional[date] = None, market: str = 'A') -> bool:
         """
         判断指定日期是否为交易日
-        
+
         Args:
             check_date: 要检查的日期，默认为今天
-            
+            market: 市场类型 A/HK/US
+
         Returns:
             bool: True表示是交易日，False表示非交易日
         """
-        if check_date is None:
-            check_date = date.today()
-        elif isinstance(check_date, str):
-            check_date = datetime.strptime(check_date, '%Y-%m-%d').date()
-        elif isinstance(check_date, datetime):
-            check_date = check_date.date()
-            
-        # 1. 检查是否为周末
-        if check_date.weekday() >= 5:  # 周六=5, 周日=6
-            return False
-            
-        # 2. 检查是否为固定节假日
-        month_day = (check_date.month, check_date.day)
-        if month_day in self.fixed_holidays:
-            self.logger.debug(f"{check_date} 是{self.fixed_holidays[month_day]}，非交易日")
-            return False
-            
-        # 3. 检查是否为特殊节假日
-        date_str = check_date.strftime('%Y-%m-%d')
-        if date_str in self.special_holidays_2024:
-            self.logger.debug(f"{check_date} 是特殊节假日，非交易日")
-            return False
-            
-        # 4. 尝试从AKShare获取官方交易日历（带缓存）
-        try:
-            if self._is_trading_day_from_akshare(check_date):
-                return True
-        except Exception as e:
-            self.logger.warning(f"无法从AKShare获取交易日历: {e}")
-            
-        # 5. 默认认为是交易日（工作日且不在已知节假日列表中）
-        return True
-        
-    def _is_trading_day_from_akshare(self, check_date: date) -> bool:
-        """从AKShare获取官方交易日历"""
-        year = check_date.year
-        cache_key = f"trading_days_{year}"
-        
-        # 检查缓存
-        if cache_key in self._trading_days_cache:
-            cache_time = self._cache_expiry.get(cache_key)
-            if cache_time and datetime.now() < cache_time:
-                trading_days = self._trading_days_cache[cache_key]
-                return check_date.strftime('%Y-%m-%d') in trading_days
-                
-        # 从API获取交易日历
-        try:
-            # 尝试获取A股交易日历（使用工具日历接口）
-            df = ak.tool_trade_date_hist_sina()
-            if df is not None and len(df) > 0:
-                # 过滤指定年份的数据
-                df['trade_date'] = df['trade_date'].astype(str)
-                year_data = df[df['trade_date'].str.startswith(str(year))]
-                trading_days = set(year_data['trade_date'].tolist())
-
-                # 缓存数据（缓存1天）
-                self._trading_days_cache[cache_key] = trading_days
-                self._cache_expiry[cache_key] = datetime.now() + timedelta(days=1)
-
-                return check_date.strftime('%Y-%m-%d') in trading_days
-                
-        except Exception as e:
-            self.logger.error(f"获取AKShare交易日历失败: {e}")
-            
-        return True  # 默认返回True
-        
-    def get_trading_days_between(self, start_date: date, end_date: date) -> List[date]:
+        check_date = _to_date(check_date) or date.today()
+        index = self.get_index(market)
+        ordinal = check_date.toordinal()
+        if index.covers(ordinal):
+            return index.is_trading_day(ordinal)
+
+        # 超出索引范围：按规则判断
+        return check_date.weekday() < 5 and check_date not in _rule_holidays(market, check_date.year)
+
+    def get_trading_days_between(self, start_date: date, end_date: date, market: str = 'A') -> List[date]:
         """
-        获取两个日期之间的所有交易日
-        
+        获取两个日期之间的所有交易日（含首尾）
+
         Args:
             start_date: 开始日期
             end_date: 结束日期
-            
+            market: 市场类型
+
         Returns:
             List[date]: 交易日列表
         """
-        if isinstance(start_date, str):
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        if isinstance(end_date, str):
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-            
-        trading_days = []
-        current_date = start_date
-        
-        while current_date <= end_date:
-            if self.is_trading_day(current_date):
-                trading_days.append(current_date)
-            current_date += timedelta(days=1)
-            
-        return trading_days
-        
-    def get_last_trading_day(self, before_date: Optional[date] = None) -> date:
+        start, end = _to_date(start_date), _to_date(end_date)
+        ordinals = self.get_index(market).slice_between(start.toordinal(), end.toordinal())
+        return [date.fromordinal(int(o)) for o in ordinals]
+
+    def get_trading_day_strings_between(self, start_date, end_date, market: str = 'A',
+                                        fmt: str = '%Y-%m-%d') -> np.ndarray:
+        """向量化返回区间内交易日字符串数组（'%Y-%m-%d' 或 '%Y%m%d'）"""
+        start, end = _to_date(start_date), _to_date(end_date)
+        ordinals = self.get_index(market).slice_between(start.toordinal(), end.toordinal())
+        strings = np.datetime_as_string(_ordinals_to_datetime64(ordinals), unit='D')
+        if fmt == '%Y%m%d':
+            strings = np.char.replace(strings, '-', '')
+        return strings
+
+    def count_trading_days_between(self, start_date, end_date, market: str = 'A') -> int:
+        """统计两个日期之间的交易日数量（含首尾）"""
+        start, end = _to_date(start_date), _to_date(end_date)
+        return self.get_index(market).count_between(start.toordinal(), end.toordinal())
+
+    def get_last_trading_day(self, before_date: Optional[date] = None, market: str = 'A') -> date:
         """
         获取指定日期之前的最后一个交易日
-        
+
         Args:
             before_date: 参考日期，默认为今天
-            
+            market: 市场类型
+
         Returns:
             date: 最后一个交易日
         """
-        if before_date is None:
-            before_date = date.today()
-        elif isinstance(before_date, str):
-            before_date = datetime.strptime(before_date, '%Y-%m-%d').date()
-        elif isinstance(before_date, datetime):
-            before_date = before_date.date()
-            
-        # 从前一天开始往前查找
-        check_date = before_date - timedelta(days=1)
-        
-        # 最多查找30天
-        for _ in range(30):
-            if self.is_trading_day(check_date):
-                return check_date
-            check_date -= timedelta(days=1)
-            
-        # 如果30天内都没有交易日，返回30天前的日期
-        self.logger.warning(f"30天内未找到交易日，返回 {check_date}")
-        return check_date
-        
-    def get_next_trading_day(self, after_date: Optional[date] = None) -> date:
+        return self.trading_days_ago(1, before_date, market)
+
+    def get_next_trading_day(self, after_date: Optional[date] = None, market: str = 'A') -> date:
         """
         获取指定日期之后的下一个交易日
-        
+
         Args:
             after_date: 参考日期，默认为今天
-            
+            market: 市场类型
+
         Returns:
             date: 下一个交易日
         """
-        if after_date is None:
-            after_date = date.today()
-        elif isinstance(after_date, str):
-            after_date = datetime.strptime(after_date, '%Y-%m-%d').date()
-        elif isinstance(after_date, datetime):
-            after_date = after_date.date()
-            
-        # 从后一天开始往后查找
-        check_date = after_date + timedelta(days=1)
-        
-        # 最多查找30天
-        for _ in range(30):
-            if self.is_trading_day(check_date):
-                return check_date
-            check_date += timedelta(days=1)
-            
-        # 如果30天内都没有交易日，返回30天后的日期
-        self.logger.warning(f"30天内未找到交易日，返回 {check_date}")
-        return check_date
-        
-    def is_market_open_time(self, check_time: Optional[datetime] = None) -> bool:
+        after_date = _to_date(after_date) or date.today()
+        ordinal = self.get_index(market).next(after_date.toordinal())
+        if ordinal is None:
+            self.logger.warning(f"{after_date} 之后超出交易日历范围")
+            return after_date + timedelta(days=1)
+        return date.fromordinal(ordinal)
+
+    def trading_days_ago(self, n: int, ref_date: Optional[date] = None, market: str = 'A') -> date:
+        """参考日期之前（不含参考日期）第 n 个交易日"""
+        ref_date = _to_date(ref_date) or date.today()
+        ordinal = self.get_index(market).prev(ref_date.toordinal(), n)
+        if ordinal is None:
+            self.logger.warning(f"{ref_date} 之前超出交易日历范围")
+            return ref_date - timedelta(days=n)
+        return date.fromordinal(ordinal)
+
+    def is_market_open_time(self, check_time: Optional[datetime] = None, market: str = 'A') -> bool:
         """
-        判断指定时间是否在交易时间内
+        判断指定时间是否在交易时间内（市场当地时间）
         A股交易时间：9:30-11:30, 13:00-15:00
-        
+
         Args:
             check_time: 要检查的时间，默认为当前时间
-            
+            market: 市场类型
+
         Returns:
             bool: True表示在交易时间内
         """
         if check_time is None:
             check_time = datetime.now()
-            
+
         # 首先检查是否为交易日
-        if not self.is_trading_day(check_time.date()):
+        if not self.is_trading_day(check_time.date(), market):
             return False
-            
-        # 检查时间段
+
         time_only = check_time.time()
-        
-        # 上午交易时间：9:30-11:30
-        morning_start = datetime.strptime("09:30", "%H:%M").time()
-        morning_end = datetime.strptime("11:30", "%H:%M").time()
-        
-        # 下午交易时间：13:00-15:00
-        afternoon_start = datetime.strptime("13:00", "%H:%M").time()
-        afternoon_end = datetime.strptime("15:00", "%H:%M").time()
-        
-        return (morning_start <= time_only <= morning_end) or \
-               (afternoon_start <= time_only <= afternoon_end)
+        return any(start <= time_only <= end for start, end in MARKET_SESSIONS[market])
 
 
 # 创建全局实例
 trading_calendar = TradingCalendar()
 
 # 便捷函数
-def is_trading_day(check_date: Optional[date] = None) -> bool:
+def is_trading_day(check_date: Optional[date] = None, market: str = 'A') -> bool:
     """判断是否为交易日的便捷函数"""
-    return trading_calendar.is_trading_day(check_date)
+    return trading_calendar.is_trading_day(check_date, market)
 
-def get_last_trading_day(before_date: Optional[date] = None) -> date:
+def get_last_trading_day(before_date: Optional[date] = None, market: str = 'A') -> date:
     """获取最后交易日的便捷函数"""
-    return trading_calendar.get_last_trading_day(before_date)
+    return trading_calendar.get_last_trading_day(before_date, market)
 
-def get_trading_days_between(start_date: date, end_date: date) -> List[date]:
+def get_next_trading_day(after_date: Optional[date] = None, market: str = 'A') -> date:
+    """获取下一交易日的便捷函数"""
+    return trading_calendar.get_next_trading_day(after_date, market)
+
+def get_trading_days_between(start_date: date, end_date: date, market: str = 'A') -> List[date]:
     """获取交易日列表的便捷函数"""
-    return trading_calendar.get_trading_days_between(start_date, end_date)
+    return trading_calendar.get_trading_days_between(start_date, end_date, market)
+
+def count_trading_days_between(start_date: date, end_date: date, market: str = 'A') -> int:
+    """统计交易日数量的便捷函数"""
+    return trading_calendar.count_trading_days_between(start_date, end_date, market)
+
+def trading_days_ago(n: int, ref_date: Optional[date] = None, market: str = 'A') -> date:
+    """N个交易日前的便捷函数"""
+    return trading_calendar.trading_days_ago(n, ref_date, market)
 
-def is_market_open_time(check_time: Optional[datetime] = None) -> bool:
+def is_market_open_time(check_time: Optional[datetime] = None, market: str = 'A') -> bool:
     """判断是否在交易时间的便捷函数"""
-    return trading_calendar.is_market_open_time(check_time)
+    return trading_calendar.is_market_open_time(check_time, market)
@@ -8,15 +8,12 @@
 
 import numpy as np
 import pandas as pd
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, g, Response
 from werkzeug.utils import secure_filename
 import csv
 import io
-from stock_analyzer import StockAnalyzer
-from us_stock_service import USStockService
 import threading
 import logging
-from logging.handlers import RotatingFileHandler
 import traceback
 import os
 import json
@@ -28,6 +25,10 @@ import threading
 import sys
 from flask_swagger_ui import get_swaggerui_blueprint
 from dotenv import load_dotenv
+from service_registry import service_registry, lazy_service, register_worker, start_workers
+
+# 后台工作线程由收到第一个请求时触发启动；须在导入登记工作线程的模块之前声明
+service_registry.hold_workers()
 
 # 条件导入数据库模块
 try:
@@ -41,16 +42,11 @@ except ImportError as e:
     def get_session():
         """数据库不可用时的占位函数"""
         return None
-from industry_analyzer import IndustryAnalyzer
-from fundamental_analyzer import FundamentalAnalyzer
-from capital_flow_analyzer import CapitalFlowAnalyzer
-from scenario_predictor import ScenarioPredictor
-from stock_qa import StockQA
-from risk_monitor import RiskMonitor
-from index_industry_analyzer import IndexIndustryAnalyzer
-from news_fetcher import news_fetcher, start_news_scheduler
-from data_service import DataService
-from stock_precache_scheduler import precache_scheduler, init_precache_scheduler
+from backtest_engine import run_backtest
+from performance_monitor import performance_monitor
+from log_pipeline import setup_logging, get_log_stats
+from metrics_core import render_metrics, PROMETHEUS_CONTENT_TYPE
+from tracing import start_trace, trace_store, get_trace
 
 # API功能导入
 try:
@@ -93,8 +89,92 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 app.config['TEMPLATES_AUTO_RELOAD'] = True
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 
-analyzer = StockAnalyzer()
-us_stock_service = USStockService()
+
+# ==================== 服务实例（延迟初始化） ====================
+# 分析器和数据服务在首次使用时才导入模块并构造，缩短冷启动时间；
+# 设置 LAZY_SERVICES=false 可恢复导入阶段全部初始化
+
+
+def _create_analyzer():
+    from stock_analyzer import StockAnalyzer
+    return StockAnalyzer()
+
+
+def _create_us_stock_service():
+    from us_stock_service import USStockService
+    return USStockService()
+
+
+def _create_fundamental_analyzer():
+    from fundamental_analyzer import FundamentalAnalyzer
+    return FundamentalAnalyzer()
+
+
+def _create_capital_flow_analyzer():
+    from capital_flow_analyzer import CapitalFlowAnalyzer
+    return CapitalFlowAnalyzer()
+
+
+def _create_scenario_predictor():
+    from scenario_predictor import ScenarioPredictor
+    return ScenarioPredictor(analyzer.resolve(), os.getenv('OPENAI_API_KEY'), os.getenv('OPENAI_API_MODEL'))
+
+
+def _create_stock_qa():
+    from stock_qa import StockQA
+    return StockQA(analyzer.resolve(), os.getenv('OPENAI_API_KEY'), os.getenv('OPENAI_API_MODEL'))
+
+
+def _create_risk_monitor():
+    from risk_monitor import RiskMonitor
+    return RiskMonitor(analyzer.resolve())
+
+
+def _create_index_industry_analyzer():
+    from index_industry_analyzer import IndexIndustryAnalyzer
+    return IndexIndustryAnalyzer(analyzer.resolve())
+
+
+def _create_industry_analyzer():
+    from industry_analyzer import IndustryAnalyzer
+    return IndustryAnalyzer()
+
+
+def _get_data_service():
+    from data_service import data_service
+    return data_service
+
+
+def _get_news_fetcher():
+    from news_fetcher import news_fetcher
+    return news_fetcher
+
+
+def _get_precache_scheduler():
+    from stock_precache_scheduler import precache_scheduler
+    return precache_scheduler
+
+
+def _start_news_scheduler():
+    from news_fetcher import start_news_scheduler
+    start_news_scheduler()
+
+
+analyzer = lazy_service('analyzer', _create_analyzer)
+us_stock_service = lazy_service('us_stock_service', _create_us_stock_service)
+fundamental_analyzer = lazy_service('fundamental_analyzer', _create_fundamental_analyzer)
+capital_flow_analyzer = lazy_service('capital_flow_analyzer', _create_capital_flow_analyzer)
+scenario_predictor = lazy_service('scenario_predictor', _create_scenario_predictor)
+stock_qa = lazy_service('stock_qa', _create_stock_qa)
+risk_monitor = lazy_service('risk_monitor', _create_risk_monitor)
+index_industry_analyzer = lazy_service('index_industry_analyzer', _create_index_industry_analyzer)
+industry_analyzer = lazy_service('industry_analyzer', _create_industry_analyzer)
+data_service = lazy_service('data_service', _get_data_service)
+news_fetcher = lazy_service('news_fetcher', _get_news_fetcher)
+precache_scheduler = lazy_service('precache_scheduler', _get_precache_scheduler)
+
+# 新闻抓取启动即访问上游，登记为后台工作线程，服务开始接收请求后再错峰启动
+register_worker('news_fetcher.scheduler', _start_news_scheduler)
 
 # 配置缓存
 cache_config = {
@@ -113,30 +193,26 @@ if os.getenv('USE_REDIS_CACHE', 'False').lower() == 'true' and os.getenv('REDIS_
 cache = Cache(config={'CACHE_TYPE': 'SimpleCache'})
 cache.init_app(app)
 
-app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
-# 确保全局变量在重新加载时不会丢失
-if 'analyzer' not in globals():
-    try:
-        from stock_analyzer import StockAnalyzer
+@app.before_request
+def _start_request_timer():
+    g.request_start_time = time.perf_counter()
+    # 收到第一个请求说明服务已开始接收连接，此时再错峰启动后台工作线程
+    start_workers()
 
-        analyzer = StockAnalyzer()
-        print("成功初始化全局StockAnalyzer实例")
-    except Exception as e:
-        print(f"初始化StockAnalyzer时出错: {e}", file=sys.stderr)
-        raise
 
-# 初始化模块实例
-fundamental_analyzer = FundamentalAnalyzer()
-capital_flow_analyzer = CapitalFlowAnalyzer()
-scenario_predictor = ScenarioPredictor(analyzer, os.getenv('OPENAI_API_KEY'), os.getenv('OPENAI_API_MODEL'))
-stock_qa = StockQA(analyzer, os.getenv('OPENAI_API_KEY'), os.getenv('OPENAI_API_MODEL'))
-risk_monitor = RiskMonitor(analyzer)
-index_industry_analyzer = IndexIndustryAnalyzer(analyzer)
-industry_analyzer = IndustryAnalyzer()
-data_service = DataService()
+@app.after_request
+def _record_request_latency(response):
+    """按路由模板记录请求耗时，未匹配路由统一归为 unmatched"""
+    start_time = g.get('request_start_time')
+    if start_time is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        performance_monitor.record_request(endpoint, request.method, response.status_code,
+                                           time.perf_counter() - start_time)
+    return response
+
 
-start_news_scheduler()
+app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
 # 线程本地存储
 thread_local = threading.local()
@@ -146,17 +222,15 @@ def get_analyzer():
     """获取线程本地的分析器实例"""
     # 如果线程本地存储中没有分析器实例，创建一个新的
     if not hasattr(thread_local, 'analyzer'):
+        from stock_analyzer import StockAnalyzer
         thread_local.analyzer = StockAnalyzer()
     return thread_local.analyzer
 
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
-handler = RotatingFileHandler('flask_app.log', maxBytes=10000000, backupCount=5)
-handler.setFormatter(logging.Formatter(
-    '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
-))
-app.logger.addHandler(handler)
+# 配置日志：异步队列写入并按 logger 采样限流，文件日志仍只记录本模块的输出
+setup_logging('flask_app.log', logging.INFO, file_logger=app.logger.name)
+# 任务管理器日志单独命名，轮询和进度更新的限流不影响其他日志
+task_logger = logging.getLogger(f'{app.logger.name}.tasks')
 
 # 旧的任务管理代码已移除，现在只使用统一任务管理器
 
@@ -258,92 +332,65 @@ class UnifiedTaskManager:
         return task_id, task
 
     def get_task(self, task_id):
-        """获取任务 - 线程安全，增强调试"""
-        app.logger.info(f"统一任务管理器: 开始查询任务 {task_id}")
-        app.logger.info(f"统一任务管理器: 当前任务数量: {len(self.tasks)}")
-
+        """获取任务 - 线程安全（前端轮询的热路径，命中时只记录调试日志）"""
         with self.lock:
             task = self.tasks.get(task_id)
             if task:
-                app.logger.info(f"统一任务管理器: 成功获取任务 {task_id}, 状态: {task['status']}, 类型: {task.get('type', '未知')}")
-                app.logger.info(f"统一任务管理器: 任务详情 - 进度: {task.get('progress', 0)}%, 创建时间: {task.get('created_at', '未知')}")
-                app.logger.info(f"统一任务管理器: 任务更新时间: {task.get('updated_at', '未知')}")
-
-                # 检查任务是否是刚创建的
-                try:
-                    created_at = datetime.strptime(task['created_at'], '%Y-%m-%d %H:%M:%S')
-                    age_seconds = (datetime.now() - created_at).total_seconds()
-                    app.logger.info(f"统一任务管理器: 任务 {task_id} 创建于 {age_seconds:.1f} 秒前")
-                except:
-                    pass
+                task_logger.debug("统一任务管理器: 获取任务 %s, 状态: %s, 类型: %s, 进度: %s%%, 更新时间: %s",
+                                  task_id, task['status'], task.get('type', '未知'), task.get('progress', 0),
+                                  task.get('updated_at', '未知'))
             else:
-                app.logger.error(f"统一任务管理器: 任务 {task_id} 不存在！")
-                app.logger.error(f"统一任务管理器: 当前任务数: {len(self.tasks)}")
-                app.logger.error(f"统一任务管理器: 当前任务列表: {list(self.tasks.keys())}")
+                task_logger.error("统一任务管理器: 任务 %s 不存在！当前任务数: %d",
+                                  task_id, len(self.tasks), extra={'fields': {'task_id': task_id}})
 
                 # 检查是否有相似的任务ID
-                similar_ids = []
-                for existing_id in self.tasks.keys():
-                    if existing_id.startswith(task_id[:8]) or task_id.startswith(existing_id[:8]):
-                        similar_ids.append(existing_id)
-                        app.logger.warning(f"统一任务管理器: 发现相似任务ID: {existing_id}")
-
-                if not similar_ids:
-                    app.logger.error(f"统一任务管理器: 没有发现相似的任务ID")
+                similar_ids = [existing_id for existing_id in self.tasks.keys()
+                               if existing_id.startswith(task_id[:8]) or task_id.startswith(existing_id[:8])]
+                if similar_ids:
+                    task_logger.warning("统一任务管理器: 发现相似任务ID: %s", similar_ids)
 
             return task
 
     def update_task(self, task_id, status=None, progress=None, result=None, error=None, **kwargs):
-        """更新任务状态 - 线程安全，增强调试"""
-        app.logger.info(f"统一任务管理器: 开始更新任务 {task_id}")
-        app.logger.info(f"统一任务管理器: 更新参数 - 状态: {status}, 进度: {progress}, 结果类型: {type(result).__name__ if result is not None else 'None'}")
-
+        """更新任务状态 - 线程安全（扫描过程中每只股票调用一次，进度只记录调试日志）"""
         with self.lock:
             if task_id not in self.tasks:
-                app.logger.error(f"统一任务管理器: 尝试更新不存在的任务 {task_id}")
-                app.logger.error(f"统一任务管理器: 当前任务列表: {list(self.tasks.keys())}")
+                task_logger.error("统一任务管理器: 尝试更新不存在的任务 %s，当前任务数: %d",
+                                  task_id, len(self.tasks), extra={'fields': {'task_id': task_id}})
                 return False
 
             task = self.tasks[task_id]
             old_status = task.get('status', '')
             old_progress = task.get('progress', 0)
 
-            app.logger.info(f"统一任务管理器: 任务 {task_id} 当前状态: {old_status}, 当前进度: {old_progress}%")
-
             # 更新基本字段
             if status is not None:
                 task['status'] = status
-                app.logger.info(f"统一任务管理器: 任务 {task_id} 状态更新: {old_status} -> {status}")
+                if status != old_status:
+                    task_logger.info("统一任务管理器: 任务 %s 状态更新: %s -> %s", task_id, old_status, status,
+                                     extra={'fields': {'task_id': task_id, 'status': status}})
             if progress is not None:
                 task['progress'] = progress
                 # 如果进度有变化，更新进度时间戳
                 if progress != old_progress:
                     task['progress_updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    app.logger.info(f"统一任务管理器: 任务 {task_id} 进度更新: {old_progress}% -> {progress}%")
+                    task_logger.debug("统一任务管理器: 任务 %s 进度更新: %s%% -> %s%%", task_id, old_progress, progress)
             if result is not None:
                 task['result'] = result
-                if isinstance(result, list):
-                    app.logger.info(f"统一任务管理器: 任务 {task_id} 结果已保存，共 {len(result)} 个结果")
-                else:
-                    app.logger.info(f"统一任务管理器: 任务 {task_id} 结果已保存，类型: {type(result).__name__}")
+                task_logger.info("统一任务管理器: 任务 %s 结果已保存，%s", task_id,
+                                 f"共 {len(result)} 个结果" if isinstance(result, list) else f"类型: {type(result).__name__}",
+                                 extra={'fields': {'task_id': task_id}})
             if error is not None:
                 task['error'] = error
-                app.logger.error(f"统一任务管理器: 任务 {task_id} 错误信息: {error}")
+                task_logger.error("统一任务管理器: 任务 %s 错误信息: %s", task_id, error,
+                                  extra={'fields': {'task_id': task_id}})
 
             # 更新其他字段
             for key, value in kwargs.items():
                 task[key] = value
-                app.logger.debug(f"统一任务管理器: 任务 {task_id} 更新字段 {key}: {value}")
+                task_logger.debug("统一任务管理器: 任务 %s 更新字段 %s: %s", task_id, key, value)
 
             task['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            # 验证任务更新成功
-            verification_task = self.tasks.get(task_id)
-            if verification_task:
-                app.logger.info(f"统一任务管理器: 任务 {task_id} 更新验证成功 - 最新状态: {verification_task['status']}, 最新进度: {verification_task.get('progress', 0)}%")
-            else:
-                app.logger.error(f"统一任务管理器: 严重错误！任务 {task_id} 更新后验证失败！")
-
             return True
 
     def cleanup_old_tasks(self):
@@ -677,30 +724,31 @@ def analyze():
         start_time = time.time()
         results = []
 
-        for stock_code in stock_codes:
-            try:
-                # 检查是否已超时
-                if time.time() - start_time > max_total_time:
-                    app.logger.warning(f"分析股票请求已超过{max_total_time}秒，提前返回已处理的{len(results)}只股票")
-                    break
-
-                # 使用线程本地缓存的分析器实例
-                current_analyzer = get_analyzer()
-                result = current_analyzer.quick_analyze_stock(stock_code.strip(), market_type)
-
-                app.logger.info(
-                    f"分析结果: 股票={stock_code}, 名称={result.get('stock_name', '未知')}, 行业={result.get('industry', '未知')}")
-                results.append(result)
-            except Exception as e:
-                app.logger.error(f"分析股票 {stock_code} 时出错: {str(e)}")
-                results.append({
-                    'stock_code': stock_code,
-                    'error': str(e),
-                    'stock_name': '分析失败',
-                    'industry': '未知'
-                })
+        with start_trace('http.analyze', stock_count=len(stock_codes), market_type=market_type) as trace:
+            for stock_code in stock_codes:
+                try:
+                    # 检查是否已超时
+                    if time.time() - start_time > max_total_time:
+                        app.logger.warning(f"分析股票请求已超过{max_total_time}秒，提前返回已处理的{len(results)}只股票")
+                        break
+
+                    # 使用线程本地缓存的分析器实例
+                    current_analyzer = get_analyzer()
+                    result = current_analyzer.quick_analyze_stock(stock_code.strip(), market_type)
+
+                    app.logger.info(
+                        f"分析结果: 股票={stock_code}, 名称={result.get('stock_name', '未知')}, 行业={result.get('industry', '未知')}")
+                    results.append(result)
+                except Exception as e:
+                    app.logger.error(f"分析股票 {stock_code} 时出错: {str(e)}")
+                    results.append({
+                        'stock_code': stock_code,
+                        'error': str(e),
+                        'stock_name': '分析失败',
+                        'industry': '未知'
+                    })
 
-        return jsonify({'results': results})
+        return jsonify({'results': results, 'trace_id': trace.trace_id})
     except Exception as e:
         app.logger.error(f"分析股票时出错: {traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
@@ -866,13 +914,16 @@ def start_stock_analysis():
         # 启动后台线程执行分析
         def run_analysis():
             try:
-                unified_task_manager.update_task(task_id, status=TASK_RUNNING, progress=10)
+                unified_task_manager.update_task(task_id, status=TASK_RUNNING, progress=10, trace_id=task_id)
 
-                # 执行分析
-                result = analyzer.perform_enhanced_analysis(stock_code, market_type)
+                # 执行分析（以任务ID作为追踪ID，可通过 /api/traces/<task_id> 查看阶段耗时）
+                with start_trace('task.stock_analysis', trace_id=task_id,
+                                 stock_code=stock_code, market_type=market_type) as trace:
+                    result = analyzer.perform_enhanced_analysis(stock_code, market_type)
 
                 # 更新任务状态为完成
-                unified_task_manager.update_task(task_id, status=TASK_COMPLETED, progress=100, result=result)
+                unified_task_manager.update_task(task_id, status=TASK_COMPLETED, progress=100, result=result,
+                                                 trace=trace.summary())
                 app.logger.info(f"分析任务 {task_id} 完成")
 
                 # 延长已完成任务的保护时间，确保前端有足够时间获取结果
@@ -943,6 +994,8 @@ def get_analysis_status(task_id):
     # 如果任务完成，包含结果
     if task['status'] == TASK_COMPLETED and 'result' in task:
         status['result'] = task['result']
+        if 'trace' in task:
+            status['trace'] = task['trace']
         app.logger.info(f"API响应: 分析任务 {task_id} 已完成，包含结果数据")
 
     # 如果任务失败，包含错误信息
@@ -1315,8 +1368,14 @@ def start_market_scan():
                 app.logger.error(traceback.format_exc())
                 start_market_scan_task_status(task_id, TASK_FAILED, error=str(e))
 
+        def run_traced_scan():
+            with start_trace('task.market_scan', trace_id=task_id,
+                             stock_count=len(stock_list), market_type=market_type) as trace:
+                run_scan()
+            unified_task_manager.update_task(task_id, trace=trace.summary())
+
         # 启动后台线程
-        thread = threading.Thread(target=run_scan)
+        thread = threading.Thread(target=run_traced_scan)
         thread.daemon = True
         thread.start()
 
@@ -1381,6 +1440,8 @@ def get_scan_status(task_id):
     # 如果任务完成，包含结果
     if task['status'] == TASK_COMPLETED and 'result' in task:
         status['result'] = task['result']
+        if 'trace' in task:
+            status['trace'] = task['trace']
         app.logger.info(f"任务 {task_id} 已完成，返回 {len(task['result'])} 个结果")
 
     # 如果任务失败，包含错误信息
@@ -1416,28 +1477,15 @@ def cancel_scan_task(task_id):
 def get_index_stocks():
     """获取指数成分股"""
     try:
-        import akshare as ak
         index_code = request.args.get('index_code', '000300')  # 默认沪深300
 
-        # 获取指数成分股
-        app.logger.info(f"获取指数 {index_code} 成分股")
-        if index_code == '000300':
-            # 沪深300成分股
-            stocks = ak.index_stock_cons_weight_csindex(symbol="000300")
-        elif index_code == '000905':
-            # 中证500成分股
-            stocks = ak.index_stock_cons_weight_csindex(symbol="000905")
-        elif index_code == '000852':
-            # 中证1000成分股
-            stocks = ak.index_stock_cons_weight_csindex(symbol="000852")
-        elif index_code == '000001':
-            # 上证指数
-            stocks = ak.index_stock_cons_weight_csindex(symbol="000001")
-        else:
+        # 支持沪深300、中证500、中证1000、上证指数
+        if index_code not in ('000300', '000905', '000852', '000001'):
             return jsonify({'error': '不支持的指数代码'}), 400
 
-        # 提取股票代码列表
-        stock_list = stocks['成分券代码'].tolist() if '成分券代码' in stocks.columns else []
+        # 经数据服务获取（走数据提供方和按日缓存），按权重降序
+        app.logger.info(f"获取指数 {index_code} 成分股")
+        stock_list = [code for code, _ in data_service.get_index_constituents(index_code)]
         app.logger.info(f"找到 {len(stock_list)} 只成分股")
 
         return jsonify({'stock_list': stock_list})
@@ -1450,18 +1498,14 @@ def get_index_stocks():
 def get_industry_stocks():
     """获取行业成分股"""
     try:
-        import akshare as ak
         industry = request.args.get('industry', '')
 
         if not industry:
             return jsonify({'error': '请提供行业名称'}), 400
 
-        # 获取行业成分股
+        # 经数据服务获取（走数据提供方和按日缓存）
         app.logger.info(f"获取 {industry} 行业成分股")
-        stocks = ak.stock_board_industry_cons_em(symbol=industry)
-
-        # 提取股票代码列表
-        stock_list = stocks['代码'].tolist() if '代码' in stocks.columns else []
+        stock_list = data_service.get_industry_constituents(industry)
         app.logger.info(f"找到 {len(stock_list)} 只 {industry} 行业股票")
 
         return jsonify({'stock_list': stock_list})
@@ -1499,8 +1543,9 @@ def run_task_cleaner():
 
                 # 如果是收盘时间，清理所有缓存
                 if is_market_close_time:
-                    # 清理分析器的数据缓存
-                    analyzer.data_cache.clear()
+                    # 清理分析器的数据缓存（尚未初始化时无需清理）
+                    if service_registry.is_initialized('analyzer'):
+                        analyzer.data_cache.clear()
 
                     # 清理 Flask 缓存
                     cache.clear()
@@ -1631,6 +1676,34 @@ def api_capital_flow():
         return jsonify({'error': str(e)}), 500
 
 
+# 批量资金流向评分：基于全市场快照，整个列表只访问一次上游
+@app.route('/api/capital_flow/batch', methods=['POST'])
+def api_capital_flow_batch():
+    try:
+        data = request.json or {}
+        stock_codes = data.get('stock_codes') or []
+        period = data.get('period', '10日')
+
+        if not stock_codes or not isinstance(stock_codes, list):
+            return jsonify({'error': 'stock_codes is required'}), 400
+
+        from fund_flow_store import FUND_FLOW_PERIODS, fund_flow_store
+        if period not in FUND_FLOW_PERIODS:
+            return jsonify({'error': f"period 需为 {'/'.join(FUND_FLOW_PERIODS)} 之一"}), 400
+
+        scores = capital_flow_analyzer.batch_calculate_capital_flow_scores(stock_codes, period)
+
+        return custom_jsonify({
+            'period': period,
+            'trade_date': fund_flow_store.get_trade_date(period),
+            'count': len(scores),
+            'scores': scores
+        })
+    except Exception as e:
+        app.logger.error(f"Error batch calculating capital flow scores: {traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+
 # 情景预测路由
 @app.route('/api/scenario_predict', methods=['POST'])
 def api_scenario_predict():
@@ -1638,13 +1711,17 @@ def api_scenario_predict():
         data = request.json
         stock_code = data.get('stock_code')
         market_type = data.get('market_type', 'A')
-        days = data.get('days', 60)
+        days = int(data.get('days', 60))
+        seed = data.get('seed')
 
         if not stock_code:
             return jsonify({'error': '请提供股票代码'}), 400
+        if not 1 <= days <= 750:
+            return jsonify({'error': 'days 需在 1 到 750 之间'}), 400
 
         # 获取情景预测结果
-        result = scenario_predictor.generate_scenarios(stock_code, market_type, days)
+        result = scenario_predictor.generate_scenarios(stock_code, market_type, days,
+                                                       seed=int(seed) if seed is not None else None)
 
         return custom_jsonify(result)
     except Exception as e:
@@ -1660,12 +1737,16 @@ def api_qa():
         stock_code = data.get('stock_code')
         question = data.get('question')
         market_type = data.get('market_type', 'A')
+        # 传入上一轮返回的 conversation_id 即可继续多轮对话
+        conversation_id = data.get('conversation_id')
+        clear_history = bool(data.get('clear_history', False))
 
         if not stock_code or not question:
             return jsonify({'error': '请提供股票代码和问题'}), 400
 
         # 获取智能问答结果
-        result = stock_qa.answer_question(stock_code, question, market_type)
+        result = stock_qa.answer_question(stock_code, question, market_type,
+                                          conversation_id=conversation_id, clear_history=clear_history)
 
         return custom_jsonify(result)
     except Exception as e:
@@ -1673,6 +1754,50 @@ def api_qa():
         return jsonify({'error': str(e)}), 500
 
 
+def score_stock(stock_code, market_type='A'):
+    """统一评分：行情、指标、评分详情和基本信息，供评分接口和投资组合导入的批量作业共用"""
+    # 使用线程本地缓存的分析器实例
+    current_analyzer = get_analyzer()
+
+    # 获取股票数据和计算指标
+    df = current_analyzer.get_stock_data(stock_code, market_type)
+    df = current_analyzer.calculate_indicators(df)
+
+    # 计算评分（使用与投资组合页面相同的算法）
+    score = current_analyzer.calculate_score(df, market_type)
+    score_details = getattr(current_analyzer, 'score_details', {'total': score})
+
+    # 获取最新数据用于显示
+    latest = df.iloc[-1]
+    prev = df.iloc[-2] if len(df) > 1 else latest
+
+    # 获取基本信息
+    try:
+        stock_info = current_analyzer.get_stock_info(stock_code)
+        stock_name = stock_info.get('股票名称', '未知')
+        industry = stock_info.get('行业', '未知')
+    except:
+        stock_name = '未知'
+        industry = '未知'
+
+    # 获取详细的评分分解信息
+    score_breakdown = getattr(current_analyzer, 'score_breakdown', {})
+
+    # 构建返回数据
+    return {
+        'stock_code': stock_code,
+        'stock_name': stock_name,
+        'industry': industry,
+        'score': score,
+        'score_details': score_details,
+        'score_breakdown': score_breakdown,  # 新增详细评分分解
+        'price': float(latest['close']),
+        'price_change': float((latest['close'] - prev['close']) / prev['close'] * 100),
+        'recommendation': current_analyzer.get_recommendation(score),
+        'analysis_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
 # 统一评分API端点
 @app.route('/api/stock_score', methods=['POST'])
 def api_stock_score():
@@ -1686,49 +1811,8 @@ def api_stock_score():
             return jsonify({'error': '请提供股票代码'}), 400
 
         app.logger.info(f"获取股票 {stock_code} 的统一评分，市场类型: {market_type}")
-
-        # 使用线程本地缓存的分析器实例
-        current_analyzer = get_analyzer()
-
-        # 获取股票数据和计算指标
-        df = current_analyzer.get_stock_data(stock_code, market_type)
-        df = current_analyzer.calculate_indicators(df)
-
-        # 计算评分（使用与投资组合页面相同的算法）
-        score = current_analyzer.calculate_score(df, market_type)
-        score_details = getattr(current_analyzer, 'score_details', {'total': score})
-
-        # 获取最新数据用于显示
-        latest = df.iloc[-1]
-        prev = df.iloc[-2] if len(df) > 1 else latest
-
-        # 获取基本信息
-        try:
-            stock_info = current_analyzer.get_stock_info(stock_code)
-            stock_name = stock_info.get('股票名称', '未知')
-            industry = stock_info.get('行业', '未知')
-        except:
-            stock_name = '未知'
-            industry = '未知'
-
-        # 获取详细的评分分解信息
-        score_breakdown = getattr(current_analyzer, 'score_breakdown', {})
-
-        # 构建返回数据
-        result = {
-            'stock_code': stock_code,
-            'stock_name': stock_name,
-            'industry': industry,
-            'score': score,
-            'score_details': score_details,
-            'score_breakdown': score_breakdown,  # 新增详细评分分解
-            'price': float(latest['close']),
-            'price_change': float((latest['close'] - prev['close']) / prev['close'] * 100),
-            'recommendation': current_analyzer.get_recommendation(score),
-            'analysis_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-
-        app.logger.info(f"股票 {stock_code} 评分计算完成: {score}")
+        result = score_stock(stock_code, market_type)
+        app.logger.info(f"股票 {stock_code} 评分计算完成: {result['score']}")
         return custom_jsonify(result)
 
     except Exception as e:
@@ -1773,70 +1857,24 @@ def api_portfolio_import_csv():
         if not file.filename.lower().endswith('.csv'):
             return jsonify({'error': '请上传CSV格式文件'}), 400
 
-        # 读取CSV文件内容
+        # 流式读取代码列，整列转换并去重
+        from portfolio_import import import_portfolio_csv, submit_portfolio_analysis
         try:
-            # 使用pandas读取CSV，更好地处理编码问题
-            content = file.read()
+            result = import_portfolio_csv(file.stream)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-            # 尝试不同的编码方式
-            encodings = ['utf-8', 'gbk', 'gb2312', 'utf-8-sig']
-            df = None
-
-            for encoding in encodings:
-                try:
-                    content_str = content.decode(encoding)
-                    df = pd.read_csv(io.StringIO(content_str))
-                    break
-                except (UnicodeDecodeError, pd.errors.EmptyDataError):
-                    continue
-
-            if df is None:
-                return jsonify({'error': 'CSV文件编码不支持，请使用UTF-8或GBK编码'}), 400
-
-        except Exception as e:
-            return jsonify({'error': f'CSV文件读取失败: {str(e)}'}), 400
-
-        # 检查是否有secID列
-        if 'secID' not in df.columns:
-            return jsonify({'error': 'CSV文件必须包含secID列'}), 400
-
-        # 提取有效的股票代码
-        stock_codes = df[df['secID'].notna() & (df['secID'] != '')]['secID'].tolist()
-
-        if not stock_codes:
+        if not result['total_count']:
             return jsonify({'error': 'CSV文件中未找到有效的股票代码'}), 400
 
-        # 转换股票代码格式
-        converted_stocks = []
-        failed_stocks = []
-
-        for original_code in stock_codes:
-            try:
-                converted_code = convert_stock_code_for_portfolio(str(original_code).strip())
-                if converted_code:
-                    converted_stocks.append({
-                        'original_code': original_code,
-                        'converted_code': converted_code
-                    })
-                else:
-                    failed_stocks.append({
-                        'code': original_code,
-                        'reason': '代码格式无法识别'
-                    })
-            except Exception as e:
-                failed_stocks.append({
-                    'code': original_code,
-                    'reason': f'转换失败: {str(e)}'
-                })
+        # 需要评分时作为一个后台作业提交，前端轮询 /api/analysis_jobs/<job_id> 获取进度和结果
+        if request.form.get('analyze', '').lower() in ('1', 'true') and result['converted_stocks']:
+            market_type = request.form.get('market_type', 'A')
+            job = submit_portfolio_analysis([s['converted_code'] for s in result['converted_stocks']],
+                                            score_stock, market_type)
+            result['analysis_job_id'] = job.job_id
 
-        return custom_jsonify({
-            'success': True,
-            'total_count': len(stock_codes),
-            'converted_count': len(converted_stocks),
-            'failed_count': len(failed_stocks),
-            'converted_stocks': converted_stocks,
-            'failed_stocks': failed_stocks
-        })
+        return custom_jsonify({'success': True, **result})
 
     except Exception as e:
         app.logger.error(f"CSV批量导入出错: {traceback.format_exc()}")
@@ -1845,49 +1883,35 @@ def api_portfolio_import_csv():
 
 def convert_stock_code_for_portfolio(code):
     """
-    转换股票代码格式，参考robust_batch_analyzer.py的逻辑
+    转换单个股票代码格式，与CSV导入的整列转换规则相同
     输入: 603316.XSHG, 601218.XSHG 等格式
-    输出: 603316, 601218 等简化格式（适合投资组合页面）
+    输出: 603316, 601218 等简化格式（适合投资组合页面），无法识别时返回 None
     """
-    try:
-        code = str(code).strip().upper()
-
-        # 如果已经是简单格式（6位数字），直接返回
-        if code.isdigit() and len(code) == 6:
-            return code
-
-        # 处理带交易所后缀的格式
-        if '.' in code:
-            stock_part = code.split('.')[0]
-            if stock_part.isdigit() and len(stock_part) == 6:
-                return stock_part
-
-        # 处理其他可能的格式
-        # 提取6位数字
-        import re
-        match = re.search(r'\d{6}', code)
-        if match:
-            return match.group()
-
-        return None
-
-    except Exception as e:
-        app.logger.error(f"股票代码转换失败 {code}: {e}")
-        return None
+    from portfolio_import import normalize_stock_codes
+    converted = normalize_stock_codes(pd.Series([code])).iloc[0]
+    return None if pd.isna(converted) else converted
 
 
 # 投资组合风险分析路由
 @app.route('/api/portfolio_risk', methods=['POST'])
 def api_portfolio_risk():
     try:
-        data = request.json
+        data = request.json or {}
         portfolio = data.get('portfolio', [])
 
         if not portfolio:
             return jsonify({'error': '请提供投资组合'}), 400
 
+        try:
+            confidence = float(data.get('confidence', 0.95))
+        except (TypeError, ValueError):
+            confidence = None
+        if confidence is None or not 0.5 < confidence < 1:
+            return jsonify({'error': 'confidence 需为 0.5 到 1 之间的数字'}), 400
+
         # 获取投资组合风险分析结果
-        result = risk_monitor.analyze_portfolio_risk(portfolio)
+        with start_trace('http.portfolio_risk', holdings=len(portfolio)):
+            result = risk_monitor.analyze_portfolio_risk(portfolio, confidence=confidence)
 
         return custom_jsonify(result)
     except Exception as e:
@@ -1895,6 +1919,44 @@ def api_portfolio_risk():
         return jsonify({'error': str(e)}), 500
 
 
+# 评分系统回测路由
+@app.route('/api/backtest', methods=['POST'])
+def api_backtest():
+    try:
+        data = request.json or {}
+        stock_codes = data.get('stock_codes', [])
+
+        if not stock_codes:
+            return jsonify({'error': '请提供股票池'}), 400
+
+        options = {
+            key: float(data[key]) for key in ('commission', 'slippage', 'sell_tax') if key in data
+        }
+        if 'weighting' in data:
+            options['weighting'] = data['weighting']
+        if 'action_exposure' in data:
+            options['action_exposure'] = data['action_exposure']
+
+        with start_trace('http.backtest', stocks=len(stock_codes)):
+            result = run_backtest(
+                stock_codes,
+                start_date=data.get('start_date'),
+                end_date=data.get('end_date'),
+                market_type=data.get('market_type', 'A'),
+                forward_horizon=int(data.get('forward_horizon', 5)),
+                **options
+            )
+
+        if 'error' in result:
+            return jsonify(result), 404
+        return custom_jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"评分系统回测出错: {traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+
 # 指数分析路由
 @app.route('/api/index_analysis', methods=['GET'])
 def api_index_analysis():
@@ -1933,6 +1995,44 @@ def api_industry_analysis():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/analysis_jobs', methods=['GET'])
+def api_analysis_jobs():
+    """查看共享分析线程池中的作业进度和上游限速状态"""
+    try:
+        from analysis_executor import analysis_executor
+        return jsonify({'success': True, 'stats': analysis_executor.get_stats()})
+    except Exception as e:
+        app.logger.error(f"获取分析作业状态出错: {traceback.format_exc()}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/analysis_jobs/<job_id>', methods=['GET'])
+def api_analysis_job(job_id):
+    """查看单个分析作业的进度和游标（?cursor=）之后新完成的结果，下次轮询传入返回的 next_cursor"""
+    try:
+        from analysis_executor import analysis_executor
+        job = analysis_executor.get_job_results(job_id, request.args.get('cursor', 0, type=int))
+        if job is None:
+            return jsonify({'success': False, 'error': '作业不存在或已过期'}), 404
+        return custom_jsonify({'success': True, 'job': job})
+    except Exception as e:
+        app.logger.error(f"获取分析作业结果出错: {traceback.format_exc()}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/analysis_jobs/<job_id>/cancel', methods=['POST'])
+def api_cancel_analysis_job(job_id):
+    """取消分析作业，未开始的股票不再分析，已完成的部分照常返回给等待的请求"""
+    try:
+        from analysis_executor import analysis_executor
+        if not analysis_executor.cancel(job_id):
+            return jsonify({'success': False, 'error': '作业不存在或已结束'}), 404
+        return jsonify({'success': True, 'job': analysis_executor.get_job(job_id)})
+    except Exception as e:
+        app.logger.error(f"取消分析作业出错: {traceback.format_exc()}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/industry_fund_flow', methods=['GET'])
 def api_industry_fund_flow():
     """获取行业资金流向数据"""
@@ -1972,10 +2072,11 @@ def api_industry_detail():
 @app.route('/api/industry_compare', methods=['GET'])
 def api_industry_compare():
     try:
-        limit = int(request.args.get('limit', 10))
+        # 不传 limit 时比较全部行业
+        limit = int(request.args.get('limit', 0)) or None
 
         # 获取行业比较结果
-        result = index_industry_analyzer.compare_industries(limit)
+        result = industry_analyzer.compare_industries(limit)
 
         return custom_jsonify(result)
     except Exception as e:
@@ -2188,6 +2289,36 @@ def get_latest_news():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# 本地新闻检索的天数、条数上限
+STOCK_NEWS_MAX_DAYS = 90
+STOCK_NEWS_MAX_LIMIT = 50
+
+
+@app.route('/api/stock_news', methods=['GET'])
+def get_stock_local_news():
+    """从本地新闻库检索与股票相关的近期新闻（按股票/行业标签和全文检索排序）"""
+    try:
+        stock_code = request.args.get('stock_code')
+        if not stock_code:
+            return jsonify({'success': False, 'error': '请提供股票代码'}), 400
+
+        industry = request.args.get('industry')
+        query = request.args.get('q')
+        try:
+            days = int(request.args.get('days', 7))
+            limit = int(request.args.get('limit', 10))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'days 和 limit 需为整数'}), 400
+        days = min(max(days, 1), STOCK_NEWS_MAX_DAYS)
+        limit = min(max(limit, 1), STOCK_NEWS_MAX_LIMIT)
+
+        result = news_fetcher.search_stock_news(stock_code, industry=industry, query=query, days=days, limit=limit)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        app.logger.error(f"检索股票新闻时出错: {traceback.format_exc()}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ======================== 预缓存管理API ========================
 
 @app.route('/api/precache/status', methods=['GET'])
@@ -2212,10 +2343,14 @@ def manual_precache():
         data = request.json or {}
         index_code = data.get('index_code', '000300')
         max_stocks = data.get('max_stocks', 50)
+        resume = data.get('resume', True)
+
+        if precache_scheduler.get_stats().get('task_running'):
+            return jsonify({'success': False, 'error': '预缓存任务正在运行中'}), 409
 
         # 在后台线程中执行预缓存
         def run_precache():
-            precache_scheduler.manual_precache(index_code, max_stocks)
+            precache_scheduler.manual_precache(index_code, max_stocks, resume=resume)
 
         thread = threading.Thread(target=run_precache)
         thread.daemon = True
@@ -2230,10 +2365,117 @@ def manual_precache():
         app.logger.error(f"手动预缓存失败: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-# 在应用启动时启动清理线程（保持原有代码不变）
-cleaner_thread = threading.Thread(target=run_task_cleaner)
-cleaner_thread.daemon = True
-cleaner_thread.start()
+
+@app.route('/api/precache/cancel', methods=['POST'])
+def cancel_precache():
+    """取消正在运行的预缓存任务，已完成的进度保留，下次运行时继续"""
+    try:
+        precache_scheduler.cancel_task()
+        return jsonify({'success': True, 'message': '已请求取消预缓存任务'})
+    except Exception as e:
+        app.logger.error(f"取消预缓存失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# ======================== 数据库统计API ========================
+
+@app.route('/api/database/query_stats', methods=['GET'])
+def get_database_query_stats():
+    """获取语句级数据库查询统计（延迟直方图、行数、连接池等待）"""
+    try:
+        from database_optimizer import db_optimizer
+
+        top_n = request.args.get('top', 20, type=int)
+        order_by = request.args.get('order_by', 'total_ms')
+        if order_by not in ('total_ms', 'count', 'avg_ms', 'max_ms', 'p95_ms', 'p99_ms', 'rows'):
+            return jsonify({'success': False, 'error': f'不支持的排序字段: {order_by}'}), 400
+
+        stats = db_optimizer.query_instrumentation.get_stats(top_n=top_n, order_by=order_by)
+
+        return jsonify({
+            'success': True,
+            'query_stats': stats,
+            'connection_stats': db_optimizer.connection_stats.copy()
+        })
+    except Exception as e:
+        app.logger.error(f"获取数据库查询统计失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/database/query_stats/reset', methods=['POST'])
+def reset_database_query_stats():
+    """清空语句级数据库查询统计"""
+    try:
+        from database_optimizer import db_optimizer
+
+        db_optimizer.query_instrumentation.reset()
+        return jsonify({'success': True, 'message': '查询统计已清空'})
+    except Exception as e:
+        app.logger.error(f"清空数据库查询统计失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ======================== 性能指标API ========================
+
+@app.route('/metrics', methods=['GET'])
+def get_prometheus_metrics():
+    """以 Prometheus 文本格式输出计数器和延迟直方图"""
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.route('/api/performance/latency', methods=['GET'])
+def get_latency_percentiles():
+    """获取按接口、缓存层级、分析阶段汇总的延迟分位数"""
+    try:
+        summary = performance_monitor.get_performance_summary()
+        return jsonify({'success': True, **summary})
+    except Exception as e:
+        app.logger.error(f"获取延迟分位数失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/performance/latency/reset', methods=['POST'])
+def reset_latency_percentiles():
+    """清空延迟统计"""
+    try:
+        performance_monitor.reset_metrics()
+        return jsonify({'success': True, 'message': '延迟统计已清空'})
+    except Exception as e:
+        app.logger.error(f"清空延迟统计失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+
+@app.route('/api/traces', methods=['GET'])
+def list_traces():
+    """列出最近的请求/任务追踪"""
+    limit = request.args.get('limit', 50, type=int)
+    name = request.args.get('name')
+    return jsonify({'success': True, 'traces': trace_store.list_recent(limit=limit, name=name)})
+
+
+@app.route('/api/traces/<trace_id>', methods=['GET'])
+def get_trace_detail(trace_id):
+    """获取单个追踪的阶段树（个股分析和市场扫描任务的追踪ID即任务ID）"""
+    trace = get_trace(trace_id)
+    if trace is None:
+        return jsonify({'success': False, 'error': '找不到指定的追踪', 'trace_id': trace_id}), 404
+    return jsonify({'success': True, 'trace': trace})
+
+
+@app.route('/api/system/services', methods=['GET'])
+def get_service_status():
+    """查看延迟初始化服务的构造耗时和后台工作线程启动情况"""
+    return jsonify({'success': True, **service_registry.status()})
+
+
+@app.route('/api/system/logging', methods=['GET'])
+def get_logging_status():
+    """查看日志管道的放行/限流/丢弃条数和入队、写入耗时"""
+    return jsonify({'success': True, **get_log_stats()})
+
+
+# 任务清理线程登记为后台工作线程，服务开始接收请求后启动
+register_worker('task_cleaner', lambda: threading.Thread(target=run_task_cleaner, daemon=True).start())
 
 # 移除自动预缓存调度器初始化，避免系统启动时的不必要API调用
 # 如需预缓存，可通过API手动触发：POST /api/precache/manual
@@ -2277,6 +2519,9 @@ else:
     print("⚠️  API集成模块不可用，跳过API功能集成")
 
 if __name__ == '__main__':
+    # 服务即将开始监听，后台工作线程在启动延迟后错峰启动
+    start_workers()
+
     # 将 host 设置为 '0.0.0.0' 使其支持所有网络接口访问
     if socketio:
         # 使用SocketIO运行应用（支持WebSocket）